@@ -12,6 +12,8 @@ import tornado.web
 
 from tornado.web import asynchronous
 
+from ltischoolbus import json_codec
+
 
 class LTIEventDispatcher(tornado.web.RequestHandler):
     '''
@@ -126,7 +128,7 @@ class LTIEventDispatcher(tornado.web.RequestHandler):
         
         # Issue a POST request to the service, not waiting for
         # a response:
-        request = httpclient.HTTPRequest(providerURL, method='POST', body=str(postBodyForm))
+        request = httpclient.HTTPRequest(providerURL, method='POST', body=json_codec.dumps(postBodyForm))
         http_client = httpclient.AsyncHTTPClient()
         
         # Asynch calls require a callback function, which we make into a no-op:
@@ -189,10 +191,9 @@ class LTIResponseListener(tornado.web.RequestHandler):
     '''
     
     def post(self):
-        # The POST body is expected to be a dict mapping
-        # param names to values. The body is a string that
-        # evaluates to a dict:
-        resultDict = eval(self.request.body)
+        # The POST body is expected to be a JSON object mapping
+        # param names to values:
+        resultDict = json_codec.loads(self.request.body)
         resultToken = resultDict['resultToken']
         
         # Find the open connection that is awaiting the
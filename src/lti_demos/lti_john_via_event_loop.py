@@ -8,6 +8,8 @@ import tornado.ioloop
 import tornado.web
 from tornado import httpclient 
 
+from ltischoolbus import json_codec
+
 
 class LTIJohnProvider(tornado.web.RequestHandler):
     '''
@@ -47,7 +49,7 @@ class LTIJohnProvider(tornado.web.RequestHandler):
         '''
         Override the post() method. The
         associated form is expected as a 
-        stringified dict in self.request.arguments.
+        JSON object in the request body.
         '''
         # Get a dict of the parameters. Note
         # that one of those parameters will be
@@ -55,7 +57,7 @@ class LTIJohnProvider(tornado.web.RequestHandler):
         # to the event dispatcher with any 
         # computed results:
         postBodyForm = self.request.body
-        postBodyDict = eval(postBodyForm)
+        postBodyDict = json_codec.loads(postBodyForm)
         self.echoParmsToEventDispatcher(postBodyDict)
         
     def echoParmsToEventDispatcher(self, paramDict):
@@ -69,7 +71,7 @@ class LTIJohnProvider(tornado.web.RequestHandler):
         paramNames.sort()
         
         # Build a request object... 
-        request = httpclient.HTTPRequest(LTIJohnProvider.eventDispatcherURL, method='POST', body=str(paramDict))
+        request = httpclient.HTTPRequest(LTIJohnProvider.eventDispatcherURL, method='POST', body=json_codec.dumps(paramDict))
         http_client = httpclient.AsyncHTTPClient()
         # ... and ship it:
         ltiResult = http_client.fetch(request, callback=lambda result: None)
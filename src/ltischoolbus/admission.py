@@ -0,0 +1,264 @@
+'''
+Created on Oct 17, 2026
+
+Admission control at the bridge's ingress. When the bus or the LTI
+consumers slow down, work piles up inside the bridge: deliveries wait
+for connection slots, consumer queues fill, and the IOLoop falls
+behind its timers. Rather than accepting requests until memory runs
+out, the bridge sheds new work while it is overloaded:
+
+   - publish requests (single, batch, NDJSON, and streamed) are
+     answered with 503, and a Retry-After header,
+   - subscribe requests are answered with 503, and a back-off hint
+     that grows the longer the overload lasts, since every new
+     subscription adds deliveries for as long as it exists,
+   - unsubscribe requests are always admitted; they reduce the load.
+
+Overload is judged from signals, each sampled every interval seconds:
+
+   - loop_lag_ms:  how late the IOLoop ran the sampling timer,
+   - in_flight:    deliveries in flight, plus those waiting for a slot,
+   - queued_bytes: bytes held in memory by all consumer queues.
+
+Each signal has a high watermark. Shedding starts when any signal
+reaches its high watermark, and ends when every signal has dropped
+below its low watermark (low_fraction of the high one), but not before
+shedding lasted min_shed_seconds. The gap between the two watermarks,
+and the minimum duration, keep the bridge from flapping between the
+two states with every sample.
+
+Requests only read the state that the last sample left behind, so
+the check costs a dict increment per request. Requests are classified
+by peek_action() before their body is parsed, so that shed requests
+cost no parsing. Bodies that name "action" more than once, such as
+in their payload, are admitted only once parsed, by action_kind() of
+their action; the regular expression cannot tell which of the fields
+is the request's own. Either way, each request is admitted once.
+
+@author: paepcke
+'''
+import re
+import time
+
+import tornado.ioloop
+
+
+# "action" : "<action>":
+ACTION_PATTERN = re.compile(r'"action"\s*:\s*"(\w+)"')
+# "action" as a field name, whatever its value:
+ACTION_NAME_PATTERN = re.compile(r'"action"\s*:')
+
+def action_kind(action):
+    '''
+    :param action: a request's action, in lower case
+    :type action: str
+    :return: the kind of request, for admit(): 'subscribe' or
+        'unsubscribe' for those actions, else 'publish'
+    :rtype: str
+    '''
+    return action if action in ('subscribe', 'unsubscribe') else 'publish'
+
+def peek_action(body):
+    '''
+    Find the kind of a request, for admit(), without parsing its body.
+    Requests whose action is not found count as publish requests.
+
+    :param body: a request body
+    :type body: str
+    :return: 'publish', 'subscribe', or 'unsubscribe'; None if the
+        body names "action" more than once, so that the kind is
+        only known once the body is parsed
+    :rtype: {str | None}
+    '''
+    if len(ACTION_NAME_PATTERN.findall(body)) > 1:
+        return None
+    match = ACTION_PATTERN.search(body)
+    return action_kind(match.group(1).lower()) if match is not None else 'publish'
+
+
+class AdmissionController(object):
+    '''
+    Usage:
+        controller = AdmissionController(max_loop_lag_ms=500)
+        controller.add_signal('in_flight', engine_in_flight, 10000)
+        controller.start()
+        ...
+        retry_after = controller.admit('publish')
+        if retry_after > 0:
+            ... respond 503, with Retry-After ...
+    '''
+
+    LOOP_LAG = 'loop_lag_ms'
+
+    # Kinds of requests, and decisions, by which admit() counts:
+    KINDS = ('publish', 'subscribe', 'unsubscribe')
+    DECISIONS = ('admitted', 'shed')
+
+    def __init__(self,
+                 max_loop_lag_ms=None,
+                 low_fraction=0.5,
+                 interval=0.1,
+                 min_shed_seconds=1,
+                 publish_retry_after=1,
+                 subscribe_retry_after=5,
+                 max_subscribe_retry_after=300,
+                 on_change=None,
+                 clock=time.time):
+        '''
+        :param max_loop_lag_ms: high watermark of the IOLoop's lag; None: lag is
+            sampled, but does not cause shedding
+        :type max_loop_lag_ms: {int | float | None}
+        :param low_fraction: low watermarks are this fraction of the high ones
+        :type low_fraction: float
+        :param interval: seconds between samples of the signals
+        :type interval: float
+        :param min_shed_seconds: shortest time that shedding lasts
+        :type min_shed_seconds: float
+        :param publish_retry_after: seconds after which shed publish requests may retry
+        :type publish_retry_after: float
+        :param subscribe_retry_after: least seconds after which shed subscribe
+            requests may retry. The hint grows to twice the time that
+            shedding has lasted, up to max_subscribe_retry_after.
+        :type subscribe_retry_after: float
+        :param max_subscribe_retry_after: largest back-off hint for subscribe requests
+        :type max_subscribe_retry_after: float
+        :param on_change: called with (shedding, {signal : value}) when
+            shedding starts or ends
+        :type on_change: {callable | None}
+        :param clock: returns the current time in seconds
+        :type clock: callable
+        :raise ValueError: if low_fraction is not between 0 and 1
+        '''
+        if not 0 < low_fraction <= 1:
+            raise ValueError('Low watermark fraction must be above 0, and at most 1; was %s' % low_fraction)
+        self.low_fraction = low_fraction
+        self.interval = interval
+        self.min_shed_seconds = min_shed_seconds
+        self.publish_retry_after = publish_retry_after
+        self.subscribe_retry_after = subscribe_retry_after
+        self.max_subscribe_retry_after = max_subscribe_retry_after
+        self.on_change = on_change
+        self.clock = clock
+
+        # Signal --> function that samples it; the loop lag is
+        # measured by tick() itself:
+        self.samplers = {}
+        # Signal --> high watermark, or None:
+        self.watermarks = {AdmissionController.LOOP_LAG : max_loop_lag_ms or None}
+        # Signal --> value at the last sample:
+        self.values = {AdmissionController.LOOP_LAG : 0}
+
+        self.shedding = False
+        # Time at which shedding started:
+        self.shed_since = None
+        self.shed_episodes_counter = 0
+        # (kind, decision) --> requests:
+        self.decision_counters = {(kind, decision) : 0
+                                  for kind in AdmissionController.KINDS
+                                  for decision in AdmissionController.DECISIONS}
+        self.io_loop = None
+        self.timeout = None
+        self.due_at = None
+
+    def add_signal(self, name, sample, high_watermark):
+        '''
+        :param name: the signal's name, as exported in metrics
+        :type name: str
+        :param sample: returns the signal's current value
+        :type sample: callable
+        :param high_watermark: value at which shedding starts; None or 0:
+            the signal is sampled, but does not cause shedding
+        :type high_watermark: {int | float | None}
+        '''
+        self.samplers[name] = sample
+        self.watermarks[name] = high_watermark or None
+        self.values[name] = sample()
+
+    def start(self):
+        '''
+        Start sampling on the current IOLoop.
+        '''
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        self.schedule()
+
+    def stop(self):
+        if self.timeout is not None:
+            self.io_loop.remove_timeout(self.timeout)
+            self.timeout = None
+
+    def admit(self, kind):
+        '''
+        Decide whether to admit a request, and count the decision.
+
+        :param kind: 'publish', 'subscribe', or 'unsubscribe'
+        :type kind: str
+        :return: 0 if the request is admitted, else seconds after which to retry
+        :rtype: float
+        '''
+        if not self.shedding or kind == 'unsubscribe':
+            self.decision_counters[(kind, 'admitted')] += 1
+            return 0
+        self.decision_counters[(kind, 'shed')] += 1
+        if kind == 'subscribe':
+            return min(max(self.subscribe_retry_after, 2 * (self.clock() - self.shed_since)),
+                       self.max_subscribe_retry_after)
+        return self.publish_retry_after
+
+    def sample(self, loop_lag_ms=0):
+        '''
+        Sample the signals, and start or end shedding. Called by
+        tick() every interval seconds.
+
+        :param loop_lag_ms: milliseconds by which the IOLoop was late
+        :type loop_lag_ms: float
+        '''
+        values = self.values
+        values[AdmissionController.LOOP_LAG] = loop_lag_ms
+        for (name, sample) in self.samplers.items():
+            values[name] = sample()
+        if not self.shedding:
+            for (name, high) in self.watermarks.items():
+                if high is not None and values[name] >= high:
+                    self.change(True)
+                    return
+        elif self.clock() - self.shed_since >= self.min_shed_seconds:
+            for (name, high) in self.watermarks.items():
+                if high is not None and values[name] >= high * self.low_fraction:
+                    return
+            self.change(False)
+
+    def stats(self):
+        '''
+        :return: whether requests are shed, the signals at the
+            last sample, and the counts of shedding episodes and
+            of shed requests
+        :rtype: {str : <any>}
+        '''
+        stats = {'shedding' : self.shedding,
+                 'shed_episodes' : self.shed_episodes_counter,
+                 'shed_requests' : sum(self.decision_counters[(kind, 'shed')]
+                                       for kind in AdmissionController.KINDS)}
+        stats.update(self.values)
+        return stats
+
+    # -------------------------------- Private Methods ---------
+
+    def schedule(self):
+        self.due_at = self.clock() + self.interval
+        self.timeout = self.io_loop.call_later(self.interval, self.tick)
+
+    def tick(self):
+        '''
+        Timer callback: the time by which it is late is the time
+        that other callbacks kept the IOLoop busy.
+        '''
+        self.sample(max(self.clock() - self.due_at, 0) * 1000)
+        self.schedule()
+
+    def change(self, shedding):
+        self.shedding = shedding
+        if shedding:
+            self.shed_since = self.clock()
+            self.shed_episodes_counter += 1
+        if self.on_change is not None:
+            self.on_change(shedding, dict(self.values))
@@ -0,0 +1,234 @@
+'''
+Created on Oct 17, 2026
+
+Authentication data of the LTI-SchoolBus bridge, prepared for
+checking requests quickly and safely:
+
+   AuthIndex     - immutable map from bus topic to the LTI key and
+                   secret that are authorized for it. Built once per
+                   version of the config file. Keys and secrets are
+                   compared in constant time, so response times do
+                   not reveal how much of a guess was right.
+   ConfigWatcher - polls a file's modification time, size, and inode
+                   from the IOLoop, and reports changes. Reloading the
+                   config file is thus never triggered by a request.
+
+The config file maps topics to key and secret:
+
+    {"studentAction" : {"ltiKey" : "ltiKey", "ltiSecret" : "ltiSecret"}}
+
+Topics in the config file may be patterns, such as studentAction.#,
+which grant access to all topics and topic patterns they match
+(see topic_matcher.py).
+
+@author: paepcke
+'''
+import hmac
+import json
+import logging
+import os
+
+from jsmin import jsmin
+import tornado.ioloop
+
+from ltischoolbus.topic_matcher import TopicMatcher, is_pattern
+
+
+class AuthIndex(object):
+    '''
+    Usage:
+        index = AuthIndex.from_file('/home/me/.ssh/ltibridge.cnf')
+        if index.check('studentAction', given_key, given_secret):
+            ...
+
+    Instances are not changed after construction. A new
+    version of the config file gets a new AuthIndex.
+    '''
+
+    def __init__(self, auth_dict, version=None):
+        '''
+        :param auth_dict: topic --> {'ltiKey' : <key>, 'ltiSecret' : <secret>}.
+            Topics whose entry lacks the key or the secret are left out.
+        :type auth_dict: {str : {str : str}}
+        :param version: identifies the config file version, such as its
+            modification time
+        :type version: <any>
+        :raise ValueError: if auth_dict is not a dict
+        '''
+        if not isinstance(auth_dict, dict):
+            raise ValueError('Authentication info must map topics to key and secret: %s' % str(auth_dict))
+        self.version = version
+        # Topic --> (key, secret) as UTF-8 strings, which
+        # hmac.compare_digest() can compare:
+        self.credentials_by_topic = {}
+        # The topics in credentials_by_topic that are patterns:
+        self.pattern_grants = TopicMatcher()
+        # Topics whose config entry is ill-formed:
+        self.bad_topics = []
+        for (topic, auth_entry) in auth_dict.items():
+            try:
+                credentials = (self.as_bytes(auth_entry['ltiKey']),
+                               self.as_bytes(auth_entry['ltiSecret']))
+                if is_pattern(topic):
+                    self.pattern_grants.add(topic)
+            except (KeyError, TypeError, ValueError):
+                self.bad_topics.append(topic)
+                continue
+            self.credentials_by_topic[topic] = credentials
+
+    @classmethod
+    def from_file(cls, path):
+        '''
+        Read a config file. C/C++ style comments are allowed.
+
+        :param path: config file
+        :type path: str
+        :return: index of the file's content, with the file's
+            modification time as version
+        :rtype: AuthIndex
+        :raise IOError: if the file cannot be read
+        :raise ValueError: if the file is not a JSON object
+        '''
+        (auth_dict, mod_time) = read_config(path)
+        return cls(auth_dict, version=mod_time)
+
+    def check(self, topic, key, secret):
+        '''
+        :param topic: topic or topic pattern
+        :type topic: str
+        :return: True if key and secret are the ones on file for
+            topic, or for a pattern that matches topic, else False
+        :rtype: bool
+        '''
+        try:
+            key = self.as_bytes(key)
+            secret = self.as_bytes(secret)
+        except TypeError:
+            # Key or secret were not strings:
+            return False
+        granted = False
+        for grant in self.grants(topic):
+            (key_on_file, secret_on_file) = self.credentials_by_topic[grant]
+            # Compare both, so that time does not tell
+            # which of the two was wrong:
+            key_ok = hmac.compare_digest(key_on_file, key)
+            secret_ok = hmac.compare_digest(secret_on_file, secret)
+            granted |= key_ok & secret_ok
+        return granted
+
+    def credentials(self, topic):
+        '''
+        :return: (key, secret) on file for topic, or else for
+            the most specific pattern that matches topic, or None
+        :rtype: {(str, str) | None}
+        '''
+        grants = self.grants(topic)
+        return self.credentials_by_topic[grants[0]] if grants else None
+
+    def grants(self, topic):
+        '''
+        :return: topic itself if it is in the config file, and the
+            patterns in the config file that match topic
+        :rtype: [str]
+        '''
+        grants = list(self.pattern_grants.match(topic))
+        if topic in self.credentials_by_topic and topic not in grants:
+            grants.insert(0, topic)
+        return grants
+
+    def topics(self):
+        return self.credentials_by_topic.keys()
+
+    def __contains__(self, topic):
+        '''
+        :return: True if any config file entry grants access
+            to topic, else False
+        '''
+        return topic in self.credentials_by_topic or len(self.pattern_grants.match(topic)) > 0
+
+    def __len__(self):
+        return len(self.credentials_by_topic)
+
+    # -------------------------------- Private Methods ---------
+
+    def as_bytes(self, value):
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        if not isinstance(value, str):
+            raise TypeError('Expected a string; got %s' % type(value))
+        return value
+
+
+def read_config(path):
+    '''
+    Read a config file. C/C++ style comments are allowed.
+
+    :param path: config file
+    :type path: str
+    :return: the file's content, and its modification time
+    :rtype: (<any>, float)
+    :raise IOError: if the file cannot be read
+    :raise ValueError: if the file is not JSON
+    '''
+    with open(path, 'r') as conf_fd:
+        mod_time = os.fstat(conf_fd.fileno()).st_mtime
+        return (json.loads(jsmin(conf_fd.read())), mod_time)
+
+
+class ConfigWatcher(object):
+    '''
+    Calls on_change(path) on the IOLoop whenever the
+    modification time, size, or inode of path change.
+    The file is polled every interval seconds.
+    '''
+
+    def __init__(self, path, on_change, interval=2, io_loop=None):
+        '''
+        :param path: file to watch
+        :type path: str
+        :param on_change: called with path after the file changed
+        :type on_change: callable
+        :param interval: seconds between polls
+        :type interval: {int | float}
+        :param io_loop: loop that runs the polls. Default: current IOLoop
+        :type io_loop: {IOLoop | None}
+        '''
+        self.path = path
+        self.on_change = on_change
+        self.logger = logging.getLogger('ltibridge')
+        self.file_signature = self.signature()
+        self.poller = tornado.ioloop.PeriodicCallback(self.poll, interval * 1000, io_loop=io_loop)
+
+    def start(self):
+        self.poller.start()
+
+    def stop(self):
+        self.poller.stop()
+
+    def poll(self):
+        '''
+        Check the file once; called periodically.
+
+        :return: True if the file changed since the last poll, else False
+        :rtype: bool
+        '''
+        signature = self.signature()
+        if signature == self.file_signature:
+            return False
+        self.file_signature = signature
+        if signature is not None:
+            try:
+                self.on_change(self.path)
+            except Exception as e:
+                self.logger.error('Could not process change of %s: %s', self.path, e)
+        return True
+
+    # -------------------------------- Private Methods ---------
+
+    def signature(self):
+        try:
+            statinfo = os.stat(self.path)
+        except OSError:
+            # Absent, or being replaced:
+            return None
+        return (statinfo.st_mtime, statinfo.st_size, statinfo.st_ino)
@@ -0,0 +1,432 @@
+'''
+Created on Oct 17, 2026
+
+Persistent HTTP(S) connections for delivering bus messages
+to LTI consumers. Tornado's own simple_httpclient sends
+'Connection: close' with every request, so each delivery pays
+for a new TCP and TLS handshake. Our subscribers are a few LMS
+hosts that receive many messages per minute; keeping
+connections to them open avoids most of those handshakes.
+
+ConnectionPool keeps idle, kept-alive connections per origin
+(scheme, host, port). PooledHTTPClient speaks just enough
+HTTP/1.1 over those connections to POST deliveries, and offers
+the same fetch() interface as AsyncHTTPClient, so it can be
+handed to a DeliveryEngine.
+
+@author: paepcke
+'''
+from collections import deque
+import datetime
+import re
+import select
+import socket
+import ssl
+import time
+import urlparse
+
+import certifi
+from tornado import gen
+from tornado.escape import native_str, utf8
+from tornado.httpclient import HTTPResponse, HTTPError
+from tornado.httputil import HTTPHeaders, parse_response_start_line
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+import tornado.ioloop
+
+try:
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    from io import BytesIO
+
+
+class PooledConnection(object):
+    '''
+    One open connection to an origin, together with the
+    bookkeeping the pool needs to decide whether it may
+    be reused.
+    '''
+    __slots__ = ('origin', 'stream', 'created', 'last_used', 'requests_served')
+
+    def __init__(self, origin, stream):
+        self.origin = origin
+        self.stream = stream
+        self.created = time.time()
+        self.last_used = self.created
+        self.requests_served = 0
+
+    def close(self):
+        self.stream.close()
+
+    def is_healthy(self):
+        '''
+        An idle keep-alive connection should have nothing to
+        read. If the socket is readable, the server either
+        closed it (EOF), or sent something we never asked for;
+        either way the connection must not be reused.
+        '''
+        if self.stream.closed():
+            return False
+        try:
+            readable, _, _ = select.select([self.stream.fileno()], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return False
+        return not readable
+
+
+class ConnectionPool(object):
+    '''
+    Per-origin pool of idle, kept-alive connections. Callers
+    acquire() a connection, use it for one request/response
+    exchange, and release() it, indicating whether the exchange
+    left the connection reusable.
+
+    Idle connections are evicted when they have been idle
+    longer than idle_timeout, when they fail the health check
+    at acquire time, when they have served max_requests
+    requests, or when their origin already has max_size idle
+    connections on release.
+
+    Statistics:
+        hits      - acquire() returned a pooled connection
+        misses    - acquire() had to open a new connection
+        evictions - idle connections closed by the pool
+        opened    - connections established in total
+        idle      - connections currently waiting in the pool
+    '''
+
+    def __init__(self,
+                 max_size=10,
+                 idle_timeout=30,
+                 max_requests=1000,
+                 connect_timeout=5,
+                 validate_cert=True,
+                 ssl_options=None,
+                 io_loop=None):
+        '''
+        :param max_size: maximum number of idle connections kept per origin
+        :type max_size: int
+        :param idle_timeout: seconds after which an unused connection is closed
+        :type idle_timeout: {int | float}
+        :param max_requests: number of requests after which a connection is retired
+        :type max_requests: int
+        :param connect_timeout: seconds to wait for TCP plus TLS set-up
+        :type connect_timeout: {int | float}
+        :param validate_cert: whether to verify the servers' certificates.
+            Ignored if ssl_options is provided.
+        :type validate_cert: bool
+        :param ssl_options: dict of ssl.wrap_socket() arguments, or an SSLContext
+        :type ssl_options: {dict | ssl.SSLContext | None}
+        :param io_loop: loop that runs the idle sweeps. Default: current IOLoop
+        :type io_loop: {IOLoop | None}
+        '''
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.connect_timeout = connect_timeout
+        if ssl_options is None:
+            if validate_cert:
+                ssl_options = {'cert_reqs' : ssl.CERT_REQUIRED,
+                               'ca_certs' : certifi.where()}
+            else:
+                ssl_options = {'cert_reqs' : ssl.CERT_NONE}
+        self.ssl_options = ssl_options
+        self.io_loop = io_loop if io_loop is not None else tornado.ioloop.IOLoop.current()
+        self.tcp_client = TCPClient()
+
+        # Origin --> deque of idle PooledConnection; most
+        # recently used at the right end:
+        self.idle = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.opened = 0
+
+        # Sweep out idle connections regularly, so that we
+        # close them before the servers do:
+        self.sweeper = tornado.ioloop.PeriodicCallback(self.evict_idle,
+                                                       max(1, self.idle_timeout / 2.) * 1000,
+                                                       io_loop=self.io_loop)
+        self.sweeper.start()
+
+    @gen.coroutine
+    def acquire(self, origin):
+        '''
+        Return a connection to origin, either from the
+        pool or newly opened.
+
+        :param origin: (scheme, host, port) triple
+        :type origin: (str, str, int)
+        :return: Future that resolves to a PooledConnection
+        :raise StreamClosedError, socket.error, ssl.SSLError, gen.TimeoutError
+        '''
+        idle_conns = self.idle.get(origin, None)
+        while idle_conns:
+            conn = idle_conns.pop()
+            if not idle_conns:
+                del self.idle[origin]
+            if time.time() - conn.last_used < self.idle_timeout and conn.is_healthy():
+                self.hits += 1
+                raise gen.Return(conn)
+            self.evict(conn)
+            idle_conns = self.idle.get(origin, None)
+
+        self.misses += 1
+        (scheme, host, port) = origin
+        connect_future = self.tcp_client.connect(host,
+                                                 port,
+                                                 ssl_options=self.ssl_options if scheme == 'https' else None)
+        try:
+            stream = yield gen.with_timeout(datetime.timedelta(seconds=self.connect_timeout), connect_future)
+        except gen.TimeoutError:
+            # The connect carries on; close its stream should it
+            # still succeed, rather than leak the socket:
+            self.io_loop.add_future(connect_future, self.close_late_stream)
+            raise
+        self.opened += 1
+        raise gen.Return(PooledConnection(origin, stream))
+
+    def release(self, conn, reusable):
+        '''
+        Return a connection after use. Connections that are
+        not reusable, have served their quota of requests, or
+        would exceed the pool's max_size are closed.
+
+        :param conn: connection obtained from acquire()
+        :type conn: PooledConnection
+        :param reusable: whether the last exchange left the connection
+            in a state where another request may be sent
+        :type reusable: bool
+        '''
+        conn.requests_served += 1
+        if not reusable or conn.stream.closed():
+            conn.close()
+            return
+        if conn.requests_served >= self.max_requests:
+            self.evict(conn)
+            return
+        idle_conns = self.idle.setdefault(conn.origin, deque())
+        if len(idle_conns) >= self.max_size:
+            self.evict(conn)
+            return
+        conn.last_used = time.time()
+        idle_conns.append(conn)
+
+    def evict(self, conn):
+        self.evictions += 1
+        conn.close()
+
+    def close_late_stream(self, connect_future):
+        '''
+        Called when a connect that acquire() gave up on finishes.
+        '''
+        if connect_future.exception() is None:
+            connect_future.result().close()
+
+    def evict_idle(self):
+        '''
+        Close all idle connections that are past their
+        idle timeout, or were closed by the server.
+        '''
+        cutoff = time.time() - self.idle_timeout
+        for origin in list(self.idle.keys()):
+            keep = deque()
+            for conn in self.idle[origin]:
+                if conn.last_used > cutoff and not conn.stream.closed():
+                    keep.append(conn)
+                else:
+                    self.evict(conn)
+            if keep:
+                self.idle[origin] = keep
+            else:
+                del self.idle[origin]
+
+    def stats(self):
+        '''
+        :return: counters that show how well the pool is working
+        :rtype: {str : int}
+        '''
+        return {'hits' : self.hits,
+                'misses' : self.misses,
+                'evictions' : self.evictions,
+                'opened' : self.opened,
+                'idle' : sum(len(conns) for conns in self.idle.values())}
+
+    def close(self):
+        '''
+        Stop the idle sweeps, and close all idle connections.
+        '''
+        self.sweeper.stop()
+        for idle_conns in self.idle.values():
+            for conn in idle_conns:
+                conn.close()
+        self.idle = {}
+
+
+class PooledHTTPClient(object):
+    '''
+    Minimal HTTP/1.1 client that sends requests over kept-alive
+    connections from a ConnectionPool. Implements the part of
+    the AsyncHTTPClient interface that DeliveryEngine uses:
+
+        fetch(request, raise_error=False) --> Future(HTTPResponse)
+        close()
+
+    Failures that never got a response, such as refused
+    connections and timeouts, produce responses with code 599,
+    just as AsyncHTTPClient does.
+    '''
+
+    HEADER_END = re.compile(b'\r?\n\r?\n')
+    MAX_HEADER_SIZE = 65536
+    # Used for requests that do not specify request_timeout,
+    # same as AsyncHTTPClient's default:
+    DEFAULT_REQUEST_TIMEOUT = 20
+
+    def __init__(self, pool):
+        '''
+        :param pool: source of connections
+        :type pool: ConnectionPool
+        '''
+        self.pool = pool
+
+    @gen.coroutine
+    def fetch(self, request, raise_error=False):
+        '''
+        Send request, and return its response.
+
+        :param request: the request; only request.url, method, headers,
+            body, and request_timeout are used.
+        :type request: tornado.httpclient.HTTPRequest
+        :param raise_error: if True, non-2xx responses raise HTTPError
+        :type raise_error: bool
+        :return: Future that resolves to an HTTPResponse
+        '''
+        start_time = time.time()
+        parsed_url = urlparse.urlsplit(request.url)
+        scheme = parsed_url.scheme.lower()
+        port = parsed_url.port or (443 if scheme == 'https' else 80)
+        origin = (scheme, parsed_url.hostname, port)
+
+        # A pooled connection that the server has closed in the
+        # meantime fails on first use, before the server saw our
+        # request. Such failures are retried once on a fresh connection:
+        attempts_left = 2
+        while True:
+            attempts_left -= 1
+            conn = None
+            try:
+                conn = yield self.pool.acquire(origin)
+                was_reused = conn.requests_served > 0
+                (start_line, headers, body, reusable) = yield gen.with_timeout(
+                    datetime.timedelta(seconds=request.request_timeout or PooledHTTPClient.DEFAULT_REQUEST_TIMEOUT),
+                    self.exchange(conn, parsed_url, request),
+                    quiet_exceptions=(StreamClosedError,))
+            except StreamClosedError as e:
+                if conn is not None:
+                    conn.close()
+                if conn is not None and was_reused and attempts_left > 0:
+                    continue
+                response = self.error_response(request, e.real_error or e, start_time)
+            except Exception as e:
+                if conn is not None:
+                    conn.close()
+                response = self.error_response(request, e, start_time)
+            else:
+                self.pool.release(conn, reusable)
+                response = HTTPResponse(request,
+                                        start_line.code,
+                                        reason=start_line.reason,
+                                        headers=headers,
+                                        buffer=BytesIO(body),
+                                        effective_url=request.url,
+                                        request_time=time.time() - start_time)
+            break
+
+        if raise_error and response.error is not None:
+            raise response.error
+        raise gen.Return(response)
+
+    def close(self):
+        self.pool.close()
+
+    # -------------------------------- Private Methods ---------
+
+    @gen.coroutine
+    def exchange(self, conn, parsed_url, request):
+        '''
+        Write one request to the connection's stream, and read
+        the response.
+
+        :return: Future that resolves to tuple (start_line, headers, body, reusable)
+        '''
+        stream = conn.stream
+        path = parsed_url.path or '/'
+        if parsed_url.query:
+            path += '?' + parsed_url.query
+        body = utf8(request.body) if request.body is not None else b''
+
+        header_lines = ['%s %s HTTP/1.1' % (request.method, path),
+                        'Host: %s' % parsed_url.netloc,
+                        'Connection: keep-alive',
+                        'Content-Length: %s' % len(body)]
+        # HTTPRequest keeps plain dicts as given, so normalize:
+        for (name, value) in HTTPHeaders(request.headers).get_all():
+            if name.lower() not in ('host', 'connection', 'content-length'):
+                header_lines.append('%s: %s' % (name, value))
+        stream.write(utf8('\r\n'.join(header_lines)) + b'\r\n\r\n' + body)
+
+        while True:
+            header_data = yield stream.read_until_regex(PooledHTTPClient.HEADER_END,
+                                                        max_bytes=PooledHTTPClient.MAX_HEADER_SIZE)
+            header_data = native_str(header_data.decode('latin1')).lstrip('\r\n')
+            (first_line, _, header_rest) = header_data.partition('\n')
+            start_line = parse_response_start_line(first_line.rstrip('\r'))
+            headers = HTTPHeaders.parse(header_rest)
+            # Skip interim responses, such as '100 Continue':
+            if not 100 <= start_line.code < 200:
+                break
+
+        connection_header = headers.get('Connection', '').lower()
+        if start_line.version == 'HTTP/1.1':
+            reusable = connection_header != 'close'
+        else:
+            reusable = connection_header == 'keep-alive'
+
+        if request.method == 'HEAD' or start_line.code in (204, 304):
+            body = b''
+        elif headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = yield self.read_chunked_body(stream)
+        elif 'Content-Length' in headers:
+            body = yield stream.read_bytes(int(headers['Content-Length']))
+        else:
+            # Body runs until the server closes the connection:
+            body = yield stream.read_until_close()
+            reusable = False
+
+        raise gen.Return((start_line, headers, body, reusable))
+
+    @gen.coroutine
+    def read_chunked_body(self, stream):
+        chunks = []
+        while True:
+            size_line = yield stream.read_until(b'\r\n', max_bytes=1024)
+            chunk_size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if chunk_size == 0:
+                # Skip optional trailers up to the final empty line:
+                while True:
+                    trailer_line = yield stream.read_until(b'\r\n', max_bytes=PooledHTTPClient.MAX_HEADER_SIZE)
+                    if trailer_line == b'\r\n':
+                        break
+                raise gen.Return(b''.join(chunks))
+            chunk = yield stream.read_bytes(chunk_size + 2)
+            chunks.append(chunk[:-2])
+
+    def error_response(self, request, error, start_time):
+        if not isinstance(error, HTTPError):
+            error = HTTPError(599, str(error) or error.__class__.__name__)
+        return HTTPResponse(request,
+                            599,
+                            error=error,
+                            request_time=time.time() - start_time)
@@ -0,0 +1,208 @@
+'''
+Created on Oct 17, 2026
+
+Suppression of duplicate publish requests. LMSs that time out
+waiting for the bridge retry the request, and the event reaches
+the bus twice. Publishers may therefore give each publish request,
+or each event of a bulk publish, an idempotency key:
+
+    {"ltiKey" : "...", "ltiSecret" : "...", "action" : "publish",
+     "bus_topic" : "studentAction",
+     "idempotency_key" : "a8098c1a-f86e-11da-bd1a-00112444be1e",
+     "payload" : {...}}
+
+A request whose key the bridge saw with the same LTI key and topic
+within the last ttl seconds is answered with status 200, and
+"duplicate" : true, but not published again. For topics whose config
+file entry has "dedup_by_payload" : true, requests without a key are
+keyed by a hash of topic and payload, so that the same payload is
+published to such a topic at most once per ttl seconds. The payload
+is hashed in canonical form, with its fields sorted, so that the
+order in which a publisher happens to send them makes no difference.
+
+   DedupTopics - the topics that are deduplicated by payload, in one
+                 version of the config file, like AuthIndex.
+   DedupCache  - the keys seen recently; lives as long as the bridge.
+
+The cache holds SHA-1 digests of the keys, so each entry takes the
+same, small amount of memory, whatever the length of its key: about
+250 bytes. The number of entries is capped; when the cache is full,
+the least recently seen key is evicted. Keys of failed publishes are
+removed again with discard(), so that the retry goes through.
+
+@author: paepcke
+'''
+from collections import OrderedDict
+import hashlib
+import time
+
+from ltischoolbus.topic_matcher import TopicMatcher, is_pattern
+
+
+def dedup_key(*parts):
+    '''
+    :param parts: the strings that identify a request, such as
+        LTI key, topic, and idempotency key
+    :type parts: {str | unicode}
+    :return: the key under which DedupCache remembers the request
+    :rtype: str
+    '''
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        digest.update(part)
+        # Keep ('ab', 'c') apart from ('a', 'bc'):
+        digest.update('\0')
+    return digest.digest()
+
+
+class DedupTopics(object):
+    '''
+    Usage:
+        topics = DedupTopics(config_dict)
+        topics.by_payload('studentAction')     # --> True or False
+
+    Instances are not changed after construction.
+    '''
+
+    def __init__(self, config_dict):
+        '''
+        :param config_dict: the config file's content: topic --> entry
+        :type config_dict: {str : {str : <any>}}
+        '''
+        self.topics = set()
+        # The topics in topics that are patterns:
+        self.pattern_topics = TopicMatcher()
+        # (topic, error message) of ill-formed entries, which are left out:
+        self.bad_entries = []
+        if not isinstance(config_dict, dict):
+            return
+        for (topic, entry) in config_dict.items():
+            if not isinstance(entry, dict) or 'dedup_by_payload' not in entry:
+                continue
+            if not isinstance(entry['dedup_by_payload'], bool):
+                self.bad_entries.append((topic, 'dedup_by_payload must be true or false; was %s' % entry['dedup_by_payload']))
+                continue
+            if entry['dedup_by_payload']:
+                self.topics.add(topic)
+                if is_pattern(topic):
+                    self.pattern_topics.add(topic)
+
+    def by_payload(self, topic):
+        '''
+        :return: True if requests to topic without an idempotency
+            key are deduplicated by payload: topic's own config entry,
+            or a pattern entry that matches topic, says so
+        :rtype: bool
+        '''
+        if len(self.topics) == 0:
+            return False
+        if topic in self.topics:
+            return True
+        return len(self.pattern_topics.match(topic)) > 0
+
+
+class DedupCache(object):
+    '''
+    Usage:
+        cache = DedupCache(ttl=300, max_entries=100000)
+        key = dedup_key(lti_key, topic, idempotency_key)
+        if not cache.add(key):
+            ... duplicate; do not publish ...
+        elif not published:
+            cache.discard(key)
+    '''
+
+    def __init__(self, ttl=300, max_entries=100000, clock=time.time):
+        '''
+        :param ttl: seconds for which a key is remembered
+        :type ttl: float
+        :param max_entries: most keys kept at any time
+        :type max_entries: int
+        :param clock: returns the current time in seconds
+        :type clock: callable
+        :raise ValueError: if ttl is not positive, or max_entries less than 1
+        '''
+        if ttl <= 0 or max_entries < 1:
+            raise ValueError('Dedup cache needs a positive TTL, and room for at least one key; was %s seconds, %s keys' %\
+                             (ttl, max_entries))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        # Key --> time at which it expires, least recently seen first:
+        self.entries = OrderedDict()
+        self.hits_counter = 0
+        self.misses_counter = 0
+        # Keys removed because they expired, or to make room:
+        self.expired_counter = 0
+        self.evicted_counter = 0
+
+    def add(self, key):
+        '''
+        Remember a key, unless it was seen less than ttl seconds ago.
+
+        :param key: result of dedup_key()
+        :type key: str
+        :return: True if the key is new, False if it is a duplicate
+        :rtype: bool
+        '''
+        now = self.clock()
+        entries = self.entries
+        expires_at = entries.pop(key, None)
+        if expires_at is not None:
+            if expires_at > now:
+                self.hits_counter += 1
+                # Most recently seen now; expiry stays as it was:
+                entries[key] = expires_at
+                return False
+            self.expired_counter += 1
+        self.misses_counter += 1
+        self.expire(now)
+        if len(entries) >= self.max_entries:
+            entries.popitem(last=False)
+            self.evicted_counter += 1
+        entries[key] = now + self.ttl
+        return True
+
+    def discard(self, key):
+        '''
+        Forget a key, such as the key of a request that could
+        not be published after all.
+        '''
+        self.entries.pop(key, None)
+
+    def stats(self):
+        '''
+        :return: keys held, lookups that found a duplicate (hits)
+            or not, the hit rate, and keys removed because they
+            expired or to make room
+        :rtype: {str : {int | float}}
+        '''
+        lookups = self.hits_counter + self.misses_counter
+        return {'entries' : len(self.entries),
+                'hits' : self.hits_counter,
+                'misses' : self.misses_counter,
+                'hit_rate' : float(self.hits_counter) / lookups if lookups > 0 else 0.0,
+                'expired' : self.expired_counter,
+                'evicted' : self.evicted_counter}
+
+    def __len__(self):
+        return len(self.entries)
+
+    # -------------------------------- Private Methods ---------
+
+    def expire(self, now):
+        '''
+        Remove expired keys from the least recently seen end. Keys
+        that were seen again since they were added may sit before
+        expired ones; those are removed when they are looked up,
+        or when the cache is full.
+        '''
+        entries = self.entries
+        while entries:
+            (key, expires_at) = next(entries.iteritems())
+            if expires_at > now:
+                return
+            del entries[key]
+            self.expired_counter += 1
@@ -0,0 +1,251 @@
+'''
+Created on Oct 17, 2026
+
+Non-blocking delivery of bus messages to LTI consumers.
+The DeliveryEngine POSTs to any number of delivery URLs
+concurrently via an asynchronous HTTP client. By default
+that client keeps connections to LTI hosts alive between
+deliveries (see connection_pool.py). The engine never blocks
+the IOLoop: requests beyond the configured limits wait in
+per-host queues, and outcomes are reported through callbacks
+that run on the IOLoop.
+
+@author: paepcke
+'''
+from collections import deque
+import functools
+import time
+import urlparse
+
+from tornado.httpclient import HTTPRequest
+import tornado.ioloop
+
+from ltischoolbus.connection_pool import ConnectionPool, PooledHTTPClient
+
+
+class Delivery(object):
+    '''
+    One pending or in-flight POST of a message body
+    to one delivery URL.
+    '''
+    __slots__ = ('url', 'host', 'body', 'headers', 'on_success', 'on_failure', 'start_time')
+
+    def __init__(self, url, host, body, headers, on_success, on_failure):
+        self.url = url
+        self.host = host
+        self.body = body
+        self.headers = headers
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.start_time = None
+
+
+class DeliveryEngine(object):
+    '''
+    Fans out POST requests to LTI delivery URLs. At most
+    max_in_flight requests are outstanding at any time
+    overall, and at most max_per_host to any one host (i.e.
+    URL netloc). Hosts with waiting requests are served
+    round-robin, so one slow LMS whose per-host quota is
+    used up does not hold back deliveries to other hosts.
+
+    Callbacks:
+        on_success(url, response)
+        on_failure(url, response)
+
+    where response is the tornado.httpclient.HTTPResponse.
+    Network level failures, such as timeouts or refused
+    connections, arrive as responses with code 599, and
+    response.error set. Any non-2xx response is a failure.
+    '''
+
+    CONTENT_TYPE_HEADERS = {'Content-Type' : 'application/json'}
+
+    def __init__(self,
+                 max_in_flight=100,
+                 max_per_host=10,
+                 request_timeout=1,
+                 idle_timeout=30,
+                 validate_cert=True,
+                 http_client=None,
+                 io_loop=None):
+        '''
+        :param max_in_flight: maximum number of concurrent POSTs overall
+        :type max_in_flight: int
+        :param max_per_host: maximum number of concurrent POSTs to one host
+        :type max_per_host: int
+        :param request_timeout: seconds to wait for each delivery to complete
+        :type request_timeout: {int | float}
+        :param idle_timeout: seconds that kept-alive connections to LTI hosts
+            may remain unused before they are closed
+        :type idle_timeout: {int | float}
+        :param validate_cert: whether delivery hosts' SSL certificates are verified
+        :type validate_cert: bool
+        :param http_client: the client to use. Default: a PooledHTTPClient
+            that keeps up to max_per_host idle connections per host.
+        :type http_client: {PooledHTTPClient | AsyncHTTPClient | None}
+        :param io_loop: loop on which callbacks are run. Default: current IOLoop
+        :type io_loop: {IOLoop | None}
+        '''
+        if max_in_flight < 1 or max_per_host < 1:
+            raise ValueError('Delivery limits must be at least 1; were max_in_flight=%s, max_per_host=%s' %\
+                             (max_in_flight, max_per_host))
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.request_timeout = request_timeout
+        self.validate_cert = validate_cert
+        self.io_loop = io_loop if io_loop is not None else tornado.ioloop.IOLoop.current()
+        if http_client is None:
+            http_client = PooledHTTPClient(ConnectionPool(max_size=max_per_host,
+                                                          idle_timeout=idle_timeout,
+                                                          validate_cert=validate_cert,
+                                                          io_loop=self.io_loop))
+        self.http_client = http_client
+        # Pool behind the client, if any, for statistics:
+        self.connection_pool = getattr(http_client, 'pool', None)
+
+        # Host --> deque of Delivery instances waiting for a slot:
+        self.pending = {}
+        # Host --> number of POSTs currently outstanding to that host:
+        self.host_in_flight = {}
+        # Hosts that have pending deliveries and spare per-host
+        # capacity, in round-robin order; the set mirrors the deque
+        # for fast membership tests:
+        self.ready_hosts = deque()
+        self.ready_set = set()
+
+        self.in_flight = 0
+        self.num_pending = 0
+
+    def deliver(self, url, body, on_success=None, on_failure=None, headers=None):
+        '''
+        Schedule one POST of body to url. Returns immediately.
+
+        :param url: delivery URL
+        :type url: str
+        :param body: POST body
+        :type body: str
+        :param on_success: called as on_success(url, response) on the IOLoop
+            after a 2xx response
+        :type on_success: {callable | None}
+        :param on_failure: called as on_failure(url, response) on the IOLoop
+            after a non-2xx response, a timeout, or a network error.
+        :type on_failure: {callable | None}
+        :param headers: HTTP headers; default: JSON content type.
+        :type headers: {{str : str} | None}
+        '''
+        host = urlparse.urlparse(url).netloc
+        delivery = Delivery(url,
+                            host,
+                            body,
+                            headers if headers is not None else DeliveryEngine.CONTENT_TYPE_HEADERS,
+                            on_success,
+                            on_failure)
+        try:
+            self.pending[host].append(delivery)
+        except KeyError:
+            self.pending[host] = deque([delivery])
+        self.num_pending += 1
+        self.mark_ready(host)
+        self.pump()
+
+    def deliver_to_all(self, urls, body, on_success=None, on_failure=None, headers=None):
+        '''
+        Schedule POSTs of the same body to each of the given URLs.
+        Parameters as for deliver().
+        '''
+        for url in urls:
+            self.deliver(url, body, on_success, on_failure, headers)
+
+    def has_capacity_for(self, url):
+        '''
+        Return True if a delivery to url would start
+        right away rather than waiting for a free slot.
+        '''
+        host = urlparse.urlparse(url).netloc
+        return self.in_flight < self.max_in_flight and\
+            self.host_in_flight.get(host, 0) < self.max_per_host and\
+            host not in self.pending
+
+    def stats(self):
+        '''
+        :return: number of deliveries in flight and waiting, plus
+            the connection pool's counters, if a pool is in use.
+        :rtype: {str : int}
+        '''
+        stats = {'in_flight' : self.in_flight,
+                 'pending' : self.num_pending}
+        if self.connection_pool is not None:
+            stats.update(self.connection_pool.stats())
+        return stats
+
+    def close(self):
+        '''
+        Release the HTTP client. Pending deliveries are dropped.
+        '''
+        self.pending = {}
+        self.ready_hosts.clear()
+        self.ready_set.clear()
+        self.num_pending = 0
+        self.http_client.close()
+
+    # -------------------------------- Private Methods ---------
+
+    def mark_ready(self, host):
+        if host not in self.ready_set and \
+           host in self.pending and \
+           self.host_in_flight.get(host, 0) < self.max_per_host:
+            self.ready_hosts.append(host)
+            self.ready_set.add(host)
+
+    def pump(self):
+        '''
+        Start waiting deliveries until either the global limit
+        is reached, or no host with waiting deliveries has
+        spare capacity.
+        '''
+        while self.in_flight < self.max_in_flight and self.ready_hosts:
+            host = self.ready_hosts.popleft()
+            self.ready_set.discard(host)
+            host_queue = self.pending[host]
+            delivery = host_queue.popleft()
+            if not host_queue:
+                del self.pending[host]
+            self.num_pending -= 1
+            self.start(delivery)
+            # Host goes to the back of the line if it has more work:
+            self.mark_ready(host)
+
+    def start(self, delivery):
+        self.in_flight += 1
+        self.host_in_flight[delivery.host] = self.host_in_flight.get(delivery.host, 0) + 1
+        delivery.start_time = time.time()
+        request = HTTPRequest(delivery.url,
+                              method='POST',
+                              body=delivery.body,
+                              headers=delivery.headers,
+                              request_timeout=self.request_timeout,
+                              validate_cert=self.validate_cert)
+        self.io_loop.add_future(self.http_client.fetch(request, raise_error=False),
+                                functools.partial(self.on_response, delivery))
+
+    def on_response(self, delivery, future):
+        self.in_flight -= 1
+        host_count = self.host_in_flight[delivery.host] - 1
+        if host_count == 0:
+            del self.host_in_flight[delivery.host]
+        else:
+            self.host_in_flight[delivery.host] = host_count
+        self.mark_ready(delivery.host)
+
+        response = future.result()
+        try:
+            if response.error is None:
+                if delivery.on_success is not None:
+                    delivery.on_success(delivery.url, response)
+            elif delivery.on_failure is not None:
+                delivery.on_failure(delivery.url, response)
+        finally:
+            # Freed slot goes to the next waiting delivery
+            # even if a callback raised:
+            self.pump()
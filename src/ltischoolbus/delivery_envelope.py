@@ -0,0 +1,47 @@
+'''
+Created on Oct 17, 2026
+
+The envelope in which a bus message is POSTed to the LTI
+consumers that subscribed to its topic:
+
+    {"time":"2026-10-17T10:01:02.123456","ltiKey":"myKey","ltiSecret":"mySecret",
+     "bus_topic":"studentAction","payload":<the bus message's content>}
+
+The payload is the message content, as a JSON string.
+build_envelope() serializes a message's envelope once, with
+proper JSON escaping, into an ASCII str. Nothing in the envelope
+differs between the subscribers of a topic, so the one str is
+shared by all of them: outbox entries, queue entries, retries,
+and batch bodies all reference it, rather than encoding it anew.
+
+@author: paepcke
+'''
+from collections import OrderedDict
+import json
+
+
+# Compact, and non-ASCII characters escaped, so that the
+# result is a byte string that needs no further encoding:
+ENVELOPE_ENCODER = json.JSONEncoder(separators=(',', ':'), ensure_ascii=True)
+
+def build_envelope(iso_time, lti_key, lti_secret, topic, payload):
+    '''
+    :param iso_time: time the bus message was created
+    :type iso_time: str
+    :param lti_key: LTI key on file for the topic
+    :type lti_key: str
+    :param lti_secret: LTI secret on file for the topic
+    :type lti_secret: str
+    :param topic: the message's bus topic
+    :type topic: str
+    :param payload: the message's content
+    :type payload: str
+    :return: the POST body
+    :rtype: str
+    :raise {TypeError | ValueError}: if a field cannot be serialized as JSON
+    '''
+    return ENVELOPE_ENCODER.encode(OrderedDict([('time', iso_time),
+                                                ('ltiKey', lti_key),
+                                                ('ltiSecret', lti_secret),
+                                                ('bus_topic', topic),
+                                                ('payload', payload)]))
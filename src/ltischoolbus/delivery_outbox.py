@@ -0,0 +1,272 @@
+'''
+Created on Oct 17, 2026
+
+Durable record of bus-message deliveries to LTI consumers.
+Every (message, delivery URL) pair is written to an SQLite
+outbox before it is POSTed, and stays there until the LTI
+consumer acknowledges it with a 2xx response. Failed
+deliveries are retried on IOLoop timers with jittered
+exponential backoff. Entries that survive a restart are
+retried when the bridge comes back up.
+
+To keep the publish path fast, inserts, retry updates, and
+acknowledgements are not committed one by one. They are
+collected in memory, and written in one transaction when
+the commit interval expires, or the batch fills up (group
+commit). An entry that is acknowledged before its insert was
+committed never touches the disk at all.
+
+@author: paepcke
+'''
+import logging
+import random
+import sqlite3
+import time
+
+import tornado.ioloop
+
+
+class DeliveryOutbox(object):
+    '''
+    SQLite-backed outbox. Usage:
+
+        entry_id = outbox.add(url, topic, body)
+        ... POST body to url ...
+        outbox.ack(entry_id)                        # on success
+        outbox.retry_later(entry_id, url, topic, body)  # on failure
+
+    When a retry comes due, the outbox calls
+    on_redeliver(entry_id, url, topic, body), which should
+    POST again, and then call ack() or retry_later() as above.
+    '''
+
+    CREATE_TABLE = '''CREATE TABLE IF NOT EXISTS outbox (
+                          id INTEGER PRIMARY KEY,
+                          url TEXT NOT NULL,
+                          topic TEXT,
+                          body BLOB NOT NULL,
+                          attempts INTEGER NOT NULL DEFAULT 0,
+                          next_attempt REAL NOT NULL
+                          )'''
+
+    def __init__(self,
+                 db_path,
+                 on_redeliver,
+                 commit_interval=0.05,
+                 max_batch=500,
+                 base_retry_delay=1,
+                 max_retry_delay=300,
+                 max_attempts=20,
+                 io_loop=None):
+        '''
+        :param db_path: SQLite file; created if absent
+        :type db_path: str
+        :param on_redeliver: called on the IOLoop as on_redeliver(entry_id, url, topic, body)
+            when a failed delivery is due for another attempt
+        :type on_redeliver: callable
+        :param commit_interval: seconds that writes may wait for
+            companions before they are committed
+        :type commit_interval: float
+        :param max_batch: number of buffered writes that triggers an
+            immediate commit
+        :type max_batch: int
+        :param base_retry_delay: seconds before the first retry
+        :type base_retry_delay: {int | float}
+        :param max_retry_delay: upper bound on the seconds between retries
+        :type max_retry_delay: {int | float}
+        :param max_attempts: number of failed attempts after which an
+            entry is abandoned; None: retry forever
+        :type max_attempts: {int | None}
+        :param io_loop: loop that runs commits and retries. Default: current IOLoop
+        :type io_loop: {IOLoop | None}
+        '''
+        self.db_path = db_path
+        self.on_redeliver = on_redeliver
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.io_loop = io_loop if io_loop is not None else tornado.ioloop.IOLoop.current()
+        self.logger = logging.getLogger('ltibridge')
+
+        self.db = sqlite3.connect(db_path)
+        # Write-ahead log: commits append to the log instead of
+        # rewriting database pages in place:
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(DeliveryOutbox.CREATE_TABLE)
+        self.db.commit()
+
+        # We hand out entry ids before the rows are written:
+        max_id = self.db.execute('SELECT MAX(id) FROM outbox').fetchone()[0]
+        self.next_id = (max_id or 0) + 1
+
+        # Writes waiting for the next group commit. Inserts are
+        # keyed by id, so an ack can cancel its insert:
+        self.pending_inserts = {}
+        self.pending_updates = {}
+        self.pending_deletes = set()
+        self.flush_timeout = None
+
+        # Entry id --> number of failed attempts so far:
+        self.attempts = {}
+        # Entry id --> IOLoop timeout handle of scheduled retries:
+        self.retry_timers = {}
+
+        self.abandoned_counter = 0
+
+    def add(self, url, topic, body):
+        '''
+        Record a delivery that is about to be attempted.
+
+        :param url: delivery URL
+        :type url: str
+        :param topic: bus topic of the message
+        :type topic: str
+        :param body: POST body
+        :type body: str
+        :return: id by which the entry is later acknowledged
+        :rtype: int
+        '''
+        entry_id = self.next_id
+        self.next_id += 1
+        self.pending_inserts[entry_id] = (entry_id, url, topic, sqlite3.Binary(body), 0, time.time())
+        self.schedule_flush()
+        return entry_id
+
+    def ack(self, entry_id):
+        '''
+        The delivery succeeded (or is to be given up);
+        forget the entry.
+
+        :param entry_id: id returned by add()
+        :type entry_id: int
+        '''
+        self.attempts.pop(entry_id, None)
+        timer = self.retry_timers.pop(entry_id, None)
+        if timer is not None:
+            self.io_loop.remove_timeout(timer)
+        self.pending_updates.pop(entry_id, None)
+        if self.pending_inserts.pop(entry_id, None) is not None:
+            # Never written; nothing to delete:
+            return
+        self.pending_deletes.add(entry_id)
+        self.schedule_flush()
+
+    def retry_later(self, entry_id, url, topic, body):
+        '''
+        The delivery failed. Schedule another attempt after
+        a jittered, exponentially growing delay. Entries that
+        have used up max_attempts are abandoned.
+
+        :return: seconds until the retry, or None if the entry was abandoned
+        :rtype: {float | None}
+        '''
+        attempts = self.attempts.get(entry_id, 0) + 1
+        if self.max_attempts is not None and attempts >= self.max_attempts:
+            self.logger.error('Giving up delivery of message on topic %s to %s after %s attempts.',
+                              topic, url, attempts)
+            self.abandoned_counter += 1
+            self.ack(entry_id)
+            return None
+        self.attempts[entry_id] = attempts
+
+        delay = self.retry_delay(attempts)
+        next_attempt = time.time() + delay
+        if entry_id in self.pending_inserts:
+            self.pending_inserts[entry_id] = (entry_id, url, topic, sqlite3.Binary(body), attempts, next_attempt)
+        else:
+            self.pending_updates[entry_id] = (attempts, next_attempt, entry_id)
+        self.schedule_flush()
+        self.schedule_retry(entry_id, url, topic, body, delay)
+        return delay
+
+    def retry_delay(self, attempts):
+        '''
+        Exponential backoff, capped at max_retry_delay, with the
+        actual delay drawn from the upper half of the interval.
+        The jitter keeps retries for many entries that failed
+        together (e.g. when an LMS went down) from arriving at
+        the LMS together.
+
+        :param attempts: number of failed attempts so far
+        :type attempts: int
+        '''
+        ceiling = min(self.max_retry_delay, self.base_retry_delay * (2 ** (attempts - 1)))
+        return random.uniform(ceiling / 2., ceiling)
+
+    def recover(self):
+        '''
+        Schedule retries for all entries left in the outbox
+        by a previous run of the bridge. Call once at startup.
+
+        :return: number of entries found
+        :rtype: int
+        '''
+        now = time.time()
+        rows = self.db.execute('SELECT id, url, topic, body, attempts, next_attempt FROM outbox').fetchall()
+        for (entry_id, url, topic, body, attempts, next_attempt) in rows:
+            self.attempts[entry_id] = attempts
+            self.schedule_retry(entry_id, url, topic, str(body), max(0, next_attempt - now))
+        return len(rows)
+
+    def flush(self):
+        '''
+        Commit all buffered writes in one transaction.
+        '''
+        if self.flush_timeout is not None:
+            self.io_loop.remove_timeout(self.flush_timeout)
+            self.flush_timeout = None
+        if not (self.pending_inserts or self.pending_updates or self.pending_deletes):
+            return
+        with self.db:
+            if self.pending_inserts:
+                self.db.executemany('INSERT INTO outbox (id, url, topic, body, attempts, next_attempt) VALUES (?,?,?,?,?,?)',
+                                    self.pending_inserts.values())
+            if self.pending_updates:
+                self.db.executemany('UPDATE outbox SET attempts=?, next_attempt=? WHERE id=?',
+                                    self.pending_updates.values())
+            if self.pending_deletes:
+                self.db.executemany('DELETE FROM outbox WHERE id=?',
+                                    [(entry_id,) for entry_id in self.pending_deletes])
+        self.pending_inserts = {}
+        self.pending_updates = {}
+        self.pending_deletes = set()
+
+    def stats(self):
+        '''
+        :return: number of entries awaiting a retry, of buffered
+            writes, and of entries given up on
+        :rtype: {str : int}
+        '''
+        return {'retrying' : len(self.retry_timers),
+                'unflushed' : len(self.pending_inserts) + len(self.pending_updates) + len(self.pending_deletes),
+                'abandoned' : self.abandoned_counter}
+
+    def close(self):
+        '''
+        Commit outstanding writes, cancel retry timers,
+        and close the database. Entries not yet acknowledged
+        remain in the outbox for recover().
+        '''
+        self.flush()
+        for timer in self.retry_timers.values():
+            self.io_loop.remove_timeout(timer)
+        self.retry_timers = {}
+        self.db.close()
+
+    # -------------------------------- Private Methods ---------
+
+    def schedule_flush(self):
+        if len(self.pending_inserts) + len(self.pending_updates) + len(self.pending_deletes) >= self.max_batch:
+            self.flush()
+        elif self.flush_timeout is None:
+            self.flush_timeout = self.io_loop.call_later(self.commit_interval, self.flush)
+
+    def schedule_retry(self, entry_id, url, topic, body, delay):
+        self.retry_timers[entry_id] = self.io_loop.call_later(delay, self.fire_retry, entry_id, url, topic, body)
+
+    def fire_retry(self, entry_id, url, topic, body):
+        del self.retry_timers[entry_id]
+        self.on_redeliver(entry_id, url, topic, body)
@@ -0,0 +1,147 @@
+'''
+Created on Oct 17, 2026
+
+The JSON codec of the bridge, the delivery receiver test
+server, and the dispatcher demos. At import, the fastest
+available implementation is picked:
+
+    ujson  -->  simplejson (with its C speedups)  -->  json (stdlib)
+
+Whichever is used, the results are the same: loads() accepts
+the raw bytes of a request body, as str, unicode, or bytearray,
+without a copy into another string first; dumps() produces
+compact, ASCII-only JSON, so it can go into HTTP bodies and bus
+messages as is.
+
+Request bodies often carry a payload that is itself JSON,
+nested as a string. parse_nested() parses such a payload once,
+and callers keep the result instead of parsing again later:
+
+    body = json_codec.loads(self.request.body)
+    payload = json_codec.parse_nested(body['payload'])
+
+Parse errors are ValueError, whatever the implementation.
+
+canonical_dumps() encodes equal values as equal text, whatever the
+order of their object fields, for hashing rather than for sending.
+
+@author: paepcke
+'''
+import json
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+def ujson_dumps(obj):
+    return ujson.dumps(obj, ensure_ascii=True, escape_forward_slashes=False)
+
+def simplejson_dumps(obj):
+    return simplejson.dumps(obj, separators=(',', ':'))
+
+def stdlib_dumps(obj):
+    return STDLIB_ENCODER.encode(obj)
+
+STDLIB_ENCODER = json.JSONEncoder(separators=(',', ':'))
+CANONICAL_ENCODER = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+# Name --> (loads, dumps), in order of preference:
+IMPLEMENTATIONS = []
+if ujson is not None:
+    IMPLEMENTATIONS.append(('ujson', (ujson.loads, ujson_dumps)))
+if simplejson is not None:
+    IMPLEMENTATIONS.append(('simplejson', (simplejson.loads, simplejson_dumps)))
+IMPLEMENTATIONS.append(('json', (json.loads, stdlib_dumps)))
+
+# Set by use():
+IMPLEMENTATION = None
+impl_loads = None
+impl_dumps = None
+
+
+def use(name=None):
+    '''
+    Switch the codec to the given implementation.
+    Used by tests to compare the implementations.
+
+    :param name: one of available(), or None for the fastest
+    :type name: {str | None}
+    :raise ValueError: if the implementation is not installed
+    '''
+    global IMPLEMENTATION, impl_loads, impl_dumps
+    if name is None:
+        name = IMPLEMENTATIONS[0][0]
+    for (impl_name, (loads_fn, dumps_fn)) in IMPLEMENTATIONS:
+        if impl_name == name:
+            IMPLEMENTATION = name
+            impl_loads = loads_fn
+            impl_dumps = dumps_fn
+            return
+    raise ValueError('JSON implementation %s is not installed; available: %s' % (name, available()))
+
+def available():
+    '''
+    :return: names of the installed implementations, fastest first
+    :rtype: [str]
+    '''
+    return [name for (name, _fns) in IMPLEMENTATIONS]
+
+def loads(data):
+    '''
+    :param data: JSON text, such as a request body
+    :type data: {str | unicode | bytearray}
+    :return: the parsed value
+    :rtype: <any>
+    :raise ValueError: if data is not proper JSON
+    '''
+    if isinstance(data, bytearray):
+        data = bytes(data)
+    return impl_loads(data)
+
+def dumps(obj):
+    '''
+    :param obj: value to encode
+    :type obj: <any>
+    :return: compact JSON, with non-ASCII characters escaped
+    :rtype: str
+    '''
+    return impl_dumps(obj)
+
+def canonical_dumps(obj):
+    '''
+    :param obj: value to encode, such as a parsed payload
+    :type obj: <any>
+    :return: compact, ASCII-only JSON with object fields sorted,
+        by the stdlib encoder whatever the implementation in use
+    :rtype: str
+    '''
+    return CANONICAL_ENCODER.encode(obj)
+
+def parse_nested(value):
+    '''
+    Parse a JSON document that was nested, as a string, inside
+    a parsed one, such as the payload field of a request.
+    Objects and arrays are already parsed, and are returned
+    as they are.
+
+    :param value: a field of a parsed JSON object
+    :type value: <any>
+    :return: the parsed value
+    :rtype: {dict | list | <any>}
+    :raise ValueError: if value is a string that is not proper
+        JSON, or is neither string, object, nor array
+    '''
+    if isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, basestring):
+        return impl_loads(value)
+    raise ValueError('Expected a JSON string, object, or array; was %s' % type(value).__name__)
+
+
+use()
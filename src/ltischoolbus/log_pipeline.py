@@ -0,0 +1,197 @@
+'''
+Created on Oct 17, 2026
+
+Logging that does not hold up the IOLoop. The bridge's log
+file handler rotates, flushes, and writes to disk; all of that
+used to happen in the thread that logged, i.e. mostly on the
+IOLoop. Here, a QueueingHandler takes its place on the logger:
+
+    LTISchoolbusBridge.logger -> QueueingHandler -> queue -> writer thread
+                                                            -> TimedRotatingFileHandler
+
+Logging a record only appends it to a bounded queue. The writer
+thread formats the record, and passes it on to the file handler,
+which rotates as before. Callers log with arguments, as in
+
+    logger.error('POST called without payload field: %s', postBodyDict)
+
+so that the message is only formatted on the writer thread,
+and not at all if the level is disabled. If the writer falls
+behind and the queue is full, records are dropped rather than
+waited for; the number dropped is logged once there is room.
+
+A RateLimitFilter on the QueueingHandler limits each category
+of record, i.e. each combination of logger, level, and message
+template, to a steady rate with bursts. A flood of bad requests
+therefore logs a handful of records per second, not one per
+request. When a category is let through again, its record
+notes how many similar records were suppressed.
+
+@author: paepcke
+'''
+import logging
+import Queue
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Token bucket per category of log record. Each category may
+    log burst records at once, and then rate records per second.
+    '''
+
+    def __init__(self, rate=10, burst=20, max_categories=10000, clock=time.time):
+        '''
+        :param rate: records per second that each category may log
+            in the long run
+        :type rate: {int | float}
+        :param burst: records a category may log at once after a quiet spell
+        :type burst: int
+        :param max_categories: number of categories tracked; when more
+            appear, all buckets start over full
+        :type max_categories: int
+        :param clock: returns the current time in seconds
+        :type clock: callable
+        :raise ValueError: if rate is not positive, or burst is less than 1
+        '''
+        logging.Filter.__init__(self)
+        if rate <= 0 or burst < 1:
+            raise ValueError('Log rate must be positive, and burst at least 1; were %s and %s' % (rate, burst))
+        self.rate = rate
+        self.burst = burst
+        self.max_categories = max_categories
+        self.clock = clock
+        # Category --> [tokens, time of last refill, number of records suppressed]:
+        self.buckets = {}
+        # Records arrive from the IOLoop, and from helper threads:
+        self.lock = threading.Lock()
+        self.suppressed_counter = 0
+
+    def filter(self, record):
+        '''
+        :return: True if the record may be logged, else False
+        :rtype: bool
+        '''
+        template = record.msg if isinstance(record.msg, basestring) else type(record.msg)
+        category = (record.name, record.levelno, template)
+        now = self.clock()
+        with self.lock:
+            bucket = self.buckets.get(category, None)
+            if bucket is None:
+                if len(self.buckets) >= self.max_categories:
+                    self.buckets.clear()
+                bucket = self.buckets[category] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.suppressed_counter += 1
+                return False
+            bucket[0] = tokens - 1
+            num_suppressed = bucket[2]
+            bucket[2] = 0
+        if num_suppressed > 0 and isinstance(record.msg, basestring):
+            # No '%' in the addition, so the template stays intact:
+            record.msg = record.msg + ' [%s similar messages suppressed]' % num_suppressed
+        return True
+
+
+class QueueingHandler(logging.Handler):
+    '''
+    Hands records to a writer thread that passes them on
+    to the target handler. Usage:
+
+        handler = QueueingHandler(TimedRotatingFileHandler(...))
+        logger.addHandler(handler)
+        ...
+        handler.close()     # writes what is queued, and stops the thread
+    '''
+
+    def __init__(self, target, max_queued=10000):
+        '''
+        :param target: handler that formats and writes the records
+        :type target: logging.Handler
+        :param max_queued: records waiting for the writer thread
+            beyond which new records are dropped
+        :type max_queued: int
+        '''
+        logging.Handler.__init__(self)
+        self.target = target
+        self.queue = Queue.Queue(maxsize=max_queued)
+        self.enqueued_counter = 0
+        self.dropped_counter = 0
+        self.reported_drops = 0
+        self.writer = threading.Thread(target=self.write_records, name='LogWriter')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def emit(self, record):
+        '''
+        Called by the logging machinery, in the thread that logs,
+        for records that passed the filters.
+        '''
+        if record.exc_info:
+            # Tracebacks refer to frames that are gone by the time
+            # the writer gets to them; render them now:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped_counter += 1
+            return
+        self.enqueued_counter += 1
+
+    def flush(self):
+        '''
+        Wait until the writer thread has handed all queued
+        records to the target, and flush the target.
+        '''
+        self.queue.join()
+        self.target.flush()
+
+    def stats(self):
+        '''
+        :return: records queued, waiting, and dropped because the queue was full
+        :rtype: {str : int}
+        '''
+        return {'enqueued' : self.enqueued_counter,
+                'waiting' : self.queue.qsize(),
+                'dropped' : self.dropped_counter}
+
+    def close(self):
+        '''
+        Write the queued records, stop the writer
+        thread, and close the target.
+        '''
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        self.target.close()
+        logging.Handler.close(self)
+
+    # -------------------------------- Private Methods ---------
+
+    def write_records(self):
+        '''
+        Runs in the writer thread until close()
+        enqueues None.
+        '''
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self.target.handle(record)
+                if self.dropped_counter > self.reported_drops:
+                    num_dropped = self.dropped_counter - self.reported_drops
+                    self.reported_drops += num_dropped
+                    self.target.handle(logging.makeLogRecord({'name' : record.name,
+                                                              'levelno' : logging.WARNING,
+                                                              'levelname' : 'WARNING',
+                                                              'msg' : 'Log queue was full; dropped %s records.',
+                                                              'args' : (num_dropped,)}))
+            finally:
+                self.queue.task_done()
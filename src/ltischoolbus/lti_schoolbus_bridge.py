@@ -23,6 +23,7 @@ import functools
 import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
+import math
 import os
 import re
 import signal
@@ -31,20 +32,39 @@ import ssl
 from subprocess import Popen
 import subprocess
 import sys
-from urllib2 import URLError
-import urllib2
+import time
 import urlparse
 
-from jsmin import jsmin
-from jsonfiledict import JsonFileDict
 from redis_bus_python.bus_message import BusMessage
 from redis_bus_python.redis_bus import BusAdapter
 import requests
 from requests.exceptions import ConnectionError
+from tornado import gen
 from tornado import httpserver
 from tornado import web
+from tornado.httpclient import AsyncHTTPClient
 import tornado
 import tornado.ioloop
+import tornado.netutil
+import tornado.process
+
+from ltischoolbus.admission import AdmissionController, action_kind, peek_action
+from ltischoolbus.auth_index import AuthIndex, ConfigWatcher, read_config
+from ltischoolbus.dedup_cache import DedupCache, DedupTopics, dedup_key
+from ltischoolbus.delivery_engine import DeliveryEngine
+from ltischoolbus.delivery_envelope import build_envelope
+from ltischoolbus.delivery_outbox import DeliveryOutbox
+from ltischoolbus import json_codec
+from ltischoolbus.log_pipeline import QueueingHandler, RateLimitFilter
+from ltischoolbus.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from ltischoolbus.payload_schema import SchemaIndex
+from ltischoolbus.phase_trace import NO_TRACE, SlowTraceLog
+from ltischoolbus.rate_limiter import RateLimiter, RateLimits, peek_lti_key
+from ltischoolbus.shard_ring import ShardRing
+from ltischoolbus.subscriber_queue import SubscriberQueue
+from ltischoolbus.subscription_journal import SubscriptionJournal
+from ltischoolbus.topic_matcher import bus_subscriptions, check_pattern, is_pattern
+from ltischoolbus.write_behind import WriteBehindFile
 
 
 #from ltischoolbus.jsmin import jsmin
@@ -66,6 +86,1210 @@ USE_CENTRAL_EVENT_LOOP = True
 # }
 
 
+class BridgeRuntime(object):
+    '''
+    Process-wide state of the bridge. Tornado creates a
+    new LTISchoolbusBridge request handler instance for every
+    incoming request. Everything that is expensive to set
+    up therefore lives here instead, and is created exactly
+    once when the service starts:
+    
+       - the BusAdapter connection to the SchoolBus,
+       - the persistent LTI subscriptions,
+       - the publish/delivery counters, and the metrics served at /metrics,
+       - one bounded queue of waiting deliveries per LTI consumer, and
+       - the machinery that delivers bus messages to LTI consumers.
+       
+    With several worker processes, each worker's runtime is one
+    delivery shard. It delivers only to the LTI consumer URLs that
+    a ShardRing assigns to it, and has its own queues, outbox, and
+    delivery engine (see shard_ring.py).
+       
+    LTISchoolbusBridge.makeApp() hands one instance of this
+    class to every request handler via initialize().
+    '''
+    
+    def __init__(self,
+                 bus_adapter=None,
+                 subscriptions_path=None,
+                 delivery_engine=None,
+                 outbox_path=None,
+                 queue_options=None,
+                 trace_options=None,
+                 admission_options=None,
+                 dedup_options=None,
+                 leader_url=None,
+                 shard_id=None,
+                 num_shards=1):
+        '''
+        Connect to the bus, load subscriptions from disk, and
+        re-subscribe to all bus topics for which LTI consumers
+        had subscriptions when the service last ran.
+        
+        When the bridge runs as several worker processes, only one
+        of them, the leader, changes subscriptions. The runtimes of
+        the other workers are given the leader's URL; they publish to
+        the bus themselves, and hand subscription requests to the
+        leader (see LTISchoolbusBridge.post()). If the workers are
+        delivery shards, every worker delivers bus messages to its
+        own share of the LTI consumers. The followers then read the
+        subscriptions that the leader keeps, and pick up its changes
+        from the subscription journal. Otherwise the leader alone
+        delivers.
+        
+        Must be called from the thread that runs the IOLoop.
+        
+        :param bus_adapter: connection to the SchoolBus. If None, a
+            new BusAdapter instance is created. Unittests and
+            benchmarks pass a stub here.
+        :type bus_adapter: {BusAdapter | None}
+        :param subscriptions_path: file where subscriptions are
+            kept. Default: LTISchoolbusBridge.subscriptions_path
+        :type subscriptions_path: {str | None}
+        :param delivery_engine: sends bus messages to LTI consumers. If None,
+            a DeliveryEngine with the limits in the LTISchoolbusBridge
+            class variables is created.
+        :type delivery_engine: {DeliveryEngine | None}
+        :param outbox_path: SQLite file that holds deliveries until LTI
+            consumers acknowledge them. Default: lti_delivery_outbox.sqlite
+            next to the subscriptions file.
+        :type outbox_path: {str | None}
+        :param queue_options: keyword arguments for the SubscriberQueue of
+            each delivery URL: max_messages, max_bytes, overflow_policy,
+            and window. Missing entries default to the LTISchoolbusBridge
+            class variables.
+        :type queue_options: {{str : <any>} | None}
+        :param trace_options: keyword arguments for the SlowTraceLog that
+            times the phases of requests and of bus message handling:
+            threshold_ms and sample_rate. Missing entries default to the
+            LTISchoolbusBridge class variables.
+        :type trace_options: {{str : <any>} | None}
+        :param admission_options: high watermarks at which new requests
+            are shed: max_loop_lag_ms, max_in_flight, and max_queued_bytes,
+            and low_fraction, the fraction of them at which shedding
+            ends. Missing entries default to the LTISchoolbusBridge
+            class variables.
+        :type admission_options: {{str : <any>} | None}
+        :param dedup_options: ttl, the seconds for which idempotency keys are
+            remembered, and max_entries, the most keys remembered. Missing
+            entries default to the LTISchoolbusBridge class variables.
+            A ttl of None turns deduplication off.
+        :type dedup_options: {{str : <any>} | None}
+        :param leader_url: URL of the /schoolbus service of the worker that
+            keeps subscriptions. None if this runtime is that worker, or
+            the only one. If given, and num_shards is 1, the subscription
+            and delivery arguments are ignored.
+        :type leader_url: {str | None}
+        :param shard_id: this runtime's delivery shard, from 0 to num_shards - 1
+        :type shard_id: {int | None}
+        :param num_shards: number of delivery shards. With more than one,
+            bus messages are only delivered to the URLs that the shard
+            ring assigns to shard_id.
+        :type num_shards: int
+        :raise ValueError: if shard_id is not one of the num_shards shards
+        '''
+        
+        # Bus messages arrive in BusAdapter threads; they
+        # are handed to this loop for delivery:
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        
+        # Create a BusAdapter instance that handles all
+        # interactions with the SchoolBus:
+        self.busAdapter = bus_adapter if bus_adapter is not None else BusAdapter()
+        
+        self.published_to_bus_counter = 0
+        self.delivered_to_lti_counter = 0
+        # Token buckets of the rate limits in the config file. Workers
+        # share the service port, so each grants its share of a limit:
+        self.rate_limiter = RateLimiter(share=1.0 / num_shards)
+        # New publish and subscribe requests are turned away while
+        # the IOLoop, deliveries, or consumer queues are overloaded.
+        # Runtimes that deliver add their signals in setup_deliveries():
+        self.admission_options = {'max_loop_lag_ms' : LTISchoolbusBridge.LTI_BRIDGE_MAX_LOOP_LAG_MS,
+                                  'max_in_flight' : LTISchoolbusBridge.LTI_BRIDGE_MAX_IN_FLIGHT,
+                                  'max_queued_bytes' : LTISchoolbusBridge.LTI_BRIDGE_MAX_QUEUED_BYTES,
+                                  'low_fraction' : LTISchoolbusBridge.LTI_BRIDGE_ADMISSION_LOW_FRACTION}
+        if admission_options is not None:
+            self.admission_options.update(admission_options)
+        self.admission = AdmissionController(max_loop_lag_ms=self.admission_options['max_loop_lag_ms'],
+                                             low_fraction=self.admission_options['low_fraction'],
+                                             interval=LTISchoolbusBridge.LTI_BRIDGE_ADMISSION_INTERVAL,
+                                             min_shed_seconds=LTISchoolbusBridge.LTI_BRIDGE_MIN_SHED_SECONDS,
+                                             on_change=self.admission_changed)
+        self.admission.start()
+        # Idempotency keys of recent publish requests:
+        self.dedup_options = {'ttl' : LTISchoolbusBridge.LTI_BRIDGE_DEDUP_TTL,
+                              'max_entries' : LTISchoolbusBridge.LTI_BRIDGE_DEDUP_MAX_KEYS}
+        if dedup_options is not None:
+            self.dedup_options.update(dedup_options)
+        self.dedup_cache = None
+        if self.dedup_options['ttl']:
+            self.dedup_cache = DedupCache(**self.dedup_options)
+        self.setup_metrics(shard_id)
+        
+        # Phase timing of requests and bus messages, with a
+        # log record of each one that is slow:
+        self.trace_options = {'threshold_ms' : LTISchoolbusBridge.LTI_BRIDGE_SLOW_THRESHOLD_MS,
+                              'sample_rate' : LTISchoolbusBridge.LTI_BRIDGE_TRACE_SAMPLE_RATE}
+        if trace_options is not None:
+            self.trace_options.update(trace_options)
+        self.trace_log = SlowTraceLog(phase_histogram=self.phase_latency, **self.trace_options)
+        
+        # Keys and secrets are reloaded when the config file
+        # changes, independently of incoming requests. Every
+        # worker process watches the file itself:
+        self.auth_watcher = None
+        if LTISchoolbusBridge.configfile is not None:
+            self.auth_watcher = ConfigWatcher(LTISchoolbusBridge.configfile,
+                                              self.reload_auth_info,
+                                              interval=LTISchoolbusBridge.LTI_BRIDGE_AUTH_POLL_INTERVAL)
+            self.auth_watcher.start()
+        
+        self.shard_ring = None
+        self.shard_id = shard_id
+        if num_shards > 1:
+            if shard_id not in range(num_shards):
+                raise ValueError('Delivery shard must be between 0 and %s; was %s' % (num_shards - 1, shard_id))
+            self.shard_ring = ShardRing(range(num_shards))
+            # Delivery URL --> whether this shard delivers to it:
+            self.owned_urls = {}
+        
+        self.leader_url = leader_url
+        if leader_url is not None:
+            # Subscription requests are forwarded to the leader:
+            self.leader_client = AsyncHTTPClient(force_instance=True)
+            if self.shard_ring is None:
+                return
+        self.setup_deliveries(subscriptions_path, delivery_engine, outbox_path, queue_options)
+        
+    def setup_deliveries(self, subscriptions_path, delivery_engine, outbox_path, queue_options):
+        '''
+        Set up what is needed to keep subscriptions, or to follow
+        the leader's, and to deliver bus messages to LTI consumers.
+        Arguments as for __init__().
+        '''
+        if delivery_engine is None:
+            delivery_engine = DeliveryEngine(max_in_flight=LTISchoolbusBridge.LTI_BRIDGE_MAX_DELIVERIES_IN_FLIGHT,
+                                             max_per_host=LTISchoolbusBridge.LTI_BRIDGE_MAX_DELIVERIES_PER_HOST,
+                                             request_timeout=LTISchoolbusBridge.LTI_BRIDGE_DELIVERY_TIMEOUT,
+                                             idle_timeout=LTISchoolbusBridge.LTI_BRIDGE_DELIVERY_IDLE_TIMEOUT)
+        self.delivery_engine = delivery_engine
+        
+        if subscriptions_path is None:
+            subscriptions_path = LTISchoolbusBridge.subscriptions_path
+        self.subscriptions_path = subscriptions_path
+        
+        # Subscriptions are kept as a snapshot in the subscriptions
+        # file, plus a journal of changes since the snapshot. Both
+        # are read into the in-memory SubscriptionIndex; changes are
+        # appended to the journal, which is compacted into a new
+        # snapshot in the background:
+        self.subscription_journal = SubscriptionJournal(self.subscriptions_path,
+                                                        sync_delay=LTISchoolbusBridge.LTI_BRIDGE_PERSIST_DELAY,
+                                                        compact_after=LTISchoolbusBridge.LTI_BRIDGE_JOURNAL_COMPACT_AFTER)
+        self.subscription_follower = None
+        if self.leader_url is None:
+            self.lti_subscriptions = self.subscription_journal.load()
+        else:
+            # Only the leader writes the journal; the other
+            # delivery shards poll it for changes:
+            self.lti_subscriptions = self.subscription_journal.follow()
+            self.subscription_follower = ConfigWatcher(self.subscription_journal.journal_path,
+                                                       self.refresh_subscriptions,
+                                                       interval=LTISchoolbusBridge.LTI_BRIDGE_SHARD_REFRESH_INTERVAL)
+            self.subscription_follower.start()
+        if len(self.lti_subscriptions) > 0:
+            self.logInfo('Loaded existing subscriptions: %s', self.lti_subscriptions)
+        else:
+            self.logInfo('No subscriptions on record.')
+        
+        # Callback for BusAdapter when a message arrives
+        # on the bus, destined for an LTI end point:
+        self.bus_in_msg_callback = functools.partial(self.bus_to_lti_callback)
+        # Bus-inmsg-handler:
+        self.bus_in_msg_handler  = functools.partial(self.to_lti_transmitter)
+        
+        # Delivery URL --> SubscriberQueue of deliveries waiting
+        # for that LTI consumer. Each consumer gets only its queue's
+        # window of deliveries into the delivery engine at a time,
+        # so a backlogged consumer does not hold up the others:
+        self.subscriber_queues = {}
+        self.queue_options = {'max_messages' : LTISchoolbusBridge.LTI_BRIDGE_QUEUE_MAX_MESSAGES,
+                              'max_bytes' : LTISchoolbusBridge.LTI_BRIDGE_QUEUE_MAX_BYTES,
+                              'overflow_policy' : LTISchoolbusBridge.LTI_BRIDGE_QUEUE_OVERFLOW_POLICY,
+                              'window' : LTISchoolbusBridge.LTI_BRIDGE_QUEUE_WINDOW}
+        if queue_options is not None:
+            self.queue_options.update(queue_options)
+        self.spill_dir = os.path.join(os.path.dirname(self.subscriptions_path), 'lti_delivery_spill')
+        if self.shard_ring is not None:
+            self.spill_dir = os.path.join(self.spill_dir, 'shard%s' % self.shard_id)
+        if self.queue_options['overflow_policy'] == SubscriberQueue.SPILL_TO_DISK and\
+           not os.path.isdir(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        # Delivery URL --> number of dropped messages at the
+        # last queue report:
+        self.reported_drops = {}
+        self.queue_reporter = tornado.ioloop.PeriodicCallback(self.report_queues,
+                                                              LTISchoolbusBridge.LTI_BRIDGE_QUEUE_REPORT_INTERVAL * 1000)
+        self.queue_reporter.start()
+        
+        # Delivery URL --> settings that the LTI consumer chose
+        # when subscribing, such as batched delivery:
+        self.delivery_options_path = os.path.join(os.path.dirname(self.subscriptions_path), 'lti_delivery_options.json')
+        self.delivery_options_persister = None
+        self.delivery_options_follower = None
+        if self.leader_url is None:
+            self.delivery_options = self.load_json_dict(self.delivery_options_path, 'delivery options')
+            self.delivery_options_persister = WriteBehindFile(self.delivery_options_path,
+                                                              lambda: json.dumps(self.delivery_options, indent=2),
+                                                              delay=LTISchoolbusBridge.LTI_BRIDGE_PERSIST_DELAY)
+        else:
+            self.delivery_options = self.load_json_dict(self.delivery_options_path, 'delivery options', create=False)
+            self.delivery_options_follower = ConfigWatcher(self.delivery_options_path,
+                                                           self.reload_delivery_options,
+                                                           interval=LTISchoolbusBridge.LTI_BRIDGE_SHARD_REFRESH_INTERVAL)
+            self.delivery_options_follower.start()
+        # Delivery URL --> IOLoop timeout handle for URLs whose
+        # partial batch is waiting for more messages:
+        self.batch_timers = {}
+        # URLs whose partial batch has waited its linger time:
+        self.batch_due = set()
+        
+        # Deliveries stay in the outbox until acknowledged; resume
+        # the ones a previous run left behind:
+        if outbox_path is None:
+            outbox_name = 'lti_delivery_outbox.sqlite'
+            if self.shard_ring is not None:
+                # Shards must not share the outbox; an entry
+                # is only ever retried by the shard that made it:
+                outbox_name = 'lti_delivery_outbox.shard%s.sqlite' % self.shard_id
+            outbox_path = os.path.join(os.path.dirname(self.subscriptions_path), outbox_name)
+        self.delivery_outbox = DeliveryOutbox(outbox_path, self.redeliver)
+        num_recovered = self.delivery_outbox.recover()
+        if num_recovered > 0:
+            self.logInfo('Resuming %s unacknowledged deliveries from %s.', num_recovered, outbox_path)
+        
+        # Channels and channel globs to which the bus
+        # adapter is subscribed for us:
+        self.bus_channels = set()
+        self.bus_globs = set()
+        # If there are subscriptions from last time this
+        # server ran, then re-subscribe to them, all at once:
+        if len(self.lti_subscriptions) > 0:
+            self.logInfo('Subscribing to %s bus topics and topic patterns.', len(self.lti_subscriptions))
+            self.update_bus_subscriptions()
+        if self.shard_ring is not None:
+            self.logInfo('Delivery shard %s of %s delivers to %s of %s subscribed URLs.',
+                         self.shard_id, len(self.shard_ring), self.shard_stats()['subscribers'], len(self.lti_subscriptions.urls()))
+        self.admission.add_signal('in_flight', self.deliveries_in_flight, self.admission_options['max_in_flight'])
+        self.admission.add_signal('queued_bytes', self.queued_bytes, self.admission_options['max_queued_bytes'])
+        self.setup_delivery_metrics()
+        
+    # -------------------------------- SchoolBus Handler ---------
+    
+    def publish_to_bus(self, topic, payload):
+        '''
+        Given a topic and an arbitrary string, publishes the
+        string to the SchoolBus.
+        
+        :param topic: topic to which message will be published
+        :type topic: str
+        :param payload: will be placed in the bus message content field.
+        :type payload: str
+        '''
+        start_time = time.time()
+        bus_message = BusMessage(content=payload, topicName=topic)
+        self.busAdapter.publish(bus_message)
+        self.publish_latency_single.observe(time.time() - start_time)
+        
+        self.published_to_bus_counter += 1
+        # Note every 100 messages:
+        if self.published_to_bus_counter % 100 == 0:
+            self.logInfo('Published total of %s messages to bus.', self.published_to_bus_counter)
+            
+    def publish_batch_to_bus(self, events):
+        '''
+        Publish many messages to the SchoolBus in one round trip:
+        all PUBLISH commands are sent to the redis server through
+        one non-transactional pipeline, and the replies are read
+        back together.
+        
+        :param events: (topic, payload) pairs; arguments as for publish_to_bus()
+        :type events: [(str, str)]
+        :return: one entry per event: None if it was published, else the error
+        :rtype: [{None | Exception}]
+        '''
+        if not events:
+            return []
+        start_time = time.time()
+        pipeline = self.busAdapter.rserver.pipeline(transaction=False)
+        for (topic, payload) in events:
+            bus_message = BusMessage(content=payload, topicName=topic)
+            # Same wire format as BusAdapter.publish(). That method
+            # writes to the server right away, so it cannot be used
+            # to fill the pipeline:
+            msg_dict = {'id' : bus_message.id,
+                        'time' : int(time.time()),
+                        'content' : bus_message.content}
+            pipeline.execute_command('PUBLISH', topic, json_codec.dumps(msg_dict))
+        try:
+            replies = pipeline.execute(raise_on_error=False)
+        except Exception as e:
+            # Connection-level failure; nothing was published:
+            self.logErr('Could not publish batch of %s messages to bus: %r', len(events), e)
+            return [e] * len(events)
+        errors = [reply if isinstance(reply, Exception) else None for reply in replies]
+        self.publish_latency_batch.observe(time.time() - start_time)
+        
+        prev_count = self.published_to_bus_counter
+        self.published_to_bus_counter += errors.count(None)
+        # Note every 100 messages:
+        if self.published_to_bus_counter // 100 > prev_count // 100:
+            self.logInfo('Published total of %s messages to bus.', self.published_to_bus_counter)
+        return errors
+    
+    def lti_subscribe(self, topic, url):
+        '''
+        Allows LTI consumers to subscribe to SchoolBus topics. 
+        The consumer must supply a URL to which arriving messages
+        and their time stamps are POSTed. It is legal to subscribe
+        to the same topic multiple times with different URLs. All 
+        URLs will be POSTed to with incoming messages. It is safe
+        to subscribe to the same topic with the same URL multiple
+        times. This situation is a no-op. It is also legal to have message
+        of multiple topics delivered to the same consumer URL.
+        
+        :param topic: the SchoolBus topic to listen to
+        :type topic: str
+        :param url: URI where consumer is ready to receive POSTs with incoming messages
+        :type url: str
+        '''
+        self.lti_subscribe_many([(topic, url)])
+        
+    def lti_subscribe_many(self, subscriptions):
+        '''
+        Add many subscriptions at once. New subscriptions are
+        appended to the subscription journal. The bus subscriptions
+        are only revised if topics without LTI subscribers before
+        are among them. Topics may be patterns; see topic_matcher.py.
+        
+        :param subscriptions: (topic, delivery URL) pairs
+        :type subscriptions: [(str, str)]
+        :raise ValueError: if a topic is an ill-formed pattern
+        '''
+        (num_added, new_topics) = self.subscription_journal.add_many(subscriptions)
+        if new_topics or (num_added > 0 and self.owns_any(subscriptions)):
+            self.update_bus_subscriptions()
+            
+    def update_bus_subscriptions(self):
+        '''
+        Bring the bus subscriptions in line with the LTI subscriptions.
+        Topic patterns are subscribed to as redis globs, chosen such
+        that no message arrives twice (see topic_matcher.bus_subscriptions()).
+        All new channels are subscribed to with a single SUBSCRIBE
+        command, and all new globs with a single PSUBSCRIBE. Messages
+        are delivered to bus_in_msg_callback directly from the
+        BusAdapter's listener thread, rather than through one
+        delivery thread per topic: the callback only hands each
+        message to the IOLoop.
+        
+        A delivery shard only subscribes to the topics to
+        which at least one of its own URLs is subscribed.
+        '''
+        topics = self.lti_subscriptions.topics()
+        if self.shard_ring is not None:
+            topics = [topic for topic in topics
+                      if any([self.owns(url) for url in self.lti_subscriptions.urls_for(topic)])]
+        (channels, globs) = bus_subscriptions(topics)
+        pub_sub = self.busAdapter.pub_sub
+        # Subscribe before unsubscribing, so that messages are not
+        # lost while a glob takes over from channels, or vice versa:
+        new_channels = channels - self.bus_channels
+        if new_channels:
+            pub_sub.subscribe(**{channel : self.bus_in_msg_callback for channel in new_channels})
+        new_globs = globs - self.bus_globs
+        if new_globs:
+            pub_sub.psubscribe(**{glob : self.bus_in_msg_callback for glob in new_globs})
+        old_channels = self.bus_channels - channels
+        if old_channels:
+            pub_sub.unsubscribe(*old_channels)
+        old_globs = self.bus_globs - globs
+        if old_globs:
+            pub_sub.punsubscribe(*old_globs)
+        self.bus_channels = channels
+        self.bus_globs = globs
+                
+    def lti_unsubscribe(self, topic, url):
+        '''
+        Allows LTI consumers to unsubscribe from a SchoolBus topic.
+        It is safe to unsubscribe from a topic/url without first
+        subscribing. This event is a no-op. If the given topic
+        is subscribed to with multiple delivery URLs, only the
+        given URL will no longer receive messages on that topic.
+        
+        :param topic: topic from which to unsubscribe
+        :type topic: str
+        :param url: delivery URI associated with the topic 
+        :type url: str
+        '''
+        self.lti_unsubscribe_many([(topic, url)])
+        
+    def lti_unsubscribe_many(self, subscriptions):
+        '''
+        Remove many subscriptions at once, appending the removals
+        to the subscription journal. The bus subscription to a topic
+        ends when the topic's last LTI subscriber is gone.
+        
+        :param subscriptions: (topic, delivery URL) pairs
+        :type subscriptions: [(str, str)]
+        '''
+        (num_removed, emptied_topics) = self.subscription_journal.remove_many(subscriptions)
+        if num_removed == 0:
+            # None of the subscriptions were in our records:
+            return
+        if emptied_topics or self.owns_any(subscriptions):
+            self.update_bus_subscriptions()
+        # Forget the delivery options and queues of URLs
+        # that receive no topic at all any more:
+        options_changed = False
+        for url in set([url for (_topic, url) in subscriptions]):
+            if self.lti_subscriptions.topics_for(url):
+                continue
+            if url in self.delivery_options:
+                del self.delivery_options[url]
+                options_changed = True
+            self.forget_url(url)
+        if options_changed:
+            self.delivery_options_persister.mark_dirty()
+            
+    def forget_url(self, url):
+        '''
+        Release the queue and metrics of a URL that no longer
+        receives any topic, unless deliveries to it are pending.
+        
+        :param url: delivery URL
+        :type url: str
+        '''
+        queue = self.subscriber_queues.get(url, None)
+        if queue is None or len(queue) > 0 or queue.in_flight > 0:
+            return
+        queue.close()
+        del self.subscriber_queues[url]
+        for outcome in ('success', 'failure'):
+            self.delivery_latency.remove((url, outcome))
+        if self.shard_ring is not None:
+            self.owned_urls.pop(url, None)
+            
+    def owns(self, url):
+        '''
+        :param url: delivery URL
+        :type url: str
+        :return: True if this runtime delivers to url, i.e. if there
+            is only one shard, or the shard ring assigns url to this one
+        :rtype: bool
+        '''
+        if self.shard_ring is None:
+            return True
+        try:
+            return self.owned_urls[url]
+        except KeyError:
+            owned = self.owned_urls[url] = self.shard_ring.shard_for(url) == self.shard_id
+            return owned
+        
+    def owns_any(self, subscriptions):
+        '''
+        :param subscriptions: (topic, delivery URL) pairs
+        :type subscriptions: [(str, str)]
+        :return: True if this runtime is a delivery shard, and
+            delivers to at least one of the URLs
+        :rtype: bool
+        '''
+        return self.shard_ring is not None and any([self.owns(url) for (_topic, url) in subscriptions])
+    
+    def refresh_subscriptions(self, journal_path):
+        '''
+        Called on the IOLoop of a delivery shard other than
+        the leader when the leader's subscription journal
+        changed. Applies the changes, and adjusts the bus
+        subscriptions to them.
+        
+        :param journal_path: the journal
+        :type journal_path: str
+        '''
+        if not self.subscription_journal.refresh():
+            return
+        self.lti_subscriptions = self.subscription_journal.index
+        self.update_bus_subscriptions()
+        for url in self.subscriber_queues.keys():
+            if not self.lti_subscriptions.topics_for(url):
+                self.forget_url(url)
+            
+    def load_json_dict(self, path, what, create=True):
+        '''
+        Read a JSON object from a state file of the bridge. If the
+        file is absent, unreadable, or does not hold a JSON object,
+        the problem is logged, and the file is started over empty.
+        
+        :param path: file to read
+        :type path: str
+        :param what: name of the file's content for log messages
+        :type what: str
+        :param create: if False, a missing or bad file is left alone,
+            as when another process owns the file
+        :type create: bool
+        :return: the file's content
+        :rtype: {str : <any>}
+        '''
+        try:
+            with open(path, 'r') as fd:
+                content_raw = fd.read()
+        except IOError:
+            # Absent on first start:
+            content_raw = None
+        if content_raw is not None:
+            try:
+                content = json.loads(content_raw)
+                if isinstance(content, dict):
+                    return content
+            except ValueError:
+                pass
+            if len(content_raw) > 0:
+                self.logErr('Bad JSON in %s file %s: %s', what, path, content_raw)
+        if create:
+            with open(path, 'w') as fd:
+                fd.write('{}')
+        return {}
+            
+    def set_batch_options(self, url, batch_options):
+        '''
+        Choose between one POST per message, and batched
+        delivery for the given delivery URL. In batched mode,
+        messages for the URL are collected until max_messages
+        of them are waiting, or the first of them has waited
+        linger_ms milliseconds. They are then POSTed together
+        as a JSON array. The setting applies to all topics
+        delivered to the URL, and is kept across restarts.
+        
+        :param url: delivery URL
+        :type url: str
+        :param batch_options: {'max_messages' : <int>, 'linger_ms' : <int>},
+            or None to deliver one message per POST.
+        :type batch_options: {{str : int} | None}
+        '''
+        options = dict(self.delivery_options.get(url, {}))
+        if batch_options is None:
+            options.pop('batch', None)
+        else:
+            options['batch'] = batch_options
+        if options:
+            self.delivery_options[url] = options
+        else:
+            self.delivery_options.pop(url, None)
+        self.delivery_options_persister.mark_dirty()
+        # A pending linger timer may no longer apply:
+        timer = self.batch_timers.pop(url, None)
+        if timer is not None:
+            self.io_loop.remove_timeout(timer)
+        queue = self.subscriber_queues.get(url, None)
+        if queue is not None:
+            self.pump_subscriber(queue)
+        
+    def reload_delivery_options(self, options_path):
+        '''
+        Called on the IOLoop of a delivery shard other than the
+        leader when the leader wrote new delivery options. Queues
+        whose batch settings changed are pumped under the new ones.
+        
+        :param options_path: the delivery options file
+        :type options_path: str
+        '''
+        delivery_options = self.load_json_dict(options_path, 'delivery options', create=False)
+        changed_urls = [url for url in set(delivery_options.keys()) | set(self.delivery_options.keys())
+                        if delivery_options.get(url, None) != self.delivery_options.get(url, None)]
+        self.delivery_options = delivery_options
+        for url in changed_urls:
+            timer = self.batch_timers.pop(url, None)
+            if timer is not None:
+                self.io_loop.remove_timeout(timer)
+            queue = self.subscriber_queues.get(url, None)
+            if queue is not None:
+                self.pump_subscriber(queue)
+        
+    def reload_auth_info(self, configfile):
+        '''
+        Called by the ConfigWatcher when the config file with
+        LTI keys and secrets changed. If the new version cannot
+        be loaded, the previous keys and secrets stay in force.
+        
+        :param configfile: the config file
+        :type configfile: str
+        '''
+        if LTISchoolbusBridge.load_auth_info(configfile, except_on_failure=False):
+            self.logInfo('Noticed that config file %s changed.', configfile)
+        else:
+            self.logErr('Config file %s changed, but could not be loaded; keeping previous keys and secrets.', configfile)
+        
+    def bus_to_lti_callback(self, bus_msg):
+        '''
+        Called from BusAdapter when a bus message arrives
+        for one or more LTI components. We just schedule
+        the real handler with the ioloop. This is so that
+        the Tornado and BusAdapter threads don't interfere:
+        the IOLoop is not thread-safe. self.bus_in_msg_handler
+        is the partial function for method to_lti_transmitter()
+        
+        :param bus_msg: message that arrived on the bus 
+        :type bus_msg: BusMessage
+        '''
+        self.io_loop.add_callback(self.handle_bus_msg, bus_msg, time.time())
+        
+    def handle_bus_msg(self, bus_msg, arrival_time):
+        '''
+        Runs on the IOLoop for each bus message that
+        bus_to_lti_callback() scheduled. Records how long the
+        message waited for the IOLoop, then hands it on.
+        
+        :param bus_msg: message that arrived on the bus 
+        :type bus_msg: BusMessage
+        :param arrival_time: time at which the BusAdapter thread passed it on
+        :type arrival_time: float
+        '''
+        self.bus_callback_lag.observe(time.time() - arrival_time)
+        self.bus_in_msg_handler(bus_msg)
+        
+    def to_lti_transmitter(self, bus_msg):
+        '''
+        Called by BusAdapter with incoming messages to which at least
+        one LTI consumer has subscribed. Delivers the message to
+        all URLs that were provided in previous calls to lti_subscribe().
+        Delivery will be JSON:
+            {
+                "time"   : "ISO time string",
+                "topic"  : "SchoolBus topic of bus message",
+                "payload": "message's 'content' field"
+            }
+        Logged errors: 
+             - no subscribers for topic: bus subscriptions are revised as side effect
+             - URL is not reachable, so POST failed
+             - HTTP-based error returned during POST
+        
+        :param bus_msg: the incoming SchoolBus message
+        :type bus_msg: BusMessage
+        '''
+        topic = bus_msg.topicName
+        trace = self.trace_log.start('bus_msg')
+        # Get the list of LTI URLs where msgs of this topic are to
+        # be delivered, directly or through topic patterns:
+        subscriber_urls = self.lti_subscriptions.urls_matching(topic)
+        trace.mark('lookup')
+        if not subscriber_urls:
+            if topic in self.bus_channels:
+                self.logErr("Server received msg for topic '%s', but subscriber dict has no subscribers for that topic.", topic)
+                self.update_bus_subscriptions()
+            else:
+                # Arrived through a glob, whose patterns
+                # do not match this topic:
+                self.logDebug("No subscriber pattern matches topic '%s'.", topic)
+            return
+        if self.shard_ring is not None:
+            subscriber_urls = [url for url in subscriber_urls if self.owns(url)]
+            if not subscriber_urls:
+                # Other shards deliver to the topic's subscribers:
+                return
+        
+        # Look up the ltiKey and ltiSecret for the
+        # topic:
+        # Get sub-dict with secret and key from config file
+        # See class header for config file format:
+        credentials = LTISchoolbusBridge.auth_index.credentials(topic)
+        if credentials is None:
+            # Yes, there is a subscriber for this topic, but
+            # not a key and/or secret.
+            # The message is dropped; the subscriptions stay,
+            # in case the config file gains an entry:
+            self.logErr('Received bus msg on topic %s to which subscriptions existed, but no key/secret.', topic)
+            return
+        (ltiKey, ltiSecret) = credentials
+        trace.mark('credentials')
+        
+        # Serialized once; all subscribers and retries share the result:
+        try:
+            body = build_envelope(bus_msg.isoTime, ltiKey, ltiSecret, topic, bus_msg.content)
+        except (TypeError, ValueError) as e:
+            self.logErr('Cannot deliver bus msg on topic %s; content is not JSON-serializable: %r', topic, e)
+            return
+        trace.mark('envelope')
+
+        # Queue the msg for each LTI URL that requested the topic. The
+        # delivery engine sends POSTs concurrently, and reports back
+        # via the callbacks, so the IOLoop does not wait on any LTI
+        # consumer. Each delivery is recorded in the outbox first,
+        # so that it survives failures and restarts until acknowledged:
+        for lti_subscriber_url in subscriber_urls:
+            entry_id = self.delivery_outbox.add(lti_subscriber_url, topic, body)
+            trace.mark('outbox')
+            self.enqueue_delivery(entry_id, lti_subscriber_url, topic, body)
+            trace.mark('enqueue')
+        self.trace_log.finish(trace, topic=topic, subscribers=len(subscriber_urls))
+
+    def enqueue_delivery(self, entry_id, lti_subscriber_url, topic, body):
+        '''
+        Add one outbox entry to the queue of its delivery URL,
+        and start deliveries from that queue if its window
+        allows. Messages that the queue's overflow policy
+        discards are removed from the outbox.
+        
+        :param entry_id: the delivery's outbox entry
+        :type entry_id: int
+        :param lti_subscriber_url: URL to which body is to be POSTed
+        :type lti_subscriber_url: str
+        :param topic: bus topic of the message
+        :type topic: str
+        :param body: the POST body
+        :type body: str
+        '''
+        queue = self.subscriber_queue(lti_subscriber_url)
+        for (dropped_entry_id, dropped_topic, _dropped_body) in queue.put((entry_id, topic, body)):
+            self.logWarn('Delivery queue for %s is full (%s); dropped message on topic %s.',
+                         lti_subscriber_url, queue.overflow_policy, dropped_topic)
+            self.delivery_outbox.ack(dropped_entry_id)
+        self.pump_subscriber(queue)
+        
+    def subscriber_queue(self, lti_subscriber_url):
+        '''
+        Return the delivery queue of the given URL,
+        creating it on first use.
+        '''
+        try:
+            return self.subscriber_queues[lti_subscriber_url]
+        except KeyError:
+            queue = SubscriberQueue(lti_subscriber_url, spill_dir=self.spill_dir, **self.queue_options)
+            self.subscriber_queues[lti_subscriber_url] = queue
+            return queue
+        
+    def pump_subscriber(self, queue):
+        '''
+        Hand deliveries from the given queue to the delivery engine
+        until the queue's window is full, or the queue is empty.
+        For URLs in batched mode, each delivery is one batch; a
+        partial batch is only sent once it has lingered long enough.
+        
+        :param queue: queue of one delivery URL
+        :type queue: SubscriberQueue
+        '''
+        batch_options = self.delivery_options.get(queue.url, {}).get('batch', None)
+        while queue.in_flight < queue.window:
+            if batch_options is None:
+                items = self.take_deliveries(queue, 1)
+            elif len(queue) >= batch_options['max_messages'] or queue.url in self.batch_due:
+                self.batch_due.discard(queue.url)
+                items = self.take_deliveries(queue, batch_options['max_messages'])
+            else:
+                # Partial batch; give it time to fill up:
+                if len(queue) > 0 and queue.url not in self.batch_timers:
+                    self.batch_timers[queue.url] = self.io_loop.call_later(batch_options['linger_ms'] / 1000.,
+                                                                           self.batch_lingered,
+                                                                           queue)
+                return
+            if not items:
+                return
+            queue.in_flight += 1
+            self.deliver(queue.url, items)
+            
+    def take_deliveries(self, queue, max_items):
+        '''
+        Remove up to max_items deliveries from the head of the
+        given queue. Deliveries to consumers that have since
+        unsubscribed from the message's topic are dropped.
+        
+        :return: list of (entry_id, topic, body)
+        :rtype: [(int, str, str)]
+        '''
+        items = []
+        while len(items) < max_items:
+            item = queue.get()
+            if item is None:
+                break
+            (entry_id, topic, _body) = item
+            if not self.lti_subscriptions.receives(topic, queue.url):
+                self.delivery_outbox.ack(entry_id)
+                continue
+            items.append(item)
+        return items
+    
+    def batch_lingered(self, queue):
+        '''
+        Called on the IOLoop when the oldest message of a
+        partial batch has waited for the linger time.
+        '''
+        self.batch_timers.pop(queue.url, None)
+        if len(queue) > 0:
+            self.batch_due.add(queue.url)
+        self.pump_subscriber(queue)
+
+    def deliver(self, lti_subscriber_url, items):
+        '''
+        Hand outbox entries to the delivery engine. A single
+        item is POSTed by itself. Several items are POSTed
+        together as a JSON array of their bodies.
+        
+        :param lti_subscriber_url: URL to which the items are to be POSTed
+        :type lti_subscriber_url: str
+        :param items: the deliveries' (outbox entry, topic, POST body)
+        :type items: [(int, str, str)]
+        '''
+        if len(items) == 1:
+            body = items[0][2]
+        else:
+            # Bodies are JSON already; no need to parse and re-encode:
+            body = '[' + ','.join([item_body for (_entry_id, _topic, item_body) in items]) + ']'
+        self.delivery_engine.deliver(lti_subscriber_url,
+                                     body,
+                                     on_success=functools.partial(self.delivery_succeeded, items),
+                                     on_failure=functools.partial(self.delivery_failed, items))
+
+    def redeliver(self, entry_id, lti_subscriber_url, topic, body):
+        '''
+        Called by the outbox when a failed delivery is due for
+        another attempt. The delivery goes to the back of its
+        consumer's queue.
+        '''
+        self.enqueue_delivery(entry_id, lti_subscriber_url, topic, body)
+        
+    def delivery_done(self, lti_subscriber_url):
+        '''
+        A delivery to the given URL completed, successfully
+        or not. Let the URL's queue start its next one.
+        '''
+        queue = self.subscriber_queues.get(lti_subscriber_url, None)
+        if queue is None:
+            return
+        queue.in_flight -= 1
+        self.pump_subscriber(queue)
+
+    def delivery_succeeded(self, items, lti_subscriber_url, response):
+        '''
+        Called by the delivery engine on the IOLoop when
+        an LTI consumer accepted a delivery.
+        
+        :param items: the delivered (outbox entry, topic, POST body)
+        :type items: [(int, str, str)]
+        :param lti_subscriber_url: URL to which the message was POSTed
+        :type lti_subscriber_url: str
+        :param response: the LTI consumer's response
+        :type response: tornado.httpclient.HTTPResponse
+        '''
+        self.observe_delivery(lti_subscriber_url, 'success', response)
+        for (entry_id, _topic, _body) in items:
+            self.delivery_outbox.ack(entry_id)
+        self.delivery_done(lti_subscriber_url)
+        prev_count = self.delivered_to_lti_counter
+        self.delivered_to_lti_counter += len(items)
+        # Note every 100 deliveries:
+        if self.delivered_to_lti_counter // 100 > prev_count // 100:
+            self.logInfo('Delivered total of %s messages to LTI clients (%s; outbox: %s).',
+                         self.delivered_to_lti_counter, self.delivery_engine.stats(), self.delivery_outbox.stats())
+
+    def delivery_failed(self, items, lti_subscriber_url, response):
+        '''
+        Called by the delivery engine on the IOLoop when a POST
+        to an LTI consumer timed out, could not connect, or
+        returned a non-2xx status. Network errors, server errors,
+        and the 'try again later' statuses 408 and 429 are retried
+        via the outbox. Other 4xx responses mean that the consumer
+        rejected the message; it is not retried. The messages of
+        a failed batch are retried one by one, and may end up
+        in different batches next time.
+        
+        :param items: the undelivered (outbox entry, topic, POST body)
+        :type items: [(int, str, str)]
+        :param lti_subscriber_url: URL to which the message was POSTed
+        :type lti_subscriber_url: str
+        :param response: the response; code 599 for network level errors
+        :type response: tornado.httpclient.HTTPResponse
+        '''
+        self.observe_delivery(lti_subscriber_url, 'failure', response)
+        topics = ', '.join(sorted(set([topic for (_entry_id, topic, _body) in items])))
+        if response.code == 599:
+            self.logErr('Bad delivery URL %s, SSL configuration for topic %s, or server down (%r).',
+                        lti_subscriber_url, topics, response.error)
+        else:
+            self.logErr("Failed to deliver %s bus message(s) to subscriber %s; %s: %s",
+                        len(items), lti_subscriber_url, response.code, response.reason)
+        for (entry_id, topic, body) in items:
+            if response.code >= 500 or response.code in (408, 429):
+                self.delivery_outbox.retry_later(entry_id, lti_subscriber_url, topic, body)
+            else:
+                self.delivery_outbox.ack(entry_id)
+        self.delivery_done(lti_subscriber_url)
+            
+    def observe_delivery(self, lti_subscriber_url, outcome, response):
+        '''
+        Record the duration of a delivery in its URL's
+        latency histogram.
+        '''
+        # Unset for some network level errors:
+        if response.request_time is not None:
+            self.delivery_latency.observe(response.request_time, (lti_subscriber_url, outcome))
+            
+    def subscriber_stats(self):
+        '''
+        :return: delivery URL --> that consumer's queue statistics;
+            see SubscriberQueue.stats()
+        :rtype: {str : {str : int}}
+        '''
+        return {url : queue.stats() for (url, queue) in self.subscriber_queues.items()}
+    
+    def shard_stats(self):
+        '''
+        Share of this delivery shard in the delivery load. Compare
+        the numbers of all shards to see how evenly the shard ring
+        spreads the LTI consumers.
+        
+        :return: the shard's number, the number of shards, subscribed URLs
+            the shard delivers to, bus topics and topic globs it listens
+            to, deliveries queued and in flight, and messages delivered
+        :rtype: {str : int}
+        '''
+        queue_stats = self.subscriber_stats().values()
+        return {'shard' : self.shard_id,
+                'shards' : len(self.shard_ring) if self.shard_ring is not None else 1,
+                'subscribers' : len([url for url in self.lti_subscriptions.urls() if self.owns(url)]),
+                'bus_topics' : len(self.bus_channels) + len(self.bus_globs),
+                'queued' : sum([stats['depth'] + stats['spilled_pending'] for stats in queue_stats]),
+                'in_flight' : sum([stats['in_flight'] for stats in queue_stats]),
+                'delivered' : self.delivered_to_lti_counter}
+    
+    def setup_metrics(self, worker_id=None):
+        '''
+        Create the registry of metrics that GET /metrics serves.
+        Histograms and counters are updated as events happen; queue
+        depths and the like are read from their owners when the
+        metrics are rendered.
+        
+        :param worker_id: number of the worker process, with which
+            every sample is labeled, so that the counters of the
+            workers that answer successive scrapes are kept apart;
+            None if there is only one process
+        :type worker_id: {int | None}
+        '''
+        self.metrics = MetricsRegistry(const_labels=[('worker', worker_id)] if worker_id is not None else ())
+        self.request_counter = self.metrics.counter('ltibridge_requests_total',
+                                                    'HTTP requests to the bridge, by action and response status.',
+                                                    ('action', 'status'))
+        publish_latency = self.metrics.histogram('ltibridge_publish_seconds',
+                                                 'Time to publish one message, or one pipelined batch, to the bus.',
+                                                 ('mode',))
+        # The two series are observed on every publish; skip the lookup:
+        self.publish_latency_single = publish_latency.series(('single',))
+        self.publish_latency_batch = publish_latency.series(('batch',))
+        self.delivery_latency = self.metrics.histogram('ltibridge_delivery_seconds',
+                                                       'Duration of POSTs to LTI consumers, by delivery URL and outcome.',
+                                                       ('url', 'outcome'))
+        self.phase_latency = self.metrics.histogram('ltibridge_phase_seconds',
+                                                    'Duration of the phases of traced requests and bus messages.',
+                                                    ('kind', 'phase'),
+                                                    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                                                             0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+        self.bus_callback_lag = self.metrics.histogram('ltibridge_bus_callback_lag_seconds',
+                                                       'Time bus messages wait between the bus listener thread and the IOLoop.').series()
+        self.metrics.gauge('ltibridge_published_messages_total',
+                           'Messages published to the bus.',
+                           lambda: self.published_to_bus_counter, metric_type='counter')
+        self.metrics.gauge('ltibridge_rate_limited_total',
+                           'Requests and bulk publish events turned away with 429, by the limit they exceeded.',
+                           lambda: {('key',) : self.rate_limiter.limited_counters['key'],
+                                    ('topic',) : self.rate_limiter.limited_counters['topic']},
+                           ('limit',), metric_type='counter')
+        self.metrics.gauge('ltibridge_log_records_dropped_total',
+                           'Log records not written, by reason.',
+                           LTISchoolbusBridge.log_drops,
+                           ('reason',), metric_type='counter')
+        self.metrics.gauge('ltibridge_admission_decisions_total',
+                           'Requests admitted, and shed with 503, by kind of request.',
+                           lambda: self.admission.decision_counters,
+                           ('kind', 'decision'), metric_type='counter')
+        self.metrics.gauge('ltibridge_admission_shedding',
+                           '1 while new publish and subscribe requests are shed, else 0.',
+                           lambda: int(self.admission.shedding))
+        self.metrics.gauge('ltibridge_admission_shed_episodes_total',
+                           'Times the bridge started shedding requests.',
+                           lambda: self.admission.shed_episodes_counter, metric_type='counter')
+        self.metrics.gauge('ltibridge_admission_signal',
+                           'Load signals that admission control watches, at their last sample.',
+                           lambda: {(name,) : value for (name, value) in self.admission.values.items()},
+                           ('signal',))
+        if self.dedup_cache is None:
+            return
+        self.metrics.gauge('ltibridge_dedup_lookups_total',
+                           'Lookups of idempotency keys, by whether the request was a duplicate (hit).',
+                           lambda: {('hit',) : self.dedup_cache.hits_counter,
+                                    ('miss',) : self.dedup_cache.misses_counter},
+                           ('result',), metric_type='counter')
+        self.metrics.gauge('ltibridge_dedup_hit_ratio',
+                           'Fraction of idempotency key lookups that found a duplicate.',
+                           lambda: self.dedup_cache.stats()['hit_rate'])
+        self.metrics.gauge('ltibridge_dedup_keys',
+                           'Idempotency keys in the dedup cache.',
+                           lambda: len(self.dedup_cache))
+        self.metrics.gauge('ltibridge_dedup_removed_total',
+                           'Idempotency keys removed from the dedup cache, because they expired, or to make room.',
+                           lambda: {('expired',) : self.dedup_cache.expired_counter,
+                                    ('evicted',) : self.dedup_cache.evicted_counter},
+                           ('reason',), metric_type='counter')
+        
+    def setup_delivery_metrics(self):
+        '''
+        Add the metrics of subscriptions and deliveries, which
+        only runtimes that deliver keep, to the registry. Delivery
+        shards add their share of the load, labeled with their number.
+        '''
+        self.metrics.gauge('ltibridge_delivered_messages_total',
+                           'Messages delivered to LTI consumers.',
+                           lambda: self.delivered_to_lti_counter, metric_type='counter')
+        self.metrics.gauge('ltibridge_queue_depth',
+                           'Deliveries waiting in each consumer queue, in memory and spilled to disk.',
+                           lambda: self.queue_metric(lambda stats: stats['depth'] + stats['spilled_pending']),
+                           ('url',))
+        self.metrics.gauge('ltibridge_queue_in_flight',
+                           'Deliveries in flight, per consumer.',
+                           lambda: self.queue_metric(lambda stats: stats['in_flight']),
+                           ('url',))
+        self.metrics.gauge('ltibridge_queue_dropped_total',
+                           'Messages dropped by the overflow policy of each consumer queue.',
+                           lambda: self.queue_metric(lambda stats: stats['dropped_oldest'] + stats['dropped_newest']),
+                           ('url',), metric_type='counter')
+        self.metrics.gauge('ltibridge_delivery_engine_pending',
+                           'Deliveries waiting for a free connection slot in the delivery engine.',
+                           lambda: self.delivery_engine.stats()['pending'])
+        self.metrics.gauge('ltibridge_outbox_retrying',
+                           'Outbox entries waiting for another delivery attempt.',
+                           lambda: self.delivery_outbox.stats()['retrying'])
+        if self.shard_ring is None:
+            return
+        self.metrics.gauge('ltibridge_shard_subscribers',
+                           'Subscribed delivery URLs that the delivery shard delivers to.',
+                           lambda: self.shard_metric('subscribers'),
+                           ('shard',))
+        self.metrics.gauge('ltibridge_shard_bus_topics',
+                           'Bus topics and topic globs the delivery shard listens to.',
+                           lambda: self.shard_metric('bus_topics'),
+                           ('shard',))
+        self.metrics.gauge('ltibridge_shard_queued',
+                           'Deliveries waiting in the queues of the delivery shard.',
+                           lambda: self.shard_metric('queued'),
+                           ('shard',))
+        self.metrics.gauge('ltibridge_shard_delivered_messages_total',
+                           'Messages the delivery shard delivered to LTI consumers.',
+                           lambda: self.shard_metric('delivered'),
+                           ('shard',), metric_type='counter')
+        
+    def queue_metric(self, extract):
+        '''
+        :param extract: computes a value from SubscriberQueue.stats()
+        :type extract: callable
+        :return: (delivery URL,) --> value, for all consumer queues
+        :rtype: {(str,) : int}
+        '''
+        return {(url,) : extract(queue.stats()) for (url, queue) in self.subscriber_queues.items()}
+    
+    def deliveries_in_flight(self):
+        '''
+        :return: deliveries in flight, and waiting for a connection slot
+        :rtype: int
+        '''
+        stats = self.delivery_engine.stats()
+        return stats['in_flight'] + stats['pending']
+    
+    def queued_bytes(self):
+        '''
+        :return: bytes held in memory by all consumer queues
+        :rtype: int
+        '''
+        return sum(queue.bytes for queue in self.subscriber_queues.itervalues())
+    
+    def admission_changed(self, shedding, signals):
+        '''
+        Called by the AdmissionController when it starts or stops
+        shedding requests.
+        '''
+        if shedding:
+            self.logWarn('Overloaded; shedding new publish and subscribe requests. Signals: %s', signals)
+        else:
+            self.logInfo('Load is back to normal; admitting all requests. Signals: %s', signals)
+    
+    def shard_metric(self, key):
+        '''
+        :param key: one of the keys of shard_stats()
+        :type key: str
+        :return: (shard,) --> the value of key
+        :rtype: {(int,) : int}
+        '''
+        return {(self.shard_id,) : self.shard_stats()[key]}
+    
+    def report_queues(self):
+        '''
+        Called periodically on the IOLoop. Logs the queue statistics
+        of each consumer that has a backlog, or lost messages to
+        its queue's overflow policy since the previous report.
+        A delivery shard also logs its shard_stats().
+        '''
+        for (url, stats) in self.subscriber_stats().items():
+            drops = stats['dropped_oldest'] + stats['dropped_newest']
+            new_drops = drops - self.reported_drops.get(url, 0)
+            self.reported_drops[url] = drops
+            if new_drops > 0:
+                self.logWarn('Delivery queue for %s dropped %s messages since last report: %s', url, new_drops, stats)
+            elif stats['depth'] + stats['spilled_pending'] > 0:
+                self.logInfo('Delivery queue for %s: %s', url, stats)
+        if self.shard_ring is not None:
+            self.logInfo('Delivery shard %s of %s: %s', self.shard_id, len(self.shard_ring), self.shard_stats())
+            
+    def close(self):
+        '''
+        Commit outstanding outbox writes, write outstanding
+        subscription changes, and release connections. Call after
+        the IOLoop has stopped.
+        Deliveries still queued remain in the outbox, and
+        are resumed at the next start.
+        '''
+        self.admission.stop()
+        if self.auth_watcher is not None:
+            self.auth_watcher.stop()
+        if self.leader_url is not None:
+            self.leader_client.close()
+            if self.shard_ring is None:
+                return
+            self.subscription_follower.stop()
+            self.delivery_options_follower.stop()
+        self.queue_reporter.stop()
+        for timer in self.batch_timers.values():
+            self.io_loop.remove_timeout(timer)
+        self.batch_timers = {}
+        for queue in self.subscriber_queues.values():
+            queue.close()
+        self.delivery_outbox.close()
+        self.delivery_engine.close()
+        # Final write of subscription and option changes:
+        self.subscription_journal.close()
+        if self.delivery_options_persister is not None:
+            self.delivery_options_persister.close()
+    
+    # -------------------------------- Utilities ---------
+    
+    def logDebug(self, msg, *args):
+        LTISchoolbusBridge.logger.debug(msg, *args)
+
+    def logWarn(self, msg, *args):
+        LTISchoolbusBridge.logger.warn(msg, *args)
+
+    def logInfo(self, msg, *args):
+        LTISchoolbusBridge.logger.info(msg, *args)
+
+    def logErr(self, msg, *args):
+        LTISchoolbusBridge.logger.error(msg, *args)
+
+
 class LTISchoolbusBridge(tornado.web.RequestHandler):
     '''
     Operates on two communication systems at once:
@@ -147,14 +1371,80 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
             "payload": "..."
         }
     
+    Subscribers that receive many messages may ask for
+    batched delivery by adding a "batch" field to the 
+    subscribe payload:
+    
+            "payload" : {
+                          "delivery_url" : "https://myMachine.myDomain.edu",
+                          "batch" : {"max_messages" : 100, "linger_ms" : 50}
+                        }
+                        
+    Messages for that delivery URL are then collected until
+    max_messages are waiting, or the oldest has waited linger_ms
+    milliseconds, and are POSTed together as a JSON array of
+    bodies like the one above. Either field may be omitted
+    to get the defaults LTI_BRIDGE_BATCH_MAX_MESSAGES and
+    LTI_BRIDGE_BATCH_LINGER_MS. "batch" : null switches back to
+    one POST per message. The choice applies to all topics
+    delivered to the URL.
+    
+    
+        
+    Many events may be published with one POST, using action
+    publish_batch. Each event carries its own topic and payload,
+    and optionally its own ltiKey and ltiSecret, which default
+    to the ones at the top level:
+    
+        {
+            "ltiKey" : "myLtiKey",
+            "ltiSecret" : "myLtiSecret",
+            "action" : "publish_batch",
+            "events" : [
+                        {"bus_topic" : "studentAction", "payload" : {...}},
+                        {"bus_topic" : "courseEvents", "payload" : {...},
+                         "ltiKey" : "otherKey", "ltiSecret" : "otherSecret"}
+                       ]
+        }
+        
+    Alternatively, a POST with Content-Type application/x-ndjson
+    may carry one complete publish message (as in the first example
+    above) per line. In both cases each event is authenticated
+    against its own topic, all accepted events are published to
+    the bus in one round trip, and the response body lists one 
+    status per event, in order:
+    
+        {"events" : [{"status" : 200}, 
+                     {"status" : 401, "reason" : "Service not authorized for bus topic 'courseEvents'"}]}
+        
+    A publish request, or an event of a bulk publish, may carry an
+    "idempotency_key" string. Requests with the same key, LTI key,
+    and topic as one published less than LTI_BRIDGE_DEDUP_TTL seconds
+    earlier are not published again; their status is 200, and
+    the response (or the event's status) is 
     
+        {"status" : 200, "duplicate" : true}
+        
+    Config file entries may ask for requests without a key to be
+    deduplicated by their payload instead (see dedup_cache.py).
+    
+    Topics are dot-separated, as in studentAction.HumanitiesSciences.Hist101.
+    Subscriptions may be to topic patterns, in which segment '*'
+    matches any one segment, and a final segment '#' matches any
+    number of segments: studentAction.HumanitiesSciences.*, or
+    studentAction.#. Messages cannot be published to patterns.
         
     Authentication is controlled by a config file. See file ltibridge.cnf.example
-    of this distribution for the format of this file.
+    of this distribution for the format of this file. Topics in that
+    file may be patterns, too; they grant access to the topics and
+    patterns they match. An entry may also declare a schema for the
+    payloads published to its topics (see payload_schema.py).
     
     HTTP Error Codes Used:
        400  (Bad Request) if no topic was provided in the request,
+                           or a publish request's topic is a pattern,
                            or if no payload is included,
+                           or an idempotency_key is not a string,
                            or no delivery URL is included in a subscribe request
        401  (Unauthorized) if ltiKey/ltiSecret are missing or incorrect,
                            or if LTI client is not authorized to subscribe
@@ -164,9 +1454,22 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
                        
        409 (Conflict)      cannot provide both: a POST body, and a GET query
                            in the URL.
+       413 (Request Entity Too Large) if a batch holds more than
+                           LTI_BRIDGE_MAX_BATCH_EVENTS events.
        415 (Unsupported Media Type) If message is not legal JSON.
+       422 (Unprocessable Entity) if a published payload does not match
+                           the schema that the config file declares for
+                           its topic. The response body lists the violations.
+       429 (Too Many Requests) if the LTI key or the topic is over the rate
+                           limit that the config file declares for it. The
+                           Retry-After header gives the seconds to wait.
        
        501 (Not Implemented) if 'action' field contains an unknown command.
+       503 (Service Unavailable) if the bridge is overloaded, and sheds new
+                           publish and subscribe requests. The Retry-After
+                           header gives the seconds to wait; for subscribe
+                           requests, so does the "retry_after" field of the
+                           JSON body.
        
     
     To test, you can use https://www.hurl.it/ with URL: 
@@ -180,20 +1483,128 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
     # Time to wait for LTI provider (e.g. LMS) to
     # respond when trying to deliver a bus message to it:
     LTI_BRIDGE_DELIVERY_TIMEOUT = 1 # second
+    
+    # Limits on concurrent deliveries of bus messages to
+    # LTI consumers, overall and to any one host:
+    LTI_BRIDGE_MAX_DELIVERIES_IN_FLIGHT = 100
+    LTI_BRIDGE_MAX_DELIVERIES_PER_HOST  = 10
+    
+    # Seconds that a kept-alive connection to an LTI host may
+    # stay unused before the bridge closes it:
+    LTI_BRIDGE_DELIVERY_IDLE_TIMEOUT = 30
+    
+    # Seconds that changes to subscriptions may wait, so that
+    # a burst of changes is written to disk together:
+    LTI_BRIDGE_PERSIST_DELAY = 0.5
+    
+    # Seconds between checks whether the config file with
+    # LTI keys and secrets changed:
+    LTI_BRIDGE_AUTH_POLL_INTERVAL = 2
+    
+    # Number of subscription journal records after which the
+    # journal is folded into a new subscriptions snapshot:
+    LTI_BRIDGE_JOURNAL_COMPACT_AFTER = 10000
+    
+    # Bounds on the queue of waiting deliveries that each
+    # LTI consumer's delivery URL has, and what to do with
+    # new messages when a queue is full: one of 'drop_oldest',
+    # 'drop_newest', or 'spill_to_disk':
+    LTI_BRIDGE_QUEUE_MAX_MESSAGES   = 1000
+    LTI_BRIDGE_QUEUE_MAX_BYTES      = 10 * 1024 * 1024
+    LTI_BRIDGE_QUEUE_OVERFLOW_POLICY = SubscriberQueue.DROP_OLDEST
+    # Number of deliveries to one consumer URL that may be
+    # in flight at once:
+    LTI_BRIDGE_QUEUE_WINDOW = 4
+    # Seconds between log reports of backlogged queues:
+    LTI_BRIDGE_QUEUE_REPORT_INTERVAL = 60
+    
+    # Defaults and upper limits for subscribers that ask
+    # for batched delivery:
+    LTI_BRIDGE_BATCH_MAX_MESSAGES = 100
+    LTI_BRIDGE_BATCH_LINGER_MS    = 50
+    LTI_BRIDGE_BATCH_MAX_MESSAGES_LIMIT = 1000
+    LTI_BRIDGE_BATCH_LINGER_MS_LIMIT    = 10000
+    
+    # Maximum number of events in one publish_batch
+    # or NDJSON request:
+    LTI_BRIDGE_MAX_BATCH_EVENTS = 1000
+    
+    NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+    
+    # Requests, and handling of bus messages, that take longer
+    # than this many milliseconds are logged with a breakdown by
+    # phase to the 'ltibridge.slow' logger. None: never logged:
+    LTI_BRIDGE_SLOW_THRESHOLD_MS = 250
+    # Fraction of requests and bus messages whose phases are timed:
+    LTI_BRIDGE_TRACE_SAMPLE_RATE = 1.0
+    
+    # Number of worker processes that serve requests. Worker 0,
+    # the leader, also keeps subscriptions; the others forward
+    # subscription requests to it, waiting at most
+    # LTI_BRIDGE_LEADER_TIMEOUT seconds for its response. Each
+    # worker is a delivery shard, and delivers bus messages to its
+    # share of the LTI consumers. The shards other than the leader
+    # check the leader's subscription journal and delivery options
+    # for changes every LTI_BRIDGE_SHARD_REFRESH_INTERVAL seconds:
+    LTI_BRIDGE_WORKERS = 1
+    LTI_BRIDGE_LEADER_TIMEOUT = 10
+    LTI_BRIDGE_SHARD_REFRESH_INTERVAL = 0.5
+    
+    # Admission control (see admission.py): new publish and subscribe
+    # requests are answered with 503 once the IOLoop runs timers
+    # LTI_BRIDGE_MAX_LOOP_LAG_MS late, or LTI_BRIDGE_MAX_IN_FLIGHT
+    # deliveries are in flight or waiting for a slot, or the consumer
+    # queues hold LTI_BRIDGE_MAX_QUEUED_BYTES in memory. None: no such
+    # limit. Shedding lasts at least LTI_BRIDGE_MIN_SHED_SECONDS, and
+    # ends once all of them are below LTI_BRIDGE_ADMISSION_LOW_FRACTION
+    # of their limits. They are sampled every LTI_BRIDGE_ADMISSION_INTERVAL
+    # seconds:
+    LTI_BRIDGE_MAX_LOOP_LAG_MS   = 500
+    LTI_BRIDGE_MAX_IN_FLIGHT     = 10000
+    LTI_BRIDGE_MAX_QUEUED_BYTES  = 512 * 1024 * 1024
+    LTI_BRIDGE_MIN_SHED_SECONDS  = 1
+    LTI_BRIDGE_ADMISSION_LOW_FRACTION = 0.5
+    LTI_BRIDGE_ADMISSION_INTERVAL = 0.1
+    
+    # Idempotency keys of publish requests are remembered for
+    # LTI_BRIDGE_DEDUP_TTL seconds (None: not at all), and at most
+    # LTI_BRIDGE_DEDUP_MAX_KEYS of them, about 250 bytes each:
+    LTI_BRIDGE_DEDUP_TTL = 300
+    LTI_BRIDGE_DEDUP_MAX_KEYS = 100000
+    
+    # Actions by which requests are counted in the metrics; see on_finish():
+    METRICS_ACTIONS = frozenset(['publish', 'subscribe', 'unsubscribe', 'publish_batch', 'publish_ndjson', 'stream'])
+    
+    # Log records are written by a background thread (see log_pipeline.py).
+    # At most LTI_BRIDGE_LOG_QUEUE_SIZE records wait for it; more are
+    # dropped. Each message template may log LTI_BRIDGE_LOG_RATE records
+    # per second, after a burst of LTI_BRIDGE_LOG_BURST. Rate None: no limit:
+    LTI_BRIDGE_LOG_QUEUE_SIZE = 10000
+    LTI_BRIDGE_LOG_RATE  = 10
+    LTI_BRIDGE_LOG_BURST = 20
 
     # Remember whether logging has been initialized (class var!):
     loggingInitialized = False
     logger = None
+    # The QueueingHandler on logger, and its rate limit, if any:
+    log_handler = None
+    log_rate_filter = None
     
     # Path to config file, which holds LTI keys/secrets:
     configfile = None
-    # Config file's modification time when auth_dict
+    # Config file's modification time when auth_index
     # is initialized from the file:
     auth_file_mod_time = None
     
-    # Dict with info obtained from the authentication 
-    # config file:
-    auth_dict = {}
+    # Keys and secrets from the authentication config
+    # file. Replaced as a whole when the file changes:
+    auth_index = AuthIndex({})
+    # Payload schemas from the same file, compiled:
+    schema_index = SchemaIndex({})
+    # Rate limits from the same file:
+    rate_limits = RateLimits({})
+    # Topics whose publish requests are deduplicated by payload:
+    dedup_topics = DedupTopics({})
     
     # Whether or not the redis-server was running when this bridge
     # service was started. If it wasn't running, we start it as
@@ -206,95 +1617,140 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
     # File in which jsonfiledict will store subscriptions:
     subscriptions_path = os.path.join(os.path.dirname(__file__), '../../subscriptions/lti_bus_subscriptions.json')
 
-    def initialize(self):
-        '''
-        This method is call once when the server is started. In 
-        contrast, the __init__() method, which we don't override
-        in this class is called every time a new request arrives.
+    def initialize(self, runtime, forwarded=False):
         '''
+        Tornado calls this method for every incoming request,
+        passing the keyword arguments that makeApp() registered
+        with the handler. All expensive state (bus connection,
+        subscriptions, counters) lives in the process-wide
+        BridgeRuntime, so the per-request cost is just picking
+        up the reference.
         
-        # Create a BusAdapter instance that handles all
-        # interactions with the SchoolBus:
-        self.busAdapter = BusAdapter()
-        
-        # Create or read existing JSON file with all
-        # subscriptions:
-        try:
-            self.lti_subscriptions = JsonFileDict(LTISchoolbusBridge.subscriptions_path)
-            self.lti_subscriptions.load()
-        except (ValueError, IOError):
-            # The persistent-subscription file was absent,
-            # or contained non-JSON:
-            try:
-                with open(LTISchoolbusBridge.subscriptions_path, 'r') as fd:
-                    subscriptions_raw = fd.readlines()
-                if subscriptions_raw is not None and len(subscriptions_raw) > 0:
-                    self.logErr('Bad JSON in subscription file %s: %s' % (LTISchoolbusBridge.subscriptions_path,
-                                                                          str(subscriptions_raw)))
-            except Exception:
-                # Can't even read the subscription file:
-                self.logErr('Could not read subscription file %s' % LTISchoolbusBridge.subscriptions_path)
-            with open(LTISchoolbusBridge.subscriptions_path, 'w') as fd:
-                fd.write('{}')
-            self.lti_subscriptions = {}
-        self.logInfo('Loaded existing subscriptions: %s' %\
-                      str(self.lti_subscriptions) if len(self.lti_subscriptions) > 0 else 'No subscriptions on record.')
-        
-        # Callback for BusAdapter when a message arrives
-        # on the bus, destined for an LTI end point:
-        self.bus_in_msg_callback = functools.partial(self.bus_to_lti_callback)
-        # Bus-inmsg-handler:
-        self.bus_in_msg_handler  = functools.partial(self.to_lti_transmitter)
-        
-        self.published_to_bus_counter = 0
-        self.delivered_to_lti_counter = 0
-        
-        # If there are subscriptions from last time this
-        # server ran, then re-subscribe to them:
-        for bus_topic in self.lti_subscriptions.keys():
-            self.logInfo('Subscribing to bus topic %s' % bus_topic)
-            self.busAdapter.subscribeToTopic(bus_topic, self.bus_in_msg_callback)
+        :param runtime: the bridge's long-lived state
+        :type runtime: BridgeRuntime
+        :param forwarded: True if requests arrive from other workers,
+            which already applied the rate limits. Only subscribe and
+            unsubscribe requests are accepted then; see makeLeaderApp()
+        :type forwarded: bool
+        '''
+        self.runtime = runtime
+        self.forwarded = forwarded
+        # Action under which on_finish() counts the request:
+        self.metrics_action = None
+        # Phase timing of the request, if it is sampled:
+        self.trace = NO_TRACE
+        # The request's payload, parsed once by post():
+        self.parsed_payload = None
         
     # -------------------------------- HTTP Handler ---------
 
+    @gen.coroutine
     def post(self):
         '''
         Override the post() method. The
         associated form is available as a 
         dict in self.request.arguments.
         
+        In a worker process other than the leader, subscribe and
+        unsubscribe requests are passed to the leader unchanged,
+        and its response is relayed.
+        
         Logs errors: Bad json in the POST body, missing SchoolBus topic, missing payload. 
         
         '''
+        self.trace = self.runtime.trace_log.start('post')
         postBodyForm = self.request.body
+        
+        # Bulk publish with one message per line?
+        is_ndjson = self.request.headers.get('Content-Type', '').split(';')[0].strip().lower() == LTISchoolbusBridge.NDJSON_CONTENT_TYPE
+        
+        # While the bridge is overloaded, turn away new work
+        # before spending time on parsing the request. Bodies
+        # whose kind the peek cannot tell are admitted once parsed:
+        kind = 'publish' if is_ndjson else peek_action(postBodyForm)
+        if kind is not None:
+            retry_after = self.runtime.admission.admit(kind)
+            if retry_after > 0:
+                self.metrics_action = kind
+                self.returnOverloaded(kind, retry_after)
+                return
+        
+        if is_ndjson:
+            self.metrics_action = 'publish_ndjson'
+            if self.forwarded:
+                self.returnForwardedActionError('publish_ndjson')
+                return
+            self.publish_ndjson(postBodyForm)
+            return
         #print(str(postBody))
         #self.write('<!DOCTYPE html><html><body><script>document.getElementById("ltiFrame-i4x-DavidU-DC1-lti-2edb4bca1198435cbaae29e8865b4d54").innerHTML = "Hello iFrame!"</script></body></html>"');    
 
         #self.echoParmsToEventDispatcher(postBodyForm)
         
+        # Turn away a consumer whose key is over its rate
+        # limit before spending time on parsing the request:
+        if LTISchoolbusBridge.rate_limits and not self.forwarded:
+            lti_key = peek_lti_key(postBodyForm)
+            if lti_key is not None:
+                wait = self.runtime.rate_limiter.wait_time(LTISchoolbusBridge.rate_limits, lti_key)
+                if wait > 0:
+                    self.logWarn('LTI key %s is over its rate limit.', lti_key)
+                    self.returnRateLimited(wait)
+                    return
+        
         try:
-            # Turn POST body JSON into a dict:
-            postBodyDict = json.loads(str(postBodyForm))
+            # Turn POST body JSON into a dict, straight from the body bytes:
+            postBodyDict = json_codec.loads(postBodyForm)
+            if not isinstance(postBodyDict, dict):
+                raise ValueError('Not a JSON object')
         except ValueError:
-            self.logErr('POST called with improper JSON: %s' % str(postBodyForm))            
+            self.logErr('POST called with improper JSON: %s', postBodyForm)            
             self.returnHTTPError(415, 'Message did not include a proper JSON object %s' % str(postBodyForm))
             return
+        self.trace.mark('parse')
 
         # Does msg contain the required 'action' field?
         action = postBodyDict.get('action', None)
         if action is None:
-            self.logErr("POST called without action field: '%s'" % str(postBodyDict))
+            self.logErr("POST called without action field: '%s'", postBodyDict)
             self.returnHTTPError(405, 'Message did not include an action field: %s' % str(postBodyDict))
             return
         # Normalize capitalization:
         action = action.lower()
+        self.metrics_action = action
+        if self.forwarded and action not in ('subscribe', 'unsubscribe'):
+            self.returnForwardedActionError(action)
+            return
+        if kind is None:
+            kind = action_kind(action)
+            retry_after = self.runtime.admission.admit(kind)
+            if retry_after > 0:
+                self.returnOverloaded(kind, retry_after)
+                return
+        elif action_kind(action) != kind:
+            # The peek found the one literal "action" field in the
+            # payload, and the request's own is spelled with escapes.
+            # It was admitted as a kind of request that it is not:
+            self.logErr("POST called with an action field the bridge cannot check before parsing: %s", postBodyDict)
+            self.returnHTTPError(400, 'Message must spell its action field name without escapes: %s' % str(postBodyDict))
+            return
+        
+        # Bulk publish carries topics with each event:
+        if action == 'publish_batch':
+            self.publish_batch(postBodyDict)
+            return
                 
         # Is the required bus_topic field present?                
         target_topic = postBodyDict.get('bus_topic', None)
         if target_topic is None:
-            self.logErr('POST called without target_topic specification: %s' % str(postBodyDict))
+            self.logErr('POST called without target_topic specification: %s', postBodyDict)
             self.returnHTTPError(400, 'Message did not include a target_topic field: %s' % str(postBodyDict))
             return
+        failure = self.topic_failure(target_topic, action)
+        if failure is not None:
+            self.logErr('POST called with bad topic: %s', failure[1])
+            self.returnHTTPError(*failure)
+            return
 
         # Look for LTI key and secret in the dict, and
         # check it against the config file:
@@ -303,32 +1759,69 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
             # check_auth will return the correct HTTP Error
             # before returning.
             return
+        self.trace.mark('auth')
+        
+        wait = self.rate_limit_wait(postBodyDict['ltiKey'], target_topic)
+        if wait > 0:
+            self.logWarn("LTI key %s is over the rate limit of its key or of topic '%s'.", postBodyDict['ltiKey'], target_topic)
+            self.returnRateLimited(wait)
+            return
+        
+        # Only the leader changes subscriptions:
+        if action in ('subscribe', 'unsubscribe') and self.runtime.leader_url is not None:
+            yield self.forward_to_leader(postBodyForm)
+            self.trace.mark('forward')
+            return
             
         payload = postBodyDict.get('payload', None)
         if payload is None:
-            self.logErr('POST called without payload field: %s' % str(postBodyDict))
+            self.logErr('POST called without payload field: %s', postBodyDict)
             self.returnHTTPError(400, 'Message did not include a payload field: %s' % str(postBodyDict))
             return
 
-        # Ensure that payload is good JSON;
-        if not isinstance(payload, dict):
-            try:
-                json.loads(payload)
-            except ValueError:
-                self.logDebug('Bad JSON in payload field of message: %s' % str(payload))
-                self.returnHTTPError(415, 'Message payload field does not contain proper JSON: %s' % str(postBodyDict))
+        # Ensure that payload is good JSON, and keep it parsed:
+        try:
+            self.parsed_payload = json_codec.parse_nested(payload)
+        except ValueError:
+            self.logDebug('Bad JSON in payload field of message: %s', payload)
+            self.returnHTTPError(415, 'Message payload field does not contain proper JSON: %s' % str(postBodyDict))
+            return
+        if action == 'publish':
+            schema_errors = self.schema_errors(target_topic, self.parsed_payload)
+            if schema_errors:
+                self.logDebug("Payload for topic '%s' does not match its schema: %s", target_topic, schema_errors)
+                self.returnSchemaError(target_topic, schema_errors)
+                return
+            failure = self.idempotency_key_failure(postBodyDict)
+            if failure is not None:
+                self.logErr('POST called with bad idempotency key: %s', postBodyDict)
+                self.returnHTTPError(*failure)
                 return
+        self.trace.mark('payload')
         
         # Finally, seems to be a legal msg; process the various actions:
         if action == 'publish':
-            self.logDebug("Req to publish to '%s': %s" % (target_topic, str(payload)))
-            self.publish_to_bus(target_topic, payload)
+            key = self.publish_dedup_key(postBodyDict, target_topic, self.parsed_payload)
+            if key is not None and not self.runtime.dedup_cache.add(key):
+                self.logDebug("Not publishing duplicate of an earlier request to '%s'.", target_topic)
+                self.write({'status' : 200, 'duplicate' : True})
+                return
+            self.logDebug("Req to publish to '%s': %s", target_topic, payload)
+            try:
+                self.runtime.publish_to_bus(target_topic, payload)
+            except Exception:
+                # Let the client's retry through:
+                if key is not None:
+                    self.runtime.dedup_cache.discard(key)
+                raise
+            self.trace.mark('publish')
             return
         elif action in ['subscribe', 'unsubscribe']:
             # Must have a URL in the payload:
-            delivery_url = payload.get('delivery_url', None)
+            payload = self.parsed_payload
+            delivery_url = payload.get('delivery_url', None) if isinstance(payload, dict) else None
             if delivery_url is None:
-                self.logErr("POST called with action '%s', but no delivery URL provided: %s" % (action, str(postBodyDict)))
+                self.logErr("POST called with action '%s', but no delivery URL provided: %s", action, postBodyDict)
                 self.returnHTTPError(400, "Action '%s' must provide a delivery_url in the payload field; offending message: '%s'" % (action, str(postBodyDict)))
                 return
             # Do minimal check of the URL: must be scheme HTTPS to 
@@ -337,30 +1830,370 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
             # be a query or fragment part:
             url_segments = urlparse.urlparse(delivery_url)
             if url_segments.scheme.lower() != 'https':
-                self.logErr("POST request specifying non-secure URL '%s': '%s'" % (delivery_url, str(postBodyDict)))
+                self.logErr("POST request specifying non-secure URL '%s': '%s'", delivery_url, postBodyDict)
                 self.returnHTTPError(403, "Delivery URL must use an encrypted scheme (https); was %s. Offending POST body '%s'" % (delivery_url, str(postBodyDict)))
                 return
             if len(url_segments.query) + len(url_segments.fragment) > 0:
-                self.logErr("POST request with non-empty query or fragment URL: '%s'" % str(postBodyDict))
+                self.logErr("POST request with non-empty query or fragment URL: '%s'", postBodyDict)
                 self.returnHTTPError(409, "Delivery URL must not have a query or fragment part, but was '%s'. Offending POST body '%s'" % (delivery_url, str(postBodyDict)))
                 return
             # Finally, all seems good for subscribe/unsubsribe:
             if action == 'subscribe':
-                self.logInfo('Subscribing to %s; LTI client: %s' % (target_topic, delivery_url))
-                self.lti_subscribe(target_topic, delivery_url)
+                # Subscriber may opt in (or out) of batched delivery:
+                if 'batch' in payload:
+                    batch_options = self.get_batch_options(payload['batch'], postBodyDict)
+                    if batch_options is False:
+                        return
+                self.logInfo('Subscribing to %s; LTI client: %s', target_topic, delivery_url)
+                self.runtime.lti_subscribe(target_topic, delivery_url)
+                if 'batch' in payload:
+                    self.runtime.set_batch_options(delivery_url, batch_options)
             else:
-                self.logInfo('Unsubscribing from %s; LTI client: %s' % (target_topic, delivery_url))
-                self.lti_unsubscribe(target_topic, delivery_url)
+                self.logInfo('Unsubscribing from %s; LTI client: %s', target_topic, delivery_url)
+                self.runtime.lti_unsubscribe(target_topic, delivery_url)
+            self.trace.mark(action)
             return
         else:
             # Unknown action:
-            self.logErr("POST called with unknown action value '%s': '%s'" % (action, str(postBodyDict)))
+            self.logErr("POST called with unknown action value '%s': '%s'", action, postBodyDict)
             self.returnHTTPError(501, "Action '%s' is not implemented; offending message: '%s'" % (action, str(postBodyDict)))
             return
             
         return
             
         
+    def on_finish(self):
+        '''
+        Called by Tornado after the response was sent. Counts
+        the request by action and response status. Actions other
+        than the known ones are counted as 'other', so that clients
+        cannot create arbitrary numbers of series. Finishes the
+        request's phase trace, which logs it if it was slow.
+        '''
+        action = self.metrics_action if self.metrics_action in LTISchoolbusBridge.METRICS_ACTIONS else 'other'
+        status = self.get_status()
+        self.runtime.request_counter.inc((action, status))
+        self.trace.mark('respond')
+        self.runtime.trace_log.finish(self.trace, action=action, status=status)
+        
+    @gen.coroutine
+    def forward_to_leader(self, postBody):
+        '''
+        Pass a request to the leader worker, and
+        respond with the leader's response.
+        
+        :param postBody: the request body
+        :type postBody: str
+        '''
+        response = yield self.runtime.leader_client.fetch(self.runtime.leader_url,
+                                                          method='POST',
+                                                          body=postBody,
+                                                          request_timeout=LTISchoolbusBridge.LTI_BRIDGE_LEADER_TIMEOUT,
+                                                          raise_error=False)
+        if response.code == 599:
+            self.logErr('Could not reach leader worker at %s: %r', self.runtime.leader_url, response.error)
+            self.returnHTTPError(503, 'Subscription service temporarily unavailable; please retry.')
+            return
+        self.set_status(response.code, reason=response.reason)
+        if 'Retry-After' in response.headers:
+            self.set_header('Retry-After', response.headers['Retry-After'])
+        if response.body:
+            self.set_header('Content-Type', response.headers.get('Content-Type', 'text/html; charset=UTF-8'))
+            self.write(response.body)
+        
+    def publish_batch(self, postBodyDict):
+        '''
+        Handle action publish_batch: authenticate each of the
+        events in the request's 'events' list against its topic,
+        and publish all the good ones in one round trip to the bus.
+        Events inherit ltiKey/ltiSecret from the top level of
+        the request unless they have their own.
+        
+        :param postBodyDict: the request
+        :type postBodyDict: {str : <any>}
+        '''
+        events = postBodyDict.get('events', None)
+        if not isinstance(events, list):
+            self.logErr('POST publish_batch called without a list in the events field: %s', postBodyDict)
+            self.returnHTTPError(400, 'Action publish_batch must provide a list of events in the events field: %s' % str(postBodyDict))
+            return
+        credentials = {}
+        for field in ('ltiKey', 'ltiSecret'):
+            if field in postBodyDict:
+                credentials[field] = postBodyDict[field]
+        batch = []
+        for event in events:
+            if isinstance(event, dict):
+                merged_event = dict(credentials)
+                merged_event.update(event)
+                event = merged_event
+            batch.append(event)
+        self.publish_events(batch)
+        
+    def publish_ndjson(self, postBody):
+        '''
+        Handle a POST with content type application/x-ndjson: each
+        non-empty line is one publish message. Lines that are not
+        proper JSON receive status 415 in the response, without
+        affecting the other lines.
+        
+        :param postBody: the request body
+        :type postBody: str
+        '''
+        batch = []
+        for line in bytes(postBody).splitlines():
+            if not line.strip():
+                continue
+            try:
+                batch.append(json_codec.loads(line))
+            except ValueError:
+                batch.append(ValueError('Line did not contain a proper JSON object: %s' % line))
+        self.trace.mark('parse')
+        self.publish_events(batch)
+        
+    def publish_events(self, events):
+        '''
+        Check each event of a bulk publish, publish the acceptable
+        ones in one round trip to the bus, and respond with
+        one status per event.
+        
+        :param events: event dicts, or ValueError instances for events
+            that could not be parsed.
+        :type events: [{{str : <any>} | ValueError}]
+        '''
+        if len(events) > LTISchoolbusBridge.LTI_BRIDGE_MAX_BATCH_EVENTS:
+            self.logErr('Bulk publish of %s events exceeds limit of %s.', len(events), LTISchoolbusBridge.LTI_BRIDGE_MAX_BATCH_EVENTS)
+            self.returnHTTPError(413, 'Bulk publish may carry at most %s events; request had %s.' %\
+                                 (LTISchoolbusBridge.LTI_BRIDGE_MAX_BATCH_EVENTS, len(events)))
+            return
+        statuses = []
+        to_publish = []
+        # Position in statuses, and dedup cache key, of each event in to_publish:
+        positions = []
+        keys = []
+        for event in events:
+            failure = self.event_failure(event)
+            if failure is not None:
+                statuses.append(self.failure_status(failure))
+                continue
+            key = self.publish_dedup_key(event, event['bus_topic'], self.parsed_payload)
+            if key is not None and not self.runtime.dedup_cache.add(key):
+                statuses.append({'status' : 200, 'duplicate' : True})
+                continue
+            positions.append(len(statuses))
+            keys.append(key)
+            statuses.append(None)
+            to_publish.append((event['bus_topic'], event['payload']))
+        self.trace.mark('check')
+                
+        errors = self.runtime.publish_batch_to_bus(to_publish)
+        self.trace.mark('publish')
+        for (position, key, error) in zip(positions, keys, errors):
+            if error is None:
+                statuses[position] = {'status' : 200}
+            else:
+                statuses[position] = {'status' : 503, 'reason' : 'Could not publish to bus: %s' % str(error)}
+                if key is not None:
+                    self.runtime.dedup_cache.discard(key)
+        
+        num_rejected = sum(1 for status in statuses if status['status'] != 200)
+        if num_rejected > 0:
+            self.logErr('Bulk publish: %s of %s events not published.', num_rejected, len(statuses))
+        else:
+            self.logDebug('Bulk publish of %s events.', len(statuses))
+        self.write({'events' : statuses})
+        
+    def event_failure(self, event):
+        '''
+        Check one event of a bulk publish the way post() checks
+        a single publish request, but without sending an HTTP
+        response. Like post(), leaves the payload of an acceptable
+        event parsed in self.parsed_payload.
+        
+        :param event: the event, or a ValueError if it could not be parsed
+        :type event: {{str : <any>} | ValueError}
+        :return: None if the event may be published, else (HTTP status, reason),
+            followed by the list of schema violations for status 422
+        :rtype: {None | (int, str) | (int, str, [{str : str}])}
+        '''
+        if isinstance(event, ValueError):
+            return (415, str(event))
+        if not isinstance(event, dict):
+            return (415, 'Event is not a JSON object: %s' % str(event))
+        if str(event.get('action', 'publish')).lower() != 'publish':
+            return (400, "Only action 'publish' is allowed in bulk publish: %s" % str(event))
+        target_topic = event.get('bus_topic', None)
+        if target_topic is None:
+            return (400, 'Event did not include a bus_topic field: %s' % str(event))
+        failure = self.topic_failure(target_topic, 'publish') or self.auth_failure(event, target_topic)
+        if failure is not None:
+            return failure
+        wait = self.rate_limit_wait(event['ltiKey'], target_topic)
+        if wait > 0:
+            return (429, 'Rate limit exceeded; retry after %s seconds.' % self.retry_after_seconds(wait))
+        payload = event.get('payload', None)
+        if payload is None:
+            return (400, 'Event did not include a payload field: %s' % str(event))
+        try:
+            self.parsed_payload = json_codec.parse_nested(payload)
+        except ValueError:
+            return (415, 'Event payload field does not contain proper JSON: %s' % str(event))
+        schema_errors = self.schema_errors(target_topic, self.parsed_payload)
+        if schema_errors:
+            return (422, self.schema_failure_reason(target_topic), schema_errors)
+        return self.idempotency_key_failure(event)
+        
+    def idempotency_key_failure(self, event):
+        '''
+        :param event: a publish request, or bulk publish event
+        :type event: {str : <any>}
+        :return: None if the event has no idempotency key, or a
+            proper one, else (HTTP status, reason)
+        :rtype: {None | (int, str)}
+        '''
+        idempotency_key = event.get('idempotency_key', None)
+        if idempotency_key is None or isinstance(idempotency_key, basestring):
+            return None
+        return (400, 'Field idempotency_key must be a string; was %s' % json_codec.dumps(idempotency_key))
+        
+    def publish_dedup_key(self, event, target_topic, parsed_payload):
+        '''
+        :param event: a publish request, or bulk publish event, that
+            passed all checks
+        :type event: {str : <any>}
+        :param target_topic: topic to publish to
+        :type target_topic: str
+        :param parsed_payload: the event's payload, as parsed by
+            json_codec.parse_nested(). Payloads are compared in
+            canonical form, so that neither the order of their
+            fields, nor whether they were sent nested as a string,
+            keeps duplicates apart.
+        :type parsed_payload: <any>
+        :return: the key under which the dedup cache remembers the
+            event: made from its idempotency key, if it has one, else
+            from its payload, if the config file asks for that for
+            target_topic. None if the event is not deduplicated.
+        :rtype: {str | None}
+        '''
+        if self.runtime.dedup_cache is None:
+            return None
+        idempotency_key = event.get('idempotency_key', None)
+        if idempotency_key is not None:
+            return dedup_key(event['ltiKey'], target_topic, idempotency_key)
+        if LTISchoolbusBridge.dedup_topics.by_payload(target_topic):
+            return dedup_key(target_topic, json_codec.canonical_dumps(parsed_payload))
+        return None
+        
+    def rate_limit_wait(self, lti_key, target_topic):
+        '''
+        Take a token for an authenticated request, or bulk publish
+        event, from the buckets of its LTI key and topic.
+        
+        :param lti_key: the request's LTI key
+        :type lti_key: str
+        :param target_topic: the request's bus topic
+        :type target_topic: str
+        :return: 0 if the request may proceed, else seconds after which to retry
+        :rtype: float
+        '''
+        if not LTISchoolbusBridge.rate_limits or self.forwarded:
+            return 0
+        return self.runtime.rate_limiter.take(LTISchoolbusBridge.rate_limits, lti_key, target_topic)
+        
+    def retry_after_seconds(self, wait):
+        return int(math.ceil(wait))
+        
+    def schema_errors(self, target_topic, parsed_payload):
+        '''
+        Validate a payload that is to be published against the
+        schema that the config file declares for its topic.
+        
+        :param target_topic: topic to publish to
+        :type target_topic: str
+        :param parsed_payload: the payload, as parsed by json_codec.parse_nested()
+        :type parsed_payload: <any>
+        :return: the payload's violations of the schema; empty if
+            there are none, or if the topic has no schema
+        :rtype: [{str : str}]
+        '''
+        schema = LTISchoolbusBridge.schema_index.schema_for(target_topic)
+        if schema is None:
+            return []
+        return schema.validate(parsed_payload)
+        
+    def schema_failure_reason(self, target_topic):
+        return "Payload does not match the schema of bus topic '%s'" % target_topic
+        
+    def failure_status(self, failure):
+        '''
+        :param failure: an event_failure() result other than None
+        :type failure: {(int, str) | (int, str, [{str : str}])}
+        :return: the status of the event in a bulk publish response
+        :rtype: {str : <any>}
+        '''
+        status = {'status' : failure[0], 'reason' : failure[1]}
+        if len(failure) > 2:
+            status['errors'] = failure[2]
+        return status
+        
+    def topic_failure(self, target_topic, action):
+        '''
+        Check the bus_topic of a request. Topic patterns may be
+        subscribed and unsubscribed to, but not published to.
+        
+        :param target_topic: the topic
+        :type target_topic: <any>
+        :param action: the request's action, in lower case
+        :type action: str
+        :return: None if the topic is fine for the action, else (HTTP status, reason)
+        :rtype: {None | (int, str)}
+        '''
+        if not isinstance(target_topic, basestring):
+            return (400, 'The bus_topic field must be a string: %s' % str(target_topic))
+        if action in ['subscribe', 'unsubscribe']:
+            try:
+                check_pattern(target_topic)
+            except ValueError as e:
+                return (400, str(e))
+        elif is_pattern(target_topic):
+            return (400, "Cannot %s to topic pattern '%s'" % (action, target_topic))
+        return None
+        
+    def get_batch_options(self, batch_field, postBodyDict):
+        '''
+        Given the 'batch' field of a subscribe request's payload,
+        return the batch options to use, with defaults filled in.
+        Returns None if the field is null, i.e. if the subscriber
+        wants one POST per message. If the field is malformed,
+        an HTTP 400 error is returned to the requestor, and
+        this method returns False.
+        
+        :param batch_field: value of the 'batch' field in the payload
+        :type batch_field: {{str : int} | None}
+        :param postBodyDict: the whole request, for error messages
+        :type postBodyDict: {str : <any>}
+        :return: {'max_messages' : <int>, 'linger_ms' : <int>}, None, or False
+        :rtype: {{str : int} | None | bool}
+        '''
+        if batch_field is None:
+            return None
+        if not isinstance(batch_field, dict):
+            self.logErr('POST called with non-dict batch field: %s', postBodyDict)
+            self.returnHTTPError(400, "Field 'batch' must be a JSON object or null; offending message: '%s'" % str(postBodyDict))
+            return False
+        batch_options = {'max_messages' : batch_field.get('max_messages', LTISchoolbusBridge.LTI_BRIDGE_BATCH_MAX_MESSAGES),
+                         'linger_ms' : batch_field.get('linger_ms', LTISchoolbusBridge.LTI_BRIDGE_BATCH_LINGER_MS)}
+        limits = {'max_messages' : (1, LTISchoolbusBridge.LTI_BRIDGE_BATCH_MAX_MESSAGES_LIMIT),
+                  'linger_ms' : (0, LTISchoolbusBridge.LTI_BRIDGE_BATCH_LINGER_MS_LIMIT)}
+        for (option, (low, high)) in limits.items():
+            value = batch_options[option]
+            if not isinstance(value, (int, long)) or isinstance(value, bool) or not low <= value <= high:
+                self.logErr("POST called with bad batch option '%s': %s", option, postBodyDict)
+                self.returnHTTPError(400, "Batch option '%s' must be an integer between %s and %s; offending message: '%s'" %\
+                                     (option, low, high, str(postBodyDict)))
+                return False
+        return batch_options
+        
     def check_auth(self, postBodyDict, target_topic):
         '''
         Given the payload dictionary and the SchoolBus topic to
@@ -370,115 +2203,68 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
         header will have been sent. The caller should simply abandon
         the request for which authentication was being checked.
         
-        The method expectes LTISchoolbusBridge.auth_dict to be initialized.
-        If the configuration file that underlies the dict does not have
+        See auth_failure() for the checks.
+        
+        :param postBodyDict: dictionary parsed from payload JSON
+        :type postBodyDict: {string : string}
+        :param target_topic: SchoolBus topic for which authentication is to be checked
+        :type target_topic: str
+        '''
+        failure = self.auth_failure(postBodyDict, target_topic)
+        if failure is None:
+            return True
+        (status_code, msg) = failure
+        if status_code == 401:
+            # Required response header field for 401-not authenticated:
+            self.set_header('WWW-Authenticate', 'key/secret')
+        self.returnHTTPError(status_code, msg)
+        return False
+        
+    def auth_failure(self, postBodyDict, target_topic):
+        '''
+        Check authentication of a request or bulk publish event
+        without sending any HTTP response. 
+        
+        The method expectes LTISchoolbusBridge.auth_index to be initialized.
+        If the configuration file that underlies the index does not have
         an entry for the given topic, auth fails. If the LTI key or LTI secret
         are absent from postBodyDict, auth fails. If either secret or key
         in the payload does not match the key/secret in the config file,
-        auth fails. See class comment for config file format.
+        auth fails. Changes to the config file are picked up by the
+        BridgeRuntime's ConfigWatcher, not here. See class comment for
+        config file format.
         
         :param postBodyDict: dictionary parsed from payload JSON
         :type postBodyDict: {string : string}
         :param target_topic: SchoolBus topic for which authentication is to be checked
         :type target_topic: str
+        :return: None if authentication checks out, else (HTTP status, reason)
+        :rtype: {None | (int, str)}
         '''
         
         try:
             given_key = postBodyDict['ltiKey']
             given_secret = postBodyDict['ltiSecret']
         except KeyError:
-            self.logErr('Either key or secret missing in incoming POST: %s' % str(postBodyDict))
-            self.returnHTTPError(401, 'Either key or secret were not included in LTI request: %s' % str(postBodyDict))
-            return False
+            self.logErr('Either key or secret missing in incoming POST: %s', postBodyDict)
+            return (401, 'Either key or secret were not included in LTI request: %s' % str(postBodyDict))
         except TypeError:
-            self.logErr('POST body of LTI request did not parse into a Python dictionary: %s' % str(postBodyDict))
-            self.returnHTTPError(415, 'POST body of LTI request did not parse into a Python dictionary: %s' % str(postBodyDict))
-            return False
+            self.logErr('POST body of LTI request did not parse into a Python dictionary: %s', postBodyDict)
+            return (415, 'POST body of LTI request did not parse into a Python dictionary: %s' % str(postBodyDict))
         
-        try:
-            # Get sub-dict with secret and key from config file
-            # See class header for config file format:
-            auth_entry = LTISchoolbusBridge.auth_dict[target_topic]
-
-            # Compare given key and secret with the key/secret on file
-            # for the target bus topic:            
-            key_on_record = auth_entry['ltiKey'] 
-            if key_on_record != given_key:
-                # One more chance: was auth file updated since we
-                # last loaded it into auth_dict?
-                if self.reload_auth_if_new():
-                    # Load the modified auth info again:
-                    auth_entry = LTISchoolbusBridge.auth_dict[target_topic]
-                    key_on_record = auth_entry['ltiKey'] 
-                    # Now is all OK?
-                    if key_on_record != given_key:
-                        self.logErr("Key '%s' does not match key for topic '%s' in config file." % (given_key, target_topic))
-                        # Required response header field for 401-not authenticated:
-                        self.set_header('WWW-Authenticate', 'key/secret')
-                        self.returnHTTPError(401, "Service not authorized for bus topic '%s'" % target_topic)
-                        return False
-                else:
-                    # Bad ltiKey:
-                    self.logErr("Key '%s' does not match key for topic '%s' in config file." % (given_key, target_topic))
-                    # Required response header field for 401-not authenticated:
-                    self.set_header('WWW-Authenticate', 'key/secret')
-                    self.returnHTTPError(401, "Service not authorized for bus topic '%s'" % target_topic)
-                    return False
-                    
-                    
-            secret_on_record = auth_entry['ltiSecret'] 
-            if secret_on_record != given_secret:
-                # One more chance: was auth file updated since we
-                # last loaded it into auth_dict?
-                if self.reload_auth_if_new():
-                    # Load the modified auth info again:
-                    auth_entry = LTISchoolbusBridge.auth_dict[target_topic]
-                    secret_on_record = auth_entry['ltiSecret'] 
-                    # Now is all OK?
-                    if secret_on_record != given_secret:
-                        self.logErr("Secret '%s' does not match secret for topic '%s' in config file." % (given_secret, target_topic))
-                        # Required response header field for 401-not authenticated:
-                        self.set_header('WWW-Authenticate', 'key/secret')
-                        self.returnHTTPError(401, "Service not authorized for bus topic '%s'" % target_topic)
-                        return False
-                else:
-                    self.logErr("Secret '%s' does not match secret for topic '%s' in config file." % (given_secret, target_topic))
-                    # Required response header field for 401-not authenticated:
-                    self.set_header('WWW-Authenticate', 'key/secret')
-                    self.returnHTTPError(401, "Service not authorized for bus topic '%s'" % target_topic)
-                    return False
-                    
-                
-        except KeyError:
+        auth_index = LTISchoolbusBridge.auth_index
+        if target_topic not in auth_index:
             # Either no config file entry for target topic, or malformed
             # config file that does not include both 'ltikey' and 'ltisecret'
             # JSON fields for given target topic: 
-            self.logErr("No entry for topic '%s' in config file, or ill-formed config file; --> Requestor not authorized for this topic" %\
+            self.logErr("No entry for topic '%s' in config file, or ill-formed config file; --> Requestor not authorized for this topic",
                         target_topic)
-            # Required response header field for 401-not authenticated:
-            self.set_header('WWW-Authenticate', 'given_key/given_secret')
-            self.returnHTTPError(401, "Service not authorized for bus topic '%s'" % target_topic)
-            return False
-
-        return True
+            return (401, "Service not authorized for bus topic '%s'" % target_topic)
+        if not auth_index.check(target_topic, given_key, given_secret):
+            self.logErr("Key or secret does not match key/secret for topic '%s' in config file.", target_topic)
+            return (401, "Service not authorized for bus topic '%s'" % target_topic)
 
-    def reload_auth_if_new(self):
-        '''
-        Check whether config file with its LTI keys and secrets
-        was modified since last load into auth_dict. If so, update
-        auth_dict and return True. Else just return False.
-        :return True if auth_dict was updated, else return False.
-        :rtype bool
-        '''
-        
-        statinfo = os.stat(LTISchoolbusBridge.configfile)
-        if LTISchoolbusBridge.auth_file_mod_time < statinfo.st_mtime and\
-           LTISchoolbusBridge.load_auth_info(LTISchoolbusBridge.configfile, except_on_failure=False):
-            self.logInfo('Noticed that config file %s changed.' % LTISchoolbusBridge.configfile)
-            return True
-        else:
-            return False
-        
+        return None
 
     def returnHTTPError(self, status_code, msg):
         '''
@@ -502,190 +2288,106 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
         # often prevents return of a faulty JSON structure: 
         # raise tornado.web.HTTPError(status_code=status_code, reason=msg)
 
-    def echoParmsToEventDispatcher(self, postBodyDict):
+    def returnRateLimited(self, wait):
         '''
-        For testing only: Write an HTML form back to the calling browser.
+        Respond with status 429, and a Retry-After header.
         
-        :param postBodyDict: Dict that contains the HTML form attr/val pairs.
-        :type postBodyDict: {string : string}
+        :param wait: seconds until the request would be accepted
+        :type wait: float
         '''
-        paramNames = postBodyDict.keys()
-        paramNames.sort()
-        self.write('<html><body>')
-        self.write('<b>LTI-SchoolBus bridge Was Invoked With Parameters:</b><br><br>')
-        for key in paramNames:
-            self.write('<b>%s: </b>%s<br>' % (key, postBodyDict[key]))
-        self.write("</body></html>")
+        retry_after = self.retry_after_seconds(wait)
+        self.returnHTTPError(429, 'Rate limit exceeded; retry after %s seconds.' % retry_after)
+        self.set_header('Retry-After', str(retry_after))
         
-    # -------------------------------- SchoolBus Handler ---------
-    
-    def publish_to_bus(self, topic, payload):
+    def returnForwardedActionError(self, action):
         '''
-        Given a topic and an arbitrary string, publishes the
-        string to the SchoolBus.
+        Respond with status 403 to a request on the leader's loopback
+        port other than subscribe or unsubscribe. Other workers only
+        forward those; anything else comes from another local process,
+        and would bypass the rate limits.
         
-        :param topic: topic to which message will be published
-        :type topic: str
-        :param payload: will be placed in the bus message content field.
-        :type payload: str
+        :param action: the request's action
+        :type action: str
         '''
-        bus_message = BusMessage(content=payload, topicName=topic)
-        self.busAdapter.publish(bus_message)
+        self.logErr("Request with action '%s' on the port for requests forwarded by other workers.", action)
+        self.returnHTTPError(403, "Only subscribe and unsubscribe requests are accepted on this port; action was '%s'." % action)
         
-        self.published_to_bus_counter += 1
-        # Note every 100 messages:
-        if self.published_to_bus_counter % 100 == 0:
-            self.logInfo('Published total of %s messages to bus.' % self.published_to_bus_counter)
-    
-    def lti_subscribe(self, topic, url):
+    def returnOverloaded(self, kind, retry_after):
         '''
-        Allows LTI consumers to subscribe to SchoolBus topics. 
-        The consumer must supply a URL to which arriving messages
-        and their time stamps are POSTed. It is legal to subscribe
-        to the same topic multiple times with different URLs. All 
-        URLs will be POSTed to with incoming messages. It is safe
-        to subscribe to the same topic with the same URL multiple
-        times. This situation is a no-op. It is also legal to have message
-        of multiple topics delivered to the same consumer URL.
+        Respond with status 503, and a Retry-After header, to a
+        request that admission control turned away. Subscribe
+        requests receive the back-off hint in the body as well:
         
-        :param topic: the SchoolBus topic to listen to
-        :type topic: str
-        :param url: URI where consumer is ready to receive POSTs with incoming messages
-        :type url: str
-        '''
-
-        try:
-            # Do we already have this URL subscribed for this topic?
-            self.lti_subscriptions[topic].index(url)
-        except KeyError:
-            # Nobody is currently subscribed to the topic:
-            self.lti_subscriptions[topic] = [url]
-            self.lti_subscriptions.save()
-        except ValueError:
-            # There are subscriptions to the topic, but url is not among them;
-            # this is the 'normal' case:
-            self.lti_subscriptions[topic].append(url)
-            self.lti_subscriptions.save()
-
-        self.busAdapter.subscribeToTopic(topic, functools.partial(self.to_lti_transmitter))
-                
-    def lti_unsubscribe(self, topic, url):
-        '''
-        Allows LTI consumers to unsubscribe from a SchoolBus topic.
-        It is safe to unsubscribe from a topic/url without first
-        subscribing. This event is a no-op. If the given topic
-        is subscribed to with multiple delivery URLs, only the
-        given URL will no longer receive messages on that topic.
+            {"status" : 503,
+             "reason" : "Bridge is overloaded; retry after 30 seconds.",
+             "retry_after" : 30}
         
-        :param topic: topic from which to unsubscribe
-        :type topic: str
-        :param url: delivery URI associated with the topic 
-        :type url: str
+        :param kind: 'publish' or 'subscribe'
+        :type kind: str
+        :param retry_after: seconds after which to retry
+        :type retry_after: float
         '''
-        self.busAdapter.unsubscribeFromTopic(topic)
-        try:
-            self.lti_subscriptions[topic].remove(url)
-            self.lti_subscriptions.save()
-        except (KeyError, ValueError):
-            # Subscription wasn't in our records:
-            pass
+        retry_after = self.retry_after_seconds(retry_after)
+        reason = 'Bridge is overloaded; retry after %s seconds.' % retry_after
+        self.returnHTTPError(503, reason)
+        self.set_header('Retry-After', str(retry_after))
+        if kind == 'subscribe':
+            self.write({'status' : 503, 'reason' : reason, 'retry_after' : retry_after})
         
-    def bus_to_lti_callback(self, bus_msg):
+    def returnSchemaError(self, target_topic, schema_errors):
         '''
-        Called from BusAdapter when a bus message arrives
-        for one or more LTI components. We just schedule
-        the real handler with the ioloop. This is so that
-        the Tornado and BusAdapter threads don't interfere:
-        the IOLoop is not thread-safe. self.bus_in_msg_handler
-        is the partial function for method to_lti_transmitter()
+        Respond with status 422, and a body that lists how the
+        payload violates the schema of its topic:
         
-        :param bus_msg: message that arrived on the bus 
-        :type bus_msg: BusMessage
-        '''
-        tornado.ioloop.IOLoop.current().add_callback(self.bus_in_msg_handler, bus_msg)
+            {"status" : 422,
+             "reason" : "Payload does not match the schema of bus topic 'studentAction'",
+             "errors" : [{"path" : "course_id", "error" : "is required"}]}
         
-    def to_lti_transmitter(self, bus_msg):
+        :param target_topic: topic the payload was to be published to
+        :type target_topic: str
+        :param schema_errors: result of schema_errors()
+        :type schema_errors: [{str : str}]
         '''
-        Called by BusAdapter with incoming messages to which at least
-        one LTI consumer has subscribed. Delivers the message to
-        all URLs that were provided in previous calls to lti_subscribe().
-        Delivery will be JSON:
-            {
-                "time"   : "ISO time string",
-                "topic"  : "SchoolBus topic of bus message",
-                "payload": "message's 'content' field"
-            }
-        Logged errors: 
-             - no subscribers for topic: unsubscribes from the topic as side effect
-             - URL is not reachable, so POST failed
-             - HTTP-based error returned during POST
+        reason = self.schema_failure_reason(target_topic)
+        self.clear()
+        self.set_status(422, reason=reason)
+        self.write({'status' : 422, 'reason' : reason, 'errors' : schema_errors})
         
-        :param bus_msg: the incoming SchoolBus message
-        :type bus_msg: BusMessage
+    def echoParmsToEventDispatcher(self, postBodyDict):
         '''
-        topic = bus_msg.topicName
-        try:
-            # Get the list of LTI URLs where msgs of this topic are to
-            # be delivered:
-            subscriber_urls = self.lti_subscriptions[topic]
-        except KeyError:
-            self.logErr("Server received msg for topic '%s', but subscriber dict has no subscribers for that topic." % topic)
-            self.busAdapter.unsubscribeFromTopic(topic)
-            return
+        For testing only: Write an HTML form back to the calling browser.
         
-        # Look up the ltiKey and ltiSecret for the
-        # topic:
-        # Get sub-dict with secret and key from config file
-        # See class header for config file format:
-        try:
-            auth_entry = LTISchoolbusBridge.auth_dict[topic]
-            (ltiKey, ltiSecret) = (auth_entry['ltiKey'], auth_entry['ltiSecret'])
-        except KeyError:
-            # Yes, there is a subscriber for this topic, but
-            # not a key and/or secret.
-            self.logErr('Received bus msg on topic %s to which subscriptions existed, but no key/secret.' % topic)
-            # Unsubscribe from this topic:
-            self.busAdapter.unsubscribeFromTopic(topic)
-            return
+        :param postBodyDict: Dict that contains the HTML form attr/val pairs.
+        :type postBodyDict: {string : string}
+        '''
+        paramNames = postBodyDict.keys()
+        paramNames.sort()
+        self.write('<html><body>')
+        self.write('<b>LTI-SchoolBus bridge Was Invoked With Parameters:</b><br><br>')
+        for key in paramNames:
+            self.write('<b>%s: </b>%s<br>' % (key, postBodyDict[key]))
+        self.write("</body></html>")
         
-        msg_to_post = '{"time" : "%s", "ltiKey" : "%s", "ltiSecret" : "%s", "bus_topic" : "%s", "payload" : "%s"}' %\
-            (bus_msg.isoTime, ltiKey, ltiSecret, topic, bus_msg.content)
-
-        # POST the msg to each LTI URL that requested the topic:
-        for lti_subscriber_url in subscriber_urls:
-            try:
-                request = urllib2.Request(lti_subscriber_url, msg_to_post, {'Content-Type': 'application/json'})
-                response = urllib2.urlopen(request,             #@UnusedVariable
-                                           json.dumps(msg_to_post),
-                                           timeout=LTISchoolbusBridge.LTI_BRIDGE_DELIVERY_TIMEOUT) 
-
-#****                #r = requests.post(lti_subscriber_url, data=msg_to_post, verify=False)
-#                 r = requests.post(lti_subscriber_url, 
-#                                   data=msg_to_post, 
-#                                   cert=['/home/paepcke/.ssl/duo_stanford_edu.pem',
-#                                         '/home/paepcke/.ssl/duo.stanford.edu.key'],
-#                                   verify=True)
-            except URLError as e:
-                self.logErr('Bad delivery URL %s, SSL configuration for topic %s, or server down (%s).' %\
-                             (lti_subscriber_url, topic, `e`))
-                continue
-#            (status, reason) = (r.status_code, r.reason)
-#            if status != 200:
-#                self.logErr("Failed to deliver bus message to subscriber %s; %s: %s" % (lti_subscriber_url, status, reason))
-            self.delivered_to_lti_counter += 1
-            # Note every 100 deliveries:
-            if self.delivered_to_lti_counter % 100 == 0:
-                self.logInfo('Delivered total of %s messages to LTI clients.' % self.delivered_to_lti_counter)
-            
-            
     # -------------------------------- Utilities ---------            
         
     @classmethod
-    def setupLogging(cls, loggingLevel, logFile=None):
+    def setupLogging(cls, loggingLevel, logFile=None, rate=LTI_BRIDGE_LOG_RATE):
+        '''
+        Direct the 'ltibridge' logger to logFile, or to the console.
+        Records are written and rotated by a background thread.
+        
+        :param loggingLevel: lowest level that is logged
+        :type loggingLevel: int
+        :param logFile: file to log to. Default: stderr
+        :type logFile: {str | None}
+        :param rate: records per second that each message template
+            may log; None for no limit
+        :type rate: {int | float | None}
+        '''
         if cls.loggingInitialized:
             # Remove previous file or console handlers,
             # else we get logging output doubled:
-            cls.logger.handlers = []
+            cls.shutdownLogging()
             
         # Set up logging:
         cls.logger = logging.getLogger('ltibridge')
@@ -698,28 +2400,61 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
                                                backupCount=6)     # Keep at most 6 old logs
         formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
         handler.setFormatter(formatter)            
-        cls.logger.addHandler(handler)
+        # Formatting, writing, and rotating happen in the handler's
+        # writer thread, not in the thread that logs:
+        cls.log_handler = QueueingHandler(handler, max_queued=cls.LTI_BRIDGE_LOG_QUEUE_SIZE)
+        cls.log_rate_filter = None
+        if rate is not None:
+            cls.log_rate_filter = RateLimitFilter(rate=rate, burst=cls.LTI_BRIDGE_LOG_BURST)
+            cls.log_handler.addFilter(cls.log_rate_filter)
+        cls.logger.addHandler(cls.log_handler)
         cls.logger.setLevel(loggingLevel)
         cls.loggingInitialized = True
+        
+    @classmethod
+    def shutdownLogging(cls):
+        '''
+        Write the log records that are still queued, and
+        remove the handlers that setupLogging() installed.
+        '''
+        for handler in cls.logger.handlers:
+            handler.close()
+        cls.logger.handlers = []
+        cls.log_handler = None
+        cls.log_rate_filter = None
+        
+    @classmethod
+    def log_drops(cls):
+        '''
+        :return: (reason,) --> number of log records not written for
+            that reason: a full queue, or a category over its rate limit
+        :rtype: {(str,) : int}
+        '''
+        drops = {}
+        if cls.log_handler is not None:
+            drops[('queue_full',)] = cls.log_handler.dropped_counter
+        if cls.log_rate_filter is not None:
+            drops[('rate_limited',)] = cls.log_rate_filter.suppressed_counter
+        return drops
  
-    def logDebug(self, msg):
-        LTISchoolbusBridge.logger.debug(msg)
+    def logDebug(self, msg, *args):
+        LTISchoolbusBridge.logger.debug(msg, *args)
 
-    def logWarn(self, msg):
-        LTISchoolbusBridge.logger.warn(msg)
+    def logWarn(self, msg, *args):
+        LTISchoolbusBridge.logger.warn(msg, *args)
 
-    def logInfo(self, msg):
-        LTISchoolbusBridge.logger.info(msg)
+    def logInfo(self, msg, *args):
+        LTISchoolbusBridge.logger.info(msg, *args)
 
-    def logErr(self, msg):
-        LTISchoolbusBridge.logger.error(msg)
+    def logErr(self, msg, *args):
+        LTISchoolbusBridge.logger.error(msg, *args)
         
     @classmethod
     def load_auth_info(cls, configfile, except_on_failure=False):
         '''
         Given location of the configuration file, which holds
         the keys and secrets of authorized LTI components,
-        (re)-initialize the class variable auth_dict from
+        (re)-initialize the class variable auth_index from
         that file. It is ok to call this method more than once.
         Class variable LTISchoolbusBridge.auth_file_mod_time is
         updated with current file mod time.
@@ -736,22 +2471,33 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
         '''
 
         try:
-            with open(configfile, 'r') as conf_fd:
-                # Use jsmin to remove any C/C++ comments from the
-                # config file:
-                LTISchoolbusBridge.auth_dict = json.loads(jsmin(conf_fd.read()))
-                statinfo = os.stat(configfile)
-                LTISchoolbusBridge.auth_file_mod_time = statinfo.st_mtime
-        except IOError:
-            if except_on_failure:
-                raise
-            else:
-                return False
-        except ValueError:
+            # C/C++ comments are allowed in the config file:
+            (config_dict, mod_time) = read_config(configfile)
+            auth_index = AuthIndex(config_dict, version=mod_time)
+        except (IOError, ValueError):
             if except_on_failure:
                 raise
             else:
                 return False
+        for topic in auth_index.bad_topics:
+            logging.getLogger('ltibridge').error("Config file entry for topic '%s' lacks ltiKey or ltiSecret; ignoring it." % topic)
+        schema_index = SchemaIndex(config_dict)
+        for (topic, error) in schema_index.bad_schemas:
+            logging.getLogger('ltibridge').error("Config file entry for topic '%s' has a bad payload schema; not validating payloads: %s" % (topic, error))
+        rate_limits = RateLimits(config_dict)
+        for (topic, error) in rate_limits.bad_limits:
+            logging.getLogger('ltibridge').error("Config file entry for topic '%s' has a bad rate limit; ignoring it: %s" % (topic, error))
+        dedup_topics = DedupTopics(config_dict)
+        for (topic, error) in dedup_topics.bad_entries:
+            logging.getLogger('ltibridge').error("Config file entry for topic '%s' has a bad dedup_by_payload field; ignoring it: %s" % (topic, error))
+        # Requests in progress keep using the index they
+        # started with; later ones see the new one:
+        LTISchoolbusBridge.auth_index = auth_index
+        LTISchoolbusBridge.schema_index = schema_index
+        LTISchoolbusBridge.rate_limits = rate_limits
+        LTISchoolbusBridge.dedup_topics = dedup_topics
+        LTISchoolbusBridge.auth_file_mod_time = auth_index.version
+        return True
 
     @classmethod  
     def makeApp(cls, init_parm_dict):
@@ -759,10 +2505,19 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
         Create the tornado application, making it 
         called via http://myServer.stanford.edu:<port>/schoolbus
         
+        The request handler's initialize() method receives a
+        'runtime' keyword argument: the one BridgeRuntime instance
+        that serves all requests. Callers may pass their own runtime
+        in init_parm_dict, else one is created here.
+        
         :param init_parm_dict: keyword args to pass to initialize() method.
         :type init_parm_dict: {string : <any>}
         '''
         
+        init_parm_dict = dict(init_parm_dict)
+        if init_parm_dict.get('runtime', None) is None:
+            init_parm_dict['runtime'] = BridgeRuntime()
+        
         settings = {
                     'path': os.path.join(os.path.dirname(__file__), 'static_html'),
                     'default_filename': 'index.html'
@@ -770,14 +2525,31 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
         
         # React to HTTPS://<server>:<post>/:  Only GET will work, and will show instructions.
         # and to   HTTPS://<server>:<post>/schoolbus  Only POST will work there.
+        # and to   HTTPS://<server>:<post>/schoolbus/stream  for streamed bulk publishing.
+        # and to   HTTPS://<server>:<post>/metrics  Only GET; operational metrics.
         handlers = [
-                    (r"/schoolbus", LTISchoolbusBridge),
+                    (r"/schoolbus", LTISchoolbusBridge, init_parm_dict),
+                    (r"/schoolbus/stream", LTISchoolbusStreamBridge, init_parm_dict),
+                    (r"/metrics", MetricsHandler, {'runtime' : init_parm_dict['runtime']}),
                     (r"/(.*)", tornado.web.StaticFileHandler, settings)
                     ]        
         
         application = tornado.web.Application(handlers)
         return application
     
+    @classmethod
+    def makeLeaderApp(cls, runtime):
+        '''
+        Create the tornado application that the leader worker serves on
+        the loopback interface, for the subscribe and unsubscribe requests
+        that the other workers forward to it. It has only the /schoolbus
+        route, which rejects all other actions.
+        
+        :param runtime: the leader's runtime
+        :type runtime: BridgeRuntime
+        '''
+        return tornado.web.Application([(r"/schoolbus", LTISchoolbusBridge, {'runtime' : runtime, 'forwarded' : True})])
+    
     @classmethod
     def guess_key_path(cls):
         '''
@@ -840,7 +2612,197 @@ class LTISchoolbusBridge(tornado.web.RequestHandler):
         except IOError:
             raise IOError('None of %s, %s, or %s exists or is readable.' %\
                           (certpath1, certpath2, certpath3))
+
+
+@tornado.web.stream_request_body
+class LTISchoolbusStreamBridge(LTISchoolbusBridge):
+    '''
+    Streaming ingest for large replays of events, such as
+    a semester's backfill. Clients POST to /schoolbus/stream
+    a body of newline-delimited JSON, one complete publish
+    message per line, as for POSTs to /schoolbus with content
+    type application/x-ndjson. Chunked transfer encoding is fine.
+    
+    Unlike /schoolbus, this handler does not wait for the whole
+    body. Lines are parsed as the bytes arrive, and accepted
+    events are published to the bus in pipelined batches of
+    LTI_BRIDGE_STREAM_BATCH_EVENTS. Tornado reads the next part of
+    the body only after the previous part has been published, so
+    a slow bus slows down the sender instead of filling memory.
+    Memory use is bounded by the batch size and the maximum line
+    length, whatever the size of the body.
+    
+    The response summarizes the outcome:
     
+        {"received" : <number of lines>,
+         "published" : <number of events published>,
+         "rejected" : <number of events not published>,
+         "duplicates" : <number of events not published again; see idempotency_key>,
+         "errors" : [{"line" : 17, "status" : 401, "reason" : "..."}, ...]
+        }
+        
+    where "errors" lists at most LTI_BRIDGE_STREAM_MAX_ERRORS
+    of the rejected lines (1-based line numbers).
+    '''
+    
+    # Accepted events per pipelined publish to the bus:
+    LTI_BRIDGE_STREAM_BATCH_EVENTS = 500
+    # Longer lines are rejected with status 413:
+    LTI_BRIDGE_STREAM_MAX_LINE = 1024 * 1024
+    # Upper limit on a streamed body, and seconds the
+    # client may take to send it:
+    LTI_BRIDGE_STREAM_MAX_BODY = 64 * 1024 * 1024 * 1024
+    LTI_BRIDGE_STREAM_BODY_TIMEOUT = 3600
+    # Number of rejected lines that are reported individually:
+    LTI_BRIDGE_STREAM_MAX_ERRORS = 100
+    
+    def prepare(self):
+        self.metrics_action = 'stream'
+        # Lift Tornado's limits for non-streamed bodies:
+        if self.request.method == 'POST':
+            self.request.connection.set_max_body_size(LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_BODY)
+            self.request.connection.set_body_timeout(LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_BODY_TIMEOUT)
+        # Bytes of an incomplete line at the end of the last chunk:
+        self.partial_line = ''
+        # True while discarding the rest of an overlong line:
+        self.skipping_line = False
+        self.line_number = 0
+        # (line number, topic, payload, dedup cache key) of events awaiting publication:
+        self.batch = []
+        self.published_counter = 0
+        self.rejected_counter = 0
+        self.duplicate_counter = 0
+        self.errors = []
+        # True if admission control turned the request away; the
+        # body that still arrives is then ignored:
+        self.shed = False
+        if self.request.method == 'POST':
+            retry_after = self.runtime.admission.admit('publish')
+            if retry_after > 0:
+                self.shed = True
+                self.returnOverloaded('publish', retry_after)
+                self.finish()
+    
+    @gen.coroutine
+    def data_received(self, chunk):
+        '''
+        Called by Tornado with each part of the request body
+        as it arrives. Tornado does not deliver the next part
+        until the returned future is done.
+        
+        :param chunk: the next bytes of the body
+        :type chunk: str
+        '''
+        if self.shed:
+            return
+        lines = chunk.split('\n')
+        # Last element is the start of a line whose end
+        # has not arrived yet:
+        rest = lines.pop()
+        for line in lines:
+            if self.skipping_line:
+                # End of an overlong line:
+                self.skipping_line = False
+                self.partial_line = ''
+                continue
+            self.take_line(self.partial_line + line)
+            self.partial_line = ''
+            if len(self.batch) >= LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_BATCH_EVENTS:
+                self.publish_stream_batch()
+                # Let other requests and deliveries have the IOLoop:
+                yield gen.moment
+        if not self.skipping_line:
+            self.partial_line += rest
+            if len(self.partial_line) > LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_LINE:
+                self.line_number += 1
+                self.reject_line(413, 'Line exceeds %s bytes.' % LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_LINE)
+                self.partial_line = ''
+                self.skipping_line = True
+        
+    def post(self):
+        '''
+        Called once the whole body has been received. Handle
+        a final line without trailing newline, publish what
+        is left, and send the summary.
+        '''
+        if self.partial_line and not self.skipping_line:
+            self.take_line(self.partial_line)
+            self.partial_line = ''
+        self.publish_stream_batch()
+        self.logInfo('Streamed ingest of %s lines: %s events published, %s rejected.',
+                     self.line_number, self.published_counter, self.rejected_counter)
+        self.write({'received' : self.line_number,
+                    'published' : self.published_counter,
+                    'rejected' : self.rejected_counter,
+                    'duplicates' : self.duplicate_counter,
+                    'errors' : self.errors})
+        
+    # -------------------------------- Private Methods ---------
+    
+    def take_line(self, line):
+        '''
+        Parse and check one line. Acceptable events are
+        added to the batch; the others are recorded as errors.
+        Blank lines are ignored.
+        '''
+        self.line_number += 1
+        if not line.strip():
+            return
+        if len(line) > LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_LINE:
+            self.reject_line(413, 'Line exceeds %s bytes.' % LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_LINE)
+            return
+        try:
+            event = json_codec.loads(line)
+        except ValueError:
+            event = ValueError('Line did not contain a proper JSON object.')
+        failure = self.event_failure(event)
+        if failure is not None:
+            self.reject_line(*failure)
+            return
+        key = self.publish_dedup_key(event, event['bus_topic'], self.parsed_payload)
+        if key is not None and not self.runtime.dedup_cache.add(key):
+            self.duplicate_counter += 1
+            return
+        self.batch.append((self.line_number, event['bus_topic'], event['payload'], key))
+        
+    def reject_line(self, status_code, reason, schema_errors=None):
+        self.rejected_counter += 1
+        if len(self.errors) < LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_ERRORS:
+            error = {'line' : self.line_number, 'status' : status_code, 'reason' : reason}
+            if schema_errors is not None:
+                error['errors'] = schema_errors
+            self.errors.append(error)
+    
+    def publish_stream_batch(self):
+        if not self.batch:
+            return
+        errors = self.runtime.publish_batch_to_bus([(topic, payload) for (_line_number, topic, payload, _key) in self.batch])
+        for ((line_number, _topic, _payload, key), error) in zip(self.batch, errors):
+            if error is None:
+                self.published_counter += 1
+                continue
+            self.rejected_counter += 1
+            if key is not None:
+                self.runtime.dedup_cache.discard(key)
+            if len(self.errors) < LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_ERRORS:
+                self.errors.append({'line' : line_number, 'status' : 503, 'reason' : 'Could not publish to bus: %s' % str(error)})
+        self.batch = []
+
+    
+class MetricsHandler(tornado.web.RequestHandler):
+    '''
+    Serves the bridge's metrics to GET /metrics, in the
+    Prometheus text exposition format. See metrics.py.
+    '''
+    
+    def initialize(self, runtime):
+        self.runtime = runtime
+        
+    def get(self):
+        self.set_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.write(self.runtime.metrics.render())
+        
+
 # Note: function not method:
 def sig_handler(sig, frame):
     # Schedule call to shutdown, so that all ioloop
@@ -852,6 +2814,18 @@ def sig_handler(sig, frame):
     io_loop.add_callback(io_loop.stop)
 
 
+def stop_if_orphaned(parent_pid):
+    '''
+    Called periodically in worker processes. Shuts the worker down
+    if the process that forked it has ended.
+    
+    :param parent_pid: process ID of the parent
+    :type parent_pid: int
+    '''
+    if os.getppid() != parent_pid:
+        sig_handler(signal.SIGTERM, None)
+
+
 def is_running(process):
     '''
     Return true if Linux process with given name is
@@ -883,6 +2857,13 @@ if __name__ == "__main__":
                         help='Logging level: one of critical, error, warning, info, debug.',
                         dest='loglevel',
                         default=None)
+    parser.add_argument('--lograte',
+                        help='Log records per second allowed for each kind of message; 0 for no limit.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_LOG_RATE,
+                        dest='log_rate',
+                        type=float,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_LOG_RATE
+                        )
     parser.add_argument('--sslcert',
                         help='Absolute path to SSL certificate file.',
                         dest='certfile',
@@ -893,6 +2874,106 @@ if __name__ == "__main__":
                         dest='keyfile',
                         default=None
                         )
+    parser.add_argument('--maxdeliveries',
+                        help='Maximum number of concurrent POSTs of bus messages to LTI consumers.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_MAX_DELIVERIES_IN_FLIGHT,
+                        dest='max_deliveries',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_MAX_DELIVERIES_IN_FLIGHT
+                        )
+    parser.add_argument('--maxhostdeliveries',
+                        help='Maximum number of concurrent POSTs of bus messages to any one LTI host.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_MAX_DELIVERIES_PER_HOST,
+                        dest='max_host_deliveries',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_MAX_DELIVERIES_PER_HOST
+                        )
+    parser.add_argument('--queuemaxmsgs',
+                        help='Maximum number of messages waiting for delivery to any one LTI consumer URL.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_QUEUE_MAX_MESSAGES,
+                        dest='queue_max_msgs',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_QUEUE_MAX_MESSAGES
+                        )
+    parser.add_argument('--queuemaxbytes',
+                        help='Maximum bytes of messages waiting for delivery to any one LTI consumer URL.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_QUEUE_MAX_BYTES,
+                        dest='queue_max_bytes',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_QUEUE_MAX_BYTES
+                        )
+    parser.add_argument('--queueoverflow',
+                        choices=SubscriberQueue.OVERFLOW_POLICIES,
+                        help='What to do with messages for an LTI consumer whose queue is full.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_QUEUE_OVERFLOW_POLICY,
+                        dest='queue_overflow',
+                        default=LTISchoolbusBridge.LTI_BRIDGE_QUEUE_OVERFLOW_POLICY
+                        )
+    parser.add_argument('--slowms',
+                        help='Log requests and bus messages that take longer than this many milliseconds,\n' +\
+                             'with the time spent in each phase; 0 to turn off. Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_SLOW_THRESHOLD_MS,
+                        dest='slow_threshold_ms',
+                        type=float,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_SLOW_THRESHOLD_MS
+                        )
+    parser.add_argument('--tracesample',
+                        help='Fraction of requests and bus messages whose phases are timed, between 0 and 1.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_TRACE_SAMPLE_RATE,
+                        dest='trace_sample_rate',
+                        type=float,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_TRACE_SAMPLE_RATE
+                        )
+    parser.add_argument('--maxlooplag',
+                        help='Shed new publish and subscribe requests while the IOLoop runs this many\n' +\
+                             'milliseconds late; 0 for no limit. Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_MAX_LOOP_LAG_MS,
+                        dest='max_loop_lag_ms',
+                        type=float,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_MAX_LOOP_LAG_MS
+                        )
+    parser.add_argument('--maxinflight',
+                        help='Shed new publish and subscribe requests while this many deliveries are in\n' +\
+                             'flight or waiting for a connection; 0 for no limit. Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_MAX_IN_FLIGHT,
+                        dest='max_in_flight',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_MAX_IN_FLIGHT
+                        )
+    parser.add_argument('--maxqueuedbytes',
+                        help='Shed new publish and subscribe requests while the consumer queues hold this\n' +\
+                             'many bytes in memory; 0 for no limit. Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_MAX_QUEUED_BYTES,
+                        dest='max_queued_bytes',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_MAX_QUEUED_BYTES
+                        )
+    parser.add_argument('--admitbelow',
+                        help='Stop shedding once all load signals are below this fraction of their limits.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_ADMISSION_LOW_FRACTION,
+                        dest='admission_low_fraction',
+                        type=float,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_ADMISSION_LOW_FRACTION
+                        )
+    parser.add_argument('--dedupttl',
+                        help='Seconds for which idempotency keys of publish requests are remembered;\n' +\
+                             '0 turns deduplication off. Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_DEDUP_TTL,
+                        dest='dedup_ttl',
+                        type=float,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_DEDUP_TTL
+                        )
+    parser.add_argument('--dedupmaxkeys',
+                        help='Most idempotency keys remembered, at about 250 bytes each.\n' +\
+                             'Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_DEDUP_MAX_KEYS,
+                        dest='dedup_max_keys',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_DEDUP_MAX_KEYS
+                        )
+    parser.add_argument('--workers',
+                        help='Number of worker processes that share the service port; 0 for one per CPU.\n' +\
+                             'Worker 0 also keeps subscriptions. Each worker delivers bus messages to its\n' +\
+                             'share of the LTI consumers, and logs to the log file name with .worker<N>\n' +\
+                             'appended. Default: %s' % LTISchoolbusBridge.LTI_BRIDGE_WORKERS,
+                        dest='workers',
+                        type=int,
+                        default=LTISchoolbusBridge.LTI_BRIDGE_WORKERS
+                        )
 
     args = parser.parse_args();
     
@@ -938,7 +3019,7 @@ if __name__ == "__main__":
         os.makedirs(os.path.dirname(args.logfile))
     except:
         pass
-    LTISchoolbusBridge.setupLogging(loggingLevel=loglevel, logFile=args.logfile)
+    LTISchoolbusBridge.setupLogging(loggingLevel=loglevel, logFile=args.logfile, rate=args.log_rate or None)
     
     # Read the config file, and make it available as a dict:
     configfile = args.configfile
@@ -957,10 +3038,6 @@ if __name__ == "__main__":
         print("Bad confiuration file syntax: %s" % `e`)
         sys.exit()
     
-    # Tornado application object (empty keyword parms dict):    
-    
-    application = LTISchoolbusBridge.makeApp({})
-    
     # If no SSL cert/key file was provided in a CLI option,
     # make an educated guess: 
     #   For cert file try:
@@ -1002,6 +3079,64 @@ if __name__ == "__main__":
         print('Cannot start server; no SSL key: %s.' % `e`)
         sys.exit()
     
+    # Bind the service port before forking worker processes, so
+    # that all workers accept connections on the same socket:
+    sockets = tornado.netutil.bind_sockets(LTISchoolbusBridge.LTI_BRIDGE_SERVICE_PORT)
+    leader_url = None
+    worker_id = None
+    num_workers = args.workers if args.workers > 0 else tornado.process.cpu_count()
+    if num_workers != 1:
+        # The leader's private port for subscription requests
+        # that other workers forward:
+        leader_sockets = tornado.netutil.bind_sockets(0, address='127.0.0.1')
+        leader_url = 'http://127.0.0.1:%s/schoolbus' % leader_sockets[0].getsockname()[1]
+        parent_pid = os.getpid()
+        # The parent process just ends on SIGTERM; the
+        # workers notice, and shut down cleanly:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        # Returns in each of the workers; the parent process stays
+        # behind, restarting workers that die:
+        worker_id = tornado.process.fork_processes(num_workers)
+        signal.signal(signal.SIGTERM, sig_handler)
+        # Threads do not survive the fork; give the worker a log
+        # writer thread of its own. Each worker writes and rotates
+        # its own file; rotating handlers that share one file would
+        # rename, and delete, each other's logs:
+        worker_logfile = None if args.logfile is None else '%s.worker%s' % (args.logfile, worker_id)
+        LTISchoolbusBridge.setupLogging(loggingLevel=loglevel, logFile=worker_logfile, rate=args.log_rate or None)
+        if worker_id == 0:
+            leader_url = None
+        else:
+            for sock in leader_sockets:
+                sock.close()
+    
+    # The one set of bus connection, subscriptions, and delivery
+    # machinery that all requests of this worker share. Each worker
+    # has its own delivery engine, with its own connection pool:
+    delivery_engine = DeliveryEngine(max_in_flight=args.max_deliveries,
+                                     max_per_host=args.max_host_deliveries,
+                                     request_timeout=LTISchoolbusBridge.LTI_BRIDGE_DELIVERY_TIMEOUT,
+                                     idle_timeout=LTISchoolbusBridge.LTI_BRIDGE_DELIVERY_IDLE_TIMEOUT)
+    runtime = BridgeRuntime(leader_url=leader_url,
+                            shard_id=worker_id,
+                            num_shards=num_workers,
+                            delivery_engine=delivery_engine,
+                            queue_options={'max_messages' : args.queue_max_msgs,
+                                           'max_bytes' : args.queue_max_bytes,
+                                           'overflow_policy' : args.queue_overflow},
+                            trace_options={'threshold_ms' : args.slow_threshold_ms or None,
+                                           'sample_rate' : args.trace_sample_rate},
+                            admission_options={'max_loop_lag_ms' : args.max_loop_lag_ms or None,
+                                               'max_in_flight' : args.max_in_flight or None,
+                                               'max_queued_bytes' : args.max_queued_bytes or None,
+                                               'low_fraction' : args.admission_low_fraction},
+                            dedup_options={'ttl' : args.dedup_ttl or None,
+                                           'max_entries' : args.dedup_max_keys})
+    
+    # Tornado application object:    
+    
+    application = LTISchoolbusBridge.makeApp({'runtime' : runtime})
+    
     # We need an SSL capable HTTP server:
     # For configuration without a cert, add "cert_reqs"  : ssl.CERT_NONE
     # to the ssl_options (though I haven't tried it out.):
@@ -1010,20 +3145,31 @@ if __name__ == "__main__":
                                                 ssl_options={"certfile": args.certfile,
                                                              "keyfile" : args.keyfile
     })
+    # Run the app on its port. Instead of application.listen, as in
+    # non-SSL services, the http_server is given the bound sockets:
+    http_server.add_sockets(sockets)
+    if num_workers != 1:
+        if leader_url is None:
+            # Plain HTTP on the loopback interface, for forwarded subscription
+            # requests, which the forwarding worker already counted against
+            # the rate limits:
+            leader_server = tornado.httpserver.HTTPServer(LTISchoolbusBridge.makeLeaderApp(runtime))
+            leader_server.add_sockets(leader_sockets)
+        # Workers stop if the parent process is gone:
+        tornado.ioloop.PeriodicCallback(functools.partial(stop_if_orphaned, parent_pid), 1000).start()
 
     fqdn = socket.getfqdn()
     service_url  = 'https://%s:%s/schoolbus' % (fqdn, LTISchoolbusBridge.LTI_BRIDGE_SERVICE_PORT)
     info_url     = 'https://%s:%s/' % (fqdn, LTISchoolbusBridge.LTI_BRIDGE_SERVICE_PORT)
-    print('Starting LTI-Schoolbus bridge for POST service at %s (info service at %s)' % (service_url, info_url))
+    if leader_url is None:
+        print('Starting LTI-Schoolbus bridge for POST service at %s (info service at %s)' % (service_url, info_url))
     
-    # Run the app on its port:
-    # Instead of application.listen, as in non-SSL
-    # services, the http_server is told to listen:
-    #*****application.listen(LTISchoolbusBridge.LTI_PORT)
-    http_server.listen(LTISchoolbusBridge.LTI_BRIDGE_SERVICE_PORT)
     try:
         tornado.ioloop.IOLoop.instance().start()
     except KeyboardInterrupt:
             print('LTI-to-Schoolbus bridge has stopped.')
             sys.exit()
+    finally:
+        runtime.close()
+        LTISchoolbusBridge.shutdownLogging()
             
\ No newline at end of file
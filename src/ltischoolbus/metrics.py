@@ -0,0 +1,274 @@
+'''
+Created on Oct 17, 2026
+
+Operational metrics of the bridge, served at GET /metrics in the
+Prometheus text exposition format (version 0.0.4):
+
+    # HELP ltibridge_requests_total HTTP requests, by action and response status.
+    # TYPE ltibridge_requests_total counter
+    ltibridge_requests_total{action="publish",status="200"} 1027
+
+Three kinds of metric are kept in a MetricsRegistry:
+
+   Counter       - monotonically increasing values, one per combination
+                   of label values.
+   Histogram     - distribution of observed values, such as latencies in
+                   seconds, over fixed bucket bounds. The bucket counts of
+                   each label combination live in a list that is allocated
+                   once; observe() only increments one of its entries.
+   GaugeFunction - values that are computed only when metrics are
+                   rendered, such as queue depths. Nothing is recorded
+                   in the hot path for them.
+
+A registry may carry constant labels, which render() adds to every
+sample, such as the worker process whose numbers the metrics are:
+
+    ltibridge_requests_total{worker="2",action="publish",status="200"} 1027
+
+Metrics are recorded and rendered on the IOLoop thread;
+they are not protected by locks.
+
+@author: paepcke
+'''
+from bisect import bisect_left
+
+
+# Upper bounds, in seconds, of latency histogram buckets:
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    '''
+    :return: number as it appears in the exposition format
+    :rtype: str
+    '''
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+def escape_label_value(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(label_names, label_values, extra=''):
+    '''
+    :param extra: preformatted label to append, such as le="0.5"
+    :type extra: str
+    :return: {a="1",b="2"}, or '' if there are no labels
+    :rtype: str
+    '''
+    pairs = ['%s="%s"' % (name, escape_label_value(value)) for (name, value) in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class Counter(object):
+    '''
+    Usage:
+        requests = registry.counter('ltibridge_requests_total', 'HTTP requests.', ('action', 'status'))
+        requests.inc(('publish', 200))
+    '''
+
+    metric_type = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        # Tuple of label values --> count:
+        self.values = {}
+
+    def inc(self, label_values=(), amount=1):
+        '''
+        :param label_values: one value per label name, in order
+        :type label_values: (<any>)
+        :param amount: increment
+        :type amount: {int | float}
+        '''
+        try:
+            self.values[label_values] += amount
+        except KeyError:
+            self.values[label_values] = amount
+
+    def value(self, label_values=()):
+        return self.values.get(label_values, 0)
+
+    def samples(self):
+        '''
+        :return: (sample name, formatted labels, value) of each series
+        :rtype: [(str, str, {int | float})]
+        '''
+        return [(self.name, format_labels(self.label_names, label_values), value)
+                for (label_values, value) in sorted(self.values.items())]
+
+
+class HistogramSeries(object):
+    '''
+    Bucket counts of one combination of label values. Callers
+    that observe the same series often may keep a reference to
+    it, and skip the lookup by label values.
+    '''
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One count per bucket bound, plus one for +Inf. Counts
+        # are per bucket; they are made cumulative when rendered:
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Index of the first bound >= value; buckets are inclusive:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Histogram(object):
+    '''
+    Usage:
+        latency = registry.histogram('ltibridge_publish_seconds', 'Time to publish.', ('mode',))
+        latency.observe(0.0021, ('single',))
+    '''
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        '''
+        :param buckets: upper bounds of the buckets, ascending. A
+            +Inf bucket is always added.
+        :type buckets: [{int | float}]
+        :raise ValueError: if buckets are not strictly ascending
+        '''
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.bounds = tuple([float(bound) for bound in buckets])
+        if any([lower >= upper for (lower, upper) in zip(self.bounds, self.bounds[1:])]):
+            raise ValueError('Histogram buckets must be strictly ascending: %s' % str(buckets))
+        # Tuple of label values --> HistogramSeries:
+        self.series_by_labels = {}
+
+    def series(self, label_values=()):
+        '''
+        :return: the series for the given label values, created on first use
+        :rtype: HistogramSeries
+        '''
+        try:
+            return self.series_by_labels[label_values]
+        except KeyError:
+            series = self.series_by_labels[label_values] = HistogramSeries(self.bounds)
+            return series
+
+    def observe(self, value, label_values=()):
+        self.series(label_values).observe(value)
+
+    def remove(self, label_values):
+        '''
+        Forget the series of the given label values, such
+        as the one of a delivery URL that no longer exists.
+        '''
+        self.series_by_labels.pop(label_values, None)
+
+    def samples(self):
+        samples = []
+        for (label_values, series) in sorted(self.series_by_labels.items()):
+            cumulative = 0
+            for (bound, count) in zip(self.bounds + (float('inf'),), series.counts):
+                cumulative += count
+                samples.append((self.name + '_bucket',
+                                format_labels(self.label_names, label_values, 'le="%s"' % format_value(bound)),
+                                cumulative))
+            labels = format_labels(self.label_names, label_values)
+            samples.append((self.name + '_sum', labels, series.total))
+            samples.append((self.name + '_count', labels, series.count))
+        return samples
+
+
+class GaugeFunction(object):
+    '''
+    A metric whose values are computed at render time by calling
+    function(). The function returns a number if there are no
+    labels, else a dict from tuples of label values to numbers.
+    '''
+
+    def __init__(self, name, help_text, function, label_names=(), metric_type='gauge'):
+        '''
+        :param metric_type: 'gauge', or 'counter' for values that
+            only ever increase, such as counters kept elsewhere
+        :type metric_type: str
+        '''
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+        self.label_names = tuple(label_names)
+        self.metric_type = metric_type
+
+    def samples(self):
+        values = self.function()
+        if not self.label_names:
+            return [(self.name, '', values)]
+        return [(self.name, format_labels(self.label_names, label_values), value)
+                for (label_values, value) in sorted(values.items())]
+
+
+class MetricsRegistry(object):
+    '''
+    Holds all metrics of a process, and renders them as text.
+    '''
+
+    def __init__(self, const_labels=()):
+        '''
+        :param const_labels: (label name, value) pairs that are added
+            to every sample of every metric
+        :type const_labels: [(str, <any>)]
+        '''
+        # name="value",... of the constant labels, or '':
+        self.const_labels = format_labels([name for (name, _value) in const_labels],
+                                          [value for (_name, value) in const_labels])[1:-1]
+        # Metrics in order of registration:
+        self.metrics = []
+        self.names = set()
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name, help_text, function, label_names=(), metric_type='gauge'):
+        return self.register(GaugeFunction(name, help_text, function, label_names, metric_type))
+
+    def render(self):
+        '''
+        :return: all metrics in the text exposition format
+        :rtype: str
+        '''
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help_text.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.metric_type))
+            for (sample_name, labels, value) in metric.samples():
+                if self.const_labels:
+                    labels = '{%s%s' % (self.const_labels, ',' + labels[1:] if labels else '}')
+                lines.append('%s%s %s' % (sample_name, labels, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    # -------------------------------- Private Methods ---------
+
+    def register(self, metric):
+        '''
+        :raise ValueError: if a metric of the same name exists
+        '''
+        if metric.name in self.names:
+            raise ValueError("Metric '%s' is already registered." % metric.name)
+        self.names.add(metric.name)
+        self.metrics.append(metric)
+        return metric
@@ -0,0 +1,416 @@
+'''
+Created on Oct 17, 2026
+
+Schemas for the payloads that are published to a topic. A topic's
+entry in the bridge config file may carry a schema, written in a
+subset of JSON Schema:
+
+    "studentAction" : {"ltiKey" : "...", "ltiSecret" : "...",
+                       "schema" : {"type" : "object",
+                                   "required" : ["course_id", "student_id", "event_type"],
+                                   "properties" : {"course_id"  : {"type" : "string", "minLength" : 1},
+                                                   "event_type" : {"enum" : ["problem_check", "seq_next"]},
+                                                   "answers"    : {"type" : "array",
+                                                                   "items" : {"type" : "string"}}}}}
+
+Supported keywords are type, enum, required, properties,
+additionalProperties (true or false), items, minItems, maxItems,
+minLength, maxLength, pattern, minimum, and maximum; title and
+description are ignored. Any other keyword is an error in the
+config file, so that misspelled constraints do not silently go
+unchecked.
+
+Each schema is compiled once per version of the config file into
+nested closures, one per constraint, so that validating a payload
+does no more than the checks themselves: no walking of the schema,
+no keyword lookups, and error paths are only built for payloads
+that fail. Validation returns a list of errors such as
+
+    [{"path" : "course_id", "error" : "is required"},
+     {"path" : "answers[2]", "error" : "must be of type string"}]
+
+which the bridge returns with status 422.
+
+@author: paepcke
+'''
+import re
+import sys
+
+from ltischoolbus.topic_matcher import TopicMatcher, is_pattern
+
+
+class SchemaError(ValueError):
+    '''
+    A schema in the config file is ill-formed.
+    '''
+    pass
+
+
+class PayloadSchema(object):
+    '''
+    Usage:
+        schema = PayloadSchema({'type' : 'object', 'required' : ['course_id']})
+        errors = schema.validate(payload)
+        if errors:
+            ... reject payload ...
+    '''
+
+    # Errors reported per payload; the rest are not looked for:
+    MAX_ERRORS = 10
+
+    # Schema type name --> classes of parsed JSON values:
+    TYPES = {'object' : (dict,),
+             'array' : (list,),
+             'string' : (str, unicode),
+             'integer' : (int, long),
+             'number' : (int, long, float),
+             'boolean' : (bool,),
+             'null' : (type(None),)}
+
+    KEYWORDS = frozenset(['type', 'enum', 'required', 'properties', 'additionalProperties',
+                          'items', 'minItems', 'maxItems', 'minLength', 'maxLength',
+                          'pattern', 'minimum', 'maximum', 'title', 'description'])
+
+    def __init__(self, schema):
+        '''
+        :param schema: the schema, as parsed from the config file
+        :type schema: {str : <any>}
+        :raise SchemaError: if schema is ill-formed
+        '''
+        self.schema = schema
+        self.check = self.compile_node(schema, '')
+
+    def validate(self, payload):
+        '''
+        :param payload: a parsed payload
+        :type payload: <any>
+        :return: the ways in which payload violates the schema;
+            empty if it does not
+        :rtype: [{str : str}]
+        '''
+        errors = []
+        self.check(payload, errors)
+        if len(errors) > PayloadSchema.MAX_ERRORS:
+            del errors[PayloadSchema.MAX_ERRORS:]
+        return errors
+
+    # -------------------------------- Private Methods ---------
+
+    def compile_node(self, schema, path):
+        '''
+        :param schema: a schema, or the schema of a nested value
+        :type schema: {str : <any>}
+        :param path: where values checked by schema are in the payload;
+            '[]' stands for the index of an array element
+        :type path: str
+        :return: function (value, errors) that appends to errors
+            the ways in which value violates schema
+        :rtype: callable
+        :raise SchemaError: if schema is ill-formed
+        '''
+        if not isinstance(schema, dict):
+            raise SchemaError("Schema at '%s' must be a JSON object; was %s" % (path, schema))
+        unknown = set(schema.keys()) - PayloadSchema.KEYWORDS
+        if unknown:
+            raise SchemaError("Schema at '%s' has unsupported keywords: %s" % (path, ', '.join(sorted(unknown))))
+        try:
+            type_names = self.type_names(schema, path)
+            checks = self.compile_constraints(schema, path, type_names)
+        except SchemaError:
+            raise
+        except (TypeError, ValueError, re.error) as e:
+            raise SchemaError("Schema at '%s' is ill-formed: %s" % (path, e))
+        if checks and checks[0] is None:
+            # The only constraint also checks the type:
+            return checks[1]
+
+        if type_names is None:
+            if not checks:
+                return lambda value, errors: None
+            if len(checks) == 1:
+                return checks[0]
+            def check_all(value, errors):
+                for check in checks:
+                    check(value, errors)
+            return check_all
+
+        (classes, type_error) = self.type_guard(type_names, path)
+        if not checks:
+            def check_type(value, errors):
+                if value.__class__ not in classes:
+                    errors.append(dict(type_error))
+            return check_type
+        if len(checks) == 1:
+            check = checks[0]
+            def check_type_and_constraint(value, errors):
+                if value.__class__ not in classes:
+                    errors.append(dict(type_error))
+                else:
+                    check(value, errors)
+            return check_type_and_constraint
+        def check_type_and_constraints(value, errors):
+            if value.__class__ not in classes:
+                # The other constraints assume the type:
+                errors.append(dict(type_error))
+                return
+            for check in checks:
+                check(value, errors)
+        return check_type_and_constraints
+
+    def type_guard(self, type_names, path):
+        '''
+        :return: the classes of values of the given types, and the
+            error for values of other classes. Parsed JSON values are
+            of exactly these classes, so a set lookup checks the type;
+            bool is not taken for int.
+        :rtype: (frozenset, {str : str})
+        '''
+        classes = frozenset([python_type for type_name in type_names for python_type in PayloadSchema.TYPES[type_name]])
+        return (classes, {'path' : path, 'error' : 'must be of type %s' % ' or '.join(type_names)})
+
+    def type_names(self, schema, path):
+        '''
+        :return: the types that schema allows, or None if it allows any
+        :rtype: {[str] | None}
+        '''
+        type_names = schema.get('type', None)
+        if type_names is None:
+            return None
+        if isinstance(type_names, basestring):
+            type_names = [type_names]
+        for type_name in type_names:
+            if type_name not in PayloadSchema.TYPES:
+                raise SchemaError("Schema at '%s' has unknown type '%s'" % (path, type_name))
+        return type_names
+
+    def compile_constraints(self, schema, path, type_names):
+        '''
+        Constraints of objects, arrays, strings, and numbers only
+        apply to values of that kind; their checks skip other values.
+        If the schema has a type, and one such constraint of a kind
+        that includes the type, the constraint's check reports values
+        of other types itself, which saves a call per value.
+
+        :return: one check per kind of constraint of schema, other
+            than its type; or None, followed by the one check that
+            also checks the type
+        :rtype: [{callable | None}]
+        '''
+        kinds = []
+        if 'required' in schema or 'properties' in schema or 'additionalProperties' in schema:
+            kinds.append((['object'], self.compile_object))
+        if 'items' in schema or 'minItems' in schema or 'maxItems' in schema:
+            kinds.append((['array'], self.compile_array))
+        if 'minLength' in schema or 'maxLength' in schema or 'pattern' in schema:
+            kinds.append((['string'], self.compile_string))
+        if 'minimum' in schema or 'maximum' in schema:
+            kinds.append((['integer', 'number'], self.compile_number))
+        if (type_names is not None and 'enum' not in schema and len(kinds) == 1 and
+            set(type_names) <= set(kinds[0][0])):
+            (classes, type_error) = self.type_guard(type_names, path)
+            return [None, kinds[0][1](schema, path, classes, type_error)]
+        checks = []
+        if 'enum' in schema:
+            checks.append(self.compile_enum(schema['enum'], path))
+        for (kind_names, compile_kind) in kinds:
+            (classes, _type_error) = self.type_guard(kind_names, path)
+            checks.append(compile_kind(schema, path, classes, None))
+        return checks
+
+    def compile_enum(self, allowed, path):
+        if not isinstance(allowed, list) or not allowed:
+            raise SchemaError("Schema at '%s': enum must be a non-empty array" % path)
+        # JSON true is not 1, though True == 1 in Python;
+        # booleans are therefore looked up separately:
+        allowed_bools = frozenset([value for value in allowed if value.__class__ is bool])
+        allowed_others = frozenset([value for value in allowed
+                                    if value.__class__ is not bool and not isinstance(value, (dict, list))])
+        allowed_containers = [value for value in allowed if isinstance(value, (dict, list))]
+        message = 'must be one of %s' % ', '.join([repr(value) for value in allowed])
+
+        def check_enum(value, errors):
+            try:
+                if value in (allowed_bools if value.__class__ is bool else allowed_others):
+                    return
+            except TypeError:
+                # Objects and arrays cannot be hashed:
+                if value in allowed_containers:
+                    return
+            errors.append({'path' : path, 'error' : message})
+        return check_enum
+
+    def compile_object(self, schema, path, classes, type_error):
+        required = schema.get('required', [])
+        if not isinstance(required, list) or not all([isinstance(name, basestring) for name in required]):
+            raise SchemaError("Schema at '%s': required must be an array of property names" % path)
+        properties = schema.get('properties', {})
+        if not isinstance(properties, dict):
+            raise SchemaError("Schema at '%s': properties must be a JSON object" % path)
+        additional = schema.get('additionalProperties', True)
+        if not isinstance(additional, bool):
+            raise SchemaError("Schema at '%s': additionalProperties must be true or false" % path)
+        required_names = frozenset(required)
+        # Sorted, so that errors are reported in a stable order:
+        property_checks = [(name, self.compile_node(properties[name], self.child_path(path, name)))
+                           for name in sorted(properties.keys())]
+        known_names = frozenset(properties.keys())
+        child_path = self.child_path
+
+        def check_object(value, errors):
+            if value.__class__ not in classes:
+                if type_error is not None:
+                    errors.append(dict(type_error))
+                return
+            # One pass in C for the common case that all are present:
+            if not value.viewkeys() >= required_names:
+                for name in required:
+                    if name not in value:
+                        errors.append({'path' : child_path(path, name), 'error' : 'is required'})
+            for (name, check) in property_checks:
+                try:
+                    property_value = value[name]
+                except KeyError:
+                    continue
+                check(property_value, errors)
+            if not additional and not known_names.issuperset(value):
+                for name in sorted(value):
+                    if name not in known_names:
+                        errors.append({'path' : child_path(path, name), 'error' : 'is not allowed'})
+        return check_object
+
+    def compile_array(self, schema, path, classes, type_error):
+        min_items = schema.get('minItems', 0)
+        max_items = schema.get('maxItems', sys.maxint)
+        item_path = path + '[]'
+        item_check = self.compile_node(schema['items'], item_path) if 'items' in schema else None
+        max_errors = PayloadSchema.MAX_ERRORS
+
+        def check_array(value, errors):
+            if value.__class__ not in classes:
+                if type_error is not None:
+                    errors.append(dict(type_error))
+                return
+            num_items = len(value)
+            if num_items < min_items:
+                errors.append({'path' : path, 'error' : 'must have at least %s items' % min_items})
+            elif num_items > max_items:
+                errors.append({'path' : path, 'error' : 'must have at most %s items' % max_items})
+            if item_check is None:
+                return
+            num_errors = len(errors)
+            for item in value:
+                item_check(item, errors)
+            if len(errors) > num_errors:
+                self.index_error_paths(value, item_check, errors, num_errors, path, item_path, max_errors)
+        return check_array
+
+    def index_error_paths(self, value, item_check, errors, num_errors, path, item_path, max_errors):
+        '''
+        Only called for arrays with bad items: check the items
+        again, one at a time, and put their index into the paths
+        of the errors they cause, stopping after max_errors errors.
+        '''
+        del errors[num_errors:]
+        for (index, item) in enumerate(value):
+            if len(errors) >= max_errors:
+                return
+            num_errors = len(errors)
+            item_check(item, errors)
+            for error in errors[num_errors:]:
+                error['path'] = error['path'].replace(item_path, '%s[%s]' % (path, index), 1)
+
+    def compile_string(self, schema, path, classes, type_error):
+        min_length = schema.get('minLength', 0)
+        max_length = schema.get('maxLength', sys.maxint)
+        pattern = schema.get('pattern', None)
+        regex = re.compile(pattern) if pattern is not None else None
+
+        def check_string(value, errors):
+            if value.__class__ not in classes:
+                if type_error is not None:
+                    errors.append(dict(type_error))
+                return
+            length = len(value)
+            if length < min_length:
+                errors.append({'path' : path, 'error' : 'must be at least %s characters long' % min_length})
+            elif length > max_length:
+                errors.append({'path' : path, 'error' : 'must be at most %s characters long' % max_length})
+            if regex is not None and regex.search(value) is None:
+                errors.append({'path' : path, 'error' : 'must match %s' % pattern})
+        return check_string
+
+    def compile_number(self, schema, path, classes, type_error):
+        minimum = schema.get('minimum', float('-inf'))
+        maximum = schema.get('maximum', float('inf'))
+
+        def check_number(value, errors):
+            if value.__class__ not in classes:
+                if type_error is not None:
+                    errors.append(dict(type_error))
+                return
+            if value < minimum:
+                errors.append({'path' : path, 'error' : 'must be at least %s' % minimum})
+            elif value > maximum:
+                errors.append({'path' : path, 'error' : 'must be at most %s' % maximum})
+        return check_number
+
+    def child_path(self, path, name):
+        return name if not path else '%s.%s' % (path, name)
+
+
+class SchemaIndex(object):
+    '''
+    The payload schemas of all topics in the config file.
+    Like AuthIndex, built once per version of the file:
+
+        index = SchemaIndex(config_dict)
+        schema = index.schema_for('studentAction.Hist101')
+        if schema is not None:
+            errors = schema.validate(payload)
+    '''
+
+    def __init__(self, config_dict):
+        '''
+        :param config_dict: the config file's content: topic --> entry.
+            Entries without a 'schema' field are not validated.
+        :type config_dict: {str : {str : <any>}}
+        '''
+        # Topic --> PayloadSchema:
+        self.schemas_by_topic = {}
+        # The topics in schemas_by_topic that are patterns:
+        self.pattern_schemas = TopicMatcher()
+        # (topic, error message) of ill-formed schemas, which are left out:
+        self.bad_schemas = []
+        if not isinstance(config_dict, dict):
+            return
+        for (topic, entry) in config_dict.items():
+            if not isinstance(entry, dict) or 'schema' not in entry:
+                continue
+            try:
+                self.schemas_by_topic[topic] = PayloadSchema(entry['schema'])
+                if is_pattern(topic):
+                    self.pattern_schemas.add(topic)
+            except ValueError as e:
+                self.schemas_by_topic.pop(topic, None)
+                self.bad_schemas.append((topic, str(e)))
+
+    def schema_for(self, topic):
+        '''
+        :param topic: topic a payload is published to
+        :type topic: str
+        :return: the schema of topic's own config entry, else of the
+            most specific pattern that matches topic and has a schema,
+            else None
+        :rtype: {PayloadSchema | None}
+        '''
+        try:
+            return self.schemas_by_topic[topic]
+        except KeyError:
+            pass
+        if len(self.schemas_by_topic) == 0:
+            return None
+        patterns = self.pattern_schemas.match(topic)
+        return self.schemas_by_topic[patterns[0]] if patterns else None
+
+    def __len__(self):
+        return len(self.schemas_by_topic)
@@ -0,0 +1,161 @@
+'''
+Created on Oct 17, 2026
+
+Lightweight timing of the phases of a request, or of the
+handling of a bus message. A PhaseTrace notes the time at the
+end of each phase:
+
+    trace = trace_log.start('post')
+    body = json.loads(...)
+    trace.mark('parse')
+    ...
+    trace.mark('publish')
+    trace_log.finish(trace, action='publish', status=200)
+
+The SlowTraceLog that hands out traces records the duration of
+each phase in a histogram (see metrics.py), and logs a structured
+record of every trace that took longer than its threshold, to the
+'ltibridge.slow' logger:
+
+    Slow post: {"kind":"post","total_ms":312.4,"phases":{"parse":0.08,"auth":0.02,
+                "payload":0.01,"publish":312.2,"respond":0.1},"action":"publish","status":200}
+
+With a sample rate below 1, only that fraction of the requests
+is traced; the others get NO_TRACE, whose mark() does nothing.
+This sampled mode keeps the cost negligible for always-on use,
+while the histograms still show where time is spent.
+
+@author: paepcke
+'''
+from collections import OrderedDict
+import json
+import logging
+import random
+import time
+
+
+class PhaseTrace(object):
+    '''
+    Durations of the consecutive phases of one unit of work.
+    '''
+    __slots__ = ('kind', 'start_time', 'last_time', 'phases')
+
+    def __init__(self, kind, start_time=None):
+        '''
+        :param kind: what is traced, such as 'post'
+        :type kind: str
+        :param start_time: when the work began. Default: now
+        :type start_time: {float | None}
+        '''
+        self.kind = kind
+        self.start_time = self.last_time = time.time() if start_time is None else start_time
+        # (phase, seconds) in order:
+        self.phases = []
+
+    def mark(self, phase):
+        '''
+        End a phase; the next one starts now.
+
+        :param phase: name of the phase that just ended
+        :type phase: str
+        '''
+        now = time.time()
+        self.phases.append((phase, now - self.last_time))
+        self.last_time = now
+
+    def elapsed(self):
+        '''
+        :return: seconds from start to the end of the last phase
+        :rtype: float
+        '''
+        return self.last_time - self.start_time
+
+    def record(self, **context):
+        '''
+        :param context: additional fields of the record, such as the HTTP status
+        :return: the trace as a JSON-serializable dict, with times in milliseconds
+        :rtype: OrderedDict
+        '''
+        phases = OrderedDict()
+        for (phase, seconds) in self.phases:
+            # A phase may occur more than once, e.g. per batch:
+            phases[phase] = round(phases.get(phase, 0) + seconds * 1000, 3)
+        record = OrderedDict([('kind', self.kind),
+                              ('total_ms', round(self.elapsed() * 1000, 3)),
+                              ('phases', phases)])
+        for key in sorted(context.keys()):
+            record[key] = context[key]
+        return record
+
+
+class NullTrace(object):
+    '''
+    Stands in for a PhaseTrace of work that is not sampled.
+    '''
+    __slots__ = ()
+
+    def mark(self, phase):
+        pass
+
+NO_TRACE = NullTrace()
+
+
+class SlowTraceLog(object):
+    '''
+    Hands out traces, and collects the finished ones.
+    '''
+
+    def __init__(self, threshold_ms=None, sample_rate=1.0, phase_histogram=None):
+        '''
+        :param threshold_ms: traces that take longer are logged.
+            None: no trace is logged.
+        :type threshold_ms: {int | float | None}
+        :param sample_rate: fraction of start() calls that return a
+            real trace, between 0 and 1
+        :type sample_rate: float
+        :param phase_histogram: if given, receives the seconds of each
+            phase, labeled with the trace's kind and the phase
+        :type phase_histogram: {metrics.Histogram | None}
+        :raise ValueError: if sample_rate is not between 0 and 1
+        '''
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('Trace sample rate must be between 0 and 1; was %s' % sample_rate)
+        self.threshold = None if threshold_ms is None else threshold_ms / 1000.
+        self.sample_rate = sample_rate
+        self.phase_histogram = phase_histogram
+        self.logger = logging.getLogger('ltibridge.slow')
+        self.slow_counter = 0
+
+    def start(self, kind, start_time=None):
+        '''
+        :param kind: what is traced, such as 'post'
+        :type kind: str
+        :param start_time: when the work began. Default: now
+        :type start_time: {float | None}
+        :return: a new trace, or NO_TRACE if this one is not sampled
+        :rtype: {PhaseTrace | NullTrace}
+        '''
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return NO_TRACE
+        return PhaseTrace(kind, start_time)
+
+    def finish(self, trace, **context):
+        '''
+        Record a trace's phases, and log it if it was slow.
+
+        :param trace: trace returned by start()
+        :type trace: {PhaseTrace | NullTrace}
+        :param context: fields to add to the logged record
+        :return: True if the trace was logged as slow, else False
+        :rtype: bool
+        '''
+        if trace is NO_TRACE:
+            return False
+        if self.phase_histogram is not None:
+            for (phase, seconds) in trace.phases:
+                self.phase_histogram.observe(seconds, (trace.kind, phase))
+        if self.threshold is None or trace.elapsed() < self.threshold:
+            return False
+        self.slow_counter += 1
+        self.logger.warning('Slow %s: %s', trace.kind, json.dumps(trace.record(**context), separators=(',', ':')))
+        return True
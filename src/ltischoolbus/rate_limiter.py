@@ -0,0 +1,335 @@
+'''
+Created on Oct 17, 2026
+
+Rate limits at the bridge's ingress, so that one misbehaving LTI
+consumer cannot flood /schoolbus and starve the others. Limits are
+declared in the config file, next to the keys and secrets:
+
+    "studentAction" : {"ltiKey" : "...", "ltiSecret" : "...",
+                       "key_rate_limit"   : {"rate" : 20, "burst" : 40},
+                       "topic_rate_limit" : {"rate" : 200, "burst" : 400}}
+
+key_rate_limit limits all requests made with the entry's LTI key,
+whatever their topic. If a key appears in several entries, its
+lowest limit applies. topic_rate_limit limits the requests to each
+topic that the entry covers; for a pattern entry, every matching
+topic has its own budget. Rates are requests (or bulk publish
+events) per second, bursts the number of requests allowed at once.
+
+   RateLimits   - the limits of one version of the config file,
+                  like AuthIndex and SchemaIndex.
+   TokenBuckets - the state of many token buckets, one float each.
+   RateLimiter  - a TokenBuckets instance for keys and one for topics;
+                  lives as long as the bridge, across config changes.
+
+The buckets use the generic cell rate algorithm: each one is the
+time at which its bucket will be full again. Buckets are refilled
+lazily, by comparing that time with the current one when a request
+comes in, and a bucket that is full is the same as no bucket, so
+full ones are swept out when memory runs short.
+
+A request may be turned away before its body is parsed: peek_lti_key()
+finds the LTI key in the raw body with a regular expression, and
+RateLimiter.wait_time() tells whether its bucket is empty. Bodies
+that name "ltiKey" more than once, such as in their payload, are
+left to the check after parsing; the regular expression cannot tell
+which of the keys is the request's own. Tokens are
+only taken once the request is authenticated, so that nobody can use
+up the budget of another consumer by sending that consumer's key.
+
+@author: paepcke
+'''
+import re
+import time
+
+from ltischoolbus.topic_matcher import TopicMatcher, is_pattern
+
+
+# "ltiKey" : "<key>", unless the key has escaped characters:
+LTI_KEY_PATTERN = re.compile(r'"ltiKey"\s*:\s*"([^"\\]*)"')
+# "ltiKey" as a field name, whatever its value:
+LTI_KEY_NAME_PATTERN = re.compile(r'"ltiKey"\s*:')
+
+def peek_lti_key(body):
+    '''
+    Find the LTI key in a request body without parsing it.
+
+    :param body: a request body
+    :type body: str
+    :return: the LTI key, or None if none was found, or if the
+        body names "ltiKey" more than once, as do bulk publish
+        events with keys of their own, or payloads with an
+        "ltiKey" field
+    :rtype: {str | None}
+    '''
+    if len(LTI_KEY_NAME_PATTERN.findall(body)) != 1:
+        return None
+    match = LTI_KEY_PATTERN.search(body)
+    return match.group(1) if match is not None else None
+
+
+class RateLimits(object):
+    '''
+    Usage:
+        limits = RateLimits(config_dict)
+        limits.key_limit('myLtiKey')            # --> (rate, burst), or None
+        limits.topic_limit('studentAction')     # --> (rate, burst), or None
+
+    Instances are not changed after construction.
+    '''
+
+    def __init__(self, config_dict):
+        '''
+        :param config_dict: the config file's content: topic --> entry
+        :type config_dict: {str : {str : <any>}}
+        '''
+        # LTI key --> (rate, burst):
+        self.key_limits = {}
+        # Topic --> (rate, burst):
+        self.topic_limits = {}
+        # The topics in topic_limits that are patterns:
+        self.pattern_limits = TopicMatcher()
+        # (topic, error message) of ill-formed limits, which are left out:
+        self.bad_limits = []
+        if not isinstance(config_dict, dict):
+            return
+        for (topic, entry) in config_dict.items():
+            if not isinstance(entry, dict):
+                continue
+            try:
+                if 'key_rate_limit' in entry:
+                    limit = self.parse_limit(entry['key_rate_limit'])
+                    lti_key = entry['ltiKey']
+                    if lti_key not in self.key_limits or limit[0] < self.key_limits[lti_key][0]:
+                        self.key_limits[lti_key] = limit
+                if 'topic_rate_limit' in entry:
+                    self.topic_limits[topic] = self.parse_limit(entry['topic_rate_limit'])
+                    if is_pattern(topic):
+                        self.pattern_limits.add(topic)
+            except (KeyError, TypeError, ValueError) as e:
+                self.topic_limits.pop(topic, None)
+                self.bad_limits.append((topic, str(e)))
+
+    def key_limit(self, lti_key):
+        '''
+        :return: (rate, burst) of the LTI key, or None if it is not limited
+        :rtype: {(float, float) | None}
+        '''
+        return self.key_limits.get(lti_key, None)
+
+    def topic_limit(self, topic):
+        '''
+        :return: (rate, burst) of topic's own config entry, else of the most
+            specific pattern that matches topic, else None if topic is not limited
+        :rtype: {(float, float) | None}
+        '''
+        try:
+            return self.topic_limits[topic]
+        except KeyError:
+            pass
+        if len(self.topic_limits) == 0:
+            return None
+        patterns = self.pattern_limits.match(topic)
+        return self.topic_limits[patterns[0]] if patterns else None
+
+    def __nonzero__(self):
+        return len(self.key_limits) + len(self.topic_limits) > 0
+
+    # -------------------------------- Private Methods ---------
+
+    def parse_limit(self, limit):
+        '''
+        :param limit: {'rate' : <requests per second>, 'burst' : <requests>};
+            burst defaults to rate, but at least 1
+        :type limit: {str : {int | float}}
+        :return: (rate, burst)
+        :rtype: (float, float)
+        :raise ValueError: if rate is not positive, or burst less than 1
+        '''
+        rate = float(limit['rate'])
+        burst = float(limit.get('burst', max(rate, 1)))
+        if rate <= 0 or burst < 1:
+            raise ValueError('Rate limit needs a positive rate, and a burst of at least 1: %s' % limit)
+        return (rate, burst)
+
+
+class TokenBuckets(object):
+    '''
+    Token buckets of many names, such as LTI keys. Each bucket is
+    stored as one float: the time at which it is full again.
+    Rates and bursts are passed with every call, so that new limits
+    take effect as soon as the config file changes.
+    '''
+
+    def __init__(self, max_buckets=100000, clock=time.time):
+        '''
+        :param max_buckets: number of buckets kept. When more are needed,
+            and no bucket is full, names without a bucket are not limited.
+        :type max_buckets: int
+        :param clock: returns the current time in seconds
+        :type clock: callable
+        '''
+        self.max_buckets = max_buckets
+        self.clock = clock
+        # Name --> time at which its bucket is full again:
+        self.full_at = {}
+        self.untracked_counter = 0
+        # Sweeps for full buckets happen at most once a second:
+        self.swept_at = None
+
+    def take(self, name, rate, burst):
+        '''
+        Take a token from the bucket of name, if it has one.
+
+        :param name: the bucket's name
+        :type name: str
+        :param rate: tokens added to the bucket per second
+        :type rate: float
+        :param burst: size of the bucket
+        :type burst: float
+        :return: 0 if a token was taken, else seconds until one is available
+        :rtype: float
+        '''
+        now = self.clock()
+        interval = 1.0 / rate
+        # The bucket is full at now, or later if it is missing tokens:
+        full_at = max(self.full_at.get(name, now), now)
+        # Each token taken moves full_at one interval into the future;
+        # a full bucket holds burst tokens:
+        wait = full_at + interval - burst * interval - now
+        if wait > 0:
+            return wait
+        if name not in self.full_at and not self.make_room(now):
+            self.untracked_counter += 1
+            return 0
+        self.full_at[name] = full_at + interval
+        return 0
+
+    def wait_time(self, name, rate, burst):
+        '''
+        :return: seconds until the bucket of name has a token; 0 if it has one now
+        :rtype: float
+        '''
+        now = self.clock()
+        full_at = self.full_at.get(name, now)
+        return max(full_at + (1 - burst) / rate - now, 0)
+
+    def __len__(self):
+        return len(self.full_at)
+
+    # -------------------------------- Private Methods ---------
+
+    def make_room(self, now):
+        '''
+        :return: True if there is room for another bucket, if
+            necessary after removing the buckets that are full
+        :rtype: bool
+        '''
+        if len(self.full_at) < self.max_buckets:
+            return True
+        if self.swept_at is not None and now - self.swept_at < 1:
+            return False
+        self.swept_at = now
+        for (name, full_at) in self.full_at.items():
+            if full_at <= now:
+                del self.full_at[name]
+        return len(self.full_at) < self.max_buckets
+
+
+class RateLimiter(object):
+    '''
+    Usage:
+        limiter = RateLimiter()
+        ...
+        wait = limiter.take(limits, lti_key, topic)
+        if wait > 0:
+            ... respond 429, with Retry-After ...
+    '''
+
+    def __init__(self, share=1.0, max_buckets=100000, clock=time.time):
+        '''
+        :param share: fraction of each limit that this process grants.
+            When several worker processes share the service port,
+            each of them grants its share of the configured limits.
+        :type share: float
+        :param max_buckets: buckets kept for keys, and again for topics
+        :type max_buckets: int
+        :param clock: returns the current time in seconds
+        :type clock: callable
+        '''
+        self.share = share
+        self.key_buckets = TokenBuckets(max_buckets, clock)
+        self.topic_buckets = TokenBuckets(max_buckets, clock)
+        # Limit ('key' or 'topic') --> requests turned away:
+        self.limited_counters = {'key' : 0, 'topic' : 0}
+
+    def take(self, limits, lti_key, topic):
+        '''
+        Take a token for a request from the buckets of its key and topic.
+        No token is taken from either if one of them is empty.
+
+        :param limits: the current limits
+        :type limits: RateLimits
+        :param lti_key: the request's LTI key; it must be authenticated
+        :type lti_key: str
+        :param topic: the request's bus topic
+        :type topic: str
+        :return: 0 if the request may proceed, else seconds after which to retry
+        :rtype: float
+        '''
+        key_limit = limits.key_limit(lti_key)
+        topic_limit = limits.topic_limit(topic)
+        if key_limit is not None and topic_limit is not None:
+            # Do not spend the key's token on a request that the topic refuses:
+            wait = self.topic_buckets.wait_time(topic, *self.scaled(topic_limit))
+            if wait > 0:
+                self.limited_counters['topic'] += 1
+                return wait
+        if key_limit is not None:
+            wait = self.key_buckets.take(lti_key, *self.scaled(key_limit))
+            if wait > 0:
+                self.limited_counters['key'] += 1
+                return wait
+        if topic_limit is not None:
+            wait = self.topic_buckets.take(topic, *self.scaled(topic_limit))
+            if wait > 0:
+                self.limited_counters['topic'] += 1
+                return wait
+        return 0
+
+    def wait_time(self, limits, lti_key):
+        '''
+        Check, without taking a token, whether the bucket of an
+        LTI key is empty. Used before a request is parsed.
+
+        :return: 0 if the key's bucket has a token, or the key is not
+            limited, else seconds after which to retry
+        :rtype: float
+        '''
+        key_limit = limits.key_limit(lti_key)
+        if key_limit is None:
+            return 0
+        wait = self.key_buckets.wait_time(lti_key, *self.scaled(key_limit))
+        if wait > 0:
+            self.limited_counters['key'] += 1
+        return wait
+
+    def stats(self):
+        '''
+        :return: buckets held, requests turned away by key and by
+            topic limits, and requests let through for lack of room
+        :rtype: {str : int}
+        '''
+        return {'key_buckets' : len(self.key_buckets),
+                'topic_buckets' : len(self.topic_buckets),
+                'limited_by_key' : self.limited_counters['key'],
+                'limited_by_topic' : self.limited_counters['topic'],
+                'untracked' : self.key_buckets.untracked_counter + self.topic_buckets.untracked_counter}
+
+    # -------------------------------- Private Methods ---------
+
+    def scaled(self, limit):
+        (rate, burst) = limit
+        if self.share == 1.0:
+            return limit
+        return (rate * self.share, max(burst * self.share, 1))
@@ -0,0 +1,130 @@
+'''
+Created on Oct 17, 2026
+
+Consistent hashing of delivery URLs onto delivery shards.
+When the bridge runs as several worker processes, each worker
+is one shard: it delivers bus messages only to the LTI consumer
+URLs that the ring assigns to it, with its own queues, outbox,
+and connection pool. Every URL has exactly one owner.
+
+Each shard is placed on a circle of hash values at many points
+(virtual nodes). A URL belongs to the shard of the first point
+at or after the URL's own hash value:
+
+    ring = ShardRing(range(4))
+    ring.shard_for('https://lms1.edu/delivery')    # --> 2
+
+Adding a fifth shard only claims the arcs in front of its own
+points, so about 1/5 of the URLs move, all of them to the new
+shard. With modulo hashing nearly all URLs would move. The
+virtual nodes keep the shares of the shards close to even.
+
+Hash values are taken from MD5, not from Python's hash(), so
+that all worker processes agree on the owner of every URL.
+
+@author: paepcke
+'''
+from bisect import bisect_left
+import hashlib
+
+
+class ShardRing(object):
+    '''
+    Usage:
+        ring = ShardRing([0, 1, 2])
+        if ring.shard_for(url) == my_shard:
+            ... deliver to url ...
+    '''
+
+    # Points on the circle per shard:
+    DEFAULT_REPLICAS = 160
+
+    def __init__(self, shards=(), replicas=DEFAULT_REPLICAS):
+        '''
+        :param shards: IDs of the initial shards, such as worker numbers
+        :type shards: [<any>]
+        :param replicas: points on the circle per shard. More points
+            spread the URLs more evenly, at the cost of memory and
+            of a slightly slower lookup.
+        :type replicas: int
+        :raise ValueError: if replicas is less than 1
+        '''
+        if replicas < 1:
+            raise ValueError('Shard ring needs at least one point per shard; was %s' % replicas)
+        self.replicas = replicas
+        self.shards = set()
+        # Ascending hash values of all points, and the
+        # shard of each point at the same position:
+        self.points = []
+        self.point_shards = []
+        for shard in shards:
+            self.add_shard(shard)
+
+    def add_shard(self, shard):
+        '''
+        Place a shard on the ring. Takes over about 1/N of
+        the keys, where N is the new number of shards.
+        Adding a shard that is on the ring is a no-op.
+        '''
+        if shard in self.shards:
+            return
+        self.shards.add(shard)
+        self.rebuild()
+
+    def remove_shard(self, shard):
+        '''
+        Take a shard off the ring. Its keys are spread over the
+        remaining shards; no other key changes owner.
+        '''
+        if shard not in self.shards:
+            return
+        self.shards.remove(shard)
+        self.rebuild()
+
+    def shard_for(self, key):
+        '''
+        :param key: a delivery URL, or any other string
+        :type key: str
+        :return: the shard that owns key
+        :rtype: <any>
+        :raise LookupError: if there are no shards
+        '''
+        if not self.points:
+            raise LookupError('Shard ring has no shards.')
+        position = bisect_left(self.points, ring_hash(key))
+        # Past the last point, the circle wraps around:
+        return self.point_shards[position % len(self.points)]
+
+    def distribution(self, keys):
+        '''
+        :param keys: keys to assign, such as all subscribed URLs
+        :type keys: [str]
+        :return: shard --> number of the keys it owns, for every shard
+        :rtype: {<any> : int}
+        '''
+        counts = dict.fromkeys(self.shards, 0)
+        for key in keys:
+            counts[self.shard_for(key)] += 1
+        return counts
+
+    def __len__(self):
+        return len(self.shards)
+
+    # -------------------------------- Private Methods ---------
+
+    def rebuild(self):
+        points = sorted([(ring_hash('%s-%s' % (shard, replica)), shard)
+                         for shard in self.shards
+                         for replica in range(self.replicas)])
+        self.points = [point for (point, _shard) in points]
+        self.point_shards = [shard for (_point, shard) in points]
+
+
+def ring_hash(key):
+    '''
+    :return: position of key on the circle, a 64 bit integer
+    :rtype: long
+    '''
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return long(hashlib.md5(key).hexdigest()[:16], 16)
@@ -0,0 +1,219 @@
+'''
+Created on Oct 17, 2026
+
+Bounded, per-subscriber queues for deliveries to LTI consumers.
+Each delivery URL gets its own SubscriberQueue, and only a small
+window of each queue's deliveries is handed to the delivery engine
+at a time. A backlogged LMS therefore fills up its own queue
+rather than holding up deliveries to healthy ones.
+
+Queues are bounded by number of messages and by bytes. When a
+queue is full, its overflow policy decides what happens:
+
+   drop_oldest   - discard the message at the head of the queue
+   drop_newest   - discard the message being added
+   spill_to_disk - append messages to a per-subscriber spill file,
+                   and read them back in order as the queue drains
+
+@author: paepcke
+'''
+from collections import deque
+import hashlib
+import json
+import os
+
+
+class SubscriberQueue(object):
+    '''
+    FIFO of pending deliveries for one delivery URL. Items
+    are tuples (entry_id, topic, body), where body is the
+    POST body string whose length counts against max_bytes.
+    '''
+
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    SPILL_TO_DISK = 'spill_to_disk'
+    OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, SPILL_TO_DISK)
+
+    def __init__(self,
+                 url,
+                 max_messages=1000,
+                 max_bytes=10 * 1024 * 1024,
+                 overflow_policy=DROP_OLDEST,
+                 spill_dir=None,
+                 window=4):
+        '''
+        :param url: delivery URL this queue serves
+        :type url: str
+        :param max_messages: maximum number of messages held in memory
+        :type max_messages: int
+        :param max_bytes: maximum total POST body bytes held in memory
+        :type max_bytes: int
+        :param overflow_policy: one of OVERFLOW_POLICIES
+        :type overflow_policy: str
+        :param spill_dir: directory for spill files; required for
+            policy spill_to_disk
+        :type spill_dir: {str | None}
+        :param window: number of this queue's deliveries that may
+            be in flight at once
+        :type window: int
+        '''
+        if overflow_policy not in SubscriberQueue.OVERFLOW_POLICIES:
+            raise ValueError("Overflow policy must be one of %s; was '%s'" %\
+                             (', '.join(SubscriberQueue.OVERFLOW_POLICIES), overflow_policy))
+        if overflow_policy == SubscriberQueue.SPILL_TO_DISK and spill_dir is None:
+            raise ValueError('Overflow policy %s requires a spill directory.' % overflow_policy)
+        self.url = url
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+        self.window = window
+
+        self.items = deque()
+        self.bytes = 0
+        # Deliveries taken from this queue, and not yet completed:
+        self.in_flight = 0
+
+        self.spill_path = None
+        if spill_dir is not None:
+            self.spill_path = os.path.join(spill_dir, hashlib.sha1(url).hexdigest() + '.spill')
+            # A spill file left behind by an earlier run holds items
+            # that the delivery outbox redelivers anyway, under entry
+            # ids of that run; reading it back would deliver them twice:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+        self.spill_writer = None
+        self.spill_reader = None
+        self.spilled_pending = 0
+
+        self.enqueued_counter = 0
+        self.dropped_oldest_counter = 0
+        self.dropped_newest_counter = 0
+        self.spilled_counter = 0
+
+    def put(self, item):
+        '''
+        Add an item at the tail of the queue, applying
+        the overflow policy if the queue is full.
+
+        :param item: (entry_id, topic, body)
+        :type item: (int, str, str)
+        :return: items that were discarded to make room, or the
+            item itself if it was discarded. Empty if nothing was lost.
+        :rtype: [(int, str, str)]
+        '''
+        self.enqueued_counter += 1
+        # Once anything is on disk, newer items must queue up
+        # behind it to preserve delivery order:
+        if self.spilled_pending > 0:
+            self.spill(item)
+            return []
+        if not self.is_full_with(item):
+            self.append(item)
+            return []
+
+        if self.overflow_policy == SubscriberQueue.DROP_NEWEST:
+            self.dropped_newest_counter += 1
+            return [item]
+        if self.overflow_policy == SubscriberQueue.SPILL_TO_DISK:
+            self.spill(item)
+            return []
+        dropped = []
+        while self.items and self.is_full_with(item):
+            dropped.append(self.popleft())
+        self.dropped_oldest_counter += len(dropped)
+        self.append(item)
+        return dropped
+
+    def get(self):
+        '''
+        Remove and return the item at the head of the queue.
+
+        :return: (entry_id, topic, body), or None if the queue is empty
+        :rtype: {(int, str, str) | None}
+        '''
+        if not self.items:
+            self.unspill()
+            if not self.items:
+                return None
+        item = self.popleft()
+        self.unspill()
+        return item
+
+    def __len__(self):
+        return len(self.items) + self.spilled_pending
+
+    def stats(self):
+        '''
+        :return: queue depth (in memory and spilled), bytes held
+            in memory, and counts of enqueued, dropped, and
+            spilled messages since the queue was created
+        :rtype: {str : int}
+        '''
+        return {'depth' : len(self.items),
+                'bytes' : self.bytes,
+                'spilled_pending' : self.spilled_pending,
+                'in_flight' : self.in_flight,
+                'enqueued' : self.enqueued_counter,
+                'dropped_oldest' : self.dropped_oldest_counter,
+                'dropped_newest' : self.dropped_newest_counter,
+                'spilled' : self.spilled_counter}
+
+    def close(self):
+        '''
+        Close spill files. Spilled items that were not yet
+        read back are lost from this queue (though not from
+        the delivery outbox).
+        '''
+        for fd in (self.spill_writer, self.spill_reader):
+            if fd is not None:
+                fd.close()
+        self.spill_writer = self.spill_reader = None
+        if self.spill_path is not None and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spilled_pending = 0
+
+    # -------------------------------- Private Methods ---------
+
+    def is_full_with(self, item):
+        return len(self.items) >= self.max_messages or \
+            (self.items and self.bytes + len(item[2]) > self.max_bytes)
+
+    def append(self, item):
+        self.items.append(item)
+        self.bytes += len(item[2])
+
+    def popleft(self):
+        item = self.items.popleft()
+        self.bytes -= len(item[2])
+        return item
+
+    def spill(self, item):
+        if self.spill_writer is None:
+            self.spill_writer = open(self.spill_path, 'ab')
+        self.spill_writer.write(json.dumps(item) + '\n')
+        self.spilled_pending += 1
+        self.spilled_counter += 1
+
+    def unspill(self):
+        '''
+        Move spilled items back into memory while there is room.
+        When the spill file is used up, it is removed.
+        '''
+        if self.spilled_pending == 0:
+            return
+        self.spill_writer.flush()
+        if self.spill_reader is None:
+            self.spill_reader = open(self.spill_path, 'rb')
+        while self.spilled_pending > 0 and len(self.items) < self.max_messages:
+            line_start = self.spill_reader.tell()
+            (entry_id, topic, body) = json.loads(self.spill_reader.readline())
+            item = (entry_id, topic, body.encode('utf-8'))
+            if self.items and self.bytes + len(item[2]) > self.max_bytes:
+                # Doesn't fit yet; leave it for next time:
+                self.spill_reader.seek(line_start)
+                break
+            self.append(item)
+            self.spilled_pending -= 1
+        if self.spilled_pending == 0:
+            self.close()
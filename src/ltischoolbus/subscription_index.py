@@ -0,0 +1,241 @@
+'''
+Created on Oct 17, 2026
+
+In-memory index of LTI consumers' subscriptions to SchoolBus
+topics. Two maps are kept in step:
+
+    topic --> ordered set of delivery URLs
+    URL   --> set of topics
+
+so that finding, adding, and removing a subscription, and
+finding all topics of a delivery URL, take constant time.
+URLs of a topic keep the order in which they subscribed.
+
+Subscriptions may be to topic patterns, such as
+studentAction.HumanitiesSciences.* (see topic_matcher.py).
+Patterns are additionally compiled into a TopicMatcher, and
+urls_matching() finds the URLs of a message's topic and of
+all patterns that match it.
+
+The index serializes to and from the format of the
+subscriptions file, which maps each topic to a list of URLs:
+
+    {"studentAction" : ["https://lms1.edu/delivery", "https://lms2.edu/delivery"]}
+
+@author: paepcke
+'''
+from collections import OrderedDict
+import json
+
+from ltischoolbus.topic_matcher import TopicMatcher, check_pattern, is_pattern
+
+
+class SubscriptionIndex(object):
+    '''
+    Set semantics: subscribing the same URL to the same
+    topic twice is a no-op, as is removing a subscription
+    that does not exist.
+    '''
+
+    def __init__(self, subscriptions=None):
+        '''
+        :param subscriptions: initial content: topic --> list of URLs
+        :type subscriptions: {{str : [str]} | None}
+        :raise ValueError: if subscriptions does not map topics to lists,
+            or holds an ill-formed topic pattern
+        '''
+        if subscriptions is not None and\
+           (not isinstance(subscriptions, dict) or
+            not all([isinstance(urls, list) for urls in subscriptions.values()])):
+            raise ValueError('Subscriptions must map topics to lists of URLs: %s' % str(subscriptions))
+        # Topic --> OrderedDict whose keys are the topic's URLs:
+        self.topic_urls = {}
+        # URL --> set of topics:
+        self.url_topics = {}
+        # The topics in topic_urls that are patterns:
+        self.pattern_matcher = TopicMatcher()
+        if subscriptions is not None:
+            self.add_many([(topic, url)
+                           for (topic, urls) in subscriptions.items()
+                           for url in urls])
+
+    @classmethod
+    def from_json(cls, json_str):
+        '''
+        :param json_str: content of a subscriptions file
+        :type json_str: str
+        :rtype: SubscriptionIndex
+        :raise ValueError: if json_str is not a JSON object of lists
+        '''
+        return cls(json.loads(json_str))
+
+    def to_dict(self):
+        '''
+        :return: topic --> list of URLs, for topics that have subscribers
+        :rtype: {str : [str]}
+        '''
+        return {topic : urls.keys() for (topic, urls) in self.topic_urls.items()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def add(self, topic, url):
+        '''
+        Subscribe url to topic.
+
+        :return: True if the subscription is new, False if it existed
+        :rtype: bool
+        :raise ValueError: if topic is an ill-formed pattern
+        '''
+        try:
+            urls = self.topic_urls[topic]
+        except KeyError:
+            check_pattern(topic)
+            urls = self.topic_urls[topic] = OrderedDict()
+            if is_pattern(topic):
+                self.pattern_matcher.add(topic)
+        if url in urls:
+            return False
+        urls[url] = True
+        try:
+            self.url_topics[url].add(topic)
+        except KeyError:
+            self.url_topics[url] = set([topic])
+        return True
+
+    def remove(self, topic, url):
+        '''
+        Unsubscribe url from topic.
+
+        :return: True if the subscription existed, else False
+        :rtype: bool
+        '''
+        urls = self.topic_urls.get(topic, None)
+        if urls is None or url not in urls:
+            return False
+        del urls[url]
+        if not urls:
+            del self.topic_urls[topic]
+            self.pattern_matcher.remove(topic)
+        topics = self.url_topics[url]
+        topics.discard(topic)
+        if not topics:
+            del self.url_topics[url]
+        return True
+
+    def add_many(self, subscriptions):
+        '''
+        Add many subscriptions at once.
+
+        :param subscriptions: (topic, url) pairs
+        :type subscriptions: [(str, str)]
+        :return: number of subscriptions that were new, and the topics
+            that had no subscribers before, in order of first appearance
+        :rtype: (int, [str])
+        '''
+        num_added = 0
+        new_topics = []
+        for (topic, url) in subscriptions:
+            if topic not in self.topic_urls:
+                new_topics.append(topic)
+            if self.add(topic, url):
+                num_added += 1
+        return (num_added, new_topics)
+
+    def remove_many(self, subscriptions):
+        '''
+        Remove many subscriptions at once.
+
+        :param subscriptions: (topic, url) pairs
+        :type subscriptions: [(str, str)]
+        :return: number of subscriptions that existed, and the
+            topics that have no subscribers left
+        :rtype: (int, [str])
+        '''
+        num_removed = 0
+        emptied_topics = []
+        for (topic, url) in subscriptions:
+            if self.remove(topic, url):
+                num_removed += 1
+                if topic not in self.topic_urls:
+                    emptied_topics.append(topic)
+        return (num_removed, emptied_topics)
+
+    def remove_url(self, url):
+        '''
+        Remove all subscriptions of the given URL.
+
+        :return: as for remove_many()
+        :rtype: (int, [str])
+        '''
+        return self.remove_many([(topic, url) for topic in list(self.url_topics.get(url, ()))])
+
+    def urls_for(self, topic):
+        '''
+        :return: URLs subscribed to topic, in order of subscription
+        :rtype: [str]
+        '''
+        urls = self.topic_urls.get(topic, None)
+        return urls.keys() if urls is not None else []
+
+    def urls_matching(self, topic):
+        '''
+        :return: URLs subscribed to topic itself, or to a pattern
+            that matches topic. Each URL is listed once.
+        :rtype: [str]
+        '''
+        patterns = self.pattern_matcher.match(topic)
+        if not patterns:
+            return self.urls_for(topic)
+        urls = OrderedDict()
+        for subscribed_topic in (topic,) + patterns:
+            for url in self.topic_urls.get(subscribed_topic, ()):
+                urls[url] = True
+        return urls.keys()
+
+    def receives(self, topic, url):
+        '''
+        :return: True if url is subscribed to topic, or to a
+            pattern that matches topic
+        :rtype: bool
+        '''
+        if self.has(topic, url):
+            return True
+        return any([self.has(pattern, url) for pattern in self.pattern_matcher.match(topic)])
+
+    def topics_for(self, url):
+        '''
+        :return: topics to which url is subscribed
+        :rtype: set(str)
+        '''
+        return set(self.url_topics.get(url, ()))
+
+    def has(self, topic, url):
+        urls = self.topic_urls.get(topic, None)
+        return urls is not None and url in urls
+
+    def topics(self):
+        '''
+        :return: topics that have at least one subscriber
+        :rtype: [str]
+        '''
+        return self.topic_urls.keys()
+
+    def urls(self):
+        '''
+        :return: URLs that are subscribed to at least one topic
+        :rtype: [str]
+        '''
+        return self.url_topics.keys()
+
+    def __contains__(self, topic):
+        return topic in self.topic_urls
+
+    def __len__(self):
+        '''
+        :return: number of topics with subscribers
+        '''
+        return len(self.topic_urls)
+
+    def __str__(self):
+        return str(self.to_dict())
@@ -0,0 +1,431 @@
+'''
+Created on Oct 17, 2026
+
+Persistence of LTI consumers' subscriptions as a snapshot
+plus an append-only journal. The snapshot is the subscriptions
+file (topic --> list of URLs). Each subscription change since
+the snapshot was written is one line in the journal:
+
+    {"op" : "subscribe", "topic" : "studentAction", "url" : "https://lms1.edu/delivery"}
+
+Changes therefore cost one short append, not a rewrite of
+all subscriptions. Appends are flushed right away, and fsynced
+together a short delay later.
+
+Once the journal holds compact_after records, it is compacted:
+on the IOLoop, the journal is renamed to <journal>.compacting,
+a fresh journal is started, and the subscriptions are serialized.
+A background thread then writes the serialized subscriptions
+as the new snapshot (see write_behind.replace_file()), and
+removes the .compacting file. If the bridge stops before
+that, the .compacting file is replayed at the next start.
+
+Loading reads the snapshot, and replays the .compacting file
+(if any) and the journal. Replay is idempotent, because
+subscriptions have set semantics. A torn last journal line,
+left by a crash during an append, is ignored.
+
+Other processes may follow the subscriptions that one process,
+the writer, keeps: follow() loads them without opening the
+journal for appending, and refresh() applies the records the
+writer appended since. When the journal was replaced by a
+compaction, refresh() loads the subscriptions afresh.
+
+@author: paepcke
+'''
+import json
+import logging
+import os
+import threading
+
+import tornado.ioloop
+
+from ltischoolbus.subscription_index import SubscriptionIndex
+from ltischoolbus.write_behind import replace_file, sync_directory
+
+
+class SubscriptionJournal(object):
+    '''
+    Usage:
+        journal = SubscriptionJournal('lti_bus_subscriptions.json')
+        index = journal.load()
+        (num_added, new_topics) = journal.add_many([(topic, url)])
+        ...
+        journal.close()
+
+    Or, in a process that only reads the subscriptions:
+        index = journal.follow()
+        ...
+        if journal.refresh():
+            index = journal.index
+
+    The journal owns the SubscriptionIndex that load() returns.
+    Callers read the index directly, but change it only through
+    add_many() and remove_many().
+    '''
+
+    SUBSCRIBE = 'subscribe'
+    UNSUBSCRIBE = 'unsubscribe'
+
+    def __init__(self, snapshot_path, sync_delay=0.5, compact_after=10000, io_loop=None):
+        '''
+        :param snapshot_path: the subscriptions file. The journal is kept
+            next to it, with extension .journal.
+        :type snapshot_path: str
+        :param sync_delay: seconds between the first unsynced append and
+            the fsync of the journal
+        :type sync_delay: {int | float}
+        :param compact_after: number of journal records that trigger compaction
+        :type compact_after: int
+        :param io_loop: loop that runs delayed fsyncs, and learns about
+            finished compactions. Default: current IOLoop
+        :type io_loop: {IOLoop | None}
+        '''
+        self.snapshot_path = os.path.abspath(snapshot_path)
+        self.journal_path = os.path.splitext(self.snapshot_path)[0] + '.journal'
+        self.compacting_path = self.journal_path + '.compacting'
+        self.sync_delay = sync_delay
+        self.compact_after = compact_after
+        self.io_loop = io_loop if io_loop is not None else tornado.ioloop.IOLoop.current()
+        self.logger = logging.getLogger('ltibridge')
+
+        self.index = None
+        self.journal = None
+        # Records in the journal and .compacting file, i.e.
+        # not yet in the snapshot:
+        self.num_records = 0
+        self.sync_timeout = None
+        self.compaction_thread = None
+        # (device, inode) of the journal that a follower read,
+        # and the position after its last complete record:
+        self.followed_id = None
+        self.followed_position = 0
+
+        self.appended_counter = 0
+        self.syncs_counter = 0
+        self.compactions_counter = 0
+
+    def load(self):
+        '''
+        Rebuild the subscriptions from snapshot and journal, and
+        open the journal for appending. A snapshot that cannot
+        be read is logged, and treated as empty.
+
+        :return: the subscriptions
+        :rtype: SubscriptionIndex
+        '''
+        self.index = self.read_snapshot()
+        self.num_records = 0
+        if os.path.exists(self.compacting_path):
+            self.logger.info('Replaying %s, left by an unfinished compaction.', self.compacting_path)
+            self.num_records += self.replay(self.compacting_path)
+        self.num_records += self.replay(self.journal_path)
+        self.journal = open(self.journal_path, 'ab')
+        if self.num_records >= self.compact_after:
+            self.compact()
+        return self.index
+
+    def follow(self):
+        '''
+        Read the subscriptions like load(), but for a process
+        other than the writer. The journal is not opened for
+        appending, is not repaired, and is never compacted by
+        this instance. Call refresh() to pick up changes.
+
+        :return: the subscriptions
+        :rtype: SubscriptionIndex
+        '''
+        while True:
+            # The journal is opened before the snapshot is read. If
+            # the writer starts a compaction meanwhile, the open journal
+            # becomes the .compacting file, whose records are read after
+            # the snapshot either way:
+            try:
+                journal = open(self.journal_path, 'rb')
+            except IOError:
+                journal = None
+            snapshot_id = file_id(self.snapshot_path)
+            self.index = self.read_snapshot()
+            if os.path.exists(self.compacting_path):
+                try:
+                    self.replay(self.compacting_path, repair=False)
+                except IOError:
+                    # Removed by the writer after it
+                    # replaced the snapshot:
+                    pass
+            if file_id(self.snapshot_path) != snapshot_id:
+                # A compaction finished while we read; the .compacting
+                # file may have gone before we got to it:
+                if journal is not None:
+                    journal.close()
+                continue
+            break
+        if journal is None:
+            self.followed_id = None
+            self.followed_position = 0
+            return self.index
+        with journal:
+            statinfo = os.fstat(journal.fileno())
+            self.followed_id = (statinfo.st_dev, statinfo.st_ino)
+            (_num_applied, self.followed_position) = self.replay_from(journal, self.journal_path)
+        return self.index
+
+    def refresh(self):
+        '''
+        For a follower: apply the records that the writer appended
+        to the journal since follow() or the previous refresh(). If
+        the writer compacted the journal, or started over, follow()
+        is called again, and self.index is a new SubscriptionIndex.
+
+        :return: True if the subscriptions may have changed, else False
+        :rtype: bool
+        '''
+        try:
+            journal = open(self.journal_path, 'rb')
+        except IOError:
+            # Absent for a moment during compaction:
+            return False
+        with journal:
+            statinfo = os.fstat(journal.fileno())
+            if (statinfo.st_dev, statinfo.st_ino) == self.followed_id and\
+               statinfo.st_size >= self.followed_position:
+                if statinfo.st_size == self.followed_position:
+                    return False
+                journal.seek(self.followed_position)
+                (num_applied, self.followed_position) = self.replay_from(journal, self.journal_path)
+                return num_applied > 0
+        self.follow()
+        return True
+
+    def add_many(self, subscriptions):
+        '''
+        Add subscriptions, and journal the ones that are new.
+
+        :param subscriptions: (topic, url) pairs
+        :type subscriptions: [(str, str)]
+        :return: as for SubscriptionIndex.add_many()
+        :rtype: (int, [str])
+        '''
+        fresh = [(topic, url) for (topic, url) in subscriptions if not self.index.has(topic, url)]
+        (num_added, new_topics) = self.index.add_many(fresh)
+        if num_added > 0:
+            self.append(SubscriptionJournal.SUBSCRIBE, fresh)
+        return (num_added, new_topics)
+
+    def remove_many(self, subscriptions):
+        '''
+        Remove subscriptions, and journal the ones that existed.
+
+        :param subscriptions: (topic, url) pairs
+        :type subscriptions: [(str, str)]
+        :return: as for SubscriptionIndex.remove_many()
+        :rtype: (int, [str])
+        '''
+        existing = [(topic, url) for (topic, url) in subscriptions if self.index.has(topic, url)]
+        (num_removed, emptied_topics) = self.index.remove_many(existing)
+        if num_removed > 0:
+            self.append(SubscriptionJournal.UNSUBSCRIBE, existing)
+        return (num_removed, emptied_topics)
+
+    def sync(self):
+        '''
+        fsync the journal now, if there were appends since
+        the last fsync.
+        '''
+        if self.sync_timeout is None:
+            return
+        self.io_loop.remove_timeout(self.sync_timeout)
+        self.sync_timeout = None
+        try:
+            os.fsync(self.journal.fileno())
+        except OSError as e:
+            self.logger.error('Could not fsync %s: %s', self.journal_path, e)
+            return
+        self.syncs_counter += 1
+
+    def compact(self):
+        '''
+        Start folding the journal into a new snapshot. Returns
+        at once; the snapshot is written in a background thread.
+        Only one compaction runs at a time.
+
+        :return: True if a compaction was started, else False
+        :rtype: bool
+        '''
+        if self.compaction_thread is not None:
+            return False
+        # Records since the last snapshot must be durable
+        # before the snapshot that holds them is replaced:
+        self.sync()
+        self.journal.close()
+        if os.path.exists(self.compacting_path):
+            # An earlier compaction failed; the records of
+            # both files are still needed:
+            with open(self.journal_path, 'rb') as fd:
+                records = fd.read()
+            with open(self.compacting_path, 'ab') as fd:
+                fd.write(records)
+                fd.flush()
+                os.fsync(fd.fileno())
+            os.remove(self.journal_path)
+        else:
+            os.rename(self.journal_path, self.compacting_path)
+        self.journal = open(self.journal_path, 'ab')
+        sync_directory(os.path.dirname(self.journal_path))
+        self.num_records = 0
+
+        snapshot = self.index.to_json()
+        self.compaction_thread = threading.Thread(target=self.write_snapshot,
+                                                  args=(snapshot,),
+                                                  name='SubscriptionCompaction')
+        self.compaction_thread.daemon = True
+        self.compaction_thread.start()
+        return True
+
+    def stats(self):
+        '''
+        :return: number of journal records not yet in the snapshot,
+            of records appended, of fsyncs, and of compactions
+        :rtype: {str : int}
+        '''
+        return {'records' : self.num_records,
+                'appended' : self.appended_counter,
+                'syncs' : self.syncs_counter,
+                'compactions' : self.compactions_counter}
+
+    def close(self):
+        '''
+        Wait for a running compaction, and fsync the journal.
+        Call at shutdown.
+        '''
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+            self.compaction_thread = None
+        if self.journal is not None:
+            self.sync()
+            self.journal.close()
+            self.journal = None
+
+    # -------------------------------- Private Methods ---------
+
+    def read_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r') as fd:
+                content_raw = fd.read()
+        except IOError:
+            # Absent on first start:
+            return SubscriptionIndex()
+        if len(content_raw) == 0:
+            return SubscriptionIndex()
+        try:
+            return SubscriptionIndex.from_json(content_raw)
+        except ValueError as e:
+            self.logger.error('Bad subscriptions snapshot %s; ignoring it: %s', self.snapshot_path, e)
+            return SubscriptionIndex()
+
+    def replay(self, path, repair=True):
+        '''
+        Apply the records of a journal file to self.index.
+
+        :param repair: if True, a torn last record is cut off
+        :type repair: bool
+        :return: number of records applied
+        :rtype: int
+        '''
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as fd:
+            (num_applied, good_length) = self.replay_from(fd, path)
+        torn_length = os.path.getsize(path) - good_length
+        if repair and torn_length > 0:
+            self.logger.warn('Ignoring torn last record of %s (%s bytes).', path, torn_length)
+            # Don't let new appends run on from the torn line:
+            with open(path, 'r+b') as fd:
+                fd.truncate(good_length)
+        return num_applied
+
+    def replay_from(self, fd, path):
+        '''
+        Apply the records from the current position of fd to
+        self.index, up to the last complete record.
+
+        :param fd: open journal file
+        :type fd: file
+        :param path: name of the file, for log messages
+        :type path: str
+        :return: number of records applied, and the position
+            after the last complete record
+        :rtype: (int, int)
+        '''
+        num_applied = 0
+        good_length = fd.tell()
+        for line in fd:
+            if not line.endswith('\n'):
+                # Torn, or still being written:
+                break
+            good_length += len(line)
+            try:
+                record = json.loads(line)
+                subscription = [(record['topic'], record['url'])]
+                op = record['op']
+            except (ValueError, KeyError, TypeError):
+                self.logger.error('Ignoring bad record in %s: %s', path, line)
+                continue
+            if op == SubscriptionJournal.SUBSCRIBE:
+                self.index.add_many(subscription)
+            elif op == SubscriptionJournal.UNSUBSCRIBE:
+                self.index.remove_many(subscription)
+            else:
+                self.logger.error("Ignoring record with unknown op '%s' in %s", op, path)
+                continue
+            num_applied += 1
+        return (num_applied, good_length)
+
+    def append(self, op, subscriptions):
+        self.journal.write(''.join([json.dumps({'op' : op, 'topic' : topic, 'url' : url}) + '\n'
+                                    for (topic, url) in subscriptions]))
+        self.journal.flush()
+        self.num_records += len(subscriptions)
+        self.appended_counter += len(subscriptions)
+        if self.sync_timeout is None:
+            self.sync_timeout = self.io_loop.call_later(self.sync_delay, self.sync)
+        if self.num_records >= self.compact_after:
+            self.compact()
+
+    def write_snapshot(self, snapshot):
+        '''
+        Runs in the compaction thread.
+        '''
+        try:
+            replace_file(self.snapshot_path, snapshot)
+            os.remove(self.compacting_path)
+            error = None
+        except (IOError, OSError) as e:
+            error = e
+        self.io_loop.add_callback(self.compaction_done, error)
+
+    def compaction_done(self, error):
+        if self.compaction_thread is None:
+            # close() already waited for us:
+            return
+        self.compaction_thread.join()
+        self.compaction_thread = None
+        if error is not None:
+            self.logger.error('Could not write subscriptions snapshot %s; '
+                              'journal %s is kept: %s', self.snapshot_path, self.compacting_path, error)
+            return
+        self.compactions_counter += 1
+        if self.num_records >= self.compact_after:
+            self.compact()
+
+
+def file_id(path):
+    '''
+    :return: (device, inode) of path, or None if it does not exist
+    :rtype: {(int, int) | None}
+    '''
+    try:
+        statinfo = os.stat(path)
+    except OSError:
+        return None
+    return (statinfo.st_dev, statinfo.st_ino)
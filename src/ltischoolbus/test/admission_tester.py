@@ -0,0 +1,118 @@
+'''
+Tests for admission control at the bridge's ingress.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import time
+import unittest
+
+from tornado.testing import AsyncTestCase
+
+from ltischoolbus.admission import AdmissionController, action_kind, peek_action
+
+
+class AdmissionTester(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.clock = lambda: self.now[0]
+        # Value of the 'in_flight' signal:
+        self.in_flight = [0]
+        # (shedding, signals) passed to on_change:
+        self.changes = []
+        self.controller = AdmissionController(max_loop_lag_ms=200,
+                                              low_fraction=0.5,
+                                              min_shed_seconds=1,
+                                              on_change=lambda shedding, signals: self.changes.append((shedding, signals)),
+                                              clock=self.clock)
+        self.controller.add_signal('in_flight', lambda: self.in_flight[0], 100)
+
+    def testShedAboveHighWatermark(self):
+        self.in_flight[0] = 99
+        self.controller.sample()
+        self.assertEqual(0, self.controller.admit('publish'))
+        self.in_flight[0] = 100
+        self.controller.sample()
+        self.assertTrue(self.controller.shedding)
+        self.assertEqual(1, self.controller.admit('publish'))
+        self.assertEqual(5, self.controller.admit('subscribe'))
+        # Unsubscribing reduces the load:
+        self.assertEqual(0, self.controller.admit('unsubscribe'))
+        self.assertEqual({('publish', 'admitted') : 1, ('publish', 'shed') : 1,
+                          ('subscribe', 'admitted') : 0, ('subscribe', 'shed') : 1,
+                          ('unsubscribe', 'admitted') : 1, ('unsubscribe', 'shed') : 0},
+                         self.controller.decision_counters)
+        self.assertEqual([(True, {'in_flight' : 100, 'loop_lag_ms' : 0})], self.changes)
+        # Loop lag alone suffices:
+        controller = AdmissionController(max_loop_lag_ms=200, clock=self.clock)
+        controller.sample(loop_lag_ms=250)
+        self.assertTrue(controller.shedding)
+
+    def testHysteresis(self):
+        self.in_flight[0] = 150
+        self.controller.sample()
+        # Below the high watermark, but not below the low one:
+        self.in_flight[0] = 60
+        self.now[0] += 5
+        self.controller.sample()
+        self.assertTrue(self.controller.shedding)
+        # Below the low watermark, but too soon after shedding started:
+        self.now[0] = 1000.0
+        self.controller.shedding = True
+        self.in_flight[0] = 10
+        self.controller.sample()
+        self.assertTrue(self.controller.shedding)
+        self.now[0] += 1
+        self.controller.sample()
+        self.assertFalse(self.controller.shedding)
+        self.assertEqual(0, self.controller.admit('publish'))
+        self.assertEqual([True, False], [shedding for (shedding, _signals) in self.changes])
+        self.assertEqual(1, self.controller.stats()['shed_episodes'])
+
+    def testSubscribeBackoffGrows(self):
+        self.in_flight[0] = 100
+        self.controller.sample()
+        self.assertEqual(5, self.controller.admit('subscribe'))
+        self.now[0] += 10
+        self.assertEqual(20, self.controller.admit('subscribe'))
+        self.now[0] += 1000
+        self.assertEqual(300, self.controller.admit('subscribe'))
+
+    def testDisabledSignals(self):
+        controller = AdmissionController(max_loop_lag_ms=None, clock=self.clock)
+        controller.add_signal('queued_bytes', lambda: 10 ** 12, 0)
+        controller.sample(loop_lag_ms=10000)
+        self.assertFalse(controller.shedding)
+        # Still sampled, for the metrics:
+        self.assertEqual({'loop_lag_ms' : 10000, 'queued_bytes' : 10 ** 12}, controller.values)
+        self.assertRaises(ValueError, AdmissionController, low_fraction=0)
+
+    def testPeekAction(self):
+        self.assertEqual('subscribe', peek_action('{"ltiKey" : "k", "action" : "subscribe"}'))
+        self.assertEqual('unsubscribe', peek_action('{"action":"UNSUBSCRIBE"}'))
+        self.assertEqual('publish', peek_action('{"action" : "publish_batch"}'))
+        self.assertEqual('publish', peek_action('not json'))
+        # Which of several action fields is the request's own is only known after parsing:
+        self.assertIsNone(peek_action('{"payload" : {"action" : "publish"}, "action" : "unsubscribe"}'))
+        self.assertEqual('subscribe', peek_action('{"action" : "subscribe", "payload" : "{\\"action\\" : \\"publish\\"}"}'))
+        self.assertEqual(['publish', 'subscribe', 'unsubscribe'],
+                         [action_kind(action) for action in ('publish_batch', 'subscribe', 'unsubscribe')])
+
+
+class LoopLagTester(AsyncTestCase):
+
+    def testLoopLagMeasured(self):
+        controller = AdmissionController(max_loop_lag_ms=50, interval=0.01)
+        controller.start()
+        # A callback that keeps the IOLoop busy delays the sampling timer:
+        self.io_loop.call_later(0.02, lambda: time.sleep(0.1))
+        self.io_loop.call_later(0.2, self.stop)
+        self.wait()
+        controller.stop()
+        self.assertEqual(1, controller.shed_episodes_counter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+'''
+Tests for the authentication index and the config file watcher.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tornado.testing import AsyncTestCase
+
+from ltischoolbus.auth_index import AuthIndex, ConfigWatcher
+
+
+class AuthIndexTester(AsyncTestCase):
+
+    AUTH_DICT = {'studentAction' : {'ltiKey' : 'ltiKey', 'ltiSecret' : 'ltiSecret'},
+                 'noSecret' : {'ltiKey' : 'ltiKey'}}
+
+    def setUp(self):
+        super(AuthIndexTester, self).setUp()
+        self.work_dir = tempfile.mkdtemp(prefix='ltibridge_test')
+        self.config_path = os.path.join(self.work_dir, 'ltibridge.cnf')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        super(AuthIndexTester, self).tearDown()
+
+    def testCheck(self):
+        index = AuthIndex(AuthIndexTester.AUTH_DICT)
+        self.assertTrue(index.check('studentAction', 'ltiKey', 'ltiSecret'))
+        self.assertTrue(index.check('studentAction', u'ltiKey', u'ltiSecret'))
+        self.assertFalse(index.check('studentAction', 'ltiKey', 'bluebeard'))
+        self.assertFalse(index.check('studentAction', 'bluebeard', 'ltiSecret'))
+        self.assertFalse(index.check('studentAction', 'ltiKey', None))
+        self.assertFalse(index.check('courseEvents', 'ltiKey', 'ltiSecret'))
+
+    def testPatternGrants(self):
+        index = AuthIndex({'courseEvents.#' : {'ltiKey' : 'courseKey', 'ltiSecret' : 'courseSecret'},
+                           'courseEvents.HumanitiesSciences.*' : {'ltiKey' : 'hsKey', 'ltiSecret' : 'hsSecret'},
+                           'badPattern.#.x' : {'ltiKey' : 'k', 'ltiSecret' : 's'}})
+        self.assertEqual(['badPattern.#.x'], index.bad_topics)
+        self.assertTrue(index.check('courseEvents.HumanitiesSciences.Hist101', 'hsKey', 'hsSecret'))
+        self.assertTrue(index.check('courseEvents.HumanitiesSciences.Hist101', 'courseKey', 'courseSecret'))
+        self.assertFalse(index.check('courseEvents.Engineering.CS101', 'hsKey', 'hsSecret'))
+        # Patterns are granted by patterns that cover them:
+        self.assertTrue(index.check('courseEvents.HumanitiesSciences.*', 'hsKey', 'hsSecret'))
+        self.assertFalse(index.check('courseEvents.HumanitiesSciences.#', 'hsKey', 'hsSecret'))
+        # The most specific grant provides the credentials:
+        self.assertEqual(('hsKey', 'hsSecret'), index.credentials('courseEvents.HumanitiesSciences.Hist101'))
+        self.assertIn('courseEvents', index)
+        self.assertNotIn('studentAction', index)
+
+    def testIllFormedEntriesLeftOut(self):
+        index = AuthIndex(AuthIndexTester.AUTH_DICT)
+        self.assertNotIn('noSecret', index)
+        self.assertEqual(['noSecret'], index.bad_topics)
+        self.assertEqual(('ltiKey', 'ltiSecret'), index.credentials('studentAction'))
+        self.assertRaises(ValueError, AuthIndex, ['studentAction'])
+
+    def testFromFileWithComments(self):
+        with open(self.config_path, 'w') as fd:
+            fd.write('// Keys and secrets\n' + json.dumps(AuthIndexTester.AUTH_DICT))
+        index = AuthIndex.from_file(self.config_path)
+        self.assertTrue(index.check('studentAction', 'ltiKey', 'ltiSecret'))
+        self.assertEqual(os.stat(self.config_path).st_mtime, index.version)
+
+    def testWatcherReportsChanges(self):
+        with open(self.config_path, 'w') as fd:
+            fd.write('{}')
+        changed = []
+        watcher = ConfigWatcher(self.config_path, changed.append, interval=0.01)
+        self.assertFalse(watcher.poll())
+        with open(self.config_path, 'w') as fd:
+            json.dump(AuthIndexTester.AUTH_DICT, fd)
+        watcher.start()
+        self.io_loop.call_later(0.05, self.stop)
+        self.wait()
+        watcher.stop()
+        self.assertEqual([self.config_path], changed)
+
+    def testWatcherSurvivesMissingFile(self):
+        changed = []
+        watcher = ConfigWatcher(self.config_path, changed.append)
+        self.assertFalse(watcher.poll())
+        with open(self.config_path, 'w') as fd:
+            fd.write('{}')
+        self.assertTrue(watcher.poll())
+        os.remove(self.config_path)
+        self.assertTrue(watcher.poll())
+        self.assertEqual([self.config_path], changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+'''
+Load and latency benchmark of the bridge, with no redis-server
+and no real LMS. Everything runs in-process on one IOLoop:
+
+   - the bridge, as built by makeApp(), with a StubBusAdapter that
+        loops published messages back to the bridge's subscriptions,
+   - a fleet of fake LTI delivery receivers, each an HTTP server on
+        its own port, which subscribe to the benchmark topics, and
+   - a load generator that POSTs to /schoolbus with a chosen
+        mix of publish, subscribe, and unsubscribe requests.
+
+Workloads:
+
+   publish   - only publishes; each is delivered to --fanout receivers
+   subscribe - subscribes and unsubscribes, alternating at random
+   mix       - 90% publish, 5% subscribe, 5% unsubscribe
+
+or a custom mix: --mix publish=80,subscribe=10,unsubscribe=10.
+Subscription churn uses topics that are never published to, with
+https delivery URLs that are never contacted, so it does not
+disturb the delivery measurements.
+
+The result is printed as JSON: overall requests/sec, and count, errors,
+mean and p50/p95/p99 latency in milliseconds per request type, plus
+the same for deliveries, measured from the start of the publish request
+to the arrival at the receiver. Load generator, bridge, and receivers
+share one CPU, so absolute numbers are lower than in production; the
+numbers are meant for comparing versions of the bridge. To do so,
+save a run with --output, and pass it to later runs as --baseline.
+Those runs exit with status 1 if throughput dropped, or p99 latency
+grew, by more than --tolerance.
+
+Usage: python -m ltischoolbus.test.bridge_load_benchmark [--workload {publish,subscribe,mix}] [--requests N] ...
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+import tornado.web
+
+from ltischoolbus.auth_index import AuthIndex
+from ltischoolbus.lti_schoolbus_bridge import BridgeRuntime, LTISchoolbusBridge
+from ltischoolbus.test.stub_bus_adapter import StubBusAdapter
+
+
+LTI_KEY = 'benchKey'
+LTI_SECRET = 'benchSecret'
+
+# Topics that are published to, and delivered to the receivers:
+PUBLISH_TOPIC = 'bench.topic%s'
+# Topics for subscription churn:
+CHURN_TOPIC = 'benchChurn.topic%s'
+CHURN_URL = 'https://lms%s.example.edu/delivery'
+
+WORKLOADS = {'publish' : {'publish' : 100},
+             'subscribe' : {'subscribe' : 50, 'unsubscribe' : 50},
+             'mix' : {'publish' : 90, 'subscribe' : 5, 'unsubscribe' : 5}}
+
+# Relative changes beyond --tolerance that count as regressions:
+REGRESSION_CHECKS = (('throughput_reqs_per_sec', -1),
+                     ('p99_ms', 1))
+
+
+class DeliveryReceiver(tornado.web.RequestHandler):
+    '''
+    Fake LTI consumer. Notes the arrival time of each
+    delivered message, single or batched.
+    '''
+
+    def initialize(self, collector, delay):
+        self.collector = collector
+        self.delay = delay
+
+    @gen.coroutine
+    def post(self):
+        arrival_time = time.time()
+        envelopes = json.loads(self.request.body)
+        if not isinstance(envelopes, list):
+            envelopes = [envelopes]
+        for envelope in envelopes:
+            self.collector.received(json.loads(envelope['payload'])['seq'], arrival_time)
+        if self.delay > 0:
+            # A slow LMS:
+            yield gen.sleep(self.delay)
+
+
+class LatencyCollector(object):
+    '''
+    Latencies in seconds, by request type, and of deliveries.
+    '''
+
+    def __init__(self):
+        # Request type --> [seconds]:
+        self.latencies = {}
+        # Request type --> number of responses other than 200:
+        self.errors = {}
+        # Sequence number of a publish --> time its request started:
+        self.publish_times = {}
+        self.delivery_latencies = []
+
+    def request_done(self, request_type, start_time, code):
+        self.latencies.setdefault(request_type, []).append(time.time() - start_time)
+        if code != 200:
+            self.errors[request_type] = self.errors.get(request_type, 0) + 1
+
+    def received(self, seq, arrival_time):
+        try:
+            self.delivery_latencies.append(arrival_time - self.publish_times[seq])
+        except KeyError:
+            # From the warmup:
+            pass
+
+
+def percentile(sorted_values, fraction):
+    '''
+    Nearest-rank percentile.
+
+    :param sorted_values: values in ascending order
+    :type sorted_values: [float]
+    :param fraction: e.g. 0.99 for p99
+    :type fraction: float
+    :rtype: {float | None}
+    '''
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, int(math.ceil(fraction * len(sorted_values))) - 1)]
+
+def summarize(latencies, num_errors=0):
+    '''
+    :param latencies: seconds
+    :type latencies: [float]
+    :return: count, errors, and mean and percentiles in milliseconds
+    :rtype: {str : <any>}
+    '''
+    latencies = sorted(latencies)
+    summary = {'count' : len(latencies), 'errors' : num_errors}
+    if latencies:
+        summary['mean_ms'] = sum(latencies) / len(latencies) * 1000
+        for (name, fraction) in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            summary[name] = percentile(latencies, fraction) * 1000
+    return summary
+
+def parse_mix(mix_spec):
+    '''
+    :param mix_spec: e.g. 'publish=80,subscribe=10,unsubscribe=10'
+    :type mix_spec: str
+    :return: request type --> weight
+    :rtype: {str : int}
+    :raise ValueError: if the spec is malformed, or names unknown request types
+    '''
+    mix = {}
+    for part in mix_spec.split(','):
+        (request_type, weight) = part.split('=')
+        if request_type not in WORKLOADS['mix']:
+            raise ValueError("Unknown request type '%s'; use publish, subscribe, or unsubscribe." % request_type)
+        mix[request_type] = int(weight)
+    return mix
+
+def make_request_body(request_type, seq, num_topics, rand):
+    '''
+    :return: POST body of one request of the given type
+    :rtype: str
+    '''
+    msg = {'ltiKey' : LTI_KEY, 'ltiSecret' : LTI_SECRET, 'action' : request_type}
+    if request_type == 'publish':
+        msg['bus_topic'] = PUBLISH_TOPIC % rand.randrange(num_topics)
+        # Carries the sequence number to the receivers:
+        msg['payload'] = json.dumps({'seq' : seq,
+                                     'event_type' : 'problem_check',
+                                     'student_id' : 'd4dfbbce6c4e9c8a0e036fb4049c0ba3',
+                                     'course_id' : 'HumanitiesSciences/NCP-101/OnGoing'})
+    else:
+        msg['bus_topic'] = CHURN_TOPIC % rand.randrange(num_topics)
+        msg['payload'] = {'delivery_url' : CHURN_URL % rand.randrange(10)}
+    return json.dumps(msg)
+
+@gen.coroutine
+def start_receivers(num_receivers, collector, delay):
+    '''
+    :return: servers, and the delivery URL of each
+    :rtype: ([HTTPServer], [str])
+    '''
+    servers = []
+    urls = []
+    for _ in range(num_receivers):
+        sock, port = bind_unused_port()
+        server = HTTPServer(tornado.web.Application([(r'/delivery', DeliveryReceiver,
+                                                      {'collector' : collector, 'delay' : delay})]))
+        server.add_sockets([sock])
+        servers.append(server)
+        urls.append('http://127.0.0.1:%s/delivery' % port)
+    raise gen.Return((servers, urls))
+
+@gen.coroutine
+def drive(url, num_requests, concurrency, mix, num_topics, collector, rand, first_seq=0):
+    '''
+    POST num_requests requests of the types in mix to url,
+    keeping at most concurrency requests outstanding. Publish
+    requests are numbered from first_seq.
+
+    :return: seconds from first request to last response
+    :rtype: float
+    '''
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+    request_types = []
+    for (request_type, weight) in sorted(mix.items()):
+        request_types.extend([request_type] * weight)
+    requests = [rand.choice(request_types) for _ in range(num_requests)]
+    next_request = [0]
+
+    @gen.coroutine
+    def worker():
+        while next_request[0] < num_requests:
+            request_type = requests[next_request[0]]
+            seq = first_seq + next_request[0]
+            next_request[0] += 1
+            body = make_request_body(request_type, seq, num_topics, rand)
+            start_time = time.time()
+            if request_type == 'publish':
+                collector.publish_times[seq] = start_time
+            response = yield client.fetch(url, method='POST', body=body, raise_error=False)
+            collector.request_done(request_type, start_time, response.code)
+
+    start_time = time.time()
+    yield [worker() for _ in range(concurrency)]
+    elapsed = time.time() - start_time
+    client.close()
+    raise gen.Return(elapsed)
+
+@gen.coroutine
+def wait_for_deliveries(collector, num_expected, timeout):
+    deadline = time.time() + timeout
+    while len(collector.delivery_latencies) < num_expected and time.time() < deadline:
+        yield gen.sleep(0.01)
+
+def compare(results, baseline, tolerance):
+    '''
+    :return: descriptions of the throughput and p99 numbers in
+        results that are worse than in baseline by more than tolerance
+    :rtype: [str]
+    '''
+    regressions = []
+    for section in ['overall'] + sorted(results['requests_by_type'].keys()) + ['deliveries']:
+        if section == 'overall':
+            (now, then) = (results, baseline)
+        elif section == 'deliveries':
+            (now, then) = (results['deliveries'], baseline.get('deliveries', {}))
+        else:
+            (now, then) = (results['requests_by_type'][section], baseline.get('requests_by_type', {}).get(section, {}))
+        for (key, direction) in REGRESSION_CHECKS:
+            if now.get(key) is None or not then.get(key):
+                continue
+            change = (now[key] - then[key]) / float(then[key])
+            if change * direction > tolerance:
+                regressions.append('%s %s: %.3f -> %.3f (%+.1f%%)' % (section, key, then[key], now[key], change * 100))
+    return regressions
+
+@gen.coroutine
+def main(args):
+    mix = parse_mix(args.mix) if args.mix else WORKLOADS[args.workload]
+    rand = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='ltibridge_bench')
+    collector = LatencyCollector()
+    (receivers, receiver_urls) = yield start_receivers(args.receivers, collector, args.receiver_delay / 1000.)
+    runtime = BridgeRuntime(bus_adapter=StubBusAdapter(keep_published=False, loopback=True),
+                            subscriptions_path=os.path.join(work_dir, 'lti_bus_subscriptions.json'))
+    sock, port = bind_unused_port()
+    bridge = HTTPServer(LTISchoolbusBridge.makeApp({'runtime' : runtime}))
+    bridge.add_sockets([sock])
+    try:
+        # Receivers have plain http URLs, which the bridge only
+        # accepts from subscribe requests with https; subscribe
+        # them directly:
+        fanout = min(args.fanout, args.receivers)
+        runtime.lti_subscribe_many([(PUBLISH_TOPIC % topic_num, receiver_urls[(topic_num + offset) % args.receivers])
+                                    for topic_num in range(args.topics)
+                                    for offset in range(fanout)])
+        url = 'http://127.0.0.1:%s/schoolbus' % port
+        # Warm up connections and code paths; warmup deliveries
+        # carry sequence numbers that are not timed:
+        yield drive(url, min(args.requests, 50), args.concurrency, mix, args.topics, LatencyCollector(), rand,
+                    first_seq=args.requests)
+        yield gen.sleep(0.1)
+
+        elapsed = yield drive(url, args.requests, args.concurrency, mix, args.topics, collector, rand)
+        num_published = len(collector.latencies.get('publish', [])) - collector.errors.get('publish', 0)
+        yield wait_for_deliveries(collector, num_published * fanout, args.drain_timeout)
+        delivery_elapsed = time.time() - min(collector.publish_times.values()) if collector.publish_times else 0
+
+        all_latencies = [latency for latencies in collector.latencies.values() for latency in latencies]
+        results = {'workload' : args.mix or args.workload,
+                   'requests' : args.requests,
+                   'concurrency' : args.concurrency,
+                   'topics' : args.topics,
+                   'receivers' : args.receivers,
+                   'fanout' : fanout,
+                   'elapsed_sec' : elapsed,
+                   'throughput_reqs_per_sec' : args.requests / elapsed}
+        results.update(summarize(all_latencies, sum(collector.errors.values())))
+        results['requests_by_type'] = {request_type : summarize(latencies, collector.errors.get(request_type, 0))
+                                       for (request_type, latencies) in collector.latencies.items()}
+        for (request_type, summary) in results['requests_by_type'].items():
+            summary['throughput_reqs_per_sec'] = summary['count'] / elapsed
+        deliveries = summarize(collector.delivery_latencies)
+        deliveries['expected'] = num_published * fanout
+        deliveries['throughput_per_sec'] = len(collector.delivery_latencies) / delivery_elapsed if delivery_elapsed else 0
+        results['deliveries'] = deliveries
+
+        regressions = []
+        if args.baseline:
+            with open(args.baseline, 'r') as fd:
+                regressions = compare(results, json.load(fd), args.tolerance)
+            results['regressions'] = regressions
+        output = json.dumps(results, indent=2, sort_keys=True)
+        print(output)
+        if args.output:
+            with open(args.output, 'w') as fd:
+                fd.write(output + '\n')
+        raise gen.Return(1 if regressions else 0)
+    finally:
+        bridge.stop()
+        for receiver in receivers:
+            receiver.stop()
+        runtime.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--workload', choices=sorted(WORKLOADS.keys()), default='publish',
+                        help='Mix of requests. Default: publish')
+    parser.add_argument('--mix',
+                        help='Custom mix instead of --workload, e.g. publish=80,subscribe=10,unsubscribe=10')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='Number of timed requests. Default: 2000')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='Number of requests kept outstanding. Default: 10')
+    parser.add_argument('--topics', type=int, default=100,
+                        help='Number of topics published to, and of topics for subscription churn. Default: 100')
+    parser.add_argument('--receivers', type=int, default=10,
+                        help='Number of fake delivery receivers. Default: 10')
+    parser.add_argument('--fanout', type=int, default=2,
+                        help='Number of receivers subscribed to each topic. Default: 2')
+    parser.add_argument('--receiverdelay', type=float, default=0, dest='receiver_delay',
+                        help='Milliseconds each receiver takes to respond. Default: 0')
+    parser.add_argument('--draintimeout', type=float, default=30, dest='drain_timeout',
+                        help='Seconds to wait for outstanding deliveries after the last request. Default: 30')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Seed for choosing request types and topics. Default: 1')
+    parser.add_argument('--output',
+                        help='File to which the JSON results are written, e.g. for use as a later --baseline')
+    parser.add_argument('--baseline',
+                        help='Results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Fraction by which throughput may drop, or p99 latency grow,\n' +\
+                             'before it counts as a regression. Default: 0.1')
+    args = parser.parse_args()
+
+    LTISchoolbusBridge.setupLogging(logging.ERROR)
+    LTISchoolbusBridge.auth_index = AuthIndex({'bench.#' : {'ltiKey' : LTI_KEY, 'ltiSecret' : LTI_SECRET},
+                                               'benchChurn.#' : {'ltiKey' : LTI_KEY, 'ltiSecret' : LTI_SECRET}})
+    sys.exit(IOLoop.current().run_sync(lambda: main(args)))
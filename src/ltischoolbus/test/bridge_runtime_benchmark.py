@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+'''
+Measures publish requests/sec of the bridge with a stubbed
+SchoolBus, comparing:
+
+   - 'per_request': the old arrangement, where every incoming
+        request built a new BusAdapter, re-read the subscription
+        file, and re-subscribed to every topic, and
+   - 'shared_runtime': the current arrangement, where makeApp()
+        injects one long-lived BridgeRuntime into every request.
+
+Both variants run in-process on one IOLoop, with an AsyncHTTPClient
+as load generator. No redis-server is needed.
+
+Usage: python -m ltischoolbus.test.bridge_runtime_benchmark [--requests N] [--concurrency C] [--topics T]
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+import tornado.web
+
+from ltischoolbus.auth_index import AuthIndex
+from ltischoolbus.lti_schoolbus_bridge import BridgeRuntime, LTISchoolbusBridge
+from ltischoolbus.test.stub_bus_adapter import StubBusAdapter
+
+
+PUBLISH_MSG = {"ltiKey" : "ltiKey",
+               "ltiSecret" : "ltiSecret",
+               "action" : "publish",
+               "bus_topic" : "studentAction",
+               "payload" : {"event_type": "problem_check",
+                            "resource_id": "i4x://HumanitiesSciences/NCP-101/problem/__61",
+                            "student_id": "d4dfbbce6c4e9c8a0e036fb4049c0ba3",
+                            "answers": {"i4x-HumanitiesSciences-NCP-101-problem-_61_2_1": ["choice_3", "choice_4"]},
+                            "result": "False",
+                            "course_id": "HumanitiesSciences/NCP-101/OnGoing"
+                            }
+               }
+
+
+class PerRequestSetupBridge(LTISchoolbusBridge):
+    '''
+    Reproduces the cost structure of the bridge before
+    BridgeRuntime existed: all setup happens in initialize(),
+    which Tornado calls for every request.
+    '''
+
+    def initialize(self, subscriptions_path):
+        LTISchoolbusBridge.initialize(self, BridgeRuntime(bus_adapter=StubBusAdapter(keep_published=False),
+                                                          subscriptions_path=subscriptions_path))
+
+    def on_finish(self):
+        self.runtime.close()
+
+
+def make_subscriptions_file(directory, num_topics):
+    path = os.path.join(directory, 'lti_bus_subscriptions.json')
+    subscriptions = {}
+    for topic_num in range(num_topics):
+        subscriptions['benchTopic%s' % topic_num] = ['https://lms%s.example.edu/delivery' % (topic_num % 10)]
+    with open(path, 'w') as fd:
+        json.dump(subscriptions, fd)
+    return path
+
+
+@gen.coroutine
+def drive(url, num_requests, concurrency):
+    '''
+    POST num_requests publish messages to url, keeping at
+    most concurrency requests outstanding. Returns requests/sec.
+    '''
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+    body = json.dumps(PUBLISH_MSG)
+    remaining = [num_requests]
+
+    @gen.coroutine
+    def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            response = yield client.fetch(url, method='POST', body=body, raise_error=False)
+            if response.code != 200:
+                raise RuntimeError('Bridge returned %s: %s' % (response.code, response.reason))
+
+    start_time = time.time()
+    yield [worker() for _ in range(concurrency)]
+    elapsed = time.time() - start_time
+    client.close()
+    raise gen.Return(num_requests / elapsed)
+
+
+@gen.coroutine
+def run_variant(application, num_requests, concurrency):
+    sock, port = bind_unused_port()
+    server = HTTPServer(application)
+    server.add_sockets([sock])
+    try:
+        url = 'http://127.0.0.1:%s/schoolbus' % port
+        # Warm up connections and code paths:
+        yield drive(url, min(num_requests, 50), concurrency)
+        reqs_per_sec = yield drive(url, num_requests, concurrency)
+    finally:
+        server.stop()
+    raise gen.Return(reqs_per_sec)
+
+
+@gen.coroutine
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix='ltibridge_bench')
+    try:
+        subscriptions_path = make_subscriptions_file(work_dir, args.topics)
+
+        per_request_app = tornado.web.Application([(r"/schoolbus",
+                                                    PerRequestSetupBridge,
+                                                    {'subscriptions_path' : subscriptions_path})])
+        runtime = BridgeRuntime(bus_adapter=StubBusAdapter(keep_published=False),
+                                subscriptions_path=subscriptions_path)
+        shared_app = LTISchoolbusBridge.makeApp({'runtime' : runtime})
+
+        results = {'requests' : args.requests,
+                   'concurrency' : args.concurrency,
+                   'subscribed_topics' : args.topics}
+        results['per_request_reqs_per_sec'] = yield run_variant(per_request_app, args.requests, args.concurrency)
+        results['shared_runtime_reqs_per_sec'] = yield run_variant(shared_app, args.requests, args.concurrency)
+        results['speedup'] = results['shared_runtime_reqs_per_sec'] / results['per_request_reqs_per_sec']
+        print(json.dumps(results, indent=2, sort_keys=True))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='Number of timed publish requests per variant. Default: 2000')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='Number of requests kept outstanding. Default: 10')
+    parser.add_argument('--topics', type=int, default=200,
+                        help='Number of topics in the subscription file. Default: 200')
+    args = parser.parse_args()
+
+    LTISchoolbusBridge.setupLogging(logging.ERROR)
+    LTISchoolbusBridge.auth_index = AuthIndex({'studentAction' : {'ltiKey' : 'ltiKey', 'ltiSecret' : 'ltiSecret'}})
+    IOLoop.current().run_sync(lambda: main(args))
@@ -0,0 +1,763 @@
+'''
+In-process tests of the LTI-SchoolBus bridge. A StubBusAdapter
+replaces the SchoolBus, so neither a redis-server nor a running
+bridge service is needed.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+from collections import OrderedDict
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from redis_bus_python.bus_message import BusMessage
+from tornado import gen
+from tornado.httpserver import HTTPServer
+from tornado.testing import AsyncHTTPTestCase, bind_unused_port
+import tornado.web
+
+from ltischoolbus.lti_schoolbus_bridge import BridgeRuntime, LTISchoolbusBridge, LTISchoolbusStreamBridge
+from ltischoolbus.subscription_journal import SubscriptionJournal
+from ltischoolbus.test.stub_bus_adapter import StubBusAdapter
+
+
+class DeliveryReceiver(tornado.web.RequestHandler):
+
+    def initialize(self, received):
+        self.received = received
+
+    def post(self):
+        self.received.append(self.request.body)
+
+
+class FlakyReceiver(tornado.web.RequestHandler):
+    '''
+    Fails every other delivery with 503 Service Unavailable.
+    '''
+
+    def initialize(self, received):
+        self.received = received
+
+    def post(self):
+        self.received.append(self.request.body)
+        if len(self.received) % 2 == 1:
+            self.set_status(503)
+
+
+class BridgeRuntimeTester(AsyncHTTPTestCase):
+
+    DELIVERY_URL = 'https://lms.example.edu/delivery'
+
+    TEST_MSG_DICT = {"ltiKey" : "ltiKey",
+                     "ltiSecret" : "ltiSecret",
+                     "action" : "publish",
+                     "bus_topic" : "studentAction",
+                     "payload" : {"event_type": "problem_check",
+                                  "course_id": "HumanitiesSciences/NCP-101/OnGoing"}
+                     }
+
+    TEST_SUBSCRIBE_DICT = {"ltiKey" : "ltiKey",
+                           "ltiSecret" : "ltiSecret",
+                           "action" : "subscribe",
+                           "bus_topic" : "studentAction",
+                           "payload" : {"delivery_url" : DELIVERY_URL}
+                           }
+
+    @classmethod
+    def setUpClass(cls):
+        super(BridgeRuntimeTester, cls).setUpClass()
+        LTISchoolbusBridge.setupLogging(logging.CRITICAL)
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ltibridge_test')
+        self.subscriptions_path = os.path.join(self.work_dir, 'lti_bus_subscriptions.json')
+        LTISchoolbusBridge.configfile = os.path.join(self.work_dir, 'ltibridge.cnf')
+        with open(LTISchoolbusBridge.configfile, 'w') as fd:
+            json.dump({'studentAction' : {'ltiKey' : 'ltiKey', 'ltiSecret' : 'ltiSecret'}}, fd)
+        LTISchoolbusBridge.load_auth_info(LTISchoolbusBridge.configfile, except_on_failure=True)
+        self.bus = StubBusAdapter()
+        # (HTTPServer, BridgeRuntime) of bridges started by start_follower():
+        self.followers = []
+        # Runtimes started by start_shards():
+        self.shards = []
+        super(BridgeRuntimeTester, self).setUp()
+
+    def tearDown(self):
+        for (server, follower) in self.followers:
+            server.stop()
+            follower.close()
+        for shard in self.shards:
+            shard.close()
+        self.runtime.close()
+        super(BridgeRuntimeTester, self).tearDown()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def get_app(self):
+        self.runtime = BridgeRuntime(bus_adapter=self.bus,
+                                     subscriptions_path=self.subscriptions_path)
+        application = LTISchoolbusBridge.makeApp({'runtime' : self.runtime})
+        # Let the bridge deliver to itself:
+        self.received = []
+        application.add_handlers(r'.*', [(r'/delivery', DeliveryReceiver, {'received' : self.received}),
+                                         (r'/flaky', FlakyReceiver, {'received' : self.received})])
+        return application
+
+    def subscriptions_on_disk(self):
+        '''
+        :return: the subscriptions a restarted bridge would load
+        :rtype: {str : [str]}
+        '''
+        self.runtime.subscription_journal.sync()
+        journal = SubscriptionJournal(self.subscriptions_path, io_loop=self.io_loop)
+        try:
+            return journal.load().to_dict()
+        finally:
+            journal.close()
+
+    def post_to_bridge(self, msg_dict):
+        return self.fetch('/schoolbus', method='POST', body=json.dumps(msg_dict))
+
+    def testPublishReachesBus(self):
+        response = self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT)
+        self.assertEqual(200, response.code)
+        self.assertEqual(1, len(self.bus.published))
+        self.assertEqual('studentAction', self.bus.published[0].topicName)
+        self.assertEqual(1, self.runtime.published_to_bus_counter)
+
+    def testPublishBatch(self):
+        msg = {'ltiKey' : 'ltiKey',
+               'ltiSecret' : 'ltiSecret',
+               'action' : 'publish_batch',
+               'events' : [{'bus_topic' : 'studentAction', 'payload' : {'event_type' : 'problem_check'}},
+                           {'bus_topic' : 'studentAction', 'payload' : {'event_type' : 'seq_next'}},
+                           {'bus_topic' : 'studentAction', 'payload' : {}, 'ltiSecret' : 'bluebeard'},
+                           {'bus_topic' : 'secretTopic', 'payload' : {}},
+                           {'bus_topic' : 'studentAction'}]}
+        response = self.post_to_bridge(msg)
+        self.assertEqual(200, response.code)
+        statuses = [event['status'] for event in json.loads(response.body)['events']]
+        self.assertEqual([200, 200, 401, 401, 400], statuses)
+        # Both good events went to the bus in one round trip:
+        self.assertEqual(2, len(self.bus.published))
+        self.assertEqual(1, self.bus.pipelines_executed)
+        self.assertIn('seq_next', self.bus.published[1].content)
+        self.assertEqual(2, self.runtime.published_to_bus_counter)
+
+    def testPublishNdjson(self):
+        lines = [json.dumps(BridgeRuntimeTester.TEST_MSG_DICT),
+                 '',
+                 '{"not json',
+                 json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)]
+        response = self.fetch('/schoolbus',
+                              method='POST',
+                              headers={'Content-Type' : 'application/x-ndjson'},
+                              body='\n'.join(lines))
+        self.assertEqual(200, response.code)
+        statuses = [event['status'] for event in json.loads(response.body)['events']]
+        self.assertEqual([200, 415, 200], statuses)
+        self.assertEqual(2, len(self.bus.published))
+
+    def testNestedPayloadParsedOnce(self):
+        msg = dict(BridgeRuntimeTester.TEST_MSG_DICT, payload='{"event_type" : "problem_check"}')
+        self.assertEqual(200, self.post_to_bridge(msg).code)
+        # Published as sent:
+        self.assertEqual('{"event_type" : "problem_check"}', self.bus.published[0].content)
+        self.assertEqual(415, self.post_to_bridge(dict(msg, payload='{"not json')).code)
+        self.assertEqual(415, self.post_to_bridge(dict(msg, payload=42)).code)
+        self.assertEqual(415, self.fetch('/schoolbus', method='POST', body='[1, 2]').code)
+        # A subscription's payload may be nested, too:
+        subscribe_msg = dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT,
+                             payload=json.dumps(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT['payload']))
+        self.assertEqual(200, self.post_to_bridge(subscribe_msg).code)
+        self.assertEqual({'studentAction' : [BridgeRuntimeTester.DELIVERY_URL]}, self.subscriptions_on_disk())
+
+    def use_event_schema(self):
+        with open(LTISchoolbusBridge.configfile, 'w') as fd:
+            json.dump({'studentAction' : {'ltiKey' : 'ltiKey',
+                                          'ltiSecret' : 'ltiSecret',
+                                          'schema' : {'type' : 'object',
+                                                      'required' : ['course_id', 'event_type']}}}, fd)
+        LTISchoolbusBridge.load_auth_info(LTISchoolbusBridge.configfile, except_on_failure=True)
+
+    def testPayloadSchemaEnforced(self):
+        self.use_event_schema()
+        self.assertEqual(200, self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT).code)
+        response = self.post_to_bridge(dict(BridgeRuntimeTester.TEST_MSG_DICT, payload='{"event_type" : "problem_check"}'))
+        self.assertEqual(422, response.code)
+        self.assertEqual([{'path' : 'course_id', 'error' : 'is required'}], json.loads(response.body)['errors'])
+        self.assertEqual(1, len(self.bus.published))
+        # Subscription payloads are not publish events:
+        self.assertEqual(200, self.post_to_bridge(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT).code)
+        # Each event of a bulk publish is checked:
+        msg = {'ltiKey' : 'ltiKey',
+               'ltiSecret' : 'ltiSecret',
+               'action' : 'publish_batch',
+               'events' : [{'bus_topic' : 'studentAction', 'payload' : BridgeRuntimeTester.TEST_MSG_DICT['payload']},
+                           {'bus_topic' : 'studentAction', 'payload' : ['problem_check']}]}
+        statuses = json.loads(self.post_to_bridge(msg).body)['events']
+        self.assertEqual([200, 422], [event['status'] for event in statuses])
+        self.assertEqual([{'path' : '', 'error' : 'must be of type object'}], statuses[1]['errors'])
+        # ... and each line of a stream:
+        body = '\n'.join([json.dumps(BridgeRuntimeTester.TEST_MSG_DICT),
+                          json.dumps(dict(BridgeRuntimeTester.TEST_MSG_DICT, payload={'course_id' : 'Hist101'}))])
+        summary = json.loads(self.fetch('/schoolbus/stream', method='POST', body=body).body)
+        self.assertEqual(1, summary['published'])
+        self.assertEqual([(2, 422, [{'path' : 'event_type', 'error' : 'is required'}])],
+                         [(error['line'], error['status'], error['errors']) for error in summary['errors']])
+
+    def use_rate_limits(self):
+        with open(LTISchoolbusBridge.configfile, 'w') as fd:
+            json.dump({'studentAction' : {'ltiKey' : 'ltiKey',
+                                          'ltiSecret' : 'ltiSecret',
+                                          'key_rate_limit' : {'rate' : 0.001, 'burst' : 2}}}, fd)
+        LTISchoolbusBridge.load_auth_info(LTISchoolbusBridge.configfile, except_on_failure=True)
+
+    def testRateLimited(self):
+        self.use_rate_limits()
+        # Requests that fail authentication do not use up the key's budget:
+        for _ in range(3):
+            self.assertEqual(401, self.post_to_bridge(dict(BridgeRuntimeTester.TEST_MSG_DICT, ltiSecret='bluebeard')).code)
+        self.assertEqual([200, 200], [self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT).code for _ in range(2)])
+        response = self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT)
+        self.assertEqual(429, response.code)
+        self.assertTrue(0 < int(response.headers['Retry-After']) <= 1000)
+        self.assertEqual(2, len(self.bus.published))
+        # Turned away before the body is parsed:
+        response = self.fetch('/schoolbus', method='POST', body='{"ltiKey" : "ltiKey", "not json')
+        self.assertEqual(429, response.code)
+        # Bulk publish events are limited one by one:
+        msg = {'ltiKey' : 'ltiKey',
+               'ltiSecret' : 'ltiSecret',
+               'action' : 'publish_batch',
+               'events' : [{'bus_topic' : 'studentAction', 'payload' : {}}]}
+        self.assertEqual(429, self.post_to_bridge(msg).code)
+        lines = [json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)] * 2
+        response = self.fetch('/schoolbus', method='POST', headers={'Content-Type' : 'application/x-ndjson'}, body='\n'.join(lines))
+        self.assertEqual([429, 429], [event['status'] for event in json.loads(response.body)['events']])
+        self.assertEqual(2, len(self.bus.published))
+        self.assertIn('ltibridge_rate_limited_total{limit="key"} 5', self.fetch('/metrics').body)
+
+    def testOverloadSheds(self):
+        # Overload the bridge:
+        self.runtime.admission.add_signal('test_load', lambda: 1, 1)
+        self.runtime.admission.sample()
+        response = self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT)
+        self.assertEqual(503, response.code)
+        self.assertEqual('1', response.headers['Retry-After'])
+        response = self.post_to_bridge(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT)
+        self.assertEqual(503, response.code)
+        self.assertEqual(int(response.headers['Retry-After']), json.loads(response.body)['retry_after'])
+        response = self.fetch('/schoolbus/stream', method='POST', body=json.dumps(BridgeRuntimeTester.TEST_MSG_DICT))
+        self.assertEqual(503, response.code)
+        self.assertEqual(0, len(self.bus.published))
+        # Unsubscribing is always admitted:
+        response = self.post_to_bridge(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, action='unsubscribe'))
+        self.assertNotEqual(503, response.code)
+        metrics = self.fetch('/metrics').body
+        self.assertIn('ltibridge_admission_decisions_total{kind="publish",decision="shed"} 2', metrics)
+        self.assertIn('ltibridge_admission_decisions_total{kind="unsubscribe",decision="admitted"} 1', metrics)
+        self.assertIn('ltibridge_admission_shedding 1', metrics)
+        self.assertIn('ltibridge_admission_signal{signal="in_flight"} 0', metrics)
+        # A publish request cannot pass for an unsubscribe one,
+        # by an action field in its payload ahead of its own:
+        body = '{"payload" : {"action" : "unsubscribe"}, %s' % json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)[1:]
+        self.assertEqual('publish', json.loads(body)['action'])
+        response = self.fetch('/schoolbus', method='POST', body=body)
+        self.assertEqual(503, response.code)
+        self.assertEqual('1', response.headers['Retry-After'])
+        self.assertEqual(0, len(self.bus.published))
+        # Nor can an unsubscribe request be shed as a publish one:
+        unsubscribe_dict = dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, action='unsubscribe')
+        body = '{"payload" : {"action" : "publish"}, %s' % json.dumps(unsubscribe_dict)[1:]
+        self.assertNotEqual(503, self.fetch('/schoolbus', method='POST', body=body).code)
+        # Each request is admitted once:
+        metrics = self.fetch('/metrics').body
+        self.assertIn('ltibridge_admission_decisions_total{kind="publish",decision="shed"} 3', metrics)
+        self.assertIn('ltibridge_admission_decisions_total{kind="unsubscribe",decision="admitted"} 2', metrics)
+        # A request's own action field spelled with escapes, hidden from the peek:
+        body = '{"payload" : {"action" : "unsubscribe"}, %s' % json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)[1:].replace('"action"', '"\\u0061ction"')
+        self.assertEqual(400, self.fetch('/schoolbus', method='POST', body=body).code)
+        self.assertEqual(0, len(self.bus.published))
+
+    def testDuplicatePublishSuppressed(self):
+        msg = dict(BridgeRuntimeTester.TEST_MSG_DICT, idempotency_key='event-1')
+        self.assertEqual(200, self.post_to_bridge(msg).code)
+        # An LMS retry:
+        response = self.post_to_bridge(msg)
+        self.assertEqual(200, response.code)
+        self.assertTrue(json.loads(response.body)['duplicate'])
+        self.assertEqual(1, len(self.bus.published))
+        self.assertEqual(400, self.post_to_bridge(dict(msg, idempotency_key=17)).code)
+        # Events of bulk publishes, too:
+        batch = {'ltiKey' : 'ltiKey',
+                 'ltiSecret' : 'ltiSecret',
+                 'action' : 'publish_batch',
+                 'events' : [{'bus_topic' : 'studentAction', 'payload' : {}, 'idempotency_key' : 'event-1'},
+                             {'bus_topic' : 'studentAction', 'payload' : {}, 'idempotency_key' : 'event-2'},
+                             {'bus_topic' : 'studentAction', 'payload' : {}, 'idempotency_key' : 'event-2'}]}
+        statuses = json.loads(self.post_to_bridge(batch).body)['events']
+        self.assertEqual([{'status' : 200, 'duplicate' : True}, {'status' : 200}, {'status' : 200, 'duplicate' : True}], statuses)
+        lines = [json.dumps(dict(msg, idempotency_key='event-3'))] * 3
+        summary = json.loads(self.fetch('/schoolbus/stream', method='POST', body='\n'.join(lines)).body)
+        self.assertEqual((1, 2), (summary['published'], summary['duplicates']))
+        self.assertEqual(3, len(self.bus.published))
+        # Without a key, requests are only deduplicated by payload where the config file says so:
+        self.assertEqual(200, self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT).code)
+        self.assertEqual(200, self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT).code)
+        self.assertEqual(5, len(self.bus.published))
+        with open(LTISchoolbusBridge.configfile, 'w') as fd:
+            json.dump({'studentAction' : {'ltiKey' : 'ltiKey', 'ltiSecret' : 'ltiSecret', 'dedup_by_payload' : True}}, fd)
+        LTISchoolbusBridge.load_auth_info(LTISchoolbusBridge.configfile, except_on_failure=True)
+        self.assertEqual(200, self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT).code)
+        self.assertTrue(json.loads(self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT).body)['duplicate'])
+        self.assertEqual(6, len(self.bus.published))
+        # The same payload, with its fields in another order, or nested as a string:
+        reordered = '{"course_id" : "HumanitiesSciences/NCP-101/OnGoing", "event_type" : "problem_check"}'
+        body = '{"ltiKey" : "ltiKey", "ltiSecret" : "ltiSecret", "action" : "publish", "bus_topic" : "studentAction", "payload" : %s}'
+        for payload in (reordered, json.dumps(reordered)):
+            response = self.fetch('/schoolbus', method='POST', body=body % payload)
+            self.assertTrue(json.loads(response.body)['duplicate'])
+        response = self.post_to_bridge({'ltiKey' : 'ltiKey',
+                                        'ltiSecret' : 'ltiSecret',
+                                        'action' : 'publish_batch',
+                                        'events' : [{'bus_topic' : 'studentAction', 'payload' : reordered}]})
+        self.assertTrue(json.loads(response.body)['events'][0]['duplicate'])
+        self.assertEqual(6, len(self.bus.published))
+        metrics = self.fetch('/metrics').body
+        self.assertIn('ltibridge_dedup_lookups_total{result="hit"} 9', metrics)
+        self.assertIn('ltibridge_dedup_lookups_total{result="miss"} 4', metrics)
+
+    def testPublishBatchTooLarge(self):
+        events = [{'bus_topic' : 'studentAction', 'payload' : {}}] * (LTISchoolbusBridge.LTI_BRIDGE_MAX_BATCH_EVENTS + 1)
+        msg = {'ltiKey' : 'ltiKey', 'ltiSecret' : 'ltiSecret', 'action' : 'publish_batch', 'events' : events}
+        response = self.post_to_bridge(msg)
+        self.assertEqual(413, response.code)
+        self.assertEqual(0, len(self.bus.published))
+
+    def testStreamIngest(self):
+        good_line = json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)
+        bad_key_line = json.dumps(dict(BridgeRuntimeTester.TEST_MSG_DICT, ltiKey='bluebeard'))
+        body = '\n'.join([good_line] * 1200 + [bad_key_line, '{"not json', good_line])
+        # Send in small chunks that split lines, with chunked encoding:
+        @gen.coroutine
+        def body_producer(write):
+            for start in range(0, len(body), 1000):
+                yield write(body[start:start + 1000])
+        response = self.fetch('/schoolbus/stream', method='POST', body_producer=body_producer)
+        self.assertEqual(200, response.code)
+        summary = json.loads(response.body)
+        self.assertEqual(1203, summary['received'])
+        self.assertEqual(1201, summary['published'])
+        self.assertEqual(2, summary['rejected'])
+        self.assertEqual([(1201, 401), (1202, 415)], [(error['line'], error['status']) for error in summary['errors']])
+        self.assertEqual(1201, len(self.bus.published))
+        # Published in batches, not one round trip per event:
+        self.assertEqual(3, self.bus.pipelines_executed)
+
+    def testStreamIngestOverlongLine(self):
+        LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_LINE = 300
+        try:
+            good_line = json.dumps(BridgeRuntimeTester.TEST_MSG_DICT, separators=(',', ':'))
+            body = '\n'.join(['x' * 700, good_line])
+            @gen.coroutine
+            def body_producer(write):
+                for start in range(0, len(body), 30):
+                    yield write(body[start:start + 30])
+            response = self.fetch('/schoolbus/stream', method='POST', body_producer=body_producer)
+        finally:
+            LTISchoolbusStreamBridge.LTI_BRIDGE_STREAM_MAX_LINE = 1024 * 1024
+        summary = json.loads(response.body)
+        self.assertEqual([(1, 413)], [(error['line'], error['status']) for error in summary['errors']])
+        self.assertEqual(2, summary['received'])
+        self.assertEqual(1, summary['published'])
+
+    def testRuntimeSharedAcrossRequests(self):
+        for _ in range(3):
+            self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT)
+        # One runtime, so counters accumulate across requests:
+        self.assertEqual(3, self.runtime.published_to_bus_counter)
+        self.assertEqual(3, len(self.bus.published))
+
+    def testBadKeyRejected(self):
+        msg = dict(BridgeRuntimeTester.TEST_MSG_DICT, ltiKey='bluebeard')
+        response = self.post_to_bridge(msg)
+        self.assertEqual(401, response.code)
+        self.assertEqual(0, len(self.bus.published))
+
+    def testConfigChangePickedUpByWatcher(self):
+        msg = dict(BridgeRuntimeTester.TEST_MSG_DICT, ltiSecret='newSecret')
+        self.assertEqual(401, self.post_to_bridge(msg).code)
+        with open(LTISchoolbusBridge.configfile, 'w') as fd:
+            json.dump({'studentAction' : {'ltiKey' : 'ltiKey', 'ltiSecret' : 'newSecret'}}, fd)
+        # Failed requests do not reload the config file:
+        self.assertEqual(401, self.post_to_bridge(msg).code)
+        self.assertTrue(self.runtime.auth_watcher.poll())
+        self.assertEqual(200, self.post_to_bridge(msg).code)
+
+    def testSubscribePersistsAndSubscribesBus(self):
+        response = self.post_to_bridge(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT)
+        self.assertEqual(200, response.code)
+        self.assertTrue(self.bus.subscribedTo('studentAction'))
+        self.assertEqual({'studentAction' : [BridgeRuntimeTester.DELIVERY_URL]}, self.subscriptions_on_disk())
+
+    def testUnsubscribeKeepsTopicForOtherSubscribers(self):
+        other_url = 'https://other.example.edu/delivery'
+        self.post_to_bridge(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT)
+        self.post_to_bridge(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, payload={'delivery_url' : other_url}))
+        self.post_to_bridge(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, action='unsubscribe'))
+        # other_url still wants the topic:
+        self.assertTrue(self.bus.subscribedTo('studentAction'))
+        self.assertEqual({'studentAction' : [other_url]}, self.subscriptions_on_disk())
+        self.post_to_bridge(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, action='unsubscribe', payload={'delivery_url' : other_url}))
+        self.assertFalse(self.bus.subscribedTo('studentAction'))
+        self.assertEqual({}, self.subscriptions_on_disk())
+
+    def testSubscriptionsJournaledAndCompacted(self):
+        self.runtime.subscription_journal.compact_after = 3
+        for i in range(5):
+            self.runtime.lti_subscribe('topic%s' % i, BridgeRuntimeTester.DELIVERY_URL)
+        # Wait for the compaction thread:
+        self.runtime.subscription_journal.close()
+        self.assertFalse(os.path.exists(self.runtime.subscription_journal.compacting_path))
+        with open(self.subscriptions_path, 'r') as fd:
+            self.assertEqual(3, len(json.load(fd)))
+        self.assertEqual(5, len(self.subscriptions_on_disk()))
+
+    def testResubscribeOnStartup(self):
+        with open(self.subscriptions_path, 'w') as fd:
+            json.dump({'deliveryTest' : [BridgeRuntimeTester.DELIVERY_URL]}, fd)
+        bus = StubBusAdapter()
+        runtime = BridgeRuntime(bus_adapter=bus, subscriptions_path=self.subscriptions_path)
+        self.assertTrue(bus.subscribedTo('deliveryTest'))
+        runtime.close()
+
+    def testResubscribeInOneBatch(self):
+        with open(self.subscriptions_path, 'w') as fd:
+            json.dump({'topic%s' % i : [BridgeRuntimeTester.DELIVERY_URL] for i in range(50)}, fd)
+        with open(os.path.splitext(self.subscriptions_path)[0] + '.journal', 'w') as fd:
+            fd.write(json.dumps({'op' : 'unsubscribe', 'topic' : 'topic0', 'url' : BridgeRuntimeTester.DELIVERY_URL}) + '\n')
+        bus = StubBusAdapter()
+        runtime = BridgeRuntime(bus_adapter=bus, subscriptions_path=self.subscriptions_path)
+        self.assertEqual(1, bus.pub_sub.subscribe_commands)
+        self.assertEqual(49, len(bus.mySubscriptions()))
+        self.assertFalse(bus.subscribedTo('topic0'))
+        runtime.close()
+
+    def testPatternSubscription(self):
+        with open(LTISchoolbusBridge.configfile, 'w') as fd:
+            json.dump({'studentAction' : {'ltiKey' : 'ltiKey', 'ltiSecret' : 'ltiSecret'},
+                       'courseEvents.#' : {'ltiKey' : 'courseKey', 'ltiSecret' : 'courseSecret'}}, fd)
+        LTISchoolbusBridge.load_auth_info(LTISchoolbusBridge.configfile, except_on_failure=True)
+        subscribe_dict = dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT,
+                              ltiKey='courseKey', ltiSecret='courseSecret',
+                              bus_topic='courseEvents.HumanitiesSciences.*')
+        self.assertEqual(200, self.post_to_bridge(subscribe_dict).code)
+        self.assertEqual(200, self.post_to_bridge(dict(subscribe_dict, bus_topic='courseEvents.HumanitiesSciences.Hist101')).code)
+        # The topic is covered by the pattern's glob, so
+        # its messages arrive only once:
+        self.assertEqual(['courseEvents.HumanitiesSciences.*'], self.bus.mySubscriptions())
+        delivered = []
+        self.runtime.bus_in_msg_handler = delivered.append
+        self.assertEqual(1, self.bus.deliver(BusMessage(content='Hello', topicName='courseEvents.HumanitiesSciences.Hist101')))
+        self.io_loop.add_callback(self.stop)
+        self.wait()
+        self.assertEqual(1, len(delivered))
+        self.assertEqual([BridgeRuntimeTester.DELIVERY_URL],
+                         self.runtime.lti_subscriptions.urls_matching('courseEvents.HumanitiesSciences.Hist202'))
+        self.assertEqual([], self.runtime.lti_subscriptions.urls_matching('courseEvents.HumanitiesSciences.Hist202.quiz'))
+        # Patterns can't be published to, and need a grant that covers them:
+        self.assertEqual(400, self.post_to_bridge(dict(subscribe_dict, action='publish')).code)
+        self.assertEqual(400, self.post_to_bridge(dict(subscribe_dict, bus_topic='courseEvents.#.quiz')).code)
+        self.assertEqual(401, self.post_to_bridge(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, bus_topic='studentAction.*')).code)
+        # Unsubscribing from the pattern brings back the topic's own channel:
+        self.post_to_bridge(dict(subscribe_dict, action='unsubscribe'))
+        self.assertEqual(['courseEvents.HumanitiesSciences.Hist101'], self.bus.mySubscriptions())
+
+    def testBusMsgHandedToIOLoop(self):
+        self.post_to_bridge(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT)
+        delivered = []
+        self.runtime.bus_in_msg_handler = delivered.append
+        self.bus.deliver(BusMessage(content='Hello', topicName='studentAction'))
+        # Delivery happens on the IOLoop, not in the bus thread:
+        self.assertEqual([], delivered)
+        self.io_loop.add_callback(self.stop)
+        self.wait()
+        self.assertEqual(1, len(delivered))
+
+    def testBusMsgDeliveredToSubscriber(self):
+        self.runtime.lti_subscriptions.add('studentAction', self.get_url('/delivery'))
+        self.runtime.to_lti_transmitter(BusMessage(content='Hello', topicName='studentAction'))
+        self.assertEqual(1, self.runtime.delivery_engine.in_flight)
+        while not self.received:
+            self.io_loop.add_timeout(self.io_loop.time() + 0.01, self.stop)
+            self.wait()
+        envelope = json.loads(self.received[0])
+        self.assertEqual('Hello', envelope['payload'])
+        self.assertEqual('studentAction', envelope['bus_topic'])
+        self.assertEqual('ltiKey', envelope['ltiKey'])
+
+    def testFailedDeliveryRetried(self):
+        self.runtime.lti_subscriptions.add('studentAction', self.get_url('/flaky'))
+        self.runtime.delivery_outbox.base_retry_delay = 0.01
+        self.runtime.to_lti_transmitter(BusMessage(content='Hello', topicName='studentAction'))
+        while self.runtime.delivered_to_lti_counter == 0:
+            self.io_loop.add_timeout(self.io_loop.time() + 0.01, self.stop)
+            self.wait()
+        # First attempt got a 503, the retry succeeded:
+        self.assertEqual(2, len(self.received))
+        self.assertEqual(self.received[0], self.received[1])
+        self.assertEqual(0, self.runtime.delivery_outbox.stats()['retrying'])
+
+    def testSubscriberQueueWindow(self):
+        url = self.get_url('/delivery')
+        self.runtime.lti_subscriptions.add('studentAction', url)
+        for i in range(10):
+            self.runtime.to_lti_transmitter(BusMessage(content='Hello%s' % i, topicName='studentAction'))
+        # Only the queue's window of deliveries goes to the engine;
+        # the rest waits in the subscriber's own queue:
+        window = self.runtime.queue_options['window']
+        self.assertEqual(window, self.runtime.delivery_engine.in_flight)
+        self.assertEqual(10 - window, self.runtime.subscriber_stats()[url]['depth'])
+        while len(self.received) < 10:
+            self.io_loop.add_timeout(self.io_loop.time() + 0.01, self.stop)
+            self.wait()
+        self.assertEqual(0, self.runtime.subscriber_stats()[url]['depth'])
+
+    def testSubscribeWithBatchOptions(self):
+        msg = dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT,
+                   payload={'delivery_url' : BridgeRuntimeTester.DELIVERY_URL,
+                            'batch' : {'max_messages' : 20}})
+        response = self.post_to_bridge(msg)
+        self.assertEqual(200, response.code)
+        expected = {BridgeRuntimeTester.DELIVERY_URL : {'batch' : {'max_messages' : 20,
+                                                                   'linger_ms' : LTISchoolbusBridge.LTI_BRIDGE_BATCH_LINGER_MS}}}
+        self.runtime.delivery_options_persister.flush()
+        with open(self.runtime.delivery_options_path, 'r') as fd:
+            self.assertEqual(expected, json.load(fd))
+        # Options go away with the URL's last subscription:
+        self.post_to_bridge(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, action='unsubscribe'))
+        self.assertEqual({}, dict(self.runtime.delivery_options))
+
+    def testBadBatchOptionsRejected(self):
+        msg = dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT,
+                   payload={'delivery_url' : BridgeRuntimeTester.DELIVERY_URL,
+                            'batch' : {'max_messages' : 0}})
+        response = self.post_to_bridge(msg)
+        self.assertEqual(400, response.code)
+        self.assertFalse(self.bus.subscribedTo('studentAction'))
+
+    def testBatchedDelivery(self):
+        url = self.get_url('/delivery')
+        self.runtime.lti_subscriptions.add('studentAction', url)
+        self.runtime.set_batch_options(url, {'max_messages' : 5, 'linger_ms' : 20})
+        for i in range(7):
+            self.runtime.to_lti_transmitter(BusMessage(content='Hello%s' % i, topicName='studentAction'))
+        # One full batch right away; the remaining two linger:
+        self.assertEqual(1, self.runtime.delivery_engine.in_flight)
+        while self.runtime.delivered_to_lti_counter < 7:
+            self.io_loop.add_timeout(self.io_loop.time() + 0.01, self.stop)
+            self.wait()
+        batches = [json.loads(body) for body in self.received]
+        self.assertEqual([5, 2], [len(batch) for batch in batches])
+        self.assertEqual('Hello6', batches[1][1]['payload'])
+
+    def testEnvelopeSharedAcrossSubscribers(self):
+        self.runtime.lti_subscriptions.add('studentAction', 'https://lms1.example.edu/delivery')
+        self.runtime.lti_subscriptions.add('studentAction', 'https://lms2.example.edu/delivery')
+        posted = []
+        self.runtime.delivery_engine.deliver = lambda url, body, **kwargs: posted.append(body)
+        content = '{"answer" : "He said \\"no\\"\\n"}'
+        self.runtime.to_lti_transmitter(BusMessage(content=content, topicName='studentAction'))
+        self.assertEqual(2, len(posted))
+        # One serialization, shared by both subscribers:
+        self.assertIs(posted[0], posted[1])
+        self.assertIsInstance(posted[0], str)
+        # The content is escaped, not spliced in raw:
+        self.assertEqual(content, json.loads(posted[0])['payload'])
+
+    def testMetricsEndpoint(self):
+        self.runtime.lti_subscriptions.add('studentAction', self.get_url('/delivery'))
+        self.runtime.update_bus_subscriptions()
+        self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT)
+        self.post_to_bridge(dict(BridgeRuntimeTester.TEST_MSG_DICT, ltiSecret='wrong'))
+        self.post_to_bridge(dict(BridgeRuntimeTester.TEST_MSG_DICT, action='no such action'))
+        self.bus.deliver(BusMessage(content='Hello', topicName='studentAction'))
+        while self.runtime.delivered_to_lti_counter == 0:
+            self.io_loop.add_timeout(self.io_loop.time() + 0.01, self.stop)
+            self.wait()
+        response = self.fetch('/metrics')
+        self.assertEqual(200, response.code)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.body.split('\n')
+        self.assertIn('ltibridge_requests_total{action="publish",status="200"} 1', lines)
+        self.assertIn('ltibridge_requests_total{action="publish",status="401"} 1', lines)
+        # Unknown actions do not become labels:
+        self.assertIn('ltibridge_requests_total{action="other",status="501"} 1', lines)
+        self.assertIn('ltibridge_publish_seconds_count{mode="single"} 1', lines)
+        self.assertIn('ltibridge_bus_callback_lag_seconds_count 1', lines)
+        self.assertIn('ltibridge_delivery_seconds_count{url="%s",outcome="success"} 1' % self.get_url('/delivery'), lines)
+        self.assertIn('ltibridge_queue_depth{url="%s"} 0' % self.get_url('/delivery'), lines)
+        self.assertIn('ltibridge_delivered_messages_total 1', lines)
+        self.assertIn('ltibridge_log_records_dropped_total{reason="rate_limited"} 0', lines)
+
+    def testSlowRequestLogged(self):
+        slow_records = []
+        self.runtime.trace_log.threshold = 0
+        # Stands in for the process-wide 'ltibridge.slow' logger,
+        # which other test modules use, too:
+        class SlowLogger(object):
+            def warning(self, msg, kind, record):
+                slow_records.append(json.loads(record, object_pairs_hook=OrderedDict))
+        self.runtime.trace_log.logger = SlowLogger()
+        self.post_to_bridge(BridgeRuntimeTester.TEST_MSG_DICT)
+        self.assertEqual(1, len(slow_records))
+        self.assertEqual(['parse', 'auth', 'payload', 'publish', 'respond'], slow_records[0]['phases'].keys())
+        self.assertEqual('publish', slow_records[0]['action'])
+        self.assertEqual(200, slow_records[0]['status'])
+        # The phases of the bus message path are traced, too:
+        self.runtime.lti_subscriptions.add('studentAction', self.get_url('/delivery'))
+        self.runtime.to_lti_transmitter(BusMessage(content='Hello', topicName='studentAction'))
+        self.assertEqual(['lookup', 'credentials', 'envelope', 'outbox', 'enqueue'], slow_records[1]['phases'].keys())
+        self.assertEqual('studentAction', slow_records[1]['topic'])
+
+    def start_follower(self, leader_url):
+        '''
+        Serve a bridge whose runtime forwards subscription
+        requests to leader_url, as in a worker other than the leader.
+        
+        :return: the follower's runtime and bus, and a function
+            that POSTs a message dict to the follower
+        :rtype: (BridgeRuntime, StubBusAdapter, callable)
+        '''
+        follower_bus = StubBusAdapter()
+        follower = BridgeRuntime(bus_adapter=follower_bus, leader_url=leader_url)
+        (sock, port) = bind_unused_port()
+        server = HTTPServer(LTISchoolbusBridge.makeApp({'runtime' : follower}))
+        server.add_sockets([sock])
+        self.followers.append((server, follower))
+        def post_to_follower(msg_dict):
+            self.http_client.fetch('http://127.0.0.1:%s/schoolbus' % port, self.stop,
+                                   method='POST', body=json.dumps(msg_dict))
+            return self.wait()
+        return (follower, follower_bus, post_to_follower)
+
+    def testLeaderPortOnlyTakesSubscriptions(self):
+        (sock, port) = bind_unused_port()
+        server = HTTPServer(LTISchoolbusBridge.makeLeaderApp(self.runtime))
+        server.add_sockets([sock])
+        try:
+            leader_url = 'http://127.0.0.1:%s/schoolbus' % port
+            (_follower, _follower_bus, post_to_follower) = self.start_follower(leader_url)
+            self.assertEqual(200, post_to_follower(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT).code)
+            self.assertEqual([BridgeRuntimeTester.DELIVERY_URL], list(self.runtime.lti_subscriptions.urls_matching('studentAction')))
+            # Other local processes cannot publish through the port, past the rate limits:
+            def fetch_leader(path, **kwargs):
+                self.http_client.fetch('http://127.0.0.1:%s%s' % (port, path), self.stop, **kwargs)
+                return self.wait()
+            self.assertEqual(403, fetch_leader('/schoolbus', method='POST', body=json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)).code)
+            self.assertEqual(403, fetch_leader('/schoolbus', method='POST', headers={'Content-Type' : 'application/x-ndjson'},
+                                               body=json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)).code)
+            self.assertEqual(404, fetch_leader('/schoolbus/stream', method='POST', body=json.dumps(BridgeRuntimeTester.TEST_MSG_DICT)).code)
+            self.assertEqual(404, fetch_leader('/metrics').code)
+            self.assertEqual(0, len(self.bus.published))
+        finally:
+            server.stop()
+
+    def testFollowerForwardsSubscriptions(self):
+        (follower, follower_bus, post_to_follower) = self.start_follower(self.get_url('/schoolbus'))
+        response = post_to_follower(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT)
+        self.assertEqual(200, response.code)
+        # Only the leader keeps the subscription, and listens on the bus:
+        self.assertEqual([BridgeRuntimeTester.DELIVERY_URL], list(self.runtime.lti_subscriptions.urls_matching('studentAction')))
+        self.assertTrue(self.bus.subscribedTo('studentAction'))
+        self.assertEqual([], follower_bus.mySubscriptions())
+        self.assertFalse(hasattr(follower, 'lti_subscriptions'))
+        self.assertIn('ltibridge_requests_total{action="subscribe",status="200"} 1', follower.metrics.render())
+        # The leader's rejections are relayed:
+        response = post_to_follower(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, ltiSecret='wrong'))
+        self.assertEqual(401, response.code)
+        # Publishing needs no leader:
+        response = post_to_follower(BridgeRuntimeTester.TEST_MSG_DICT)
+        self.assertEqual(200, response.code)
+        self.assertEqual(1, len(follower_bus.published))
+        self.assertEqual([], self.bus.published)
+        response = post_to_follower(dict(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT, action='unsubscribe'))
+        self.assertEqual(200, response.code)
+        self.assertFalse(self.bus.subscribedTo('studentAction'))
+
+    def testFollowerWithoutLeader(self):
+        (sock, port) = bind_unused_port()
+        sock.close()
+        (_follower, _follower_bus, post_to_follower) = self.start_follower('http://127.0.0.1:%s/schoolbus' % port)
+        response = post_to_follower(BridgeRuntimeTester.TEST_SUBSCRIBE_DICT)
+        self.assertEqual(503, response.code)
+
+    def start_shards(self, num_shards):
+        '''
+        Create the runtimes of delivery shards that share their
+        subscriptions, as in the worker processes of a bridge
+        started with --workers. Shard 0 is the leader.
+        
+        :return: the shards' runtimes, in order of shard number
+        :rtype: [BridgeRuntime]
+        '''
+        subscriptions_path = os.path.join(self.work_dir, 'shards', 'lti_bus_subscriptions.json')
+        os.makedirs(os.path.dirname(subscriptions_path))
+        for shard_id in range(num_shards):
+            leader_url = None if shard_id == 0 else 'http://127.0.0.1:1/schoolbus'
+            self.shards.append(BridgeRuntime(bus_adapter=StubBusAdapter(),
+                                             subscriptions_path=subscriptions_path,
+                                             leader_url=leader_url,
+                                             shard_id=shard_id,
+                                             num_shards=num_shards))
+        return self.shards
+
+    def testShardedDelivery(self):
+        (leader, follower) = self.start_shards(2)
+        urls = ['https://lms%s.example.edu/delivery' % i for i in range(20)]
+        leader.lti_subscribe_many([('studentAction', url) for url in urls])
+        # The follower picks up the leader's subscriptions from the journal:
+        self.assertTrue(follower.subscription_follower.poll())
+        self.assertEqual(sorted(urls), sorted(follower.lti_subscriptions.urls_matching('studentAction')))
+        posted = []
+        for shard in (leader, follower):
+            shard.delivery_engine.deliver = lambda url, body, shard=shard, **kwargs: posted.append((shard.shard_id, url))
+            self.assertTrue(shard.busAdapter.subscribedTo('studentAction'))
+            shard.to_lti_transmitter(BusMessage(content='Hello', topicName='studentAction'))
+        # Every URL received the message once, from the shard that owns it:
+        self.assertEqual(sorted(urls), sorted([url for (_shard_id, url) in posted]))
+        self.assertEqual(set([0, 1]), set([shard_id for (shard_id, _url) in posted]))
+        for (shard_id, url) in posted:
+            self.assertEqual(shard_id, leader.shard_ring.shard_for(url))
+        stats = [shard.shard_stats() for shard in (leader, follower)]
+        self.assertEqual(len(urls), sum([shard_stats['subscribers'] for shard_stats in stats]))
+        metrics = follower.metrics.render().split('\n')
+        self.assertIn('ltibridge_shard_subscribers{worker="1",shard="1"} %s' % stats[1]['subscribers'], metrics)
+        # Every series is labeled with the worker that reports it:
+        self.assertEqual([], [line for line in metrics if line and not line.startswith('#') and '{worker="1"' not in line])
+
+    def testShardListensOnlyForOwnSubscribers(self):
+        (leader, follower) = self.start_shards(2)
+        leader_url = [url for url in ['https://lms%s.example.edu/delivery' % i for i in range(20)] if leader.owns(url)][0]
+        leader.lti_subscribe_many([('courseEvents', leader_url)])
+        follower.subscription_follower.poll()
+        self.assertTrue(leader.busAdapter.subscribedTo('courseEvents'))
+        self.assertFalse(follower.busAdapter.subscribedTo('courseEvents'))
+        # Delivery options reach the other shards, too:
+        leader.set_batch_options(leader_url, {'max_messages' : 5, 'linger_ms' : 20})
+        leader.delivery_options_persister.flush()
+        self.assertTrue(follower.delivery_options_follower.poll())
+        self.assertEqual(leader.delivery_options, follower.delivery_options)
+        leader.lti_unsubscribe_many([('courseEvents', leader_url)])
+        follower.subscription_follower.poll()
+        self.assertFalse(leader.busAdapter.subscribedTo('courseEvents'))
+        self.assertEqual(0, len(follower.lti_subscriptions))
+
+
+if __name__ == "__main__":
+    unittest.main()
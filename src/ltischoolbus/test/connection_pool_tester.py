@@ -0,0 +1,173 @@
+'''
+Tests for the keep-alive connection pool used
+for deliveries to LTI consumers.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import os
+import unittest
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.httpclient import HTTPRequest
+from tornado.testing import AsyncHTTPTestCase, AsyncHTTPSTestCase, gen_test
+import tornado.web
+
+from ltischoolbus.connection_pool import ConnectionPool, PooledHTTPClient
+
+
+class EchoReceiver(tornado.web.RequestHandler):
+
+    def post(self):
+        self.write('received: ' + self.request.body)
+
+
+class ChunkedReceiver(tornado.web.RequestHandler):
+
+    def post(self):
+        # Flushing before finish() makes Tornado use chunked encoding:
+        self.write('part1')
+        self.flush()
+        self.write('part2')
+
+
+class ClosingReceiver(tornado.web.RequestHandler):
+
+    def post(self):
+        self.set_header('Connection', 'close')
+        self.write('bye')
+
+
+def make_app():
+    return tornado.web.Application([(r"/echo", EchoReceiver),
+                                    (r"/chunked", ChunkedReceiver),
+                                    (r"/close", ClosingReceiver)])
+
+
+class ConnectionPoolTester(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return make_app()
+
+    def setUp(self):
+        super(ConnectionPoolTester, self).setUp()
+        self.pool = ConnectionPool(max_size=2, idle_timeout=30, io_loop=self.io_loop)
+        self.client = PooledHTTPClient(self.pool)
+
+    def tearDown(self):
+        self.client.close()
+        super(ConnectionPoolTester, self).tearDown()
+
+    def post(self, path, body='hello'):
+        return self.client.fetch(HTTPRequest(self.get_url(path), method='POST', body=body))
+
+    @gen_test
+    def testConnectionReused(self):
+        for i in range(3):
+            response = yield self.post('/echo', body='msg%s' % i)
+            self.assertEqual(200, response.code)
+            self.assertEqual('received: msg%s' % i, response.body)
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['opened'])
+        self.assertEqual(1, stats['idle'])
+
+    @gen_test
+    def testChunkedResponseKeepsConnection(self):
+        response = yield self.post('/chunked')
+        self.assertEqual('part1part2', response.body)
+        response = yield self.post('/echo')
+        self.assertEqual(200, response.code)
+        self.assertEqual(1, self.pool.stats()['hits'])
+
+    @gen_test
+    def testConnectionCloseHonored(self):
+        response = yield self.post('/close')
+        self.assertEqual('bye', response.body)
+        self.assertEqual(0, self.pool.stats()['idle'])
+        yield self.post('/echo')
+        self.assertEqual(2, self.pool.stats()['misses'])
+
+    @gen_test
+    def testServerClosedIdleConnection(self):
+        yield self.post('/echo')
+        # Server drops its end of the idle connection:
+        yield self.http_server.close_all_connections()
+        response = yield self.post('/echo')
+        self.assertEqual(200, response.code)
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(2, stats['opened'])
+
+    @gen_test
+    def testMaxSizeAndIdleTimeout(self):
+        # Four concurrent requests need four connections,
+        # but only max_size of them are kept:
+        yield [self.post('/echo') for _ in range(4)]
+        stats = self.pool.stats()
+        self.assertEqual(4, stats['opened'])
+        self.assertEqual(2, stats['idle'])
+        self.assertEqual(2, stats['evictions'])
+
+        self.pool.idle_timeout = 0
+        yield gen.sleep(0.01)
+        self.pool.evict_idle()
+        self.assertEqual(0, self.pool.stats()['idle'])
+        self.assertEqual(4, self.pool.stats()['evictions'])
+
+    @gen_test
+    def testLateConnectClosed(self):
+        class SlowTcpClient(object):
+            def connect(self, host, port, ssl_options=None):
+                self.future = Future()
+                return self.future
+        class Stream(object):
+            closed = False
+            def close(self):
+                self.closed = True
+        self.pool.connect_timeout = 0.01
+        self.pool.tcp_client = SlowTcpClient()
+        with self.assertRaises(gen.TimeoutError):
+            yield self.pool.acquire(('http', 'lms1', 80))
+        # The connect completes after all:
+        stream = Stream()
+        self.pool.tcp_client.future.set_result(stream)
+        yield gen.moment
+        self.assertTrue(stream.closed)
+
+    @gen_test
+    def testConnectFailure(self):
+        response = yield self.client.fetch(HTTPRequest('http://127.0.0.1:1/nobody', method='POST', body='x'))
+        self.assertEqual(599, response.code)
+        self.assertIsNotNone(response.error)
+
+
+class HttpsConnectionPoolTester(AsyncHTTPSTestCase):
+
+    def get_app(self):
+        return make_app()
+
+    def get_ssl_options(self):
+        # Self-signed certificate for localhost:
+        test_dir = os.path.dirname(__file__)
+        return {'certfile' : os.path.join(test_dir, 'test_ssl.crt'),
+                'keyfile' : os.path.join(test_dir, 'test_ssl.key')}
+
+    @gen_test
+    def testTlsConnectionReused(self):
+        # The test server's certificate is self-signed:
+        pool = ConnectionPool(validate_cert=False, io_loop=self.io_loop)
+        client = PooledHTTPClient(pool)
+        for _ in range(3):
+            response = yield client.fetch(HTTPRequest(self.get_url('/echo'), method='POST', body='secure'))
+            self.assertEqual('received: secure', response.body)
+        self.assertEqual(1, pool.stats()['opened'])
+        self.assertEqual(2, pool.stats()['hits'])
+        client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
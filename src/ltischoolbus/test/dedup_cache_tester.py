@@ -0,0 +1,83 @@
+'''
+Tests for the deduplication of publish requests.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus.dedup_cache import DedupCache, DedupTopics, dedup_key
+
+
+class DedupCacheTester(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.clock = lambda: self.now[0]
+
+    def testDuplicateWithinTtl(self):
+        cache = DedupCache(ttl=60, clock=self.clock)
+        key = dedup_key('ltiKey', 'studentAction', 'event-1')
+        self.assertTrue(cache.add(key))
+        self.now[0] += 59
+        self.assertFalse(cache.add(key))
+        # A hit does not extend the key's lifetime:
+        self.now[0] += 1
+        self.assertTrue(cache.add(key))
+        self.assertEqual({'entries' : 1, 'hits' : 1, 'misses' : 2, 'hit_rate' : 1 / 3.0,
+                          'expired' : 1, 'evicted' : 0},
+                         cache.stats())
+
+    def testExpiredKeysRemoved(self):
+        cache = DedupCache(ttl=60, clock=self.clock)
+        for event_id in range(10):
+            cache.add(dedup_key('ltiKey', 'studentAction', str(event_id)))
+        self.now[0] += 61
+        cache.add(dedup_key('ltiKey', 'studentAction', 'new'))
+        self.assertEqual(1, len(cache))
+        self.assertEqual(10, cache.stats()['expired'])
+
+    def testCapacity(self):
+        cache = DedupCache(ttl=60, max_entries=3, clock=self.clock)
+        keys = [dedup_key(str(event_id)) for event_id in range(4)]
+        for key in keys[:3]:
+            cache.add(key)
+        # Key 0 was seen again, so key 1 is the least recently seen:
+        self.assertFalse(cache.add(keys[0]))
+        self.assertTrue(cache.add(keys[3]))
+        self.assertEqual(3, len(cache))
+        self.assertEqual(1, cache.evicted_counter)
+        self.assertFalse(cache.add(keys[0]))
+        self.assertTrue(cache.add(keys[1]))
+        self.assertRaises(ValueError, DedupCache, ttl=0)
+        self.assertRaises(ValueError, DedupCache, max_entries=0)
+
+    def testDiscard(self):
+        cache = DedupCache(clock=self.clock)
+        key = dedup_key('ltiKey', 'studentAction', u'\xe9v\xe9nement')
+        cache.add(key)
+        cache.discard(key)
+        self.assertTrue(cache.add(key))
+        cache.discard(dedup_key('never added'))
+
+    def testKeys(self):
+        self.assertEqual(20, len(dedup_key('ltiKey', 'studentAction', 'x' * 10000)))
+        self.assertEqual(dedup_key(u'a', 'b'), dedup_key('a', u'b'))
+        self.assertNotEqual(dedup_key('ab', 'c'), dedup_key('a', 'bc'))
+
+    def testDedupTopics(self):
+        topics = DedupTopics({'studentAction' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'dedup_by_payload' : True},
+                              'courseEvents.#' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'dedup_by_payload' : True},
+                              'studentReprimand' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'dedup_by_payload' : False},
+                              'badEntry' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'dedup_by_payload' : 'yes'}})
+        self.assertTrue(topics.by_payload('studentAction'))
+        self.assertTrue(topics.by_payload('courseEvents.Hist101'))
+        self.assertFalse(topics.by_payload('studentReprimand'))
+        self.assertFalse(topics.by_payload('badEntry'))
+        self.assertEqual(['badEntry'], [topic for (topic, _error) in topics.bad_entries])
+        self.assertFalse(DedupTopics({}).by_payload('studentAction'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+'''
+Tests for the concurrent delivery engine. Deliveries go to
+a receiver application that runs in the test's own IOLoop.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, gen_test
+import tornado.web
+
+from ltischoolbus.delivery_engine import DeliveryEngine
+
+
+class HoldingReceiver(tornado.web.RequestHandler):
+    '''
+    Delivery endpoint that does not answer until the
+    test releases it, so that tests can observe how
+    many deliveries are outstanding at once.
+    '''
+
+    def initialize(self, received, held):
+        self.received = received
+        self.held = held
+
+    @tornado.web.asynchronous
+    def post(self):
+        self.received.append(self.request.body)
+        self.held.append(self)
+
+
+class FailingReceiver(tornado.web.RequestHandler):
+
+    def post(self):
+        self.set_status(500)
+
+
+class DeliveryEngineTester(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.received = []
+        self.held = []
+        return tornado.web.Application([(r"/hold/.*", HoldingReceiver, {'received' : self.received,
+                                                                        'held' : self.held}),
+                                        (r"/fail", FailingReceiver)])
+
+    def release_all(self):
+        while self.held:
+            self.held.pop(0).finish()
+
+    @gen.coroutine
+    def wait_for(self, condition):
+        for _ in range(200):
+            if condition():
+                return
+            yield gen.sleep(0.01)
+        self.fail('Condition never became true.')
+
+    @gen_test
+    def testPerHostLimit(self):
+        engine = DeliveryEngine(max_in_flight=10, max_per_host=2)
+        succeeded = []
+        urls = [self.get_url('/hold/%s' % i) for i in range(5)]
+        engine.deliver_to_all(urls, '{"payload" : "hi"}', on_success=lambda url, resp: succeeded.append(url))
+        # All five URLs share one host, so only two go out:
+        self.assertEqual(2, engine.in_flight)
+        self.assertEqual(3, engine.num_pending)
+        yield self.wait_for(lambda: len(self.held) == 2)
+        while len(succeeded) < 5:
+            self.release_all()
+            yield gen.sleep(0.01)
+            self.assertTrue(engine.in_flight <= 2)
+        self.assertEqual(sorted(urls), sorted(succeeded))
+        self.assertEqual(['{"payload" : "hi"}'] * 5, self.received)
+        engine.close()
+
+    @gen_test
+    def testGlobalLimit(self):
+        engine = DeliveryEngine(max_in_flight=3, max_per_host=10)
+        engine.deliver_to_all([self.get_url('/hold/%s' % i) for i in range(7)], 'x')
+        self.assertEqual(3, engine.in_flight)
+        self.assertEqual(4, engine.num_pending)
+        yield self.wait_for(lambda: len(self.held) == 3)
+        self.release_all()
+        yield self.wait_for(lambda: len(self.held) == 3)
+        self.assertEqual(1, engine.num_pending)
+        engine.close()
+
+    @gen_test
+    def testFailureCallback(self):
+        engine = DeliveryEngine()
+        failures = []
+        engine.deliver(self.get_url('/fail'), 'x', on_failure=lambda url, resp: failures.append(resp.code))
+        # Nothing listens on port 1:
+        engine.deliver('http://127.0.0.1:1/nobody', 'x', on_failure=lambda url, resp: failures.append(resp.code))
+        yield self.wait_for(lambda: len(failures) == 2)
+        self.assertEqual([500, 599], sorted(failures))
+        self.assertEqual(0, engine.in_flight)
+        engine.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
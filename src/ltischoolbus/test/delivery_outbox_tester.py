@@ -0,0 +1,118 @@
+'''
+Tests for the durable delivery outbox.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from tornado.testing import AsyncTestCase
+
+from ltischoolbus.delivery_outbox import DeliveryOutbox
+
+
+class DeliveryOutboxTester(AsyncTestCase):
+
+    def setUp(self):
+        super(DeliveryOutboxTester, self).setUp()
+        self.work_dir = tempfile.mkdtemp(prefix='ltibridge_test')
+        self.db_path = os.path.join(self.work_dir, 'outbox.sqlite')
+        self.redelivered = []
+        self.outbox = self.open_outbox()
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        super(DeliveryOutboxTester, self).tearDown()
+
+    def open_outbox(self, **kwargs):
+        return DeliveryOutbox(self.db_path,
+                              lambda *entry: self.redelivered.append(entry),
+                              io_loop=self.io_loop,
+                              **kwargs)
+
+    def rows_on_disk(self):
+        db = sqlite3.connect(self.db_path)
+        try:
+            return db.execute('SELECT id, url, attempts FROM outbox ORDER BY id').fetchall()
+        finally:
+            db.close()
+
+    def testGroupCommit(self):
+        first = self.outbox.add('https://lms1/delivery', 'studentAction', '{"a" : 1}')
+        second = self.outbox.add('https://lms2/delivery', 'studentAction', '{"a" : 1}')
+        self.assertEqual(second, first + 1)
+        # Not yet committed:
+        self.assertEqual([], self.rows_on_disk())
+        self.outbox.flush()
+        self.assertEqual([(first, 'https://lms1/delivery', 0),
+                          (second, 'https://lms2/delivery', 0)],
+                         self.rows_on_disk())
+
+    def testCommitTimer(self):
+        self.outbox.add('https://lms1/delivery', 'studentAction', 'x')
+        self.io_loop.call_later(self.outbox.commit_interval * 2, self.stop)
+        self.wait()
+        self.assertEqual(1, len(self.rows_on_disk()))
+
+    def testAckBeforeCommitNeverWritten(self):
+        entry_id = self.outbox.add('https://lms1/delivery', 'studentAction', 'x')
+        self.outbox.ack(entry_id)
+        self.outbox.flush()
+        self.assertEqual([], self.rows_on_disk())
+
+    def testAckAfterCommitDeletes(self):
+        entry_id = self.outbox.add('https://lms1/delivery', 'studentAction', 'x')
+        self.outbox.flush()
+        self.outbox.ack(entry_id)
+        self.outbox.flush()
+        self.assertEqual([], self.rows_on_disk())
+
+    def testRetryWithBackoff(self):
+        self.outbox.base_retry_delay = 0.01
+        entry_id = self.outbox.add('https://lms1/delivery', 'studentAction', 'x')
+        delay = self.outbox.retry_later(entry_id, 'https://lms1/delivery', 'studentAction', 'x')
+        self.assertTrue(0.005 <= delay <= 0.01)
+        self.outbox.flush()
+        self.assertEqual([(entry_id, 'https://lms1/delivery', 1)], self.rows_on_disk())
+        self.io_loop.call_later(0.05, self.stop)
+        self.wait()
+        self.assertEqual([(entry_id, 'https://lms1/delivery', 'studentAction', 'x')], self.redelivered)
+
+    def testBackoffGrowsAndIsCapped(self):
+        self.outbox.base_retry_delay = 1
+        self.outbox.max_retry_delay = 10
+        self.assertTrue(0.5 <= self.outbox.retry_delay(1) <= 1)
+        self.assertTrue(4 <= self.outbox.retry_delay(4) <= 8)
+        self.assertTrue(5 <= self.outbox.retry_delay(30) <= 10)
+
+    def testAbandonAfterMaxAttempts(self):
+        self.outbox.max_attempts = 2
+        entry_id = self.outbox.add('https://lms1/delivery', 'studentAction', 'x')
+        self.assertIsNotNone(self.outbox.retry_later(entry_id, 'https://lms1/delivery', 'studentAction', 'x'))
+        self.assertIsNone(self.outbox.retry_later(entry_id, 'https://lms1/delivery', 'studentAction', 'x'))
+        self.outbox.flush()
+        self.assertEqual([], self.rows_on_disk())
+        self.assertEqual(1, self.outbox.stats()['abandoned'])
+
+    def testRecoverAfterRestart(self):
+        self.outbox.add('https://lms1/delivery', 'studentAction', '{"payload" : "survivor"}')
+        self.outbox.close()
+
+        self.outbox = self.open_outbox()
+        self.assertEqual(1, self.outbox.recover())
+        self.io_loop.add_callback(self.stop)
+        self.wait()
+        self.assertEqual([(1, 'https://lms1/delivery', 'studentAction', '{"payload" : "survivor"}')],
+                         self.redelivered)
+        # New entries do not reuse the surviving entry's id:
+        self.assertEqual(2, self.outbox.add('https://lms1/delivery', 'studentAction', 'x'))
+
+
+if __name__ == "__main__":
+    unittest.main()
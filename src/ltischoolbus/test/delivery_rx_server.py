@@ -26,6 +26,8 @@ from tornado import web
 import tornado
 from tornado.gen import coroutine
 
+from ltischoolbus import json_codec
+
 
 class LtiBridgeDeliveryReceiver(tornado.web.RequestHandler):
     '''
@@ -80,14 +82,15 @@ class LtiBridgeDeliveryReceiver(tornado.web.RequestHandler):
         
         postBodyForm = self.request.body
         try:
-            # Turn POST body JSON into a dict:
-            postBodyDict = json.loads(str(postBodyForm))
+            # Check the POST body JSON, parsing it
+            # once, straight from the body bytes:
+            postBodyDict = json_codec.loads(postBodyForm) #@UnusedVariable
         except ValueError:
             print('POST called with improper JSON: %s' % str(postBodyForm))            
             return
 
         #print(str(postBodyDict))
-        MsgManager.get_instance().handle_delivered_msg(str(postBodyDict))
+        MsgManager.get_instance().handle_delivered_msg(postBodyForm)
           
 class MsgManager(object):
     '''
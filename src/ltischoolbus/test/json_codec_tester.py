@@ -0,0 +1,62 @@
+'''
+Tests for the JSON codec shared by the bridge and its demos.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus import json_codec
+
+
+class JsonCodecTester(unittest.TestCase):
+
+    BODY = '{"ltiKey" : "ltiKey", "payload" : "{\\"answer\\" : \\"caf\\u00e9\\"}", "events" : [1, 2.5, null, true]}'
+
+    def tearDown(self):
+        json_codec.use()
+
+    def testImplementationsAgree(self):
+        # Whichever implementation is installed behaves the same:
+        for name in json_codec.available():
+            json_codec.use(name)
+            body = json_codec.loads(JsonCodecTester.BODY)
+            self.assertEqual([1, 2.5, None, True], body['events'])
+            self.assertEqual({'answer' : u'caf\xe9'}, json_codec.parse_nested(body['payload']))
+            encoded = json_codec.dumps({'url' : 'https://lms.example.edu/delivery', 'answer' : u'caf\xe9'})
+            self.assertEqual(str, type(encoded))
+            self.assertNotIn(' ', encoded)
+            self.assertIn('https://lms.example.edu/delivery', encoded)
+            self.assertIn('caf\\u00e9', encoded)
+            self.assertEqual({'url' : 'https://lms.example.edu/delivery', 'answer' : u'caf\xe9'},
+                             json_codec.loads(encoded))
+
+    def testStdlibFallback(self):
+        self.assertEqual('json', json_codec.available()[-1])
+        self.assertEqual(json_codec.available()[0], json_codec.IMPLEMENTATION)
+        self.assertRaises(ValueError, json_codec.use, 'no_such_json')
+
+    def testLoadsFromBytes(self):
+        self.assertEqual({'a' : 1}, json_codec.loads(bytearray('{"a" : 1}')))
+        self.assertEqual({'a' : 1}, json_codec.loads(u'{"a" : 1}'))
+        self.assertRaises(ValueError, json_codec.loads, '{"not json')
+        self.assertRaises(ValueError, json_codec.loads, '')
+
+    def testParseNested(self):
+        payload = {'delivery_url' : 'https://lms.example.edu/delivery'}
+        # Already parsed with the outer document:
+        self.assertIs(payload, json_codec.parse_nested(payload))
+        self.assertEqual([1, 2], json_codec.parse_nested([1, 2]))
+        self.assertEqual(payload, json_codec.parse_nested('{"delivery_url" : "https://lms.example.edu/delivery"}'))
+        self.assertEqual('plain', json_codec.parse_nested('"plain"'))
+        self.assertRaises(ValueError, json_codec.parse_nested, 'Hello from the SchoolBus.')
+        self.assertRaises(ValueError, json_codec.parse_nested, 42)
+
+    def testCanonicalDumps(self):
+        self.assertEqual('{"a":[1,{"b":2,"c":3}],"d":"\\u00e9"}',
+                         json_codec.canonical_dumps(json_codec.loads('{"d" : "\\u00e9", "a" : [1, {"c" : 3, "b" : 2}]}')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+'''
+Tests for the queued, rate-limited logging of the bridge.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import logging
+import threading
+import unittest
+
+from ltischoolbus.log_pipeline import QueueingHandler, RateLimitFilter
+
+
+class CollectingHandler(logging.Handler):
+    '''
+    Keeps formatted records, with the name of the
+    thread that formatted them.
+    '''
+
+    def __init__(self, gate=None):
+        logging.Handler.__init__(self)
+        self.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.gate = gate
+        self.lines = []
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        self.lines.append((self.format(record), threading.current_thread().name))
+
+
+class ThreadNamer(object):
+    '''
+    Formats as the name of the thread that formats it.
+    '''
+
+    def __str__(self):
+        return threading.current_thread().name
+
+
+class LogPipelineTester(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('ltibridge.test.%s' % self.id())
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = None
+
+    def tearDown(self):
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+
+    def add_handler(self, target, **kwargs):
+        self.handler = QueueingHandler(target, **kwargs)
+        self.logger.addHandler(self.handler)
+        return self.handler
+
+    def testWrittenByWriterThread(self):
+        target = CollectingHandler()
+        handler = self.add_handler(target)
+        self.logger.error('Bad request: %s', ThreadNamer())
+        handler.flush()
+        # Formatted lazily, in the writer thread:
+        self.assertEqual([('ERROR Bad request: LogWriter', 'LogWriter')], target.lines)
+        self.assertEqual(1, handler.stats()['enqueued'])
+
+    def testDisabledLevelNotFormatted(self):
+        formatted = []
+        class Spy(object):
+            def __str__(self):
+                formatted.append(True)
+                return 'spy'
+        handler = self.add_handler(CollectingHandler())
+        self.logger.debug('Payload: %s', Spy())
+        handler.flush()
+        self.assertEqual([], formatted)
+
+    def testFullQueueDrops(self):
+        gate = threading.Event()
+        target = CollectingHandler(gate)
+        handler = self.add_handler(target, max_queued=2)
+        # The first record blocks the writer; two more fill the queue:
+        for i in range(10):
+            self.logger.info('Record %s', i)
+        num_dropped = handler.stats()['dropped']
+        self.assertTrue(num_dropped >= 7)
+        gate.set()
+        handler.flush()
+        lines = [line for (line, _thread) in target.lines]
+        self.assertEqual(['INFO Record %s' % i for i in range(10 - num_dropped)],
+                         [line for line in lines if line.startswith('INFO')])
+        self.assertIn('WARNING Log queue was full; dropped %s records.' % num_dropped, lines)
+
+    def testExceptionRenderedWhenLogged(self):
+        target = CollectingHandler()
+        handler = self.add_handler(target)
+        try:
+            raise ValueError('not json')
+        except ValueError:
+            self.logger.exception('Cannot parse')
+        handler.flush()
+        self.assertIn('ValueError: not json', target.lines[0][0])
+
+    def testRateLimitPerCategory(self):
+        now = [1000.0]
+        rate_filter = RateLimitFilter(rate=2, burst=3, clock=lambda: now[0])
+        target = CollectingHandler()
+        handler = self.add_handler(target)
+        handler.addFilter(rate_filter)
+        for i in range(10):
+            self.logger.error('Bad key in POST: %s', i)
+        # Other messages are not held back by the flood:
+        self.logger.error('Config file changed')
+        handler.flush()
+        self.assertEqual(['ERROR Bad key in POST: 0', 'ERROR Bad key in POST: 1', 'ERROR Bad key in POST: 2',
+                          'ERROR Config file changed'],
+                         [line for (line, _thread) in target.lines])
+        self.assertEqual(7, rate_filter.suppressed_counter)
+        # Half a second later, one more is allowed, and notes the others:
+        now[0] += 0.5
+        self.logger.error('Bad key in POST: %s', 10)
+        self.logger.error('Bad key in POST: %s', 11)
+        handler.flush()
+        self.assertEqual('ERROR Bad key in POST: 10 [7 similar messages suppressed]', target.lines[-1][0])
+        self.assertEqual(8, rate_filter.suppressed_counter)
+
+    def testBadRateRejected(self):
+        self.assertRaises(ValueError, RateLimitFilter, 0)
+        self.assertRaises(ValueError, RateLimitFilter, 1, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+'''
+Tests for the counters and histograms served at /metrics.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus.metrics import MetricsRegistry
+
+
+class MetricsTester(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def testCounter(self):
+        counter = self.registry.counter('requests_total', 'Requests.', ('action', 'status'))
+        counter.inc(('publish', 200))
+        counter.inc(('publish', 200))
+        counter.inc(('subscribe', 401), 3)
+        self.assertEqual(2, counter.value(('publish', 200)))
+        self.assertEqual('# HELP requests_total Requests.\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{action="publish",status="200"} 2\n'
+                         'requests_total{action="subscribe",status="401"} 3\n',
+                         self.registry.render())
+
+    def testHistogramBuckets(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        lines = self.registry.render().splitlines()
+        # Buckets are cumulative, and include their upper bound:
+        self.assertEqual(['latency_seconds_bucket{le="0.1"} 2',
+                          'latency_seconds_bucket{le="1.0"} 3',
+                          'latency_seconds_bucket{le="+Inf"} 4',
+                          'latency_seconds_sum 2.65',
+                          'latency_seconds_count 4'],
+                         lines[2:])
+
+    def testHistogramSeriesPreallocated(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency.', ('url',))
+        series = histogram.series(('https://lms1',))
+        counts = series.counts
+        histogram.observe(0.002, ('https://lms1',))
+        # Same series, same list; observing only increments:
+        self.assertIs(series, histogram.series(('https://lms1',)))
+        self.assertIs(counts, series.counts)
+        self.assertEqual(1, sum(counts))
+        histogram.remove(('https://lms1',))
+        self.assertEqual({}, histogram.series_by_labels)
+
+    def testBadBuckets(self):
+        with self.assertRaises(ValueError):
+            self.registry.histogram('latency_seconds', 'Latency.', buckets=(1, 0.1))
+
+    def testGaugeFunction(self):
+        depths = {('https://lms1',) : 4}
+        self.registry.gauge('queue_depth', 'Depth.', lambda: depths, ('url',))
+        self.assertIn('queue_depth{url="https://lms1"} 4', self.registry.render())
+        depths[('https://lms1',)] = 0
+        self.assertIn('queue_depth{url="https://lms1"} 0', self.registry.render())
+
+    def testLabelValuesEscaped(self):
+        counter = self.registry.counter('odd_total', 'Odd.', ('name',))
+        counter.inc(('say "hi"\\\n',))
+        self.assertIn('odd_total{name="say \\"hi\\"\\\\\\n"} 1', self.registry.render())
+
+    def testConstLabels(self):
+        registry = MetricsRegistry(const_labels=[('worker', 2)])
+        registry.counter('requests_total', 'Requests.', ('action',)).inc(('publish',))
+        registry.gauge('queued', 'Queued.', lambda: 3)
+        registry.histogram('latency_seconds', 'Latency.', buckets=(0.5,)).observe(0.1)
+        text = registry.render()
+        self.assertIn('requests_total{worker="2",action="publish"} 1', text)
+        self.assertIn('queued{worker="2"} 3', text)
+        self.assertIn('latency_seconds_bucket{worker="2",le="0.5"} 1', text)
+        self.assertIn('latency_seconds_count{worker="2"} 1', text)
+
+    def testDuplicateName(self):
+        self.registry.counter('requests_total', 'Requests.')
+        with self.assertRaises(ValueError):
+            self.registry.counter('requests_total', 'Requests.')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+'''
+Measures the cost of validating publish payloads against a topic
+schema, per event, next to the cost of parsing the request that
+carries the event:
+
+   - 'parse': json_codec.loads() of the whole publish request,
+        which the bridge does for every request anyway,
+   - 'interpreted': a validator that walks the schema for every
+        payload, looking up each keyword, as straightforward
+        validators do, and
+   - 'compiled': PayloadSchema, the closures the bridge compiles
+        from the config file.
+
+Payloads are edX-style problem_check events; a fraction of them
+(--badfraction) miss fields or have wrong types, so that the
+error paths are timed as well. The compiled validation should cost
+a small fraction of the parse.
+
+Usage: python -m ltischoolbus.test.payload_schema_benchmark [--events N] [--badfraction F]
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from ltischoolbus import json_codec
+from ltischoolbus.payload_schema import PayloadSchema
+
+
+EVENT_SCHEMA = {'type' : 'object',
+                'required' : ['course_id', 'student_id', 'event_type', 'resource_id'],
+                'properties' : {'course_id' : {'type' : 'string', 'minLength' : 1},
+                                'student_id' : {'type' : 'string', 'minLength' : 1},
+                                'resource_id' : {'type' : 'string'},
+                                'event_type' : {'enum' : ['problem_check', 'seq_next', 'play_video']},
+                                'result' : {'type' : 'boolean'},
+                                'attempt' : {'type' : 'integer', 'minimum' : 1},
+                                'answers' : {'type' : 'array',
+                                             'maxItems' : 20,
+                                             'items' : {'type' : 'string', 'maxLength' : 200}}}}
+
+def make_event(bad):
+    event = {'course_id' : 'HumanitiesSciences/NCP-101/OnGoing',
+             'student_id' : '%032x' % random.getrandbits(128),
+             'resource_id' : 'i4x-HumanitiesSciences-NCP-101-problem-%s' % random.randrange(100),
+             'event_type' : 'problem_check',
+             'result' : random.random() < 0.5,
+             'attempt' : random.randrange(1, 5),
+             'answers' : ['choice_%s' % random.randrange(4) for _ in range(random.randrange(1, 6))]}
+    if bad:
+        del event['student_id']
+        event['attempt'] = 'first'
+    return event
+
+def make_bodies(num_events, bad_fraction):
+    return [json.dumps({'ltiKey' : 'ltiKey',
+                        'ltiSecret' : 'ltiSecret',
+                        'action' : 'publish',
+                        'bus_topic' : 'studentAction',
+                        'payload' : make_event(random.random() < bad_fraction)})
+            for _ in range(num_events)]
+
+TYPES = {'object' : dict, 'array' : list, 'string' : basestring, 'integer' : (int, long),
+         'number' : (int, long, float), 'boolean' : bool}
+
+def interpret(schema, value, path, errors):
+    '''
+    Reference validator that walks the schema for every value.
+    '''
+    if 'type' in schema and not isinstance(value, TYPES[schema['type']]):
+        errors.append({'path' : path, 'error' : 'must be of type %s' % schema['type']})
+        return
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append({'path' : path, 'error' : 'must be one of %s' % schema['enum']})
+    if isinstance(value, dict):
+        for name in schema.get('required', []):
+            if name not in value:
+                errors.append({'path' : '%s.%s' % (path, name), 'error' : 'is required'})
+        for (name, property_schema) in schema.get('properties', {}).items():
+            if name in value:
+                interpret(property_schema, value[name], '%s.%s' % (path, name), errors)
+    if isinstance(value, list):
+        if 'maxItems' in schema and len(value) > schema['maxItems']:
+            errors.append({'path' : path, 'error' : 'must have at most %s items' % schema['maxItems']})
+        if 'items' in schema:
+            for (index, item) in enumerate(value):
+                interpret(schema['items'], item, '%s[%s]' % (path, index), errors)
+    if isinstance(value, basestring):
+        if 'minLength' in schema and len(value) < schema['minLength']:
+            errors.append({'path' : path, 'error' : 'too short'})
+        if 'maxLength' in schema and len(value) > schema['maxLength']:
+            errors.append({'path' : path, 'error' : 'too long'})
+    if isinstance(value, (int, long)) and 'minimum' in schema and value < schema['minimum']:
+        errors.append({'path' : path, 'error' : 'too small'})
+
+def time_per_event(function, items):
+    start_time = time.time()
+    for item in items:
+        function(item)
+    return (time.time() - start_time) / len(items) * 1000000
+
+def main(args):
+    bodies = make_bodies(args.events, args.badfraction)
+    payloads = [json_codec.loads(body)['payload'] for body in bodies]
+    schema = PayloadSchema(EVENT_SCHEMA)
+
+    # Both validators must agree on which payloads are bad:
+    for payload in payloads[:200]:
+        interpreted_errors = []
+        interpret(EVENT_SCHEMA, payload, '', interpreted_errors)
+        assert bool(interpreted_errors) == bool(schema.validate(payload)), payload
+
+    def interpreted(payload):
+        interpret(EVENT_SCHEMA, payload, '', [])
+
+    parse_usec = time_per_event(json_codec.loads, bodies)
+    interpreted_usec = time_per_event(interpreted, payloads)
+    compiled_usec = time_per_event(schema.validate, payloads)
+    results = {'events' : args.events,
+               'bad_fraction' : args.badfraction,
+               'json_implementation' : json_codec.IMPLEMENTATION,
+               'parse_usec_per_event' : parse_usec,
+               'interpreted_usec_per_event' : interpreted_usec,
+               'compiled_usec_per_event' : compiled_usec,
+               'compiled_percent_of_parse' : 100 * compiled_usec / parse_usec}
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--events', type=int, default=20000,
+                        help='Number of timed events. Default: 20000')
+    parser.add_argument('--badfraction', type=float, default=0.1,
+                        help='Fraction of events whose payload violates the schema. Default: 0.1')
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+'''
+Tests for the compiled payload schemas of publish events.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus.payload_schema import PayloadSchema, SchemaError, SchemaIndex
+
+
+class PayloadSchemaTester(unittest.TestCase):
+
+    EVENT_SCHEMA = {'type' : 'object',
+                    'required' : ['course_id', 'student_id', 'event_type'],
+                    'properties' : {'course_id' : {'type' : 'string', 'minLength' : 1},
+                                    'event_type' : {'enum' : ['problem_check', 'seq_next']},
+                                    'attempt' : {'type' : 'integer', 'minimum' : 1},
+                                    'answers' : {'type' : 'array',
+                                                 'maxItems' : 3,
+                                                 'items' : {'type' : 'string', 'pattern' : '^choice_'}}}}
+
+    GOOD_EVENT = {'course_id' : 'HumanitiesSciences/NCP-101/OnGoing',
+                  'student_id' : 'a1b2',
+                  'event_type' : 'problem_check',
+                  'attempt' : 2,
+                  'answers' : ['choice_1', 'choice_3']}
+
+    def setUp(self):
+        self.schema = PayloadSchema(PayloadSchemaTester.EVENT_SCHEMA)
+
+    def testGoodPayload(self):
+        self.assertEqual([], self.schema.validate(PayloadSchemaTester.GOOD_EVENT))
+        # Properties without a schema may hold anything:
+        self.assertEqual([], self.schema.validate(dict(PayloadSchemaTester.GOOD_EVENT, result=True)))
+
+    def testMissingFields(self):
+        self.assertEqual([{'path' : 'student_id', 'error' : 'is required'},
+                          {'path' : 'event_type', 'error' : 'is required'}],
+                         self.schema.validate({'course_id' : 'Hist101'}))
+        self.assertEqual([{'path' : '', 'error' : 'must be of type object'}],
+                         self.schema.validate('Hello from some LTI consumer.'))
+
+    def testBadValues(self):
+        event = dict(PayloadSchemaTester.GOOD_EVENT,
+                     course_id='',
+                     event_type='seq_prev',
+                     attempt=True,
+                     answers=['choice_1', 3, 'other'])
+        # Properties are checked in the order of their names:
+        self.assertEqual([{'path' : 'answers[1]', 'error' : 'must be of type string'},
+                          {'path' : 'answers[2]', 'error' : 'must match ^choice_'},
+                          {'path' : 'attempt', 'error' : 'must be of type integer'},
+                          {'path' : 'course_id', 'error' : 'must be at least 1 characters long'},
+                          {'path' : 'event_type', 'error' : "must be one of 'problem_check', 'seq_next'"}],
+                         self.schema.validate(event))
+        self.assertEqual([{'path' : 'answers', 'error' : 'must have at most 3 items'}],
+                         self.schema.validate(dict(PayloadSchemaTester.GOOD_EVENT, answers=['choice_1'] * 4)))
+
+    def testNestedArraysAndClosedObjects(self):
+        schema = PayloadSchema({'type' : 'object',
+                                'additionalProperties' : False,
+                                'properties' : {'grid' : {'items' : {'items' : {'type' : 'number', 'maximum' : 1}}}}})
+        self.assertEqual([], schema.validate({'grid' : [[0, 0.5], [1]]}))
+        self.assertEqual([{'path' : 'grid[1][0]', 'error' : 'must be at most 1'}],
+                         schema.validate({'grid' : [[0, 0.5], [2]]}))
+        self.assertEqual([{'path' : 'extra', 'error' : 'is not allowed'}],
+                         schema.validate({'grid' : [], 'extra' : 1}))
+
+    def testErrorsCapped(self):
+        schema = PayloadSchema({'items' : {'type' : 'string'}})
+        self.assertEqual(PayloadSchema.MAX_ERRORS, len(schema.validate(range(100))))
+
+    def testBadSchemas(self):
+        for bad_schema in [['course_id'],
+                           {'type' : 'text'},
+                           {'requird' : ['course_id']},
+                           {'required' : 'course_id'},
+                           {'enum' : []},
+                           {'properties' : {'course_id' : {'pattern' : '('}}}]:
+            self.assertRaises(SchemaError, PayloadSchema, bad_schema)
+
+    def testSchemaIndex(self):
+        index = SchemaIndex({'studentAction' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'schema' : {'required' : ['a']}},
+                             'studentAction.#' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'schema' : {'required' : ['b']}},
+                             'studentAction.Hist.*' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'schema' : {'required' : ['c']}},
+                             'courseEvents' : {'ltiKey' : 'k', 'ltiSecret' : 's'},
+                             'badEvents' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'schema' : {'type' : 'text'}}})
+        self.assertEqual(3, len(index))
+        self.assertEqual(['badEvents'], [topic for (topic, _error) in index.bad_schemas])
+        self.assertEqual({'required' : ['a']}, index.schema_for('studentAction').schema)
+        self.assertEqual({'required' : ['b']}, index.schema_for('studentAction.Math.Calc1').schema)
+        # The most specific pattern wins:
+        self.assertEqual({'required' : ['c']}, index.schema_for('studentAction.Hist.Hist101').schema)
+        self.assertIsNone(index.schema_for('courseEvents'))
+        self.assertIsNone(index.schema_for('badEvents'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+'''
+Tests for phase timing and the slow trace log.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import json
+import logging
+import unittest
+
+from ltischoolbus.metrics import MetricsRegistry
+from ltischoolbus.phase_trace import NO_TRACE, PhaseTrace, SlowTraceLog
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+class PhaseTraceTester(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.logger = logging.getLogger('ltibridge.slow')
+        self.logger.addHandler(self.handler)
+        # Independent of the 'ltibridge' logger's level and
+        # handlers, which other test modules set up:
+        self.saved_level = self.logger.level
+        self.saved_propagate = self.logger.propagate
+        self.logger.setLevel(logging.WARNING)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(self.saved_level)
+        self.logger.propagate = self.saved_propagate
+
+    def testPhases(self):
+        trace = PhaseTrace('post', start_time=100.)
+        for (phase, seconds) in (('parse', 0.001), ('outbox', 0.002), ('outbox', 0.003)):
+            trace.phases.append((phase, seconds))
+            trace.last_time += seconds
+        record = trace.record(status=200)
+        self.assertEqual('post', record['kind'])
+        self.assertEqual(6.0, record['total_ms'])
+        # Repeated phases are added up:
+        self.assertEqual([('parse', 1.0), ('outbox', 5.0)], record['phases'].items())
+        self.assertEqual(200, record['status'])
+
+    def testSlowTraceLogged(self):
+        trace_log = SlowTraceLog(threshold_ms=10)
+        fast = trace_log.start('post')
+        fast.mark('parse')
+        self.assertFalse(trace_log.finish(fast))
+        slow = trace_log.start('post', start_time=fast.start_time - 1)
+        slow.mark('publish')
+        self.assertTrue(trace_log.finish(slow, action='publish'))
+        self.assertEqual(1, len(self.handler.records))
+        (prefix, record) = self.handler.records[0].split(': ', 1)
+        self.assertEqual('Slow post', prefix)
+        record = json.loads(record)
+        self.assertEqual(['publish'], record['phases'].keys())
+        self.assertEqual('publish', record['action'])
+
+    def testNoThreshold(self):
+        trace_log = SlowTraceLog(threshold_ms=None)
+        trace = trace_log.start('post', start_time=0)
+        trace.mark('parse')
+        self.assertFalse(trace_log.finish(trace))
+        self.assertEqual([], self.handler.records)
+
+    def testSampling(self):
+        self.assertIs(NO_TRACE, SlowTraceLog(sample_rate=0).start('post'))
+        self.assertIsNot(NO_TRACE, SlowTraceLog(sample_rate=1).start('post'))
+        # Unsampled work costs a no-op:
+        NO_TRACE.mark('parse')
+        self.assertFalse(SlowTraceLog(threshold_ms=0).finish(NO_TRACE))
+        with self.assertRaises(ValueError):
+            SlowTraceLog(sample_rate=2)
+
+    def testPhaseHistogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('phase_seconds', 'Phases.', ('kind', 'phase'))
+        trace_log = SlowTraceLog(phase_histogram=histogram)
+        trace = trace_log.start('bus_msg')
+        trace.mark('lookup')
+        trace.mark('envelope')
+        trace_log.finish(trace)
+        self.assertEqual(1, histogram.series(('bus_msg', 'lookup')).count)
+        self.assertEqual(1, histogram.series(('bus_msg', 'envelope')).count)
+
+
+if __name__ == "__main__":
+    unittest.main()
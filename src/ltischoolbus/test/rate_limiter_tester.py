@@ -0,0 +1,104 @@
+'''
+Tests for the rate limits at the bridge's ingress.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus.rate_limiter import RateLimiter, RateLimits, TokenBuckets, peek_lti_key
+
+
+class RateLimiterTester(unittest.TestCase):
+
+    CONFIG = {'studentAction' : {'ltiKey' : 'oliKey', 'ltiSecret' : 's',
+                                 'key_rate_limit' : {'rate' : 2, 'burst' : 3},
+                                 'topic_rate_limit' : {'rate' : 10}},
+              'courseEvents.#' : {'ltiKey' : 'oliKey', 'ltiSecret' : 's',
+                                  'key_rate_limit' : {'rate' : 1},
+                                  'topic_rate_limit' : {'rate' : 1, 'burst' : 2}},
+              'studentReprimand' : {'ltiKey' : 'otherKey', 'ltiSecret' : 's'},
+              'badLimit' : {'ltiKey' : 'badKey', 'ltiSecret' : 's', 'topic_rate_limit' : {'rate' : 0}}}
+
+    def setUp(self):
+        self.now = [1000.0]
+        self.clock = lambda: self.now[0]
+
+    def testBurstThenRate(self):
+        buckets = TokenBuckets(clock=self.clock)
+        self.assertEqual([0, 0, 0], [buckets.take('k', 2, 3) for _ in range(3)])
+        self.assertAlmostEqual(0.5, buckets.take('k', 2, 3))
+        self.assertAlmostEqual(0.5, buckets.wait_time('k', 2, 3))
+        self.now[0] += 0.5
+        self.assertEqual(0, buckets.wait_time('k', 2, 3))
+        self.assertEqual(0, buckets.take('k', 2, 3))
+        self.assertAlmostEqual(0.5, buckets.take('k', 2, 3))
+        # Other names have buckets of their own:
+        self.assertEqual(0, buckets.take('other', 2, 3))
+        # A quiet spell refills the bucket, but not beyond burst:
+        self.now[0] += 60
+        self.assertEqual([0, 0, 0], [buckets.take('k', 2, 3) for _ in range(3)])
+        self.assertTrue(buckets.take('k', 2, 3) > 0)
+
+    def testFullBucketsSwept(self):
+        buckets = TokenBuckets(max_buckets=2, clock=self.clock)
+        buckets.take('a', 1, 5)
+        buckets.take('b', 1, 5)
+        # No room; a third name is let through, but not tracked:
+        self.assertEqual(0, buckets.take('c', 1, 1))
+        self.assertEqual(0, buckets.take('c', 1, 1))
+        self.assertEqual(2, buckets.untracked_counter)
+        # Once a and b are full again, they make room:
+        self.now[0] += 2
+        self.assertEqual(0, buckets.take('c', 1, 1))
+        self.assertEqual(1, len(buckets))
+        self.assertTrue(buckets.take('c', 1, 1) > 0)
+
+    def testLimitsFromConfig(self):
+        limits = RateLimits(RateLimiterTester.CONFIG)
+        # The lowest limit of a key applies:
+        self.assertEqual((1.0, 1.0), limits.key_limit('oliKey'))
+        self.assertIsNone(limits.key_limit('otherKey'))
+        self.assertEqual((10.0, 10.0), limits.topic_limit('studentAction'))
+        self.assertEqual((1.0, 2.0), limits.topic_limit('courseEvents.Hist101'))
+        self.assertIsNone(limits.topic_limit('studentReprimand'))
+        self.assertEqual(['badLimit'], [topic for (topic, _error) in limits.bad_limits])
+        self.assertFalse(RateLimits({}))
+
+    def testKeyAndTopic(self):
+        limits = RateLimits({'courseEvents.#' : {'ltiKey' : 'k', 'ltiSecret' : 's',
+                                                  'key_rate_limit' : {'rate' : 1, 'burst' : 10},
+                                                  'topic_rate_limit' : {'rate' : 1, 'burst' : 2}}})
+        limiter = RateLimiter(clock=self.clock)
+        self.assertEqual([0, 0], [limiter.take(limits, 'k', 'courseEvents.Hist101') for _ in range(2)])
+        self.assertTrue(limiter.take(limits, 'k', 'courseEvents.Hist101') > 0)
+        # The refused request did not cost the key a token:
+        self.assertEqual([0] * 8, [limiter.take(limits, 'k', 'courseEvents.Math%s' % i) for i in range(8)])
+        self.assertTrue(limiter.take(limits, 'k', 'courseEvents.Physics') > 0)
+        self.assertTrue(limiter.wait_time(limits, 'k') > 0)
+        self.assertEqual(0, limiter.wait_time(limits, 'unlimitedKey'))
+        stats = limiter.stats()
+        self.assertEqual((2, 1), (stats['limited_by_key'], stats['limited_by_topic']))
+
+    def testShareOfLimit(self):
+        limits = RateLimits({'t' : {'ltiKey' : 'k', 'ltiSecret' : 's', 'key_rate_limit' : {'rate' : 8, 'burst' : 8}}})
+        limiter = RateLimiter(share=0.25, clock=self.clock)
+        self.assertEqual([0, 0], [limiter.take(limits, 'k', 't') for _ in range(2)])
+        self.assertAlmostEqual(0.5, limiter.take(limits, 'k', 't'))
+
+    def testPeekLtiKey(self):
+        self.assertEqual('oliKey', peek_lti_key('{"action" : "publish", "ltiKey" : "oliKey", "payload" : {}}'))
+        self.assertEqual('oliKey', peek_lti_key('{"ltiKey":"oliKey"}'))
+        self.assertEqual('ltiKey', peek_lti_key('{"ltiKey" : "ltiKey", "payload" : "ltiKey"}'))
+        self.assertIsNone(peek_lti_key('{"ltiKey" : "oli\\"Key"}'))
+        self.assertIsNone(peek_lti_key('{"payload" : "{\\"ltiKey\\" : \\"oliKey\\"}"}'))
+        self.assertIsNone(peek_lti_key('not json'))
+        # Which of several keys is the request's own is only known after parsing:
+        self.assertIsNone(peek_lti_key('{"payload" : {"ltiKey" : "victimKey"}, "ltiKey" : "oliKey"}'))
+        self.assertIsNone(peek_lti_key('{"ltiKey" : "oli\\"Key", "payload" : {"ltiKey" : "victimKey"}}'))
+        self.assertIsNone(peek_lti_key('{"events" : [{"ltiKey" : "oliKey"}, {"ltiKey" : "oliKey"}]}'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+'''
+Tests for the consistent hashing of delivery URLs onto shards.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus.shard_ring import ShardRing
+
+
+class ShardRingTester(unittest.TestCase):
+
+    URLS = ['https://lms%s.example.edu/delivery/%s' % (i % 37, i) for i in range(10000)]
+
+    def owners(self, ring):
+        return {url : ring.shard_for(url) for url in ShardRingTester.URLS}
+
+    def testDeterministic(self):
+        # Workers build their rings independently, and must agree:
+        self.assertEqual(self.owners(ShardRing(range(4))), self.owners(ShardRing([3, 1, 0, 2])))
+        self.assertEqual(ShardRing(range(4)).shard_for(u'https://lms.example.edu/d\xe9livery'),
+                         ShardRing(range(4)).shard_for(u'https://lms.example.edu/d\xe9livery'.encode('utf-8')))
+
+    def testEvenSpread(self):
+        counts = ShardRing(range(4)).distribution(ShardRingTester.URLS)
+        self.assertEqual([0, 1, 2, 3], sorted(counts.keys()))
+        self.assertEqual(len(ShardRingTester.URLS), sum(counts.values()))
+        for count in counts.values():
+            self.assertTrue(0.75 * 2500 < count < 1.25 * 2500, counts)
+
+    def testAddingShardMovesOneNth(self):
+        ring = ShardRing(range(4))
+        before = self.owners(ring)
+        ring.add_shard(4)
+        after = self.owners(ring)
+        moved = [url for url in before if before[url] != after[url]]
+        # About a fifth of the URLs move, all of them to the new shard:
+        self.assertTrue(0.15 < len(moved) / float(len(before)) < 0.25, len(moved))
+        self.assertEqual(set([4]), set([after[url] for url in moved]))
+
+    def testRemovingShardMovesOnlyItsUrls(self):
+        ring = ShardRing(range(5))
+        before = self.owners(ring)
+        ring.remove_shard(2)
+        after = self.owners(ring)
+        moved = [url for url in before if before[url] != after[url]]
+        self.assertEqual(sorted([url for url in before if before[url] == 2]), sorted(moved))
+        self.assertNotIn(2, after.values())
+
+    def testEmptyRing(self):
+        ring = ShardRing()
+        self.assertRaises(LookupError, ring.shard_for, 'https://lms.example.edu/delivery')
+        ring.add_shard('only')
+        self.assertEqual('only', ring.shard_for('https://lms.example.edu/delivery'))
+        self.assertRaises(ValueError, ShardRing, range(2), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+'''
+Stand-in for redis_bus_python's BusAdapter that needs no
+redis-server. Used by unittests and benchmarks that run
+the bridge in-process.
+
+@author: paepcke
+'''
+import json
+import re
+
+from redis_bus_python.bus_message import BusMessage
+
+
+class StubPipeline(object):
+    '''
+    Collects PUBLISH commands like a redis pipeline, and
+    hands them to the StubBusAdapter on execute().
+    '''
+
+    def __init__(self, bus_adapter):
+        self.bus_adapter = bus_adapter
+        self.command_stack = []
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append(args)
+        return self
+
+    def execute(self, raise_on_error=True):
+        replies = []
+        for args in self.command_stack:
+            if args[0] != 'PUBLISH':
+                raise NotImplementedError('StubPipeline only supports PUBLISH; got %s' % args[0])
+            (topic, wire_msg) = args[1:3]
+            self.bus_adapter.publish(BusMessage(content=json.loads(wire_msg)['content'], topicName=topic))
+            replies.append(0)
+        self.bus_adapter.pipelines_executed += 1
+        self.command_stack = []
+        return replies
+
+
+class StubRedisServer(object):
+    '''
+    The part of the redis client (BusAdapter.rserver)
+    that the bridge uses directly.
+    '''
+
+    def __init__(self, bus_adapter):
+        self.bus_adapter = bus_adapter
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return StubPipeline(self.bus_adapter)
+
+
+class StubPubSub(object):
+    '''
+    The part of the redis pubsub listener (BusAdapter.pub_sub)
+    that the bridge uses directly.
+    '''
+
+    def __init__(self, bus_adapter):
+        self.bus_adapter = bus_adapter
+        # Number of SUBSCRIBE commands 'sent':
+        self.subscribe_commands = 0
+
+    def subscribe(self, *context, **delivery_mechanisms):
+        self.bus_adapter.subscriptions.update(delivery_mechanisms)
+        self.subscribe_commands += 1
+
+    def psubscribe(self, *context, **delivery_mechanisms):
+        self.bus_adapter.pattern_subscriptions.update(delivery_mechanisms)
+
+    def unsubscribe(self, *channel_names):
+        for channel in channel_names:
+            self.bus_adapter.subscriptions.pop(channel, None)
+
+    def punsubscribe(self, *channel_patterns):
+        for pattern in channel_patterns:
+            self.bus_adapter.pattern_subscriptions.pop(pattern, None)
+
+
+class StubBusAdapter(object):
+    '''
+    Implements the subset of the BusAdapter API that the
+    LTI-SchoolBus bridge uses. Published messages are kept
+    in a list, and subscriptions in a dict that maps topics
+    to delivery callables. Call deliver() to simulate a
+    message arriving from the bus.
+    '''
+
+    def __init__(self, keep_published=True, loopback=False):
+        '''
+        :param keep_published: if True, every published BusMessage
+            is appended to self.published. Benchmarks turn this
+            off to avoid unbounded memory growth.
+        :type keep_published: bool
+        :param loopback: if True, published messages are delivered
+            to the subscriptions right away, as a real bus would.
+        :type loopback: bool
+        '''
+        self.keep_published = keep_published
+        self.loopback = loopback
+        self.published = []
+        self.publish_count = 0
+        self.subscriptions = {}
+        # Redis glob --> delivery callable:
+        self.pattern_subscriptions = {}
+        self.rserver = StubRedisServer(self)
+        self.pub_sub = StubPubSub(self)
+        # Number of pipelined round trips to the 'server':
+        self.pipelines_executed = 0
+
+    def publish(self, busMessage, sync=False, timeout=None, block=True, auth=None):
+        self.publish_count += 1
+        if self.keep_published:
+            self.published.append(busMessage)
+        if self.loopback:
+            return self.deliver(busMessage)
+        # Real BusAdapter returns number of recipients:
+        return 0
+
+    def subscribeToTopic(self, topicIdentifier, deliveryCallable, threaded=True, context=None):
+        self.subscriptions[topicIdentifier] = deliveryCallable
+
+    def unsubscribeFromTopic(self, topicIdentifier=None):
+        if topicIdentifier is None:
+            self.subscriptions = {}
+            self.pattern_subscriptions = {}
+        else:
+            self.subscriptions.pop(topicIdentifier, None)
+
+    def mySubscriptions(self):
+        return self.subscriptions.keys() + self.pattern_subscriptions.keys()
+
+    def subscribedTo(self, topic):
+        return topic in self.subscriptions or topic in self.pattern_subscriptions
+
+    def close(self):
+        self.unsubscribeFromTopic()
+
+    def deliver(self, bus_msg):
+        '''
+        Simulate arrival of a message from the bus: call the
+        callables that were registered for the message's topic,
+        and for each redis glob that matches the topic.
+
+        :param bus_msg: message as it would arrive from the bus
+        :type bus_msg: BusMessage
+        :return: number of subscriptions that received the message
+        :rtype: int
+        '''
+        callbacks = [callback for (glob, callback) in self.pattern_subscriptions.items()
+                     if glob_to_regex(glob).match(bus_msg.topicName)]
+        try:
+            callbacks.insert(0, self.subscriptions[bus_msg.topicName])
+        except KeyError:
+            pass
+        for callback in callbacks:
+            callback(bus_msg)
+        return len(callbacks)
+
+
+def glob_to_regex(glob):
+    '''
+    Compile a redis PSUBSCRIBE glob. Only '*', '?', and
+    backslash escapes are supported.
+    '''
+    regex = ''
+    chars = iter(glob)
+    for char in chars:
+        if char == '\\':
+            regex += re.escape(next(chars, '\\'))
+        elif char == '*':
+            regex += '.*'
+        elif char == '?':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+    return re.compile(regex + '$', re.DOTALL)
@@ -0,0 +1,124 @@
+'''
+Tests for the bounded per-subscriber delivery queues.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+from ltischoolbus.subscriber_queue import SubscriberQueue
+
+
+class SubscriberQueueTester(unittest.TestCase):
+
+    URL = 'https://lms1/delivery'
+
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp(prefix='ltibridge_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def make_queue(self, **kwargs):
+        return SubscriberQueue(SubscriberQueueTester.URL, spill_dir=self.spill_dir, **kwargs)
+
+    def drain(self, queue):
+        items = []
+        item = queue.get()
+        while item is not None:
+            items.append(item)
+            item = queue.get()
+        return items
+
+    def testFifo(self):
+        queue = self.make_queue()
+        for i in range(3):
+            self.assertEqual([], queue.put((i, 'studentAction', 'msg%s' % i)))
+        self.assertEqual(3, len(queue))
+        self.assertEqual(12, queue.stats()['bytes'])
+        self.assertEqual([0, 1, 2], [entry_id for (entry_id, _, _) in self.drain(queue)])
+        self.assertEqual(0, queue.stats()['bytes'])
+
+    def testDropOldest(self):
+        queue = self.make_queue(max_messages=2, overflow_policy=SubscriberQueue.DROP_OLDEST)
+        queue.put((1, 'studentAction', 'a'))
+        queue.put((2, 'studentAction', 'b'))
+        self.assertEqual([(1, 'studentAction', 'a')], queue.put((3, 'studentAction', 'c')))
+        self.assertEqual([2, 3], [entry_id for (entry_id, _, _) in self.drain(queue)])
+        self.assertEqual(1, queue.stats()['dropped_oldest'])
+
+    def testDropNewest(self):
+        queue = self.make_queue(max_messages=2, overflow_policy=SubscriberQueue.DROP_NEWEST)
+        queue.put((1, 'studentAction', 'a'))
+        queue.put((2, 'studentAction', 'b'))
+        self.assertEqual([(3, 'studentAction', 'c')], queue.put((3, 'studentAction', 'c')))
+        self.assertEqual([1, 2], [entry_id for (entry_id, _, _) in self.drain(queue)])
+        self.assertEqual(1, queue.stats()['dropped_newest'])
+
+    def testByteBound(self):
+        queue = self.make_queue(max_bytes=10, overflow_policy=SubscriberQueue.DROP_OLDEST)
+        queue.put((1, 'studentAction', 'x' * 6))
+        queue.put((2, 'studentAction', 'x' * 4))
+        # Needs room for 7 bytes; both older messages must go:
+        dropped = queue.put((3, 'studentAction', 'x' * 7))
+        self.assertEqual([1, 2], [entry_id for (entry_id, _, _) in dropped])
+        self.assertEqual(7, queue.stats()['bytes'])
+
+    def testOversizedMessageStillQueued(self):
+        # A message larger than max_bytes fits into an empty queue:
+        queue = self.make_queue(max_bytes=4)
+        self.assertEqual([], queue.put((1, 'studentAction', 'x' * 10)))
+        self.assertEqual(1, len(queue))
+
+    def testSpillToDiskKeepsOrder(self):
+        queue = self.make_queue(max_messages=2, overflow_policy=SubscriberQueue.SPILL_TO_DISK)
+        for i in range(5):
+            self.assertEqual([], queue.put((i, 'studentAction', 'msg%s' % i)))
+        stats = queue.stats()
+        self.assertEqual(2, stats['depth'])
+        self.assertEqual(3, stats['spilled_pending'])
+        self.assertTrue(os.path.exists(queue.spill_path))
+        # Room frees up while more messages arrive:
+        self.assertEqual(0, queue.get()[0])
+        queue.put((5, 'studentAction', 'msg5'))
+        self.assertEqual([(i, 'studentAction', 'msg%s' % i) for i in range(1, 6)], self.drain(queue))
+        # Spill file is gone once read back:
+        self.assertFalse(os.path.exists(queue.spill_path))
+
+    def testStaleSpillFileIgnored(self):
+        # A run that ended without draining its spill file:
+        queue = self.make_queue(max_messages=1, overflow_policy=SubscriberQueue.SPILL_TO_DISK)
+        for i in range(4):
+            queue.put((i, 'studentAction', 'old%s' % i))
+        queue.spill_writer.close()
+        self.assertTrue(os.path.exists(queue.spill_path))
+        # The next run's queue for the same URL:
+        queue = self.make_queue(max_messages=1, overflow_policy=SubscriberQueue.SPILL_TO_DISK)
+        for i in range(10, 13):
+            queue.put((i, 'studentAction', 'new%s' % i))
+        self.assertEqual([10, 11, 12], [entry_id for (entry_id, _, _) in self.drain(queue)])
+        self.assertFalse(os.path.exists(queue.spill_path))
+
+    def testSpillRespectsByteBound(self):
+        queue = self.make_queue(max_bytes=8, overflow_policy=SubscriberQueue.SPILL_TO_DISK)
+        for i in range(4):
+            queue.put((i, 'studentAction', 'msg%s' % i))
+        self.assertEqual(2, queue.stats()['depth'])
+        queue.get()
+        self.assertEqual(2, queue.stats()['depth'])
+        self.assertEqual(1, queue.stats()['spilled_pending'])
+        self.assertEqual([1, 2, 3], [entry_id for (entry_id, _, _) in self.drain(queue)])
+
+    def testSpillRequiresDirectory(self):
+        with self.assertRaises(ValueError):
+            SubscriberQueue(SubscriberQueueTester.URL, overflow_policy=SubscriberQueue.SPILL_TO_DISK)
+        with self.assertRaises(ValueError):
+            SubscriberQueue(SubscriberQueueTester.URL, overflow_policy='drop_everything')
+
+
+if __name__ == "__main__":
+    unittest.main()
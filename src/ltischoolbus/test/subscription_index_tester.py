@@ -0,0 +1,95 @@
+'''
+Tests for the index of LTI subscriptions.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import json
+import unittest
+
+from ltischoolbus.subscription_index import SubscriptionIndex
+
+
+class SubscriptionIndexTester(unittest.TestCase):
+
+    LMS1 = 'https://lms1.edu/delivery'
+    LMS2 = 'https://lms2.edu/delivery'
+
+    def setUp(self):
+        self.index = SubscriptionIndex()
+
+    def testAddIsIdempotent(self):
+        self.assertTrue(self.index.add('studentAction', SubscriptionIndexTester.LMS1))
+        self.assertFalse(self.index.add('studentAction', SubscriptionIndexTester.LMS1))
+        self.assertEqual([SubscriptionIndexTester.LMS1], self.index.urls_for('studentAction'))
+        self.assertTrue(self.index.has('studentAction', SubscriptionIndexTester.LMS1))
+        self.assertIn('studentAction', self.index)
+
+    def testUrlsKeepSubscriptionOrder(self):
+        self.index.add('studentAction', SubscriptionIndexTester.LMS2)
+        self.index.add('studentAction', SubscriptionIndexTester.LMS1)
+        self.assertEqual([SubscriptionIndexTester.LMS2, SubscriptionIndexTester.LMS1],
+                         self.index.urls_for('studentAction'))
+
+    def testReverseIndex(self):
+        self.index.add('studentAction', SubscriptionIndexTester.LMS1)
+        self.index.add('courseEvents', SubscriptionIndexTester.LMS1)
+        self.index.add('courseEvents', SubscriptionIndexTester.LMS2)
+        self.assertEqual(set(['studentAction', 'courseEvents']), self.index.topics_for(SubscriptionIndexTester.LMS1))
+        self.index.remove('studentAction', SubscriptionIndexTester.LMS1)
+        self.assertEqual(set(['courseEvents']), self.index.topics_for(SubscriptionIndexTester.LMS1))
+        # Topic without subscribers is gone:
+        self.assertNotIn('studentAction', self.index)
+        self.assertEqual([], self.index.urls_for('studentAction'))
+
+    def testRemoveAbsentIsNoop(self):
+        self.assertFalse(self.index.remove('studentAction', SubscriptionIndexTester.LMS1))
+        self.index.add('studentAction', SubscriptionIndexTester.LMS1)
+        self.assertFalse(self.index.remove('studentAction', SubscriptionIndexTester.LMS2))
+        self.assertEqual(1, len(self.index))
+
+    def testBulkOperations(self):
+        subscriptions = [('course%s' % i, SubscriptionIndexTester.LMS1) for i in range(1000)]
+        subscriptions.append(('course0', SubscriptionIndexTester.LMS2))
+        (num_added, new_topics) = self.index.add_many(subscriptions)
+        self.assertEqual(1001, num_added)
+        self.assertEqual(1000, len(new_topics))
+        self.assertEqual('course0', new_topics[0])
+
+        (num_removed, emptied_topics) = self.index.remove_url(SubscriptionIndexTester.LMS1)
+        self.assertEqual(1000, num_removed)
+        # course0 still has LMS2:
+        self.assertEqual(999, len(emptied_topics))
+        self.assertEqual(['course0'], self.index.topics())
+        self.assertEqual([SubscriptionIndexTester.LMS2], self.index.urls())
+
+    def testPatternSubscriptions(self):
+        self.index.add('studentAction.HumanitiesSciences.Hist101', SubscriptionIndexTester.LMS1)
+        self.index.add('studentAction.HumanitiesSciences.*', SubscriptionIndexTester.LMS2)
+        self.index.add('studentAction.#', SubscriptionIndexTester.LMS1)
+        self.assertEqual([SubscriptionIndexTester.LMS1, SubscriptionIndexTester.LMS2],
+                         self.index.urls_matching('studentAction.HumanitiesSciences.Hist101'))
+        self.assertEqual([SubscriptionIndexTester.LMS1],
+                         self.index.urls_matching('studentAction.Engineering.CS101'))
+        self.assertTrue(self.index.receives('studentAction.HumanitiesSciences.Hist202', SubscriptionIndexTester.LMS2))
+        self.index.remove('studentAction.HumanitiesSciences.*', SubscriptionIndexTester.LMS2)
+        self.assertFalse(self.index.receives('studentAction.HumanitiesSciences.Hist202', SubscriptionIndexTester.LMS2))
+        self.assertRaises(ValueError, self.index.add, 'studentAction.#.Hist101', SubscriptionIndexTester.LMS1)
+
+    def testJsonRoundTrip(self):
+        file_content = json.dumps({'studentAction' : [SubscriptionIndexTester.LMS1, SubscriptionIndexTester.LMS2],
+                                   'courseEvents' : [SubscriptionIndexTester.LMS2]})
+        index = SubscriptionIndex.from_json(file_content)
+        self.assertEqual(json.loads(file_content), json.loads(index.to_json()))
+        self.assertEqual(set(['studentAction', 'courseEvents']), index.topics_for(SubscriptionIndexTester.LMS2))
+
+    def testBadFormatRejected(self):
+        with self.assertRaises(ValueError):
+            SubscriptionIndex.from_json('{"studentAction" : "https://lms1.edu/delivery"}')
+        with self.assertRaises(ValueError):
+            SubscriptionIndex.from_json('["studentAction"]')
+
+
+if __name__ == "__main__":
+    unittest.main()
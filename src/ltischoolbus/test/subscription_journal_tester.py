@@ -0,0 +1,146 @@
+'''
+Tests for the snapshot-plus-journal store of subscriptions.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tornado.testing import AsyncTestCase
+
+from ltischoolbus.subscription_journal import SubscriptionJournal
+
+
+class SubscriptionJournalTester(AsyncTestCase):
+
+    def setUp(self):
+        super(SubscriptionJournalTester, self).setUp()
+        self.work_dir = tempfile.mkdtemp(prefix='ltibridge_test')
+        self.snapshot_path = os.path.join(self.work_dir, 'lti_bus_subscriptions.json')
+        self.journal = self.open_journal()
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        super(SubscriptionJournalTester, self).tearDown()
+
+    def open_journal(self, **kwargs):
+        journal = SubscriptionJournal(self.snapshot_path, io_loop=self.io_loop, **kwargs)
+        self.index = journal.load()
+        return journal
+
+    def reopen(self, **kwargs):
+        self.journal.close()
+        self.journal = self.open_journal(**kwargs)
+
+    def testAddAndRemoveSurviveRestart(self):
+        self.assertEqual((2, ['t1']), self.journal.add_many([('t1', 'url1'), ('t1', 'url2')]))
+        self.assertEqual((1, []), self.journal.remove_many([('t1', 'url1'), ('t2', 'url1')]))
+        self.reopen()
+        self.assertEqual({'t1' : ['url2']}, self.index.to_dict())
+
+    def testOnlyChangesJournaled(self):
+        self.journal.add_many([('t1', 'url1')])
+        self.journal.add_many([('t1', 'url1')])
+        self.journal.remove_many([('t2', 'url1')])
+        self.assertEqual(1, self.journal.stats()['appended'])
+
+    def testAppendsSyncedTogether(self):
+        self.journal.sync_delay = 0.01
+        self.journal.add_many([('t1', 'url1')])
+        self.journal.add_many([('t2', 'url1')])
+        self.io_loop.call_later(0.05, self.stop)
+        self.wait()
+        self.assertEqual(1, self.journal.stats()['syncs'])
+
+    def testTornLastRecordIgnored(self):
+        self.journal.add_many([('t1', 'url1')])
+        self.journal.close()
+        with open(self.journal.journal_path, 'ab') as fd:
+            fd.write('{"op" : "subscribe", "topic" : "t2", "u')
+        self.journal = self.open_journal()
+        self.assertEqual({'t1' : ['url1']}, self.index.to_dict())
+        # Appends after the torn record are readable:
+        self.journal.add_many([('t3', 'url1')])
+        self.reopen()
+        self.assertEqual(set(['t1', 't3']), set(self.index.topics()))
+
+    def testCompaction(self):
+        self.journal.compact_after = 3
+        self.journal.add_many([('t1', 'url1'), ('t2', 'url1')])
+        self.journal.add_many([('t3', 'url1')])
+        # Compaction started; later changes go to the fresh journal:
+        self.journal.remove_many([('t1', 'url1')])
+        self.io_loop.call_later(0.1, self.stop)
+        self.wait()
+        self.assertEqual(1, self.journal.stats()['compactions'])
+        self.assertFalse(os.path.exists(self.journal.compacting_path))
+        with open(self.snapshot_path, 'r') as fd:
+            self.assertEqual(set(['t1', 't2', 't3']), set(json.load(fd).keys()))
+        self.reopen()
+        self.assertEqual(set(['t2', 't3']), set(self.index.topics()))
+
+    def testUnfinishedCompactionReplayed(self):
+        self.journal.add_many([('t1', 'url1')])
+        self.journal.close()
+        # As if the bridge stopped before the snapshot was written:
+        os.rename(self.journal.journal_path, self.journal.compacting_path)
+        self.journal = self.open_journal()
+        self.journal.add_many([('t2', 'url1')])
+        self.reopen()
+        self.assertEqual(set(['t1', 't2']), set(self.index.topics()))
+        # The next compaction folds in both files:
+        self.journal.compact()
+        self.journal.close()
+        self.assertFalse(os.path.exists(self.journal.compacting_path))
+        with open(self.snapshot_path, 'r') as fd:
+            self.assertEqual(set(['t1', 't2']), set(json.load(fd).keys()))
+
+    def testFollowerSeesWritersChanges(self):
+        self.journal.add_many([('t1', 'url1'), ('t2', 'url1')])
+        follower = SubscriptionJournal(self.snapshot_path, io_loop=self.io_loop)
+        self.assertEqual(set(['t1', 't2']), set(follower.follow().topics()))
+        self.assertFalse(follower.refresh())
+        self.journal.remove_many([('t1', 'url1')])
+        # A record still being written is left for the next refresh:
+        with open(self.journal.journal_path, 'ab') as fd:
+            fd.write('{"op" : "subscribe", "topic" : "t3", ')
+        self.assertTrue(follower.refresh())
+        self.assertEqual(set(['t2']), set(follower.index.topics()))
+        with open(self.journal.journal_path, 'ab') as fd:
+            fd.write('"url" : "url1"}\n')
+        self.assertTrue(follower.refresh())
+        self.assertEqual(set(['t2', 't3']), set(follower.index.topics()))
+        # The follower never writes:
+        self.assertIsNone(follower.journal)
+
+    def testFollowerSurvivesCompaction(self):
+        follower = SubscriptionJournal(self.snapshot_path, io_loop=self.io_loop)
+        follower.follow()
+        self.journal.compact_after = 2
+        self.journal.add_many([('t1', 'url1'), ('t2', 'url1')])
+        self.journal.add_many([('t3', 'url1')])
+        self.assertTrue(follower.refresh())
+        self.assertEqual(set(['t1', 't2', 't3']), set(follower.index.topics()))
+        self.io_loop.call_later(0.1, self.stop)
+        self.wait()
+        self.assertEqual(1, self.journal.stats()['compactions'])
+        self.journal.remove_many([('t3', 'url1')])
+        self.assertTrue(follower.refresh())
+        self.assertEqual(set(['t1', 't2']), set(follower.index.topics()))
+
+    def testBadSnapshotIgnored(self):
+        self.journal.close()
+        with open(self.snapshot_path, 'w') as fd:
+            fd.write('not json')
+        self.journal = self.open_journal()
+        self.assertEqual(0, len(self.index))
+
+
+if __name__ == "__main__":
+    unittest.main()
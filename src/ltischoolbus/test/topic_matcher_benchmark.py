@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+'''
+Measures the cost of matching a topic against growing numbers
+of subscribed topic patterns, comparing:
+
+   - 'linear': each pattern compiled to a regular expression,
+        and all of them tried in turn, and
+   - 'trie': the TopicMatcher, with its match cache cleared first,
+        so every lookup walks the trie.
+
+Patterns look like course-level subscriptions:
+studentAction.School<s>.Course<c>.*, plus one School<s>.#
+pattern per school. Topics are drawn from the same schools
+and courses, so most of them match.
+
+Usage: python -m ltischoolbus.test.topic_matcher_benchmark [--patterns N,N,...] [--lookups L]
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from ltischoolbus.topic_matcher import ANY_SEGMENTS, ONE_SEGMENT, SEPARATOR, TopicMatcher
+
+
+NUM_SCHOOLS = 20
+
+def make_patterns(num_patterns):
+    patterns = ['studentAction.School%s.%s' % (school, ANY_SEGMENTS) for school in range(NUM_SCHOOLS)]
+    course = 0
+    while len(patterns) < num_patterns:
+        patterns.append('studentAction.School%s.Course%s.%s' % (course % NUM_SCHOOLS, course, ONE_SEGMENT))
+        course += 1
+    return patterns[:num_patterns]
+
+def make_topics(num_patterns, num_lookups):
+    return ['studentAction.School%s.Course%s.quiz%s' % (course % NUM_SCHOOLS, course, lookup % 10)
+            for (lookup, course) in enumerate([random.randrange(num_patterns) for _ in range(num_lookups)])]
+
+def pattern_to_regex(pattern):
+    regex = ''
+    for (position, segment) in enumerate(pattern.split(SEPARATOR)):
+        if segment == ANY_SEGMENTS:
+            regex += '(\\..*)?' if position > 0 else '.*'
+            continue
+        if position > 0:
+            regex += '\\.'
+        regex += '[^.]+' if segment == ONE_SEGMENT else re.escape(segment)
+    return re.compile(regex + '$')
+
+def time_lookups(match, topics):
+    start_time = time.time()
+    for topic in topics:
+        match(topic)
+    return (time.time() - start_time) / len(topics) * 1000000
+
+def main(args):
+    results = {'lookups' : args.lookups, 'linear_usec_per_match' : {}, 'trie_usec_per_match' : {}}
+    for num_patterns in [int(num) for num in args.patterns.split(',')]:
+        patterns = make_patterns(num_patterns)
+        topics = make_topics(num_patterns, args.lookups)
+
+        regexes = [(pattern, pattern_to_regex(pattern)) for pattern in patterns]
+        linear = lambda topic: [pattern for (pattern, regex) in regexes if regex.match(topic)]
+
+        matcher = TopicMatcher(patterns)
+        def trie(topic):
+            matcher.match_cache = {}
+            return matcher.match(topic)
+
+        # Both must agree:
+        for topic in topics[:100]:
+            assert sorted(linear(topic)) == sorted(trie(topic)), topic
+
+        results['linear_usec_per_match'][num_patterns] = time_lookups(linear, topics)
+        results['trie_usec_per_match'][num_patterns] = time_lookups(trie, topics)
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--patterns', default='10,100,1000,10000',
+                        help='Comma-separated numbers of patterns to measure. Default: 10,100,1000,10000')
+    parser.add_argument('--lookups', type=int, default=2000,
+                        help='Number of timed matches per pattern count. Default: 2000')
+    main(parser.parse_args())
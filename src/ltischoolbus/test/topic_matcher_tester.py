@@ -0,0 +1,73 @@
+'''
+Tests for topic patterns and the compiled topic matcher.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import unittest
+
+from ltischoolbus.topic_matcher import TopicMatcher, bus_subscriptions, check_pattern, is_pattern
+
+
+class TopicMatcherTester(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = TopicMatcher(['studentAction.HumanitiesSciences.*',
+                                     'studentAction.*.Hist101',
+                                     'studentAction.#',
+                                     'courseEvents'])
+
+    def testPatternSyntax(self):
+        self.assertTrue(is_pattern('studentAction.*'))
+        self.assertTrue(is_pattern('#'))
+        self.assertFalse(is_pattern('studentAction.Hist*'))
+        self.assertRaises(ValueError, check_pattern, 'studentAction.#.Hist101')
+        self.assertRaises(ValueError, self.matcher.add, '#.Hist101')
+
+    def testMatchMostSpecificFirst(self):
+        self.assertEqual(('studentAction.HumanitiesSciences.*', 'studentAction.*.Hist101', 'studentAction.#'),
+                         self.matcher.match('studentAction.HumanitiesSciences.Hist101'))
+        self.assertEqual(('studentAction.#',), self.matcher.match('studentAction'))
+        self.assertEqual(('studentAction.#',), self.matcher.match('studentAction.Engineering.CS101.quiz'))
+        self.assertEqual(('courseEvents',), self.matcher.match('courseEvents'))
+        self.assertEqual((), self.matcher.match('courseEvents.Hist101'))
+
+    def testMatchPatterns(self):
+        # A pattern matches a pattern if it matches all its topics:
+        self.assertEqual(('studentAction.HumanitiesSciences.*', 'studentAction.#'),
+                         self.matcher.match('studentAction.HumanitiesSciences.*'))
+        self.assertEqual(('studentAction.#',), self.matcher.match('studentAction.HumanitiesSciences.#'))
+        self.assertEqual((), TopicMatcher(['studentAction.*']).match('studentAction.#'))
+
+    def testRemove(self):
+        self.assertTrue(self.matcher.remove('studentAction.#'))
+        self.assertFalse(self.matcher.remove('studentAction.#'))
+        self.assertFalse(self.matcher.remove('never.*'))
+        self.assertEqual((), self.matcher.match('studentAction.Engineering.CS101.quiz'))
+        self.assertTrue(self.matcher.remove('studentAction.HumanitiesSciences.*'))
+        self.assertTrue(self.matcher.remove('studentAction.*.Hist101'))
+        self.assertTrue(self.matcher.remove('courseEvents'))
+        self.assertEqual(0, len(self.matcher))
+        # Unused trie nodes are pruned:
+        self.assertTrue(self.matcher.root.is_empty())
+
+    def testCacheInvalidatedOnChange(self):
+        self.assertEqual((), self.matcher.match('courseEvents.Hist101'))
+        self.matcher.add('courseEvents.*')
+        self.assertEqual(('courseEvents.*',), self.matcher.match('courseEvents.Hist101'))
+
+    def testBusSubscriptions(self):
+        (channels, globs) = bus_subscriptions(['studentAction.HumanitiesSciences.*',
+                                               'studentAction.HumanitiesSciences.Hist101.*',
+                                               'studentAction.HumanitiesSciences.Hist101',
+                                               'studentAction.#',
+                                               'courseEvents',
+                                               'odd?topic.*'])
+        self.assertEqual(set(['courseEvents', 'studentAction']), channels)
+        self.assertEqual(set(['studentAction.*', 'odd\\?topic.*']), globs)
+        self.assertEqual((set(), set(['*'])), bus_subscriptions(['*.Hist101', 'courseEvents']))
+
+
+if __name__ == "__main__":
+    unittest.main()
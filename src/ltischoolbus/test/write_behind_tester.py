@@ -0,0 +1,83 @@
+'''
+Tests for write-behind persistence of state files.
+
+Created on Oct 17, 2026
+
+@author: paepcke
+'''
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tornado.testing import AsyncTestCase
+
+from ltischoolbus.write_behind import WriteBehindFile
+
+
+class WriteBehindFileTester(AsyncTestCase):
+
+    def setUp(self):
+        super(WriteBehindFileTester, self).setUp()
+        self.work_dir = tempfile.mkdtemp(prefix='ltibridge_test')
+        self.path = os.path.join(self.work_dir, 'state.json')
+        self.state = {}
+        self.persister = WriteBehindFile(self.path,
+                                         lambda: json.dumps(self.state),
+                                         delay=0.02,
+                                         io_loop=self.io_loop)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        super(WriteBehindFileTester, self).tearDown()
+
+    def read_state(self):
+        with open(self.path, 'r') as fd:
+            return json.load(fd)
+
+    def testChangesCoalesced(self):
+        for i in range(50):
+            self.state['topic%s' % i] = ['https://lms1/delivery']
+            self.persister.mark_dirty()
+        # Nothing written yet:
+        self.assertFalse(os.path.exists(self.path))
+        self.io_loop.call_later(0.05, self.stop)
+        self.wait()
+        self.assertEqual(50, len(self.read_state()))
+        self.assertEqual({'changes' : 50, 'writes' : 1}, self.persister.stats())
+
+    def testReplaceLeavesNoTempFiles(self):
+        with open(self.path, 'w') as fd:
+            fd.write('{"old" : []}')
+        self.state['new'] = []
+        self.persister.mark_dirty()
+        self.assertTrue(self.persister.flush())
+        self.assertEqual({'new' : []}, self.read_state())
+        self.assertEqual(['state.json'], os.listdir(self.work_dir))
+
+    def testCloseFlushes(self):
+        self.state['studentAction'] = ['https://lms1/delivery']
+        self.persister.mark_dirty()
+        self.persister.close()
+        self.assertEqual(self.state, self.read_state())
+        # Clean state: no further writes:
+        self.persister.flush()
+        self.assertEqual(1, self.persister.stats()['writes'])
+
+    def testFailedWriteRetried(self):
+        persister = WriteBehindFile(os.path.join(self.work_dir, 'missing_dir', 'state.json'),
+                                    lambda: '{}',
+                                    delay=0.02,
+                                    io_loop=self.io_loop)
+        persister.mark_dirty()
+        self.assertFalse(persister.flush())
+        # Still dirty, with another attempt scheduled:
+        self.assertTrue(persister.dirty)
+        self.assertIsNotNone(persister.flush_timeout)
+        os.mkdir(os.path.join(self.work_dir, 'missing_dir'))
+        self.assertTrue(persister.flush())
+
+
+if __name__ == "__main__":
+    unittest.main()
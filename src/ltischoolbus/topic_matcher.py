@@ -0,0 +1,293 @@
+'''
+Created on Oct 17, 2026
+
+Hierarchical SchoolBus topics, and patterns over them. Topics
+are dot-separated segments, as in studentAction.HumanitiesSciences.Hist101.
+In a pattern, two segments are wildcards:
+
+    *   matches exactly one segment:  studentAction.HumanitiesSciences.*
+    #   as last segment only, matches zero or more segments: studentAction.#
+
+Other segments match themselves. A TopicMatcher compiles a set of
+patterns into a trie with one level per segment, so matching a
+topic costs time proportional to the topic's depth and the number
+of wildcard branches on its path, not to the number of patterns.
+
+Patterns may themselves be matched against patterns. In a topic that
+is matched, '*' is only matched by '*' or '#', and '#' only by '#'.
+A pattern thus matches another pattern exactly if it matches every
+topic that the other one matches. This is how grants of topic
+patterns in the bridge's config file cover subscriptions to patterns.
+
+@author: paepcke
+'''
+
+SEPARATOR = '.'
+ONE_SEGMENT = '*'
+ANY_SEGMENTS = '#'
+
+# Characters that redis treats specially in PSUBSCRIBE patterns:
+REDIS_GLOB_SPECIALS = '\\*?[]^'
+
+
+def is_pattern(topic):
+    '''
+    :return: True if topic has a wildcard segment, else False
+    :rtype: bool
+    '''
+    return any([segment in (ONE_SEGMENT, ANY_SEGMENTS) for segment in topic.split(SEPARATOR)])
+
+def check_pattern(pattern):
+    '''
+    :param pattern: topic or topic pattern
+    :type pattern: str
+    :raise ValueError: if '#' is used other than as the last segment
+    '''
+    segments = pattern.split(SEPARATOR)
+    if ANY_SEGMENTS in segments[:-1]:
+        raise ValueError("Wildcard '%s' may only be the last segment of a topic pattern: '%s'" % (ANY_SEGMENTS, pattern))
+
+def bus_subscriptions(topics):
+    '''
+    Given the topics and topic patterns that LTI consumers subscribed
+    to, compute the bus subscriptions that bring in all messages they
+    need, such that no message arrives through more than one of them.
+    Each pattern becomes a redis glob over its literal prefix, e.g.
+    'a.b.*' becomes 'a.b.*', as does 'a.b.*.c'. Globs and topics that
+    another glob already covers are left out.
+
+    :param topics: topics and patterns
+    :type topics: [str]
+    :return: channels to SUBSCRIBE to, and globs to PSUBSCRIBE to
+    :rtype: (set(str), set(str))
+    '''
+    # Literal prefixes of patterns, such as 'a.b.':
+    prefixes = set()
+    channels = set()
+    for topic in topics:
+        if not is_pattern(topic):
+            channels.add(topic)
+            continue
+        literal_segments = []
+        for segment in topic.split(SEPARATOR):
+            if segment in (ONE_SEGMENT, ANY_SEGMENTS):
+                break
+            literal_segments.append(segment)
+        if literal_segments:
+            prefixes.add(SEPARATOR.join(literal_segments) + SEPARATOR)
+        else:
+            prefixes.add('')
+        if segment == ANY_SEGMENTS and literal_segments:
+            # 'a.#' also matches 'a' itself:
+            channels.add(SEPARATOR.join(literal_segments))
+    prefixes = set([prefix for prefix in prefixes if prefix == '' or not covered(prefix[:-1], prefixes)])
+    channels = set([channel for channel in channels if not covered(channel, prefixes)])
+    globs = set([''.join(['\\' + char if char in REDIS_GLOB_SPECIALS else char for char in prefix]) + '*'
+                 for prefix in prefixes])
+    return (channels, globs)
+
+def covered(topic, prefixes):
+    '''
+    :return: True if a segment-wise proper prefix of topic, such
+        as 'a.' or 'a.b.' for topic 'a.b.c', is in prefixes
+    :rtype: bool
+    '''
+    if '' in prefixes:
+        return True
+    prefix = ''
+    for segment in topic.split(SEPARATOR)[:-1]:
+        prefix += segment + SEPARATOR
+        if prefix in prefixes:
+            return True
+    return False
+
+
+class TopicTrieNode(object):
+    '''
+    One segment position in a TopicMatcher's trie.
+    '''
+    __slots__ = ('children', 'star', 'patterns', 'rest_patterns')
+
+    def __init__(self):
+        # Literal segment --> TopicTrieNode:
+        self.children = {}
+        # Node for a '*' segment:
+        self.star = None
+        # Patterns that end at this node:
+        self.patterns = []
+        # Patterns that end with '#' after this node:
+        self.rest_patterns = []
+
+    def is_empty(self):
+        return not (self.children or self.star or self.patterns or self.rest_patterns)
+
+
+class TopicMatcher(object):
+    '''
+    Usage:
+        matcher = TopicMatcher(['studentAction.HumanitiesSciences.*', 'studentAction.#'])
+        matcher.match('studentAction.HumanitiesSciences.Hist101')
+        --> ('studentAction.HumanitiesSciences.*', 'studentAction.#')
+
+    Results of match() are cached until the next change
+    to the set of patterns.
+    '''
+
+    # Number of topics whose matches are cached:
+    MAX_CACHED_TOPICS = 10000
+
+    def __init__(self, patterns=()):
+        '''
+        :param patterns: initial patterns
+        :type patterns: [str]
+        :raise ValueError: if a pattern is ill-formed; see check_pattern()
+        '''
+        self.root = TopicTrieNode()
+        self.num_patterns = 0
+        self.match_cache = {}
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern):
+        '''
+        :return: True if pattern is new, else False
+        :rtype: bool
+        :raise ValueError: if pattern is ill-formed; see check_pattern()
+        '''
+        check_pattern(pattern)
+        (node, last_segment) = self.find_node(pattern, create=True)
+        patterns = node.rest_patterns if last_segment == ANY_SEGMENTS else node.patterns
+        if pattern in patterns:
+            return False
+        patterns.append(pattern)
+        self.num_patterns += 1
+        self.match_cache = {}
+        return True
+
+    def remove(self, pattern):
+        '''
+        :return: True if pattern was present, else False
+        :rtype: bool
+        '''
+        (node, last_segment) = self.find_node(pattern, create=False)
+        if node is None:
+            return False
+        patterns = node.rest_patterns if last_segment == ANY_SEGMENTS else node.patterns
+        if pattern not in patterns:
+            return False
+        patterns.remove(pattern)
+        self.num_patterns -= 1
+        self.match_cache = {}
+        self.prune(pattern)
+        return True
+
+    def match(self, topic):
+        '''
+        :param topic: topic, or pattern, to match
+        :type topic: str
+        :return: the patterns that match topic, more specific ones
+            (literal segments before wildcards) first
+        :rtype: (str)
+        '''
+        try:
+            return self.match_cache[topic]
+        except KeyError:
+            pass
+        matches = []
+        self.collect(self.root, topic.split(SEPARATOR), 0, matches)
+        matches = tuple(matches)
+        if len(self.match_cache) >= TopicMatcher.MAX_CACHED_TOPICS:
+            self.match_cache = {}
+        self.match_cache[topic] = matches
+        return matches
+
+    def patterns(self):
+        '''
+        :return: all patterns
+        :rtype: [str]
+        '''
+        result = []
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            result.extend(node.patterns)
+            result.extend(node.rest_patterns)
+            nodes.extend(node.children.values())
+            if node.star is not None:
+                nodes.append(node.star)
+        return result
+
+    def __contains__(self, pattern):
+        (node, last_segment) = self.find_node(pattern, create=False)
+        if node is None:
+            return False
+        return pattern in (node.rest_patterns if last_segment == ANY_SEGMENTS else node.patterns)
+
+    def __len__(self):
+        return self.num_patterns
+
+    # -------------------------------- Private Methods ---------
+
+    def find_node(self, pattern, create):
+        '''
+        Walk the trie along the pattern's segments. A final
+        '#' segment is not walked; its patterns are kept at
+        the node before it.
+
+        :return: the node where pattern is kept (None if absent and
+            not create), and the pattern's last segment
+        :rtype: (TopicTrieNode, str)
+        '''
+        segments = pattern.split(SEPARATOR)
+        last_segment = segments[-1]
+        if last_segment == ANY_SEGMENTS:
+            segments = segments[:-1]
+        node = self.root
+        for segment in segments:
+            if segment == ONE_SEGMENT:
+                child = node.star
+                if child is None and create:
+                    child = node.star = TopicTrieNode()
+            else:
+                child = node.children.get(segment, None)
+                if child is None and create:
+                    child = node.children[segment] = TopicTrieNode()
+            if child is None:
+                return (None, last_segment)
+            node = child
+        return (node, last_segment)
+
+    def prune(self, pattern):
+        '''
+        Remove the nodes along pattern's path that no
+        longer lead to any pattern.
+        '''
+        segments = pattern.split(SEPARATOR)
+        if segments[-1] == ANY_SEGMENTS:
+            segments = segments[:-1]
+        path = [self.root]
+        for segment in segments:
+            path.append(path[-1].star if segment == ONE_SEGMENT else path[-1].children[segment])
+        for depth in range(len(segments), 0, -1):
+            if not path[depth].is_empty():
+                return
+            parent = path[depth - 1]
+            if segments[depth - 1] == ONE_SEGMENT:
+                parent.star = None
+            else:
+                del parent.children[segments[depth - 1]]
+
+    def collect(self, node, segments, position, matches):
+        if position == len(segments):
+            matches.extend(node.patterns)
+            matches.extend(node.rest_patterns)
+            return
+        segment = segments[position]
+        if segment != ANY_SEGMENTS:
+            if segment != ONE_SEGMENT:
+                child = node.children.get(segment, None)
+                if child is not None:
+                    self.collect(child, segments, position + 1, matches)
+            if node.star is not None:
+                self.collect(node.star, segments, position + 1, matches)
+        matches.extend(node.rest_patterns)
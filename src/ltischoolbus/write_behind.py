@@ -0,0 +1,146 @@
+'''
+Created on Oct 17, 2026
+
+Write-behind persistence of small state files, such as the
+bridge's subscriptions. Callers change their in-memory state,
+and tell a WriteBehindFile that it is dirty. All changes
+within a short delay are then written together with one
+crash-safe file replacement:
+
+   1. write the new content to a temp file in the same directory,
+   2. fsync the temp file,
+   3. rename it over the old file (atomic on POSIX), and
+   4. fsync the directory, so the rename itself is durable.
+
+After a crash the file therefore holds either the old or
+the new content, never a mix. close() writes outstanding
+changes, and must be called at shutdown.
+
+@author: paepcke
+'''
+import logging
+import os
+import tempfile
+
+import tornado.ioloop
+
+
+def replace_file(path, content):
+    '''
+    Crash-safe replacement of a file's content, as described
+    above. Also used for subscription snapshots.
+
+    :param path: file to replace or create
+    :type path: str
+    :param content: new file content
+    :type content: str
+    :raise {IOError | OSError}: if the file cannot be written
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, temp_path) = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(content)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    sync_directory(directory)
+
+def sync_directory(directory):
+    '''
+    fsync a directory, so that renames and creations
+    of files in it are durable.
+    '''
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class WriteBehindFile(object):
+    '''
+    Usage:
+        persister = WriteBehindFile(path, lambda: json.dumps(state))
+        state['x'] = 1
+        persister.mark_dirty()
+        ...
+        persister.close()
+    '''
+
+    def __init__(self, path, serialize, delay=0.5, io_loop=None):
+        '''
+        :param path: file to maintain
+        :type path: str
+        :param serialize: called without arguments at write time; returns
+            the complete new file content
+        :type serialize: callable
+        :param delay: seconds between the first unsaved change and the write
+        :type delay: {int | float}
+        :param io_loop: loop that runs the delayed writes. Default: current IOLoop
+        :type io_loop: {IOLoop | None}
+        '''
+        self.path = os.path.abspath(path)
+        self.serialize = serialize
+        self.delay = delay
+        self.io_loop = io_loop if io_loop is not None else tornado.ioloop.IOLoop.current()
+        self.logger = logging.getLogger('ltibridge')
+
+        self.dirty = False
+        self.flush_timeout = None
+        self.writes_counter = 0
+        self.changes_counter = 0
+
+    def mark_dirty(self):
+        '''
+        Note that the state changed. The file is written
+        delay seconds after the first of a run of changes.
+        '''
+        self.dirty = True
+        self.changes_counter += 1
+        if self.flush_timeout is None:
+            self.flush_timeout = self.io_loop.call_later(self.delay, self.flush)
+
+    def flush(self):
+        '''
+        Write the current state now, if it changed since
+        the last write. If writing fails, the state stays
+        dirty, and another attempt is scheduled.
+
+        :return: True if the file is up to date, else False
+        :rtype: bool
+        '''
+        if self.flush_timeout is not None:
+            self.io_loop.remove_timeout(self.flush_timeout)
+            self.flush_timeout = None
+        if not self.dirty:
+            return True
+        # Changes made while we write are not lost: they
+        # set dirty again after this point:
+        self.dirty = False
+        try:
+            replace_file(self.path, self.serialize())
+        except (IOError, OSError) as e:
+            self.logger.error('Could not write %s; will retry: %s', self.path, e)
+            self.mark_dirty()
+            return False
+        self.writes_counter += 1
+        return True
+
+    def stats(self):
+        '''
+        :return: number of changes noted, and of file writes
+        :rtype: {str : int}
+        '''
+        return {'changes' : self.changes_counter,
+                'writes' : self.writes_counter}
+
+    def close(self):
+        '''
+        Write outstanding changes. Call at shutdown.
+        '''
+        self.flush()